@@ -3,30 +3,95 @@
 Nosdonnées - Application Flask
 Plateforme de partage de bases de données
 """
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_file # type: ignore
+from flask import Flask, Request, current_app, render_template, request, redirect, url_for, flash, jsonify, abort, session # type: ignore
 from flask_sqlalchemy import SQLAlchemy # type: ignore
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user # type: ignore
 from werkzeug.security import generate_password_hash, check_password_hash # type: ignore
 from werkzeug.utils import secure_filename # type: ignore
+from werkzeug.local import LocalProxy # type: ignore
+import click # type: ignore
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
 import json
+import time
+import uuid
+from types import SimpleNamespace
 
-app = Flask(__name__)
-app.config['SECRET_KEY'] = 'nosdonnees-secret-key-change-in-production'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///nosdonnees.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['UPLOAD_FOLDER'] = 'uploads'
-app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB max
+import search_index
+from schema_upgrade import upgrade_schema
+from counters import CounterBuffer
+from download_log import DownloadEvent, DownloadLogWriter
+import rollups
+from suggest import SuggestIndex
+from caching import create_cache
+import keyset
+from query_budget import QueryBudget, query_budget
+from sqlite_tuning import RoutingSession, SQLiteTuning
+from instrumentation import Instrumentation, io_timer
+from downloads import file_sha256, send_dataset_file, is_new_download
+from blob_store import BlobStore
+import chunked_upload
+import profiling
+import preview
+from job_queue import JobMixin, JobQueue
+from view_registry import ViewRegistry
+from config import get_config
 
-# Créer le dossier uploads s'il n'existe pas
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-
-db = SQLAlchemy(app)
+# Extensions et services du processus, liés à l'application par create_app()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 login_manager = LoginManager()
-login_manager.init_app(app)
 login_manager.login_view = 'login'
 
+# Vues et commandes, ajoutées à l'application par create_app()
+views = ViewRegistry()
+
+# Services qui dépendent de la configuration : créés par create_app() et
+# rangés dans app.extensions, ces noms désignent ceux de l'application courante
+def _service(name):
+    return LocalProxy(lambda: current_app.extensions[name])
+
+blob_store = _service('blob_store')  # stockage des fichiers par contenu
+preview_cache = _service('preview_cache')  # pages d'aperçu
+preview_indexes = _service('preview_indexes')  # index des lignes chargés, par empreinte
+suggest_index = _service('suggest_index')  # suggestions de recherche, servies depuis la mémoire du processus
+cache = _service('cache')  # page d'accueil et statistiques
+
+class UploadRequest(Request):
+    """Requête dont les fichiers reçus sont hachés pendant leur écriture sur disque"""
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return blob_store.open_temp()
+
+# Compteurs de vues/téléchargements appliqués par lots
+counter_buffer = CounterBuffer()
+
+CATALOGUE_CACHE_KEYS = ('home:data', 'home:page', 'api:stats')
+
+def invalidate_catalogue_cache():
+    """Oublier les pages et statistiques qui dépendent du catalogue"""
+    cache.delete(*CATALOGUE_CACHE_KEYS)
+
+@counter_buffer.on_flush
+def invalidate_after_downloads(rows):
+    # Les pages en cache affichent les téléchargements, pas les vues : un vidage
+    # de vues seules les laisse valides
+    if any(row['download_count'] for row in rows):
+        invalidate_catalogue_cache()
+
+# Journal des téléchargements écrit par lots, hors de la requête
+download_log = DownloadLogWriter()
+
+# Agrégats d'usage par heure et par jour (dataset, domaine, contributeur)
+usage_rollups = rollups.RollupBuffer()
+
+@download_log.on_write
+def rollup_downloads(events):
+    for event in events:
+        usage_rollups.add(event.dataset_id, 'downloads', event.downloaded_at)
+    usage_rollups.flush()
+
+# Les vues sont appliquées avec les compteurs
+counter_buffer.on_flush(lambda rows: usage_rollups.flush())
+
 # Modèles de données
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -80,6 +145,7 @@ class Dataset(db.Model):
     file_path = db.Column(db.String(500), nullable=False)
     file_format = db.Column(db.String(10), nullable=False)
     file_size = db.Column(db.Integer)
+    file_hash = db.Column(db.String(64))  # SHA-256 du contenu (ETag)
     domain_id = db.Column(db.Integer, db.ForeignKey('domain.id'), nullable=False)
     keywords = db.Column(db.String(500))
     documentation = db.Column(db.Text)
@@ -89,20 +155,89 @@ class Dataset(db.Model):
     rejection_reason = db.Column(db.Text)  # Raison du rejet
     download_count = db.Column(db.Integer, default=0)
     view_count = db.Column(db.Integer, default=0)
-    rating = db.Column(db.Float, default=0.0)
+    rating = db.Column(db.Float, default=0.0)  # Moyenne des notes (= rating_sum / rating_count)
+    rating_sum = db.Column(db.Integer, default=0)  # Somme des notes des commentaires
+    rating_count = db.Column(db.Integer, default=0)  # Nombre de commentaires notés
+    row_count = db.Column(db.Integer)
+    column_count = db.Column(db.Integer)
+    profile = db.Column(db.Text)  # Profil des colonnes (JSON, voir profiling.py)
+    profile_status = db.Column(db.String(20))  # pending, done, unsupported, failed
+    profiled_at = db.Column(db.DateTime)
     
     # Relations
     domain = db.relationship('Domain', backref='datasets')
     user = db.relationship('User', backref='datasets')
     comments = db.relationship('Comment', backref='dataset', lazy='dynamic')
+    
+    # Index des accès du catalogue : statut filtré puis tri ou domaine
+    __table_args__ = (
+        db.Index('ix_dataset_status_rating', 'status', 'rating'),
+        db.Index('ix_dataset_status_creation_date', 'status', 'creation_date'),
+        db.Index('ix_dataset_status_download_count', 'status', 'download_count'),
+        db.Index('ix_dataset_status_domain', 'status', 'domain_id', 'creation_date'),
+        db.Index('ix_dataset_user_status', 'user_id', 'status'),
+    )
+    
+    def get_profile(self):
+        """Profil des colonnes décodé, ou None s'il n'a pas encore été calculé"""
+        return json.loads(self.profile) if self.profile else None
 
 class DownloadLog(db.Model):
+    """Ancien journal des téléchargements (voir download_log.py et `flask migrate-download-log`)"""
     id = db.Column(db.Integer, primary_key=True)
     dataset_id = db.Column(db.Integer, db.ForeignKey('dataset.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     ip_address = db.Column(db.String(45))
     user_agent = db.Column(db.Text)
     downloaded_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_download_log_dataset_downloaded_at', 'dataset_id', 'downloaded_at'),
+    )
+
+class UserAgent(db.Model):
+    """User-Agent des téléchargements, enregistré une seule fois"""
+    id = db.Column(db.Integer, primary_key=True)
+    digest = db.Column(db.String(40), unique=True, nullable=False)  # SHA-1 du texte
+    value = db.Column(db.Text, nullable=False)
+
+class UsageRollup(db.Model):
+    """Téléchargements et vues agrégés par période (voir rollups.py)"""
+    scope = db.Column(db.String(10), primary_key=True)  # dataset, domain, user
+    scope_id = db.Column(db.Integer, primary_key=True)
+    granularity = db.Column(db.String(5), primary_key=True)  # hour, day
+    period = db.Column(db.DateTime, primary_key=True)  # début de la période (UTC)
+    downloads = db.Column(db.Integer, nullable=False, default=0)
+    views = db.Column(db.Integer, nullable=False, default=0)
+
+class SimilarDataset(db.Model):
+    """Bases similaires précalculées, par rang (voir similarity.py)"""
+    dataset_id = db.Column(db.Integer, primary_key=True)
+    rank = db.Column(db.Integer, primary_key=True)
+    similar_id = db.Column(db.Integer, nullable=False)
+    score = db.Column(db.Float, nullable=False)
+
+class Blob(db.Model):
+    """Fichier stocké par contenu, partagé par les datasets identiques"""
+    sha256 = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.BigInteger)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class UploadSession(db.Model):
+    """Upload par morceaux en cours (le dataset n'est créé qu'à la finalisation)"""
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    total_size = db.Column(db.BigInteger, nullable=False)
+    sha256 = db.Column(db.String(64))  # Empreinte annoncée par le client (optionnelle)
+    status = db.Column(db.String(20), default='open')  # open, complete, failed
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class Job(JobMixin, db.Model):
+    """Tâche de fond (voir job_queue.py)"""
+    dataset_id = db.Column(db.Integer, db.ForeignKey('dataset.id'))
+    
+    dataset = db.relationship('Dataset', backref=db.backref('jobs', lazy='dynamic'))
 
 class Comment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -114,66 +249,277 @@ class Comment(db.Model):
     
     # Relations
     user = db.relationship('User', backref='comments')
+    
+    __table_args__ = (
+        db.Index('ix_comment_dataset_created_at', 'dataset_id', 'created_at'),
+    )
+
+# File des tâches de fond (profilage, etc.)
+job_queue = JobQueue()
+
+# Profils de chargement : relations lues par les gabarits, chargées avec la
+# requête principale plutôt qu'une fois par ligne affichée
+LOAD_PROFILES = {
+    'dataset_card': (db.joinedload(Dataset.domain),),  # listes et pages de dataset
+    'comment_thread': (db.joinedload(Comment.user),),  # commentaires avec leur auteur
+}
+
+def with_profile(query, name):
+    """Appliquer un profil de chargement à une requête"""
+    return query.options(*LOAD_PROFILES[name])
 
 @login_manager.user_loader
 def load_user(user_id):
     return User.query.get(int(user_id))
 
-# Routes
-@app.route('/')
-def home():
-    """Page d'accueil"""
+def register_blob(stored):
+    """Enregistrer un blob s'il est nouveau (sans commit)
+
+    Aucun chemin ne supprime de dataset et un rejet peut être annulé : les
+    fichiers sont conservés. Les datasets qui partagent un blob se retrouvent
+    par ``Dataset.file_hash``.
+    """
+    blob = db.session.get(Blob, stored.digest)
+    if blob is None:
+        blob = Blob(sha256=stored.digest, size=stored.size)
+        db.session.add(blob)
+    return blob
+
+@job_queue.task()
+def profile_dataset(dataset_id):
+    """Calculer le profil des colonnes d'un dataset et l'enregistrer (tâche de fond)"""
+    dataset = db.session.get(Dataset, dataset_id)
+    if dataset is None:
+        return
+    try:
+        result = profiling.profile_file(dataset.file_path, dataset.file_format,
+                                        batch_size=current_app.config['PROFILE_BATCH_SIZE'])
+    except profiling.UnsupportedFormat:
+        dataset.profile_status = 'unsupported'
+    except Exception:
+        # Enregistrer l'échec puis laisser la file réessayer plus tard
+        dataset.profile_status = 'failed'
+        dataset.profiled_at = datetime.utcnow()
+        db.session.commit()
+        raise
+    else:
+        dataset.row_count = result['row_count']
+        dataset.column_count = result['column_count']
+        dataset.profile = json.dumps(result, ensure_ascii=False, default=str)
+        dataset.profile_status = 'done'
+    dataset.profiled_at = datetime.utcnow()
+    db.session.commit()
+    if dataset.status == 'validated':
+        # Les noms de colonnes comptent dans la similarité
+        job_queue.enqueue('refresh_similar', dataset_id=dataset.id)
+
+@job_queue.task()
+def refresh_similar(dataset_id):
+    """Mettre à jour les bases similaires après un changement de dataset (tâche de fond)"""
+    import similarity
+    with db.engine.begin() as conn:
+        similarity.refresh(conn, SimilarDataset.__table__, Dataset.__table__, dataset_id,
+                           max_age=current_app.config['SIMILARITY_INDEX_MAX_AGE'])
+    # Les mises à jour incrémentales laissent vieillir les autres scores
+    delay = current_app.config['SIMILARITY_REBUILD_DELAY']
+    if delay and not Job.query.filter_by(name='rebuild_similar', status='queued').first():
+        job_queue.enqueue('rebuild_similar', delay=delay)
+
+@job_queue.task()
+def rebuild_similar():
+    """Recalculer les bases similaires de tous les datasets validés (tâche de fond)"""
+    import similarity
+    with db.engine.begin() as conn:
+        return similarity.rebuild(conn, SimilarDataset.__table__, Dataset.__table__)
+
+def preview_index_path(dataset):
+    """Chemin de l'index des lignes (partagé par les fichiers identiques)"""
+    if not dataset.file_hash:
+        return None
+    return preview.index_path(current_app.config['PREVIEW_INDEX_FOLDER'], dataset.file_hash)
+
+@job_queue.task()
+def build_preview_index(dataset_id):
+    """Indexer les positions des lignes pour l'aperçu paginé (tâche de fond)"""
+    dataset = db.session.get(Dataset, dataset_id)
+    if dataset is None:
+        return
+    path = preview_index_path(dataset)
+    if path is None or os.path.exists(path):
+        return
+    index = preview.build_row_index(dataset.file_path, dataset.file_format,
+                                    stride=current_app.config['PREVIEW_INDEX_STRIDE'])
+    if index is not None:
+        index.save(path)
+
+def enqueue_dataset_processing(dataset):
+    """Programmer les traitements effectués après l'upload d'un fichier"""
+    dataset.profile_status = 'pending'
+    db.session.commit()
+    job_queue.enqueue('profile_dataset', dataset_id=dataset.id)
+    if dataset.file_format in preview.INDEXED_FORMATS:
+        job_queue.enqueue('build_preview_index', dataset_id=dataset.id)
+
+def home_data():
+    """Statistiques et listes de la page d'accueil, en valeurs simples (mises en cache)"""
     stats = {
         'total_datasets': Dataset.query.filter_by(status='validated').count(),
         'total_downloads': db.session.query(db.func.sum(Dataset.download_count)).scalar() or 0,
         'total_users': User.query.count()
     }
     
-    popular_datasets = Dataset.query.filter_by(status='validated').order_by(Dataset.download_count.desc()).limit(6).all()
-    active_domains = Domain.query.join(Dataset).filter(Dataset.status == 'validated').group_by(Domain.id).order_by(db.func.count(Dataset.id).desc()).limit(5).all()
-    
-    return render_template('home.html', stats=stats, popular_datasets=popular_datasets, active_domains=active_domains)
+    popular_datasets = [
+        SimpleNamespace(
+            id=dataset.id,
+            title=dataset.title,
+            file_format=dataset.file_format,
+            short_description=dataset.short_description,
+            description=dataset.description[:100],
+            download_count=dataset.download_count
+        )
+        for dataset in Dataset.query.filter_by(status='validated').order_by(Dataset.download_count.desc()).limit(6)
+    ]
+    dataset_count = db.func.count(Dataset.id)
+    active_domains = [
+        SimpleNamespace(id=domain.id, name=domain.name, icon=domain.icon, dataset_count=count)
+        for domain, count in db.session.query(Domain, dataset_count).join(Dataset).filter(
+            Dataset.status == 'validated'
+        ).group_by(Domain.id).order_by(dataset_count.desc()).limit(5)
+    ]
+    return {'stats': stats, 'popular_datasets': popular_datasets, 'active_domains': active_domains}
 
-@app.route('/datasets')
-def dataset_list():
-    """Liste des bases de données"""
-    page = request.args.get('page', 1, type=int)
-    per_page = 12
-    
-    # Filtres
-    q = request.args.get('q', '')
-    domain_id = request.args.get('domain', type=int)
-    file_format = request.args.get('file_format', '')
+# Routes
+@views.route('/')
+@query_budget(6)
+def home():
+    """Page d'accueil"""
+    # Visiteurs anonymes : la page entière est servie depuis le cache
+    cacheable_page = not current_user.is_authenticated and '_flashes' not in session
+    if cacheable_page:
+        page = cache.get('home:page')
+        if page is not None:
+            return page
     
-    # Ne montrer que les datasets validés
+    data = cache.get_or_set('home:data', home_data, ttl=current_app.config['STATS_CACHE_DURATION'])
+    page = render_template('home.html', **data)
+    if cacheable_page:
+        cache.set('home:page', page, ttl=current_app.config['STATS_CACHE_DURATION'])
+    return page
+
+# Tris des listes : colonnes de la clé de pagination (identifiant en dernier)
+LISTING_SORTS = {
+    'recent': (Dataset.creation_date, Dataset.id),
+    'downloads': (Dataset.download_count, Dataset.id),
+    'rating': (Dataset.rating, Dataset.rating_count, Dataset.id),
+}
+
+def filtered_datasets(args):
+    """Datasets validés filtrés selon les paramètres de liste (q, domain, file_format)"""
     query = Dataset.query.filter_by(status='validated')
     
+    q = args.get('q', '')
     if q:
-        query = query.filter(
-            db.or_(
-                Dataset.title.contains(q),
-                Dataset.description.contains(q)
-            )
-        )
+        # Recherche plein texte (FTS5, classement BM25)
+        query = search_index.apply_search(query, Dataset, db.session, q)
     
+    domain_id = args.get('domain', type=int)
     if domain_id:
         query = query.filter_by(domain_id=domain_id)
     
+    file_format = args.get('file_format', '')
     if file_format:
         query = query.filter_by(file_format=file_format)
     
-    datasets = query.order_by(Dataset.creation_date.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
+    return query
+
+def listing_page(query, args, per_page):
+    """Page d'une liste de datasets désignée par un curseur ``after``/``before``
+
+    Les tris de LISTING_SORTS reprennent l'index après la clé du curseur ;
+    le classement par pertinence d'une recherche (tri par défaut avec ``q``)
+    garde un décalage, encodé dans le même format de curseur. Lève
+    ``keyset.InvalidCursor``.
+    """
+    sort = args.get('sort') or ('relevance' if args.get('q') else 'recent')
+    after, before = args.get('after'), args.get('before')
+    if sort in LISTING_SORTS:
+        return keyset.paginate_query(query, sort, LISTING_SORTS[sort], per_page, after=after, before=before)
+    if sort != 'relevance':
+        raise keyset.InvalidCursor(f'Tri inconnu : {sort}')
     
+    token = before or after
+    offset = keyset.decode_cursor(token, sort, 1)[0] if token else 0
+    if not isinstance(offset, int) or offset < 0:
+        raise keyset.InvalidCursor('Curseur invalide')
+    rows = query.offset(offset).limit(per_page + 1).all()
+    items = rows[:per_page]
+    next_cursor = keyset.encode_cursor(sort, [offset + per_page]) if len(rows) > per_page else None
+    prev_cursor = keyset.encode_cursor(sort, [max(offset - per_page, 0)]) if offset else None
+    # Le curseur « before » désigne directement le début de la page précédente
+    return keyset.KeysetPage(items, next_cursor, prev_cursor)
+
+def listing_count(query, args):
+    """Nombre de résultats pour l'en-tête : exact sans filtre (en cache), sinon borné"""
+    if not any(args.get(name) for name in ('q', 'domain', 'file_format')):
+        stats = cache.get_or_set('api:stats', catalogue_stats, ttl=current_app.config['STATS_CACHE_DURATION'])
+        return stats['validated_datasets'], False
+    return keyset.capped_count(query, current_app.config['LISTING_COUNT_CAP'])
+
+@views.route('/datasets')
+@query_budget(6)
+def dataset_list():
+    """Liste des bases de données (pagination par curseur)"""
+    query = filtered_datasets(request.args)
+    try:
+        datasets = listing_page(with_profile(query, 'dataset_card'), request.args, current_app.config['DATASETS_PER_PAGE'])
+    except keyset.InvalidCursor:
+        # Curseur périmé ou modifié : retour à la première page
+        args = {k: v for k, v in request.args.items() if k not in ('after', 'before', 'sort')}
+        return redirect(url_for('dataset_list', **args))
+    result_count, count_is_approximate = listing_count(query, request.args)
+    
+    # Paramètres conservés par les liens de pagination
+    list_args = {k: v for k, v in request.args.items() if k not in ('after', 'before', 'page')}
     domains = Domain.query.all()
     
-    return render_template('dataset_list.html', datasets=datasets, domains=domains)
+    return render_template('dataset_list.html', datasets=datasets, domains=domains, list_args=list_args,
+                           result_count=result_count, count_is_approximate=count_is_approximate)
 
-@app.route('/datasets/<int:dataset_id>')
+@views.route('/api/datasets')
+def api_dataset_list():
+    """API de liste des datasets validés, paginée par curseur (mêmes filtres que /datasets)"""
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    query = filtered_datasets(request.args)
+    try:
+        page = listing_page(query, request.args, limit)
+    except keyset.InvalidCursor as exc:
+        return jsonify({'error': str(exc)}), 400
+    
+    payload = {
+        'items': [{
+            'id': dataset.id,
+            'title': dataset.title,
+            'short_description': dataset.short_description,
+            'file_format': dataset.file_format,
+            'domain_id': dataset.domain_id,
+            'author': dataset.author,
+            'creation_date': dataset.creation_date.isoformat() if dataset.creation_date else None,
+            'download_count': counter_buffer.live_count(dataset, 'download_count'),
+            'rating': dataset.rating,
+            'url': url_for('dataset_detail', dataset_id=dataset.id)
+        } for dataset in page.items],
+        'next_cursor': page.next_cursor,
+        'prev_cursor': page.prev_cursor
+    }
+    if request.args.get('count'):
+        payload['count'], payload['count_is_approximate'] = listing_count(query, request.args)
+    return jsonify(payload)
+
+@views.route('/datasets/<int:dataset_id>')
+@query_budget(6)
 def dataset_detail(dataset_id):
     """Détail d'une base de données"""
-    dataset = Dataset.query.get_or_404(dataset_id)
+    dataset = with_profile(Dataset.query, 'dataset_card').get_or_404(dataset_id)
     
     # Vérifier que l'utilisateur peut voir ce dataset
     if dataset.status != 'validated' and (not current_user.is_authenticated or 
@@ -181,25 +527,24 @@ def dataset_detail(dataset_id):
         flash('Cette base de données n\'est pas accessible.', 'warning')
         return redirect(url_for('dataset_list'))
     
-    # Incrémenter le compteur de vues
-    dataset.view_count += 1
-    db.session.commit()
+    # Incrémenter le compteur de vues (appliqué en différé par lots)
+    counter_buffer.increment(dataset.id, 'view_count')
+    usage_rollups.add(dataset.id, 'views')
     
-    comments = Comment.query.filter_by(dataset_id=dataset_id).order_by(Comment.created_at.desc()).all()
+    comments = with_profile(Comment.query, 'comment_thread').filter_by(
+        dataset_id=dataset_id
+    ).order_by(Comment.created_at.desc()).all()
     
-    # Bases similaires (même domaine, seulement validées)
-    similar_datasets = Dataset.query.filter_by(
-        domain_id=dataset.domain_id, status='validated'
-    ).filter(Dataset.id != dataset_id).limit(5).all()
+    # Bases similaires précalculées (lecture par la clé primaire de similar_dataset)
+    similar_datasets = Dataset.query.join(SimilarDataset, SimilarDataset.similar_id == Dataset.id).filter(
+        SimilarDataset.dataset_id == dataset_id, Dataset.status == 'validated'
+    ).order_by(SimilarDataset.rank).all()
     
-    return render_template('dataset_detail.html', dataset=dataset, comments=comments, similar_datasets=similar_datasets)
+    return render_template('dataset_detail.html', dataset=dataset, comments=comments, similar_datasets=similar_datasets,
+                           can_preview=dataset.file_format in preview.PREVIEW_FORMATS)
 
-@app.route('/datasets/<int:dataset_id>/download')
-def dataset_download(dataset_id):
-    """Téléchargement d'une base de données"""
-    dataset = Dataset.query.get_or_404(dataset_id)
-    
-    # Vérifier les permissions de téléchargement
+def user_can_download(dataset):
+    """L'utilisateur courant peut-il télécharger (ou prévisualiser) ce dataset ?"""
     can_download = False
     
     # Les admins peuvent télécharger tous les datasets
@@ -212,87 +557,164 @@ def dataset_download(dataset_id):
     elif current_user.is_authenticated and current_user.id == dataset.user_id:
         can_download = True
     
-    if not can_download:
+    return can_download
+
+@views.route('/datasets/<int:dataset_id>/download')
+def dataset_download(dataset_id):
+    """Téléchargement d'une base de données"""
+    dataset = Dataset.query.get_or_404(dataset_id)
+    
+    if not user_can_download(dataset):
         flash('Vous n\'avez pas les permissions pour télécharger cette base de données.', 'warning')
         return redirect(url_for('dataset_detail', dataset_id=dataset_id))
     
-    # Incrémenter le compteur de téléchargements
-    dataset.download_count += 1
-    db.session.commit()
+    if not os.path.exists(dataset.file_path):
+        flash('Fichier non trouvé.', 'danger')
+        return redirect(url_for('dataset_detail', dataset_id=dataset_id))
     
-    # Enregistrer le téléchargement
-    log = DownloadLog(
-        dataset_id=dataset_id,
-        user_id=current_user.id if current_user.is_authenticated else None,
-        ip_address=request.remote_addr,
-        user_agent=request.headers.get('User-Agent', '')
-    )
-    db.session.add(log)
-    db.session.commit()
+    # Empreinte du contenu (ETag fort), calculée une fois pour les anciens datasets
+    if not dataset.file_hash:
+        with io_timer():
+            dataset.file_hash = file_sha256(dataset.file_path)
+        db.session.commit()
     
-    # Retourner le fichier
-    return send_file(
+    # Retourner le fichier (streaming, Range/If-Range, 304 si ETag identique)
+    response = send_dataset_file(
         dataset.file_path,
-        as_attachment=True,
-        download_name=f"{dataset.title}.{dataset.file_format}"
+        f"{dataset.title}.{dataset.file_format}",
+        dataset.file_hash
     )
-
-@app.route('/upload', methods=['GET', 'POST'])
-@login_required
-def dataset_upload():
-    """Upload d'une nouvelle base de données"""
-    if request.method == 'POST':
-        # Récupération des données du formulaire
-        title = request.form.get('title')
-        description = request.form.get('description')
-        short_description = request.form.get('short_description', '')
-        source = request.form.get('source', '')
-        methodology = request.form.get('methodology', '')
-        geographic_scope = request.form.get('geographic_scope', '')
-        time_period = request.form.get('time_period', '')
-        documentation = request.form.get('documentation', '')
-        keywords = request.form.get('keywords', '')
-        domain_id = request.form.get('domain_id')
-        file = request.files.get('file')
-        
-        # Validation des champs obligatoires
-        required_fields = {
-            'title': 'Titre',
-            'description': 'Description',
-            'source': 'Source',
-            'documentation': 'Documentation',
-            'domain_id': 'Domaine',
-            'file': 'Fichier'
-        }
-        
-        missing_fields = []
-        for field, label in required_fields.items():
-            if field == 'file':
-                if not file or file.filename == '':
-                    missing_fields.append(label)
-            elif not request.form.get(field):
-                missing_fields.append(label)
-        
-        if missing_fields:
-            flash(f'Champs obligatoires manquants : {", ".join(missing_fields)}', 'error')
-            return render_template('dataset_upload.html', domains=Domain.query.all())
-        
-        # Validation du fichier
-        if file:
-            allowed_extensions = {'csv', 'xlsx', 'xls', 'json', 'xml', 'sql', 'zip'}
-            file_extension = file.filename.rsplit('.', 1)[1].lower() if '.' in file.filename else ''
-            
-            if file_extension not in allowed_extensions:
-                flash('Type de fichier non autorisé. Formats acceptés : CSV, Excel, JSON, XML, SQL, ZIP', 'error')
-                return render_template('dataset_upload.html', domains=Domain.query.all())
-        
-        # Sauvegarder le fichier
-        filename = secure_filename(file.filename)
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(file_path)
+    
+    # Les 304 et les reprises de téléchargement ne sont pas comptés
+    if is_new_download(response):
+        # Incrémenter le compteur de téléchargements (appliqué en différé par lots)
+        counter_buffer.increment(dataset.id, 'download_count')
         
-        # Créer la documentation enrichie
-        enriched_documentation = f"""
+        # Enregistrer le téléchargement (écrit par lots dans le journal partitionné)
+        download_log.record(
+            dataset.id,
+            user_id=current_user.id if current_user.is_authenticated else None,
+            ip_address=request.remote_addr,
+            user_agent=request.headers.get('User-Agent', '')
+        )
+    
+    return response
+
+@views.route('/api/datasets/<int:dataset_id>/usage')
+def api_dataset_usage(dataset_id):
+    """API d'usage : téléchargements et vues par heure ou par jour, lus dans les agrégats"""
+    dataset = Dataset.query.get_or_404(dataset_id)
+    if not user_can_download(dataset):
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    granularity = request.args.get('granularity', 'day')
+    if granularity not in rollups.GRANULARITIES:
+        return jsonify({'error': f'Granularité invalide : {granularity} (hour, day)'}), 400
+    # Dates ISO (``AAAA-MM-JJ`` ou avec l'heure) ; ``to`` inclus, jusqu'à la fin de sa période
+    step = rollups.period_step(granularity)
+    try:
+        end = datetime.fromisoformat(request.args['to']) if request.args.get('to') else datetime.utcnow()
+        end = rollups.period_start(end, granularity) + step
+        start = (datetime.fromisoformat(request.args['from']) if request.args.get('from')
+                 else end - step * (48 if granularity == 'hour' else 30))
+        start = rollups.period_start(start, granularity)
+    except ValueError:
+        return jsonify({'error': 'Date invalide (format AAAA-MM-JJ)'}), 400
+    if start >= end or end - start > rollups.MAX_RANGE[granularity]:
+        return jsonify({'error': 'Intervalle invalide ou trop long pour cette granularité'}), 400
+    
+    series = rollups.usage_series(
+        db.session.connection(), UsageRollup.__table__, 'dataset', dataset.id, granularity, start, end
+    )
+    response = jsonify({
+        'dataset_id': dataset.id,
+        'granularity': granularity,
+        'from': start.isoformat(),
+        'to': (end - step).isoformat(),
+        'series': [dict(point, period=point['period'].isoformat()) for point in series],
+        'totals': {kind: sum(point[kind] for point in series) for kind in rollups.KINDS},
+    })
+    response.cache_control.private = True
+    response.cache_control.max_age = 60
+    return response
+
+@views.route('/api/datasets/<int:dataset_id>/preview')
+def api_dataset_preview(dataset_id):
+    """API d'aperçu : lignes ``offset .. offset + limit`` du fichier, en JSON"""
+    dataset = Dataset.query.get_or_404(dataset_id)
+    if not user_can_download(dataset):
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    offset = request.args.get('offset', 0, type=int)
+    limit = request.args.get('limit', current_app.config['PREVIEW_DEFAULT_LIMIT'], type=int)
+    if offset < 0 or limit < 1:
+        return jsonify({'error': 'Paramètres offset/limit invalides'}), 400
+    limit = min(limit, current_app.config['PREVIEW_MAX_LIMIT'])
+    if not os.path.exists(dataset.file_path):
+        return jsonify({'error': 'Fichier non trouvé'}), 404
+    
+    # Les pages sont identifiées par le contenu du fichier : elles ne changent jamais
+    version = dataset.file_hash or f'{dataset.id}-{os.path.getmtime(dataset.file_path)}'
+    cache_key = (version, offset, limit)
+    # Chargé une fois par processus : une page en cache ne relit rien sur disque
+    index = preview_indexes.get(dataset.file_hash)
+    
+    page = preview_cache.get(cache_key)
+    if page is None:
+        try:
+            with io_timer():
+                page = preview.read_rows(dataset.file_path, dataset.file_format, offset, limit, index=index)
+        except profiling.UnsupportedFormat as exc:
+            return jsonify({'error': str(exc)}), 415
+        preview_cache.set(cache_key, page)
+    columns, rows = page
+    
+    total = index.total if index is not None else dataset.row_count
+    has_more = offset + len(rows) < total if total is not None else len(rows) == limit
+    response = jsonify({
+        'dataset_id': dataset.id,
+        'columns': columns,
+        'rows': rows,
+        'offset': offset,
+        'limit': limit,
+        'total': total,
+        'next_offset': offset + len(rows) if has_more else None
+    })
+    response.set_etag(f'{version}-{offset}-{limit}-{total}')
+    response.cache_control.private = True
+    response.cache_control.max_age = 300
+    return response.make_conditional(request)
+
+def get_file_extension(filename):
+    """Extension en minuscules d'un nom de fichier ('' si absente)"""
+    return filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+
+def missing_dataset_fields(form, has_file):
+    """Libellés des champs obligatoires absents du formulaire d'upload"""
+    required_fields = {
+        'title': 'Titre',
+        'description': 'Description',
+        'source': 'Source',
+        'documentation': 'Documentation',
+        'domain_id': 'Domaine',
+    }
+    missing_fields = [label for field, label in required_fields.items() if not form.get(field)]
+    if not has_file:
+        missing_fields.append('Fichier')
+    return missing_fields
+
+def create_dataset(form, filename, stored):
+    """Créer une base de données en attente de validation à partir du formulaire
+    et du fichier déjà rangé dans le stockage par contenu"""
+    # Récupération des données du formulaire
+    source = form.get('source', '')
+    methodology = form.get('methodology', '')
+    geographic_scope = form.get('geographic_scope', '')
+    time_period = form.get('time_period', '')
+    documentation = form.get('documentation', '')
+    
+    # Créer la documentation enrichie
+    enriched_documentation = f"""
 CONTEXTE ET MÉTHODOLOGIE
 
 Source des données : {source}
@@ -306,31 +728,64 @@ DOCUMENTATION DÉTAILLÉE
 
 INFORMATIONS TECHNIQUES
 - Format du fichier : {filename.split('.')[-1].upper()}
-- Taille du fichier : {os.path.getsize(file_path) / (1024*1024):.2f} MB
+- Taille du fichier : {stored.size / (1024*1024):.2f} MB
 - Soumis par : {current_user.username} ({current_user.organization or 'Non spécifiée'})
 - Date de soumission : {datetime.now().strftime('%d/%m/%Y à %H:%M')}
 """
+    
+    # Créer la base de données
+    dataset = Dataset(
+        title=form.get('title'),
+        description=form.get('description'),
+        short_description=form.get('short_description', ''),
+        source=source,
+        author=current_user.username,
+        domain_id=form.get('domain_id'),
+        keywords=form.get('keywords', ''),
+        documentation=enriched_documentation,
+        file_path=stored.path,
+        file_format=get_file_extension(filename),
+        file_size=stored.size,
+        file_hash=stored.digest,
+        user_id=current_user.id,
+        status='pending',  # Nouveau système de statuts
+        is_validated=False  # Gardé pour compatibilité
+    )
+    
+    register_blob(stored)
+    db.session.add(dataset)
+    db.session.flush()
+    search_index.index_dataset(db.session, dataset)
+    db.session.commit()
+    invalidate_catalogue_cache()
+    invalidate_dashboard(current_user.id)
+    
+    # Le fichier est sur disque : le reste est fait par les workers
+    enqueue_dataset_processing(dataset)
+    return dataset
+
+@views.route('/upload', methods=['GET', 'POST'])
+@login_required
+def dataset_upload():
+    """Upload d'une nouvelle base de données"""
+    if request.method == 'POST':
+        file = request.files.get('file')
         
-        # Créer la base de données
-        dataset = Dataset(
-            title=title,
-            description=description,
-            short_description=short_description,
-            source=source,
-            author=current_user.username,
-            domain_id=domain_id,
-            keywords=keywords,
-            documentation=enriched_documentation,
-            file_path=file_path,
-            file_format=filename.split('.')[-1].lower(),
-            file_size=os.path.getsize(file_path),
-            user_id=current_user.id,
-            status='pending',  # Nouveau système de statuts
-            is_validated=False  # Gardé pour compatibilité
-        )
+        # Validation des champs obligatoires
+        missing_fields = missing_dataset_fields(request.form, file and file.filename != '')
+        if missing_fields:
+            flash(f'Champs obligatoires manquants : {", ".join(missing_fields)}', 'error')
+            return render_template('dataset_upload.html', domains=Domain.query.all())
         
-        db.session.add(dataset)
-        db.session.commit()
+        # Validation du fichier
+        if get_file_extension(file.filename) not in current_app.config['ALLOWED_EXTENSIONS']:
+            flash('Type de fichier non autorisé. Formats acceptés : CSV, Excel, JSON, XML, SQL, ZIP', 'error')
+            return render_template('dataset_upload.html', domains=Domain.query.all())
+        
+        # Conserver le fichier sous son empreinte (déjà calculée pendant la réception)
+        filename = secure_filename(file.filename)
+        stored = blob_store.store(file.stream)
+        create_dataset(request.form, filename, stored)
         
         flash('Base de données soumise avec succès! Elle sera validée par nos administrateurs.', 'success')
         return redirect(url_for('dashboard'))
@@ -338,7 +793,154 @@ INFORMATIONS TECHNIQUES
     domains = Domain.query.all()
     return render_template('dataset_upload.html', domains=domains)
 
-@app.route('/register', methods=['GET', 'POST'])
+# Upload par morceaux (gros fichiers, reprise après coupure)
+def get_upload_session(upload_id):
+    """Session d'upload de l'utilisateur courant, ou 404"""
+    upload = db.session.get(UploadSession, upload_id)
+    if upload is None or upload.user_id != current_user.id:
+        abort(404)
+    return upload
+
+def purge_expired_uploads(user_id=None):
+    """Abandonner les sessions ouvertes sans morceau reçu depuis ``UPLOAD_SESSION_TTL``
+
+    La session passe à ``failed`` et son fichier partiel est supprimé.
+    Retourne le nombre de sessions abandonnées.
+    """
+    ttl = current_app.config['UPLOAD_SESSION_TTL']
+    limit = datetime.utcnow() - timedelta(seconds=ttl)
+    query = UploadSession.query.filter(UploadSession.status == 'open', UploadSession.created_at < limit)
+    if user_id is not None:
+        query = query.filter(UploadSession.user_id == user_id)
+    purged = 0
+    for upload in query:
+        # Un gros fichier peut dépasser le délai : seul le dernier morceau compte
+        activity = chunked_upload.last_activity(blob_store.tmp_dir, upload.id)
+        if activity is not None and time.time() - activity < ttl:
+            continue
+        chunked_upload.discard(blob_store.tmp_dir, upload.id)
+        upload.status = 'failed'
+        purged += 1
+    db.session.commit()
+    return purged
+
+def upload_session_json(upload):
+    return {
+        'upload_id': upload.id,
+        'filename': upload.filename,
+        'size': upload.total_size,
+        'offset': chunked_upload.received_size(blob_store.tmp_dir, upload.id),
+        'chunk_size': current_app.config['UPLOAD_CHUNK_SIZE'],
+        'status': upload.status
+    }
+
+@views.route('/api/uploads', methods=['POST'])
+@login_required
+def api_upload_init():
+    """Ouvrir une session d'upload par morceaux"""
+    data = request.get_json(silent=True) or {}
+    filename = secure_filename(data.get('filename') or '')
+    size = data.get('size')
+    
+    if not filename or get_file_extension(filename) not in current_app.config['ALLOWED_EXTENSIONS']:
+        return jsonify({'error': 'Type de fichier non autorisé'}), 400
+    if not isinstance(size, int) or size <= 0 or size > current_app.config['UPLOAD_MAX_TOTAL_SIZE']:
+        return jsonify({'error': 'Taille de fichier invalide'}), 400
+    
+    purge_expired_uploads(current_user.id)
+    open_sessions = UploadSession.query.filter_by(user_id=current_user.id, status='open').count()
+    if open_sessions >= current_app.config['UPLOAD_MAX_OPEN_SESSIONS']:
+        return jsonify({'error': 'Trop d\'uploads en cours : terminez-en ou abandonnez-en un'}), 429
+    
+    upload = UploadSession(
+        id=uuid.uuid4().hex,
+        user_id=current_user.id,
+        filename=filename,
+        total_size=size,
+        sha256=(data.get('sha256') or '').lower() or None
+    )
+    db.session.add(upload)
+    db.session.commit()
+    chunked_upload.create_part(blob_store.tmp_dir, upload.id)
+    
+    return jsonify(upload_session_json(upload)), 201
+
+@views.route('/api/uploads/<upload_id>', methods=['GET'])
+@login_required
+def api_upload_status(upload_id):
+    """État d'une session (position à partir de laquelle reprendre)"""
+    return jsonify(upload_session_json(get_upload_session(upload_id)))
+
+@views.route('/api/uploads/<upload_id>', methods=['PUT'])
+@login_required
+def api_upload_chunk(upload_id):
+    """Recevoir un morceau à la position ?offset="""
+    upload = get_upload_session(upload_id)
+    if upload.status != 'open':
+        return jsonify({'error': 'Session terminée'}), 409
+    
+    offset = request.args.get('offset', type=int)
+    if offset is None:
+        return jsonify({'error': 'Paramètre offset manquant'}), 400
+    
+    try:
+        received = chunked_upload.append_chunk(
+            blob_store.tmp_dir, upload.id, offset, request.stream,
+            request.headers.get('X-Chunk-Sha256'), upload.total_size
+        )
+    except chunked_upload.ChunkError as e:
+        payload = upload_session_json(upload)
+        payload['error'] = str(e)
+        return jsonify(payload), 409
+    
+    return jsonify({'upload_id': upload.id, 'offset': received, 'size': upload.total_size})
+
+@views.route('/api/uploads/<upload_id>/complete', methods=['POST'])
+@login_required
+def api_upload_complete(upload_id):
+    """Finaliser l'upload : vérifier le fichier et créer la base de données"""
+    upload = get_upload_session(upload_id)
+    if upload.status != 'open':
+        return jsonify({'error': 'Session terminée'}), 409
+    
+    received = chunked_upload.received_size(blob_store.tmp_dir, upload.id)
+    if received != upload.total_size:
+        return jsonify({'error': 'Fichier incomplet', 'offset': received, 'size': upload.total_size}), 409
+    
+    missing_fields = missing_dataset_fields(request.form, True)
+    if missing_fields:
+        return jsonify({'error': f'Champs obligatoires manquants : {", ".join(missing_fields)}'}), 400
+    
+    digest = chunked_upload.file_digest(blob_store.tmp_dir, upload.id)
+    if upload.sha256 and digest != upload.sha256:
+        chunked_upload.discard(blob_store.tmp_dir, upload.id)
+        upload.status = 'failed'
+        db.session.commit()
+        return jsonify({'error': 'Empreinte du fichier incorrecte'}), 422
+    
+    stored = blob_store.adopt_file(chunked_upload.part_path(blob_store.tmp_dir, upload.id), digest)
+    chunked_upload.forget(upload.id)
+    upload.status = 'complete'
+    dataset = create_dataset(request.form, upload.filename, stored)
+    
+    flash('Base de données soumise avec succès! Elle sera validée par nos administrateurs.', 'success')
+    return jsonify({
+        'dataset_id': dataset.id,
+        'url': url_for('dataset_detail', dataset_id=dataset.id),
+        'redirect': url_for('dashboard')
+    }), 201
+
+@views.route('/api/uploads/<upload_id>', methods=['DELETE'])
+@login_required
+def api_upload_abort(upload_id):
+    """Abandonner une session d'upload"""
+    upload = get_upload_session(upload_id)
+    chunked_upload.discard(blob_store.tmp_dir, upload.id)
+    db.session.delete(upload)
+    db.session.commit()
+    return '', 204
+
+@views.route('/register', methods=['GET', 'POST'])
 def register():
     """Inscription utilisateur"""
     if request.method == 'POST':
@@ -371,13 +973,14 @@ def register():
         
         db.session.add(user)
         db.session.commit()
+        invalidate_catalogue_cache()
         
         flash('Compte créé avec succès! Vous pouvez maintenant vous connecter.', 'success')
         return redirect(url_for('login'))
     
     return render_template('register.html')
 
-@app.route('/login', methods=['GET', 'POST'])
+@views.route('/login', methods=['GET', 'POST'])
 def login():
     """Connexion utilisateur"""
     if request.method == 'POST':
@@ -394,7 +997,7 @@ def login():
     
     return render_template('login.html')
 
-@app.route('/logout')
+@views.route('/logout')
 @login_required
 def logout():
     """Déconnexion"""
@@ -402,56 +1005,175 @@ def logout():
     flash('Vous avez été déconnecté.', 'info')
     return redirect(url_for('home'))
 
-@app.route('/dashboard')
+def dashboard_user_stats(user_id):
+    """Statistiques d'un contributeur en une seule requête (agrégats conditionnels)"""
+    def count_status(status):
+        return db.func.coalesce(db.func.sum(db.case((Dataset.status == status, 1), else_=0)), 0)
+    
+    downloads = db.select(db.func.coalesce(db.func.sum(UsageRollup.downloads), 0)).where(
+        UsageRollup.scope == 'user', UsageRollup.scope_id == user_id, UsageRollup.granularity == 'day'
+    ).scalar_subquery()
+    row = db.session.query(
+        db.func.count(Dataset.id),
+        count_status('validated'),
+        count_status('pending'),
+        count_status('rejected'),
+        downloads,
+        db.func.sum(Dataset.rating_sum),
+        db.func.sum(Dataset.rating_count),
+    ).filter(Dataset.user_id == user_id).one()
+    total, validated, pending, rejected, total_downloads, rating_sum, rating_count = row
+    return {
+        'total_datasets': total,
+        'validated_datasets': validated,
+        'pending_datasets': pending,
+        'rejected_datasets': rejected,
+        'total_downloads': total_downloads,
+        'average_rating': rating_sum / rating_count if rating_count else 0.0
+    }
+
+def dashboard_data(user_id, is_admin):
+    """Contenu du tableau de bord d'un utilisateur (lignes simples, mises en cache)"""
+    # Bases de données de l'utilisateur (domaine joint : pas de requête par ligne)
+    user_datasets = db.session.query(
+        Dataset.id, Dataset.title, Dataset.status, Dataset.creation_date, Dataset.download_count,
+        Domain.name.label('domain_name')
+    ).join(Domain).filter(Dataset.user_id == user_id).order_by(Dataset.creation_date.desc()).all()
+    
+    # Traitements en arrière-plan (tous pour les admins, sinon ceux de l'utilisateur)
+    jobs_query = db.session.query(Job).join(Dataset, Job.dataset_id == Dataset.id)
+    if not is_admin:
+        jobs_query = jobs_query.filter(Dataset.user_id == user_id)
+    recent_jobs = jobs_query.with_entities(
+        Job.dataset_id, Job.name, Job.status, Job.attempts, Job.max_attempts, Job.last_error, Job.created_at,
+        Dataset.title.label('dataset_title')
+    ).order_by(Job.id.desc()).limit(10).all()
+    job_counts = dict(
+        jobs_query.with_entities(Job.status, db.func.count(Job.id)).group_by(Job.status).all()
+    )
+    
+    return {
+        'user_stats': dashboard_user_stats(user_id),
+        'user_datasets': user_datasets,
+        'recent_jobs': recent_jobs,
+        'job_counts': job_counts
+    }
+
+def invalidate_dashboard(user_id):
+    """Oublier le tableau de bord en cache d'un utilisateur"""
+    cache.delete(f'dashboard:{user_id}')
+
+@views.route('/dashboard')
 @login_required
+@query_budget(10)
 def dashboard():
     """Tableau de bord utilisateur"""
-    # Statistiques utilisateur
-    user_stats = {
-        'total_datasets': Dataset.query.filter_by(user_id=current_user.id).count(),
-        'validated_datasets': Dataset.query.filter_by(user_id=current_user.id, status='validated').count(),
-        'pending_datasets': Dataset.query.filter_by(user_id=current_user.id, status='pending').count(),
-        'rejected_datasets': Dataset.query.filter_by(user_id=current_user.id, status='rejected').count(),
-        'total_downloads': DownloadLog.query.join(Dataset).filter(Dataset.user_id == current_user.id).count(),
-        'average_rating': db.session.query(db.func.avg(Comment.rating)).filter(
-            Comment.dataset_id.in_(
-                db.session.query(Dataset.id).filter_by(user_id=current_user.id)
-            )
-        ).scalar() or 0
-    }
+    is_admin = current_user.role == 'admin'
+    data = cache.get_or_set(
+        f'dashboard:{current_user.id}',
+        lambda: dashboard_data(current_user.id, is_admin),
+        ttl=current_app.config['DASHBOARD_CACHE_TTL']
+    )
     
-    # Bases de données de l'utilisateur
-    user_datasets = Dataset.query.filter_by(user_id=current_user.id).order_by(Dataset.creation_date.desc()).all()
-    
-    # Pour les admins
-    pending_datasets = []
-    rejected_datasets = []
-    validated_datasets = []
-    top_datasets = []
-    if current_user.role == 'admin':
-        # Datasets en attente de validation
-        pending_datasets = Dataset.query.filter_by(status='pending').order_by(Dataset.creation_date.desc()).all()
-        # Datasets rejetés
-        rejected_datasets = Dataset.query.filter_by(status='rejected').order_by(Dataset.creation_date.desc()).all()
-        # Datasets validés récents
-        validated_datasets = Dataset.query.filter_by(status='validated').order_by(Dataset.creation_date.desc()).limit(10).all()
-        # Top datasets par téléchargements
-        top_datasets = Dataset.query.filter_by(status='validated').order_by(Dataset.download_count.desc()).limit(10).all()
-    
-    return render_template('dashboard.html', 
-                         user_stats=user_stats,
-                         user_datasets=user_datasets,
-                         pending_datasets=pending_datasets,
-                         rejected_datasets=rejected_datasets,
-                         validated_datasets=validated_datasets,
-                         top_datasets=top_datasets)
-
-@app.route('/add_comment/<int:dataset_id>', methods=['POST'])
+    # Pour les admins : compteurs par statut ; les listes sont chargées à la demande (api_admin_datasets)
+    catalogue = None
+    if is_admin:
+        catalogue = cache.get_or_set('api:stats', catalogue_stats, ttl=current_app.config['STATS_CACHE_DURATION'])
+    
+    return render_template('dashboard.html', catalogue=catalogue, **data)
+
+ADMIN_LIST_ORDERS = {
+    'recent': (Dataset.creation_date.desc(), Dataset.id.desc()),
+    'downloads': (Dataset.download_count.desc(), Dataset.id.desc()),
+}
+
+@views.route('/api/admin/datasets')
+@login_required
+def api_admin_datasets():
+    """Listes paginées du tableau de bord admin (en attente, rejetées, validées)"""
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    status = request.args.get('status', 'pending')
+    sort = request.args.get('sort', 'recent')
+    if status not in ('pending', 'validated', 'rejected') or sort not in ADMIN_LIST_ORDERS:
+        return jsonify({'error': 'Paramètres invalides'}), 400
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', current_app.config['ADMIN_LIST_PER_PAGE'], type=int), 1), 100)
+    
+    query = db.session.query(
+        Dataset.id, Dataset.title, Dataset.author, Dataset.creation_date, Dataset.rejection_reason,
+        Dataset.download_count, Dataset.rating, Domain.name.label('domain_name')
+    ).join(Domain).filter(Dataset.status == status).order_by(*ADMIN_LIST_ORDERS[sort])
+    rows = query.offset((page - 1) * per_page).limit(per_page + 1).all()
+    
+    return jsonify({
+        'status': status,
+        'page': page,
+        'per_page': per_page,
+        'has_next': len(rows) > per_page,
+        'items': [{
+            'id': row.id,
+            'title': row.title,
+            'author': row.author,
+            'domain': row.domain_name,
+            'creation_date': row.creation_date.strftime('%d/%m/%Y') if row.creation_date else None,
+            'rejection_reason': row.rejection_reason,
+            'download_count': counter_buffer.live_count(row, 'download_count'),
+            'rating': round(row.rating or 0, 1),
+            'detail_url': url_for('dataset_detail', dataset_id=row.id),
+            'validation_url': url_for('dataset_validation_detail', dataset_id=row.id)
+        } for row in rows[:per_page]]
+    })
+
+def valid_rating(value):
+    """Note retenue pour l'agrégat (1 à 5) ; 0 ou absente = pas de note"""
+    return value if value is not None and 1 <= value <= 5 else None
+
+def apply_rating(dataset_id, rating, sign=1):
+    """Répercuter une note ajoutée (sign=1) ou retirée (sign=-1) sur l'agrégat du dataset
+
+    La mise à jour est faite en SQL (pas de lecture préalable) et n'est pas
+    validée : elle est commitée avec le commentaire.
+    """
+    if rating is None:
+        return
+    new_sum = db.func.coalesce(Dataset.rating_sum, 0) + sign * rating
+    new_count = db.func.coalesce(Dataset.rating_count, 0) + sign
+    db.session.query(Dataset).filter(Dataset.id == dataset_id).update({
+        Dataset.rating_sum: new_sum,
+        Dataset.rating_count: new_count,
+        Dataset.rating: db.case((new_count > 0, db.cast(new_sum, db.Float) / new_count), else_=0.0),
+    }, synchronize_session=False)
+
+def backfill_ratings():
+    """Recalculer les agrégats de notes de tous les datasets à partir des commentaires"""
+    totals = dict(
+        (dataset_id, (rating_sum, rating_count))
+        for dataset_id, rating_sum, rating_count in db.session.query(
+            Comment.dataset_id, db.func.sum(Comment.rating), db.func.count(Comment.id)
+        ).filter(Comment.rating.between(1, 5)).group_by(Comment.dataset_id)
+    )
+    rows = []
+    for (dataset_id,) in db.session.query(Dataset.id):
+        rating_sum, rating_count = totals.get(dataset_id, (0, 0))
+        rows.append({
+            'id': dataset_id,
+            'rating_sum': rating_sum,
+            'rating_count': rating_count,
+            'rating': rating_sum / rating_count if rating_count else 0.0,
+        })
+    if rows:
+        db.session.execute(db.update(Dataset), rows)
+    db.session.commit()
+    return len(rows)
+
+@views.route('/add_comment/<int:dataset_id>', methods=['POST'])
 @login_required
 def add_comment(dataset_id):
     """Ajouter un commentaire"""
     dataset = Dataset.query.get_or_404(dataset_id)
-    rating = request.form.get('rating', type=int)
+    rating = valid_rating(request.form.get('rating', type=int))
     comment_text = request.form.get('comment_text', '').strip()
     
     if not comment_text:
@@ -459,19 +1181,39 @@ def add_comment(dataset_id):
         return redirect(url_for('dataset_detail', dataset_id=dataset_id))
     
     comment = Comment(
-        dataset_id=dataset_id,
+        dataset_id=dataset.id,
         user_id=current_user.id,
         text=comment_text,
         rating=rating
     )
     
+    # Commentaire et agrégat de notes dans la même transaction
     db.session.add(comment)
+    apply_rating(dataset.id, rating)
     db.session.commit()
     
     flash('Commentaire ajouté avec succès !', 'success')
     return redirect(url_for('dataset_detail', dataset_id=dataset_id))
 
-@app.route('/admin/validate_dataset/<int:dataset_id>', methods=['POST'])
+@views.route('/delete_comment/<int:comment_id>', methods=['POST'])
+@login_required
+def delete_comment(comment_id):
+    """Supprimer un commentaire (son auteur ou un admin)"""
+    comment = Comment.query.get_or_404(comment_id)
+    dataset_id = comment.dataset_id
+    
+    if current_user.role != 'admin' and current_user.id != comment.user_id:
+        flash('Vous ne pouvez supprimer que vos propres commentaires.', 'warning')
+        return redirect(url_for('dataset_detail', dataset_id=dataset_id))
+    
+    apply_rating(dataset_id, valid_rating(comment.rating), sign=-1)
+    db.session.delete(comment)
+    db.session.commit()
+    
+    flash('Commentaire supprimé.', 'success')
+    return redirect(url_for('dataset_detail', dataset_id=dataset_id))
+
+@views.route('/admin/validate_dataset/<int:dataset_id>', methods=['POST'])
 @login_required
 def validate_dataset(dataset_id):
     """Valider une base de données (admin seulement)"""
@@ -485,13 +1227,18 @@ def validate_dataset(dataset_id):
     dataset.status = 'validated'
     dataset.is_validated = True
     dataset.rejection_reason = None  # Effacer toute raison de rejet précédente
+    search_index.index_dataset(db.session, dataset)
     
     db.session.commit()
+    invalidate_catalogue_cache()
+    invalidate_dashboard(dataset.user_id)
+    update_suggestions(dataset)
+    job_queue.enqueue('refresh_similar', dataset_id=dataset.id)
     
     flash(f'Base de données "{dataset.title}" validée avec succès !', 'success')
     return redirect(url_for('dashboard'))
 
-@app.route('/admin/reject_dataset/<int:dataset_id>', methods=['POST'])
+@views.route('/admin/reject_dataset/<int:dataset_id>', methods=['POST'])
 @login_required
 def reject_dataset(dataset_id):
     """Rejeter une base de données avec commentaire (admin seulement)"""
@@ -510,13 +1257,19 @@ def reject_dataset(dataset_id):
     dataset.status = 'rejected'
     dataset.is_validated = False
     dataset.rejection_reason = rejection_reason
+    # Seuls les datasets validés sont recherchés ; la validation les réindexe
+    search_index.remove_dataset(db.session, dataset.id)
     
     db.session.commit()
+    invalidate_catalogue_cache()
+    invalidate_dashboard(dataset.user_id)
+    update_suggestions(dataset)
+    job_queue.enqueue('refresh_similar', dataset_id=dataset.id)
     
     flash(f'Base de données "{dataset.title}" rejetée avec succès.', 'warning')
     return redirect(url_for('dashboard'))
 
-@app.route('/admin/dataset_validation/<int:dataset_id>')
+@views.route('/admin/dataset_validation/<int:dataset_id>')
 @login_required
 def dataset_validation_detail(dataset_id):
     """Page de détail pour la validation d'une base de données (admin seulement)"""
@@ -524,10 +1277,10 @@ def dataset_validation_detail(dataset_id):
         flash('Accès non autorisé.', 'danger')
         return redirect(url_for('dashboard'))
     
-    dataset = Dataset.query.get_or_404(dataset_id)
+    dataset = with_profile(Dataset.query, 'dataset_card').get_or_404(dataset_id)
     return render_template('admin/dataset_validation.html', dataset=dataset)
 
-@app.route('/update_profile', methods=['POST'])
+@views.route('/update_profile', methods=['POST'])
 @login_required
 def update_profile():
     """Mettre à jour le profil utilisateur"""
@@ -604,21 +1357,59 @@ def update_profile():
     flash('Profil mis à jour avec succès !', 'success')
     return redirect(url_for('dashboard'))
 
+def suggest_rows(flask_app=None):
+    """Datasets validés avec le nom de leur domaine, pour l'index des suggestions"""
+    # Contexte propre : la reconstruction peut tourner dans un thread
+    with (flask_app or current_app._get_current_object()).app_context():
+        return db.session.query(
+            Dataset.id, Dataset.title, Dataset.keywords, Dataset.author, Dataset.domain_id,
+            Domain.name.label('domain_name'), Dataset.download_count
+        ).outerjoin(Domain, Domain.id == Dataset.domain_id).filter(Dataset.status == 'validated').all()
+
+def update_suggestions(dataset):
+    """Répercuter la validation ou le rejet d'un dataset dans l'index des suggestions"""
+    if dataset.status != 'validated':
+        suggest_index.remove_dataset(dataset.id)
+        return
+    suggest_index.add_dataset(SimpleNamespace(
+        id=dataset.id, title=dataset.title, keywords=dataset.keywords, author=dataset.author,
+        domain_id=dataset.domain_id, domain_name=dataset.domain.name if dataset.domain else None,
+        download_count=dataset.download_count
+    ))
+
 # API Routes
-@app.route('/api/search')
+@views.route('/api/suggest')
+@query_budget(1)
+def api_suggest():
+    """Complétions de la recherche au fil de la frappe (sans requête SQL, sauf au premier appel)"""
+    q = request.args.get('q', '')[:100]
+    flask_app = current_app._get_current_object()
+    suggest_index.ensure_fresh(lambda: suggest_rows(flask_app))
+    
+    suggestions = []
+    for entry in suggest_index.suggest(q, request.args.get('limit', type=int)):
+        if entry['kind'] == 'dataset':
+            url = url_for('dataset_detail', dataset_id=entry['target'])
+        elif entry['kind'] == 'domain':
+            url = url_for('dataset_list', domain=entry['target'])
+        else:
+            url = url_for('dataset_list', q=entry['target'])
+        suggestions.append({'kind': entry['kind'], 'label': entry['label'], 'count': entry['count'], 'url': url})
+    
+    response = jsonify({'q': q, 'suggestions': suggestions})
+    response.cache_control.public = True
+    response.cache_control.max_age = 60
+    return response
+
+@views.route('/api/search')
 def api_search():
     """API de recherche"""
     q = request.args.get('q', '')
     if not q:
         return jsonify({'results': []})
     
-    datasets = Dataset.query.filter(
-        Dataset.status == 'validated',
-        db.or_(
-            Dataset.title.contains(q),
-            Dataset.description.contains(q)
-        )
-    ).limit(10).all()
+    query = Dataset.query.filter(Dataset.status == 'validated')
+    datasets = search_index.apply_search(query, Dataset, db.session, q).limit(10).all()
     
     results = []
     for dataset in datasets:
@@ -626,85 +1417,311 @@ def api_search():
             'id': dataset.id,
             'title': dataset.title,
             'description': dataset.short_description or dataset.description[:100],
+            'rating': round(dataset.rating or 0, 2),
+            'rating_count': dataset.rating_count or 0,
             'url': url_for('dataset_detail', dataset_id=dataset.id)
         })
     
     return jsonify({'results': results})
 
-@app.route('/api/stats')
+@views.route('/api/stats')
 def api_stats():
     """API des statistiques"""
     if not current_user.is_authenticated or current_user.role != 'admin':
         return jsonify({'error': 'Unauthorized'}), 403
     
-    stats = {
-        'total_datasets': Dataset.query.count(),
-        'validated_datasets': Dataset.query.filter_by(status='validated').count(),
-        'pending_datasets': Dataset.query.filter_by(status='pending').count(),
-        'rejected_datasets': Dataset.query.filter_by(status='rejected').count(),
+    return jsonify(cache.get_or_set('api:stats', catalogue_stats, ttl=current_app.config['STATS_CACHE_DURATION']))
+
+@views.route('/metrics')
+def metrics():
+    """Métriques des vues au format Prometheus (INSTRUMENTATION_ENABLED)"""
+    if not current_app.config['INSTRUMENTATION_ENABLED']:
+        abort(404)
+    token = current_app.config['METRICS_TOKEN']
+    if token:
+        if request.headers.get('Authorization') != f'Bearer {token}':
+            abort(403)
+    elif request.remote_addr not in ('127.0.0.1', '::1'):
+        abort(403)
+    return current_app.extensions['instrumentation'].metrics.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+def catalogue_stats():
+    """Nombre de bases par statut et nombre d'utilisateurs (une requête groupée)"""
+    by_status = dict(db.session.query(Dataset.status, db.func.count(Dataset.id)).group_by(Dataset.status).all())
+    return {
+        'total_datasets': sum(by_status.values()),
+        'validated_datasets': by_status.get('validated', 0),
+        'pending_datasets': by_status.get('pending', 0),
+        'rejected_datasets': by_status.get('rejected', 0),
         'total_users': User.query.count()
     }
-    
-    return jsonify(stats)
 
 def migrate_existing_datasets():
     """Migrer les datasets existants vers le nouveau système de statuts"""
-    with app.app_context():
-        # Mettre à jour les datasets existants
-        datasets = Dataset.query.all()
-        for dataset in datasets:
-            if dataset.status is None:
-                # Si le statut n'est pas défini, utiliser is_validated
-                if dataset.is_validated:
-                    dataset.status = 'validated'
-                else:
-                    dataset.status = 'pending'
-        
+    # Une seule requête sur les lignes sans statut, sans charger le catalogue
+    result = db.session.execute(
+        db.update(Dataset).where(Dataset.status.is_(None)).values(
+            status=db.case((Dataset.is_validated.is_(True), 'validated'), else_='pending')
+        )
+    )
+    db.session.commit()
+    print(f"✅ Migration des datasets terminée ({result.rowcount} dataset(s))")
+
+def migrate_uploads_to_blobs():
+    """Ranger les fichiers déjà uploadés dans le stockage par contenu"""
+    moved = 0
+    for dataset in Dataset.query.all():
+        path = dataset.file_path
+        if not path or not os.path.exists(path):
+            continue
+        if os.path.abspath(path).startswith(os.path.abspath(blob_store.root) + os.sep):
+            continue
+        stored = blob_store.import_file(path)
+        register_blob(stored)
+        dataset.file_path = stored.path
+        dataset.file_hash = stored.digest
+        dataset.file_size = stored.size
+        moved += 1
+    db.session.commit()
+    print(f"✅ {moved} fichier(s) rangé(s) dans {blob_store.root}")
+
+@views.command('migrate-blobs')
+def migrate_blobs_command():
+    """Ranger les fichiers existants dans le stockage par contenu"""
+    migrate_uploads_to_blobs()
+
+@views.command('cleanup-uploads')
+def cleanup_uploads_command():
+    """Abandonner les uploads par morceaux inactifs et supprimer leurs fichiers partiels"""
+    print(f"✅ {purge_expired_uploads()} session(s) d'upload abandonnée(s)")
+
+@views.command('profile-datasets')
+def profile_datasets_command():
+    """Programmer le profilage des datasets qui n'ont pas encore de profil"""
+    datasets = Dataset.query.filter(Dataset.profile_status.is_(None)).all()
+    for dataset in datasets:
+        enqueue_dataset_processing(dataset)
+    print(f"✅ {len(datasets)} dataset(s) ajouté(s) à la file (voir `flask run-workers`)")
+
+@views.command('rebuild-similar')
+def rebuild_similar_command():
+    """Recalculer les bases similaires de tous les datasets validés"""
+    count = rebuild_similar()
+    print(f"✅ Bases similaires recalculées pour {count} dataset(s)")
+
+@views.command('backfill-ratings')
+def backfill_ratings_command():
+    """Recalculer les notes moyennes stockées à partir des commentaires"""
+    print(f"✅ Notes recalculées pour {backfill_ratings()} dataset(s)")
+
+def migrate_download_log(batch_size=5000):
+    """Verser l'ancienne table DownloadLog dans le journal partitionné et les agrégats"""
+    moved = 0
+    while True:
+        logs = DownloadLog.query.order_by(DownloadLog.id).limit(batch_size).all()
+        if not logs:
+            break
+        download_log.write([
+            DownloadEvent(log.dataset_id, log.user_id, log.ip_address, log.user_agent or '',
+                          log.downloaded_at or datetime.utcnow())
+            for log in logs
+        ])
+        download_log.flush()
+        DownloadLog.query.filter(DownloadLog.id <= logs[-1].id).delete(synchronize_session=False)
         db.session.commit()
-        print("✅ Migration des datasets terminée!")
+        moved += len(logs)
+    return moved
+
+@views.command('migrate-download-log')
+def migrate_download_log_command():
+    """Déplacer les téléchargements enregistrés dans DownloadLog vers le journal partitionné"""
+    print(f"✅ {migrate_download_log()} téléchargement(s) versé(s) dans {download_log.partitions.folder}")
+
+@views.command('compact-download-log')
+def compact_download_log_command():
+    """Regrouper par mois les anciennes partitions du journal des téléchargements"""
+    today = datetime.utcnow().date()
+    retention = current_app.config['DOWNLOAD_LOG_RETENTION_DAYS']
+    merged, dropped = download_log.partitions.compact(
+        today - timedelta(days=current_app.config['DOWNLOAD_LOG_COMPACT_AFTER_DAYS']),
+        drop_before=today - timedelta(days=retention) if retention else None
+    )
+    print(f"✅ {merged} jour(s) regroupé(s), {dropped} mois supprimé(s)")
+    pruned = usage_rollups.prune('hour', datetime.utcnow() - timedelta(days=current_app.config['USAGE_HOURLY_RETENTION_DAYS']))
+    print(f"✅ {pruned} agrégat(s) horaire(s) ancien(s) supprimé(s)")
+
+@views.command('run-workers')
+@click.option('--threads', default=2, show_default=True, help='Workers par processus')
+@click.option('--processes', default=1, show_default=True, help='Nombre de processus')
+@click.option('--once', is_flag=True, help='Vider la file puis quitter')
+def run_workers_command(threads, processes, once):
+    """Exécuter les tâches de fond (à lancer à côté du serveur web)"""
+    if once:
+        print(f"✅ {job_queue.run_pending()} tâche(s) exécutée(s)")
+        return
+    print(f"🚀 {processes} processus x {threads} worker(s), Ctrl+C pour arrêter")
+    job_queue.run_workers(threads=threads, processes=processes)
+
+# Pages rejouées par le conseiller d'index ({dataset} : premier dataset validé)
+INDEX_ADVISOR_URLS = (
+    '/',
+    '/datasets',
+    '/datasets?sort=downloads',
+    '/datasets?sort=rating',
+    '/datasets?domain={domain}',
+    '/datasets?file_format=csv',
+    '/datasets/{dataset}',
+    '/dashboard',
+    '/api/search?q=donnees',
+    '/api/stats',
+)
+
+@views.command('index-advisor')
+@click.option('--url', 'urls', multiple=True, help='Page à analyser (par défaut : pages principales)')
+@click.option('--show-plans', is_flag=True, help='Afficher le plan de chaque requête')
+@click.option('--strict', is_flag=True, help='Code de sortie 1 si un parcours complet de table est trouvé')
+def index_advisor_command(urls, show_plans, strict):
+    """Rejouer les requêtes des pages principales et signaler les parcours sans index"""
+    import index_advisor
+    dataset = Dataset.query.filter_by(status='validated').first()
+    admin = User.query.filter_by(role='admin').first()
+    urls = [url.format(dataset=dataset.id if dataset else 0, domain=dataset.domain_id if dataset else 0)
+            for url in urls or INDEX_ADVISOR_URLS]
+    
+    cache.clear()  # sinon l'accueil et les statistiques ne touchent pas la base
+    reports = index_advisor.advise(current_app._get_current_object(), db.engine, urls, user_id=admin.id if admin else None,
+                                   ignore_tables=('domain',))
+    
+    flagged = [report for report in reports if report['issues']]
+    for report in reports:
+        if report['issues'] or show_plans:
+            marker = '⚠️ ' if report['issues'] else '✅'
+            print(f"{marker} {report['url']} : {report['sql'][:160]}")
+            for detail in report['plan'] if show_plans else []:
+                print(f"      {detail}")
+            for issue in report['issues']:
+                print(f"   -> {issue}")
+    full_scans = [report for report in flagged if any(map(index_advisor.is_full_scan, report['issues']))]
+    print(f"{len(reports)} requête(s) analysée(s), {len(flagged)} signalée(s) dont {len(full_scans)} parcours complet(s)")
+    if strict and full_scans:
+        raise SystemExit(1)
 
 def init_db():
-    """Initialiser la base de données"""
-    with app.app_context():
-        db.create_all()
-        
-        # Créer les domaines par défaut
-        domains_data = [
-            {'name': 'Santé', 'description': 'Bases de données liées à la santé publique', 'icon': 'fas fa-heartbeat'},
-            {'name': 'Éducation', 'description': 'Données sur l\'éducation et les écoles', 'icon': 'fas fa-graduation-cap'},
-            {'name': 'Agriculture', 'description': 'Données agricoles et production', 'icon': 'fas fa-seedling'},
-            {'name': 'Environnement', 'description': 'Données environnementales', 'icon': 'fas fa-leaf'},
-            {'name': 'Économie', 'description': 'Données économiques et financières', 'icon': 'fas fa-chart-line'},
-            {'name': 'Transport', 'description': 'Données de transport et mobilité', 'icon': 'fas fa-car'},
-            {'name': 'Démographie', 'description': 'Données démographiques', 'icon': 'fas fa-users'},
-            {'name': 'Technologie', 'description': 'Données technologiques', 'icon': 'fas fa-microchip'}
-        ]
-        
-        for domain_data in domains_data:
-            domain = Domain.query.filter_by(name=domain_data['name']).first()
-            if not domain:
-                domain = Domain(**domain_data)
-                db.session.add(domain)
-        
-        # Créer un admin par défaut
-        admin = User.query.filter_by(username='admin').first()
-        if not admin:
-            admin = User(
-                username='admin',
-                email='admin@nosdonnees.fr',
-                role='admin',
-                organization='Nosdonnées'
-            )
-            admin.set_password('admin123')
-            db.session.add(admin)
-        
-        db.session.commit()
-        
-        # Migrer les datasets existants
-        migrate_existing_datasets()
-        
-        print("✅ Base de données initialisée avec succès!")
+    """Initialiser la base de données (dans le contexte de l'application)"""
+    import similarity
+    # Créer les tables et ajouter les colonnes/index manquants
+    for operation in upgrade_schema(db):
+        print(f"🔧 Schéma mis à jour : {operation}")
+    
+    # Créer les domaines par défaut
+    domains_data = [
+        {'name': 'Santé', 'description': 'Bases de données liées à la santé publique', 'icon': 'fas fa-heartbeat'},
+        {'name': 'Éducation', 'description': 'Données sur l\'éducation et les écoles', 'icon': 'fas fa-graduation-cap'},
+        {'name': 'Agriculture', 'description': 'Données agricoles et production', 'icon': 'fas fa-seedling'},
+        {'name': 'Environnement', 'description': 'Données environnementales', 'icon': 'fas fa-leaf'},
+        {'name': 'Économie', 'description': 'Données économiques et financières', 'icon': 'fas fa-chart-line'},
+        {'name': 'Transport', 'description': 'Données de transport et mobilité', 'icon': 'fas fa-car'},
+        {'name': 'Démographie', 'description': 'Données démographiques', 'icon': 'fas fa-users'},
+        {'name': 'Technologie', 'description': 'Données technologiques', 'icon': 'fas fa-microchip'}
+    ]
+    
+    for domain_data in domains_data:
+        domain = Domain.query.filter_by(name=domain_data['name']).first()
+        if not domain:
+            domain = Domain(**domain_data)
+            db.session.add(domain)
+    
+    # Créer un admin par défaut
+    admin = User.query.filter_by(username='admin').first()
+    if not admin:
+        admin = User(
+            username='admin',
+            email='admin@nosdonnees.fr',
+            role='admin',
+            organization='Nosdonnées'
+        )
+        admin.set_password('admin123')
+        db.session.add(admin)
+    
+    db.session.commit()
+    
+    # Migrer les datasets existants
+    migrate_existing_datasets()
+    
+    # Construire l'index de recherche plein texte
+    search_index.rebuild_search_index(db.session, Dataset.query.all())
+    
+    # Calculer les bases similaires
+    with db.engine.begin() as conn:
+        similarity.rebuild(conn, SimilarDataset.__table__, Dataset.__table__)
+    
+    print("✅ Base de données initialisée avec succès!")
 
-if __name__ == '__main__':
+@views.command('init-db')
+def init_db_command():
+    """Créer ou mettre à jour le schéma, les données par défaut et les index"""
     init_db()
+
+def ensure_database(flask_app):
+    """Initialiser la base si elle n'a pas encore de tables (premier lancement)
+
+    Le démarrage ne fait rien d'autre : les mises à jour du schéma et les
+    reconstructions d'index passent par `flask init-db`.
+    """
+    with flask_app.app_context():
+        if not db.inspect(db.engine).has_table(Dataset.__tablename__):
+            init_db()
+
+def shutdown_services():
+    """Écrire les compteurs, le journal et les agrégats en attente (arrêt d'un worker)
+
+    Les processus créés par fork n'exécutent pas les fonctions atexit.
+    """
+    counter_buffer.shutdown()
+    download_log.shutdown()
+    usage_rollups.flush()
+
+def create_app(config_object=None):
+    """Créer et configurer l'application
+
+    Les services qui dépendent de la configuration (stockage des fichiers,
+    caches, suggestions...) sont rangés dans ``app.extensions``. Les
+    compteurs, le journal et la file des tâches sont propres au processus
+    et servent la dernière application créée. Rien n'est écrit sur disque
+    ni lu en base ici : les dossiers sont créés au premier fichier, le
+    schéma par `flask init-db`.
+    """
+    flask_app = Flask(__name__)
+    # Configuration de config.py, choisie par FLASK_ENV (development par défaut, production, testing)
+    flask_app.config.from_object(config_object or get_config())
+    flask_app.request_class = UploadRequest
+
+    flask_app.extensions['blob_store'] = BlobStore(flask_app.config['BLOB_FOLDER'])
+    flask_app.extensions['preview_cache'] = preview.PageCache(flask_app.config['PREVIEW_CACHE_SIZE'])
+    flask_app.extensions['preview_indexes'] = preview.IndexCache(
+        flask_app.config['PREVIEW_INDEX_FOLDER'], flask_app.config['PREVIEW_INDEX_CACHE_SIZE']
+    )
+    flask_app.extensions['suggest_index'] = SuggestIndex(
+        max_age=flask_app.config['SUGGEST_MAX_AGE'], limit=flask_app.config['SUGGEST_LIMIT']
+    )
+
+    db.init_app(flask_app)
+    SQLiteTuning(flask_app, db)
+    login_manager.init_app(flask_app)
+    counter_buffer.init_app(flask_app, db)
+    create_cache(flask_app)
+    download_log.init_app(flask_app, db)
+    usage_rollups.init_app(flask_app, db)
+    job_queue.init_app(flask_app, db, Job)
+    # Nombre de requêtes SQL par vue (debug et tests)
+    QueryBudget(flask_app, db)
+    # Temps, requêtes SQL, gabarits et octets par vue (INSTRUMENTATION_ENABLED)
+    Instrumentation(flask_app, db)
+
+    views.register(flask_app)
+    return flask_app
+
+if __name__ == '__main__':
+    app = create_app()
+    ensure_database(app)
     app.run(debug=True, host='0.0.0.0', port=8000) 
\ No newline at end of file
@@ -14,5 +14,7 @@ from django.core.asgi import get_asgi_application  # type: ignore
 
 # Set the default settings module for the 'django' program.
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "nosdonnees.settings")
+# Serve downloads and search with the async views (see settings.py).
+os.environ.setdefault("NOSDONNEES_ASYNC_VIEWS", "1")
 
 application = get_asgi_application()
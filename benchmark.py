@@ -0,0 +1,680 @@
+#!/usr/bin/env python
+"""
+Banc d'essai reproductible de l'application Flask
+
+``python benchmark.py run`` génère un catalogue synthétique (utilisateurs,
+domaines, datasets, commentaires, téléchargements et fichiers, en nombres
+configurables) dans un dossier de travail, puis mesure dans le processus,
+sans serveur ni réseau, la latence (p50, p90, p95, p99) et le débit des
+scénarios :
+
+- ``home`` : page d'accueil anonyme ;
+- ``listing`` / ``listing_filtered`` / ``listing_search`` : liste des
+  datasets, filtrée par domaine et format, et recherche plein texte ;
+- ``search`` : API de recherche ;
+- ``detail`` : page d'un dataset ;
+- ``download`` : téléchargement complet d'un fichier ;
+- ``upload`` : envoi d'un nouveau fichier par un contributeur.
+
+Le résultat est écrit en JSON (``instance/benchmarks/<date>-<commit>.json``
+par défaut) ; ``python benchmark.py compare ancien.json nouveau.json``
+compare deux exécutions. À graine égale, le catalogue et la suite des
+requêtes sont identiques d'une exécution à l'autre.
+
+``python benchmark.py scaling`` sert le même catalogue avec ``serve.py``
+(1, 2, 4... workers jusqu'au nombre de cœurs) et mesure par HTTP le débit
+obtenu par des processus clients, et son gain par rapport à un worker.
+"""
+
+import http.client
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import signal
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from datetime import datetime, timedelta
+
+import click # type: ignore
+from werkzeug.security import generate_password_hash # type: ignore
+
+import rollups
+import similarity
+
+# Taille du catalogue généré par défaut
+DEFAULT_SPEC = {
+    'users': 50,
+    'domains': 8,
+    'datasets': 1000,
+    'comments': 3000,
+    'downloads': 10000,
+    'files': 40,  # contenus distincts, partagés entre les datasets
+    'file_size': 64 * 1024,  # taille moyenne des fichiers (octets)
+}
+
+BENCHMARK_PASSWORD = 'benchmark'
+
+WORDS = (
+    'santé', 'vaccination', 'école', 'élèves', 'récolte', 'maïs', 'cacao', 'pluviométrie',
+    'forêt', 'emploi', 'budget', 'commune', 'population', 'recensement', 'transport', 'routes',
+    'électricité', 'eau', 'hôpitaux', 'paludisme', 'marchés', 'prix', 'exportations', 'internet',
+)
+REGIONS = ('Abidjan', 'Bouaké', 'Daloa', 'Korhogo', 'San-Pédro', 'Yamoussoukro', 'Man', 'Gagnoa')
+DOMAIN_NAMES = ('Santé', 'Éducation', 'Agriculture', 'Environnement', 'Économie', 'Transport',
+                'Démographie', 'Technologie')
+
+
+def _csv_content(rng, size):
+    """Contenu CSV d'environ ``size`` octets"""
+    lines = ['id,region,indicateur,valeur,date']
+    total = len(lines[0]) + 1
+    row = 0
+    while total < size:
+        line = (f'{row},{rng.choice(REGIONS)},{rng.choice(WORDS)},'
+                f'{rng.uniform(0, 1000):.2f},20{rng.randint(10, 23)}-{rng.randint(1, 12):02d}-01')
+        lines.append(line)
+        total += len(line.encode()) + 1
+        row += 1
+    return ('\n'.join(lines) + '\n').encode()
+
+
+def generate_catalogue(nosdonnees, blob_store, spec=None, seed=42, now=None):
+    """Remplir une base vide avec un catalogue synthétique
+
+    ``nosdonnees`` est le module de l'application (modèles et ``db``), à
+    appeler dans un contexte d'application. Tous les utilisateurs ont le mot
+    de passe ``BENCHMARK_PASSWORD`` ; le premier est administrateur, les
+    suivants alternent contributeurs et visiteurs. Retourne le nombre de
+    lignes créées par table.
+    """
+    spec = dict(DEFAULT_SPEC, **(spec or {}))
+    rng = random.Random(seed)
+    now = now or datetime(2024, 1, 1)
+    db = nosdonnees.db
+    if db.session.query(nosdonnees.Dataset.id).first() is not None:
+        raise ValueError('La base du banc d\'essai doit être vide')
+
+    def spread(days):
+        return now - timedelta(seconds=rng.randint(0, days * 86400))
+
+    password_hash = generate_password_hash(BENCHMARK_PASSWORD)
+    users = [
+        {'id': i + 1, 'username': f'user{i}', 'email': f'user{i}@example.org', 'password_hash': password_hash,
+         'role': 'admin' if i == 0 else ('contributor' if i % 2 else 'visitor'), 'created_at': spread(1000)}
+        for i in range(spec['users'])
+    ]
+    contributors = [user for user in users if user['role'] != 'visitor']
+    domains = [
+        {'id': i + 1, 'name': DOMAIN_NAMES[i % len(DOMAIN_NAMES)] + ('' if i < len(DOMAIN_NAMES) else f' {i}'),
+         'description': f'Domaine {i}', 'icon': 'fas fa-database'}
+        for i in range(spec['domains'])
+    ]
+
+    # Fichiers distincts, rangés par contenu comme les uploads réels
+    files = []
+    for _ in range(spec['files']):
+        size = rng.randint(spec['file_size'] // 2, spec['file_size'] * 3 // 2)
+        files.append(blob_store.store(io.BytesIO(_csv_content(rng, size))))
+    sizes = {stored.digest: stored.size for stored in files}
+    used = set()
+
+    datasets = []
+    for i in range(spec['datasets']):
+        stored = rng.choice(files)
+        used.add(stored.digest)
+        words = rng.sample(WORDS, 3)
+        region = rng.choice(REGIONS)
+        author = rng.choice(contributors)
+        status = rng.choices(('validated', 'pending', 'rejected'), weights=(85, 10, 5))[0]
+        datasets.append({
+            'id': i + 1,
+            'title': f'{words[0].capitalize()} et {words[1]} à {region} ({2010 + i % 14})',
+            'description': f'Données sur {words[0]}, {words[1]} et {words[2]} dans la région de {region}.',
+            'short_description': f'{words[0].capitalize()} à {region}',
+            'source': 'Banc d\'essai',
+            'author': author['username'],
+            'creation_date': spread(1000),
+            'file_path': stored.path,
+            'file_format': 'csv',
+            'file_size': stored.size,
+            'file_hash': stored.digest,
+            'domain_id': rng.choice(domains)['id'],
+            'keywords': ','.join(words),
+            'documentation': 'Jeu de données synthétique',
+            'user_id': author['id'],
+            'status': status,
+            'is_validated': status == 'validated',
+            'rejection_reason': 'Documentation insuffisante' if status == 'rejected' else None,
+            'view_count': rng.randint(0, 500),
+            'download_count': 0,
+            'rating': 0.0,
+            'rating_sum': 0,
+            'rating_count': 0,
+        })
+
+    comments = []
+    for i in range(spec['comments']):
+        dataset = rng.choice(datasets)
+        rating = rng.randint(1, 5)
+        dataset['rating_sum'] += rating
+        dataset['rating_count'] += 1
+        comments.append({
+            'id': i + 1, 'dataset_id': dataset['id'], 'user_id': rng.choice(users)['id'],
+            'text': f'Avis {i} : données {rng.choice(WORDS)} utiles', 'rating': rating, 'created_at': spread(365),
+        })
+    for dataset in datasets:
+        if dataset['rating_count']:
+            dataset['rating'] = dataset['rating_sum'] / dataset['rating_count']
+
+    # Téléchargements concentrés sur quelques datasets populaires (historique agrégé seulement)
+    weights = [1 / (rank + 1) for rank in range(len(datasets))]
+    usage = {}
+    for dataset in rng.choices(datasets, weights=weights, k=spec['downloads'] if datasets else 0):
+        dataset['download_count'] += 1
+        rollups.add_event(usage, dataset['id'], 'downloads', spread(365))
+    owners = {dataset['id']: (dataset['user_id'], dataset['domain_id']) for dataset in datasets}
+
+    for model, rows in (
+        (nosdonnees.User, users),
+        (nosdonnees.Domain, domains),
+        (nosdonnees.Blob, [{'sha256': digest, 'size': sizes[digest]} for digest in used]),
+        (nosdonnees.Dataset, datasets),
+        (nosdonnees.Comment, comments),
+    ):
+        if rows:
+            db.session.execute(db.insert(model), rows)
+    rollups.apply_deltas(db.session.connection(), nosdonnees.UsageRollup.__table__,
+                         rollups.expand_deltas(usage, owners))
+    db.session.commit()
+    nosdonnees.search_index.rebuild_search_index(db.session, nosdonnees.Dataset.query.all())
+    with db.engine.begin() as conn:
+        similarity.rebuild(conn, nosdonnees.SimilarDataset.__table__, nosdonnees.Dataset.__table__)
+
+    return {
+        'users': len(users), 'domains': len(domains), 'files': len(used),
+        'datasets': len(datasets), 'comments': len(comments), 'downloads': spec['downloads'] if datasets else 0,
+    }
+
+
+def percentile(values, fraction):
+    """Percentile par interpolation linéaire d'une liste triée"""
+    if not values:
+        return None
+    position = (len(values) - 1) * fraction
+    low = int(position)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (position - low)
+
+
+def summarize(durations, elapsed, errors=0):
+    """Percentiles (ms) et débit (requêtes/s) d'une série de mesures"""
+    values = sorted(durations)
+    return {
+        'requests': len(values),
+        'errors': errors,
+        'mean_ms': round(sum(values) / len(values) * 1000, 3) if values else None,
+        **{f'p{int(q * 100)}_ms': round(percentile(values, q) * 1000, 3) if values else None
+           for q in (0.5, 0.9, 0.95, 0.99)},
+        'max_ms': round(values[-1] * 1000, 3) if values else None,
+        'throughput_rps': round(len(values) / elapsed, 1) if elapsed else None,
+    }
+
+
+def run_scenario(client, make_request, iterations, warmup=0, expected=(200,)):
+    """Exécuter ``make_request(client, i)`` et mesurer chaque appel
+
+    La réponse est lue entièrement (transfert compris) avant l'arrêt du
+    chronomètre. Les codes absents de ``expected`` sont comptés en erreurs.
+    """
+    for i in range(warmup):
+        make_request(client, i).close()
+    durations = []
+    errors = 0
+    started = time.perf_counter()
+    for i in range(warmup, warmup + iterations):
+        start = time.perf_counter()
+        response = make_request(client, i)
+        response.get_data()
+        durations.append(time.perf_counter() - start)
+        if response.status_code not in expected:
+            errors += 1
+        response.close()
+    return summarize(durations, time.perf_counter() - started, errors)
+
+
+def build_scenarios(nosdonnees, seed=42):
+    """Scénarios ``nom -> (fonction de requête, utilisateur connecté, codes attendus)``"""
+    db = nosdonnees.db
+    Dataset = nosdonnees.Dataset
+    rng = random.Random(seed)
+    validated = [row.id for row in db.session.query(Dataset.id).filter_by(status='validated').order_by(Dataset.id)]
+    domains = [row.id for row in db.session.query(nosdonnees.Domain.id).order_by(nosdonnees.Domain.id)]
+    contributor = db.session.query(nosdonnees.User.id).filter_by(role='contributor').order_by(nosdonnees.User.id).limit(1).scalar()
+    rng.shuffle(validated)
+    words = list(WORDS)
+
+    def pick(values, i):
+        return values[i % len(values)]
+
+    def upload(client, i):
+        content = f'id,valeur\n{i},{rng.random()}\n'.encode() * 200
+        return client.post('/upload', data={
+            'title': f'Envoi {i}', 'description': 'Envoi du banc d\'essai', 'source': 'Banc d\'essai',
+            'documentation': 'Documentation', 'domain_id': str(domains[0]), 'keywords': 'essai',
+            'file': (io.BytesIO(content), f'envoi-{i}.csv'),
+        }, content_type='multipart/form-data')
+
+    return {
+        'home': (lambda client, i: client.get('/'), None, (200,)),
+        'listing': (lambda client, i: client.get('/datasets'), None, (200,)),
+        'listing_filtered': (lambda client, i: client.get(
+            f'/datasets?domain={pick(domains, i)}&file_format=csv&sort=downloads'), None, (200,)),
+        'listing_search': (lambda client, i: client.get(f'/datasets?q={pick(words, i)}'), None, (200,)),
+        'search': (lambda client, i: client.get(f'/api/search?q={pick(words, i)[:4]}'), None, (200,)),
+        'detail': (lambda client, i: client.get(f'/datasets/{pick(validated, i)}'), None, (200,)),
+        'download': (lambda client, i: client.get(f'/datasets/{pick(validated, i)}/download'), None, (200,)),
+        'upload': (upload, contributor, (302,)),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def prepare_app(workdir, spec, seed, cache_backend, **environ):
+    """Créer l'application sur une base neuve du dossier de travail et y générer le catalogue"""
+    workdir = os.path.abspath(workdir or tempfile.mkdtemp(prefix='nosdonnees-bench-'))
+    os.makedirs(workdir, exist_ok=True)
+    database = os.path.join(workdir, 'benchmark.db')
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(database + suffix):
+            os.remove(database + suffix)
+
+    # L'application lit sa configuration à l'import : base, fichiers et cache du banc d'essai
+    os.environ.update(
+        DATABASE_URL=f'sqlite:///{database}', UPLOAD_FOLDER=os.path.join(workdir, 'uploads'),
+        CACHE_BACKEND=cache_backend, COUNTER_BACKEND='memory', JOB_EMBEDDED_WORKERS='0',
+        DOWNLOAD_LOG_FOLDER=os.path.join(workdir, 'download_log'), **environ
+    )
+    import app as nosdonnees
+    application = nosdonnees.create_app()
+
+    # Mesures hors mode debug (configuration de développement par défaut) et sans comptage des requêtes
+    application.debug = False
+    application.config['QUERY_BUDGET_ENABLED'] = False
+    with application.app_context():
+        nosdonnees.upgrade_schema(nosdonnees.db)
+        started = time.perf_counter()
+        counts = generate_catalogue(nosdonnees, application.extensions['blob_store'], spec, seed)
+        click.echo(f"📦 Catalogue généré en {time.perf_counter() - started:.1f} s : "
+                   + ', '.join(f'{count} {name}' for name, count in counts.items()))
+    return nosdonnees, application, counts
+
+
+def logged_in_client(application, user_id):
+    client = application.test_client()
+    if user_id is not None:
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+            session['_fresh'] = True
+    return client
+
+
+def default_output(application, suffix=''):
+    return os.path.join(application.instance_path, 'benchmarks',
+                        f"{datetime.now():%Y%m%d-%H%M%S}-{git_commit() or 'local'}{suffix}.json")
+
+
+def write_report(report, output):
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    click.echo(f"✅ Résultats : {output}")
+
+
+@click.group()
+def cli():
+    """Banc d'essai de Nosdonnées"""
+
+
+@cli.command()
+@click.option('--users', default=DEFAULT_SPEC['users'], show_default=True)
+@click.option('--domains', default=DEFAULT_SPEC['domains'], show_default=True)
+@click.option('--datasets', default=DEFAULT_SPEC['datasets'], show_default=True)
+@click.option('--comments', default=DEFAULT_SPEC['comments'], show_default=True)
+@click.option('--downloads', default=DEFAULT_SPEC['downloads'], show_default=True, help='Téléchargements (agrégés par jour)')
+@click.option('--files', default=DEFAULT_SPEC['files'], show_default=True, help='Fichiers distincts')
+@click.option('--file-size', default=DEFAULT_SPEC['file_size'], show_default=True, help='Taille moyenne (octets)')
+@click.option('--iterations', default=200, show_default=True, help='Requêtes mesurées par scénario')
+@click.option('--warmup', default=20, show_default=True, help='Requêtes non mesurées par scénario')
+@click.option('--seed', default=42, show_default=True)
+@click.option('--scenario', 'scenarios', multiple=True, help='Scénario à exécuter (par défaut : tous)')
+@click.option('--cache', 'cache_backend', default='memory', show_default=True,
+              type=click.Choice(['memory', 'null']), help='Cache applicatif')
+@click.option('--workdir', type=click.Path(file_okay=False), help='Dossier de la base et des fichiers générés')
+@click.option('--output', type=click.Path(dir_okay=False), help='Fichier JSON des résultats')
+def run(iterations, warmup, seed, scenarios, cache_backend, workdir, output, **spec):
+    """Générer un catalogue synthétique et mesurer les scénarios"""
+    nosdonnees, application, counts = prepare_app(workdir, spec, seed, cache_backend)
+    with application.app_context():
+        available = build_scenarios(nosdonnees, seed)
+
+    unknown = set(scenarios) - set(available)
+    if unknown:
+        raise click.BadParameter(', '.join(sorted(unknown)), param_hint='--scenario')
+
+    results = {}
+    for name, (make_request, user_id, expected) in available.items():
+        if scenarios and name not in scenarios:
+            continue
+        results[name] = run_scenario(logged_in_client(application, user_id), make_request, iterations, warmup, expected)
+        r = results[name]
+        click.echo(f"{name:<18} p50 {r['p50_ms']:>8.2f} ms  p95 {r['p95_ms']:>8.2f} ms  "
+                   f"p99 {r['p99_ms']:>8.2f} ms  {r['throughput_rps']:>8.1f} req/s"
+                   + (f"  ⚠️ {r['errors']} erreur(s)" if r['errors'] else ''))
+    nosdonnees.counter_buffer.flush()
+    nosdonnees.download_log.flush()
+
+    commit = git_commit()
+    report = {
+        'commit': commit,
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'sqlite': sqlite3.sqlite_version,
+        'seed': seed,
+        'iterations': iterations,
+        'warmup': warmup,
+        'cache': cache_backend,
+        'catalogue': counts,
+        'file_size': spec['file_size'],
+        'scenarios': results,
+    }
+    write_report(report, output or default_output(application))
+
+
+def run_concurrently(workers, duration):
+    """Exécuter chaque ``(nom, fonction)`` de ``workers`` dans son thread pendant ``duration`` secondes
+
+    ``fonction(i)`` retourne une réponse ; un code 5xx ou une exception
+    compte comme une erreur. Retourne le résumé par nom.
+    """
+    durations = {name: [] for name, _ in workers}
+    errors = {name: 0 for name, _ in workers}
+    lock = threading.Lock()
+    start_barrier = threading.Barrier(len(workers))
+
+    def loop(name, make_request):
+        local, failed, i = [], 0, 0
+        start_barrier.wait()
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                response = make_request(i)
+                response.get_data()
+                failed += response.status_code >= 500
+                response.close()
+            except Exception:
+                failed += 1
+            local.append(time.perf_counter() - start)
+            i += 1
+        with lock:
+            durations[name].extend(local)
+            errors[name] += failed
+
+    threads = [threading.Thread(target=loop, args=worker) for worker in workers]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return {name: summarize(durations[name], elapsed, errors[name]) for name in durations}
+
+
+@cli.command()
+@click.option('--datasets', default=DEFAULT_SPEC['datasets'], show_default=True)
+@click.option('--readers', default=8, show_default=True, help='Threads de lecture (pages et listes)')
+@click.option('--writers', default=2, show_default=True, help='Threads d\'écriture (commentaires)')
+@click.option('--duration', default=10.0, show_default=True, help='Durée de la mesure (secondes)')
+@click.option('--counter-threshold', default=1, show_default=True,
+              help='Vues accumulées avant écriture des compteurs (1 : une écriture par vue)')
+@click.option('--tuning/--no-tuning', default=True, show_default=True,
+              help='Réglages SQLite (WAL, pragmas, verrou d\'écriture, pool de lecture)')
+@click.option('--seed', default=42, show_default=True)
+@click.option('--workdir', type=click.Path(file_okay=False), help='Dossier de la base et des fichiers générés')
+@click.option('--output', type=click.Path(dir_okay=False), help='Fichier JSON des résultats')
+def concurrency(datasets, readers, writers, duration, counter_threshold, tuning, seed, workdir, output):
+    """Mesurer lectures et écritures simultanées (comparer --tuning et --no-tuning)"""
+    spec = dict(DEFAULT_SPEC, datasets=datasets, files=min(DEFAULT_SPEC['files'], datasets))
+    nosdonnees, application, counts = prepare_app(workdir, spec, seed, 'null', SQLITE_TUNING='1' if tuning else '0')
+    nosdonnees.counter_buffer.flush_threshold = counter_threshold
+    with application.app_context():
+        available = build_scenarios(nosdonnees, seed)
+        validated = [row.id for row in nosdonnees.db.session.query(nosdonnees.Dataset.id).filter_by(status='validated')]
+        commenters = [row.id for row in nosdonnees.db.session.query(nosdonnees.User.id).order_by(nosdonnees.User.id)]
+
+    def reader(index):
+        client = logged_in_client(application, None)
+        detail, listing = available['detail'][0], available['listing_filtered'][0]
+        return lambda i: (detail if i % 2 else listing)(client, i * readers + index)
+
+    def writer(index):
+        client = logged_in_client(application, commenters[index % len(commenters)])
+        return lambda i: client.post(f'/add_comment/{validated[(i * writers + index) % len(validated)]}', data={
+            'comment_text': f'Avis {index}-{i} du banc d\'essai', 'rating': str(1 + i % 5)
+        })
+
+    workers = [('read', reader(index)) for index in range(readers)] + \
+              [('write', writer(index)) for index in range(writers)]
+    results = run_concurrently(workers, duration)
+    nosdonnees.counter_buffer.flush()
+    nosdonnees.download_log.flush()
+
+    for name, r in results.items():
+        click.echo(f"{name:<6} p50 {r['p50_ms']:>8.2f} ms  p95 {r['p95_ms']:>8.2f} ms  "
+                   f"p99 {r['p99_ms']:>8.2f} ms  {r['throughput_rps']:>8.1f} req/s"
+                   + (f"  ⚠️ {r['errors']} erreur(s)" if r['errors'] else ''))
+    write_lock = application.extensions['sqlite_tuning'].write_lock
+    report = {
+        'commit': git_commit(),
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'seed': seed,
+        'tuning': tuning,
+        'readers': readers,
+        'writers': writers,
+        'duration': duration,
+        'counter_threshold': counter_threshold,
+        'catalogue': counts,
+        'write_lock': write_lock and {
+            'acquisitions': write_lock.acquisitions, 'waits': write_lock.waits,
+            'wait_ms': round(write_lock.wait_seconds * 1000, 1),
+        },
+        'scenarios': results,
+    }
+    write_report(report, output or default_output(application, '-concurrency-' + ('tuned' if tuning else 'default')))
+
+
+def _http_client(base_url, paths, duration, offset):
+    """Boucle d'un processus client : requêtes ``GET`` sur une connexion persistante"""
+    url = urllib.parse.urlsplit(base_url)
+    connection = None
+    durations, errors, i = [], 0, offset
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        if connection is None:
+            connection = http.client.HTTPConnection(url.hostname, url.port, timeout=30)
+        start = time.perf_counter()
+        try:
+            connection.request('GET', paths[i % len(paths)])
+            response = connection.getresponse()
+            response.read()
+            errors += response.status >= 500
+            if response.will_close:
+                connection.close()
+                connection = None
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            connection.close()
+            connection = None
+        durations.append(time.perf_counter() - start)
+        i += 1
+    if connection is not None:
+        connection.close()
+    return durations, errors
+
+
+def load_http(base_url, paths, clients, duration):
+    """Charger ``base_url`` avec ``clients`` processus pendant ``duration`` secondes
+
+    Des processus plutôt que des threads : le client ne doit pas être limité
+    par le GIL avant le serveur mesuré.
+    """
+    with multiprocessing.get_context('fork').Pool(clients) as pool:
+        results = pool.starmap(_http_client, [(base_url, paths, duration, index * 7919) for index in range(clients)])
+    durations = [value for values, _ in results for value in values]
+    return summarize(durations, duration, sum(errors for _, errors in results))
+
+
+def free_port(host='127.0.0.1'):
+    with socket.socket() as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(host, port, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise click.ClickException(f'Le serveur s\'est arrêté (code {process.returncode})')
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise click.ClickException(f'Le serveur n\'écoute pas sur le port {port} après {timeout} s')
+
+
+def default_worker_counts():
+    """1, 2, 4... jusqu'au nombre de cœurs (inclus)"""
+    cores = os.cpu_count() or 1
+    counts, count = [], 1
+    while count < cores:
+        counts.append(count)
+        count *= 2
+    return counts + [cores]
+
+
+@cli.command()
+@click.option('--datasets', default=DEFAULT_SPEC['datasets'], show_default=True)
+@click.option('--workers', 'worker_counts', multiple=True, type=int,
+              help='Nombre de workers à mesurer (répétable ; par défaut 1, 2, 4... jusqu\'au nombre de cœurs)')
+@click.option('--threads', default=4, show_default=True, help='Threads par worker')
+@click.option('--clients', default=16, show_default=True, help='Processus clients simultanés')
+@click.option('--duration', default=10.0, show_default=True, help='Durée de la mesure par configuration (secondes)')
+@click.option('--warmup', default=2.0, show_default=True, help='Charge non mesurée avant chaque mesure (secondes)')
+@click.option('--server', default='auto', show_default=True, type=click.Choice(['auto', 'gunicorn', 'builtin']))
+@click.option('--cache', 'cache_backend', default='memory', show_default=True,
+              type=click.Choice(['memory', 'null']), help='Cache applicatif')
+@click.option('--seed', default=42, show_default=True)
+@click.option('--workdir', type=click.Path(file_okay=False), help='Dossier de la base et des fichiers générés')
+@click.option('--output', type=click.Path(dir_okay=False), help='Fichier JSON des résultats')
+def scaling(datasets, worker_counts, threads, clients, duration, warmup, server, cache_backend, seed, workdir, output):
+    """Mesurer le débit HTTP de serve.py selon le nombre de workers"""
+    spec = dict(DEFAULT_SPEC, datasets=datasets, files=min(DEFAULT_SPEC['files'], datasets))
+    nosdonnees, application, counts = prepare_app(workdir, spec, seed, cache_backend)
+    with application.app_context():
+        validated = [row.id for row in nosdonnees.db.session.query(nosdonnees.Dataset.id).filter_by(status='validated')]
+        nosdonnees.db.engine.dispose()  # la base est servie par d'autres processus
+    rng = random.Random(seed)
+    paths = ['/', '/datasets'] + [f'/datasets/{dataset_id}' for dataset_id in rng.sample(validated, min(50, len(validated)))] \
+        + [f'/datasets?q={urllib.parse.quote(word)}' for word in WORDS] \
+        + [f'/api/search?q={urllib.parse.quote(word[:4])}' for word in WORDS]
+    rng.shuffle(paths)
+
+    results = {}
+    for workers in sorted(set(worker_counts or default_worker_counts())):
+        port = free_port()
+        process = subprocess.Popen(
+            [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'serve.py'), 'flask',
+             '--server', server, '--bind', f'127.0.0.1:{port}', '--workers', str(workers), '--threads', str(threads),
+             '--preload', '--max-requests', '0', '--no-access-log'],
+            stdout=subprocess.DEVNULL
+        )
+        try:
+            wait_for_port('127.0.0.1', port, process)
+            base_url = f'http://127.0.0.1:{port}'
+            if warmup:
+                load_http(base_url, paths, clients, warmup)
+            r = results[f'workers_{workers}'] = load_http(base_url, paths, clients, duration)
+        finally:
+            process.send_signal(signal.SIGTERM)
+            process.wait()
+        r['workers'] = workers
+        reference = results[min(results, key=lambda name: results[name]['workers'])]
+        r['speedup'] = round(r['throughput_rps'] / reference['throughput_rps'], 2) if reference['throughput_rps'] else None
+        click.echo(f"{workers:>3} worker(s)  p50 {r['p50_ms']:>8.2f} ms  p95 {r['p95_ms']:>8.2f} ms  "
+                   f"{r['throughput_rps']:>8.1f} req/s  x{r['speedup']}"
+                   + (f"  ⚠️ {r['errors']} erreur(s)" if r['errors'] else ''))
+
+    report = {
+        'commit': git_commit(),
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'server': server,
+        'threads': threads,
+        'clients': clients,
+        'duration': duration,
+        'cache': cache_backend,
+        'catalogue': counts,
+        'scenarios': results,
+    }
+    write_report(report, output or default_output(application, '-scaling'))
+
+
+def compare_reports(before, after, metric='p50_ms'):
+    """Écart relatif (%) de ``metric`` par scénario présent dans les deux résultats"""
+    changes = {}
+    for name, result in after['scenarios'].items():
+        previous = before['scenarios'].get(name, {}).get(metric)
+        if previous and result.get(metric) is not None:
+            changes[name] = round((result[metric] - previous) / previous * 100, 1)
+    return changes
+
+
+@cli.command()
+@click.argument('before', type=click.File(encoding='utf-8'))
+@click.argument('after', type=click.File(encoding='utf-8'))
+def compare(before, after):
+    """Comparer deux fichiers de résultats (latences en ms, écart en %)"""
+    before, after = json.load(before), json.load(after)
+    click.echo(f"{before.get('commit')} → {after.get('commit')}")
+    for metric in ('p50_ms', 'p95_ms', 'p99_ms'):
+        changes = compare_reports(before, after, metric)
+        for name, change in changes.items():
+            old, new = before['scenarios'][name][metric], after['scenarios'][name][metric]
+            click.echo(f"{metric:<7} {name:<18} {old:>9.2f} → {new:>9.2f}  ({change:+.1f} %)")
+
+
+if __name__ == '__main__':
+    cli()
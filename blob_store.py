@@ -0,0 +1,187 @@
+"""
+Stockage des fichiers par contenu (content-addressed storage)
+
+Chaque fichier est rangé sous son empreinte SHA-256, dans des sous-dossiers
+à deux niveaux (``blobs/ab/cd/abcd...``) pour éviter les répertoires géants.
+Deux uploads identiques partagent donc le même fichier, et deux fichiers de
+même nom ne s'écrasent plus.
+
+L'empreinte est calculée pendant la réception : ``HashingTempFile`` est
+utilisé comme fichier temporaire par Werkzeug (voir ``UploadRequest`` dans
+app.py) et hache chaque morceau au moment où il est écrit sur disque. Le
+fichier temporaire est ensuite simplement renommé vers son emplacement
+définitif, sans nouvelle lecture ni copie.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+from collections import namedtuple
+
+CHUNK_SIZE = 1024 * 1024  # 1 Mo
+
+StoredBlob = namedtuple('StoredBlob', ['digest', 'path', 'size', 'duplicate'])
+
+
+class HashingTempFile:
+    """Fichier temporaire qui calcule son SHA-256 au fil des écritures"""
+
+    def __init__(self, directory):
+        fd, self.name = tempfile.mkstemp(dir=directory, prefix='upload-', suffix='.part')
+        self._file = os.fdopen(fd, 'w+b')
+        self._digest = hashlib.sha256()
+        self.size = 0
+        self.committed = False
+
+    def write(self, data):
+        self._digest.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    def hexdigest(self):
+        return self._digest.hexdigest()
+
+    def read(self, *args):
+        return self._file.read(*args)
+
+    def readline(self, *args):
+        return self._file.readline(*args)
+
+    def seek(self, *args):
+        return self._file.seek(*args)
+
+    def tell(self):
+        return self._file.tell()
+
+    def flush(self):
+        return self._file.flush()
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def seekable(self):
+        return True
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return True
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+    def __iter__(self):
+        return iter(self._file)
+
+    def close(self):
+        """Fermer le fichier ; il est supprimé s'il n'a pas été conservé"""
+        if not self._file.closed:
+            self._file.close()
+        if not self.committed and os.path.exists(self.name):
+            os.remove(self.name)
+
+
+class BlobStore:
+    """Dossier de fichiers adressés par leur empreinte SHA-256"""
+
+    def __init__(self, root):
+        self.root = root
+        self.tmp_dir = os.path.join(root, 'tmp')
+
+    def ensure_dirs(self):
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def path_for(self, digest):
+        """Chemin d'un blob à partir de son empreinte"""
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def exists(self, digest):
+        return os.path.exists(self.path_for(digest))
+
+    def open_temp(self):
+        """Nouveau fichier temporaire hachant, dans le même système de fichiers"""
+        self.ensure_dirs()
+        return HashingTempFile(self.tmp_dir)
+
+    def _commit(self, temp):
+        # Le contenu est sur disque avant que le dataset ne le référence
+        temp.flush()
+        os.fsync(temp.fileno())
+        digest = temp.hexdigest()
+        path = self.path_for(digest)
+        duplicate = os.path.exists(path)
+        if not duplicate:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(temp.name, path)
+            temp.committed = True
+        temp.close()
+        return StoredBlob(digest, path, temp.size, duplicate)
+
+    def store(self, stream, chunk_size=CHUNK_SIZE):
+        """Conserver le contenu d'un flux et retourner le ``StoredBlob``
+
+        Un ``HashingTempFile`` déjà rempli (upload reçu par ``UploadRequest``)
+        est renommé directement ; tout autre flux est copié par morceaux.
+        """
+        if isinstance(stream, HashingTempFile) and not stream.closed:
+            return self._commit(stream)
+
+        temp = self.open_temp()
+        try:
+            for chunk in iter(lambda: stream.read(chunk_size), b''):
+                temp.write(chunk)
+        except Exception:
+            temp.close()
+            raise
+        return self._commit(temp)
+
+    def adopt_file(self, source_path, digest):
+        """Déplacer un fichier complet dont l'empreinte est connue (upload par morceaux)"""
+        path = self.path_for(digest)
+        size = os.path.getsize(source_path)
+        if os.path.exists(path):
+            os.remove(source_path)
+            return StoredBlob(digest, path, size, True)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(source_path, path)
+        return StoredBlob(digest, path, size, False)
+
+    def import_file(self, source_path, link=True):
+        """Ranger un fichier existant dans le store
+
+        Avec ``link=True`` un lien physique est créé quand c'est possible
+        (pas de copie des données) ; sinon le fichier est copié.
+        """
+        with open(source_path, 'rb') as fh:
+            digest = hashlib.sha256()
+            for chunk in iter(lambda: fh.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+        digest = digest.hexdigest()
+        path = self.path_for(digest)
+        size = os.path.getsize(source_path)
+        if os.path.exists(path):
+            return StoredBlob(digest, path, size, True)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if link:
+            try:
+                os.link(source_path, path)
+                return StoredBlob(digest, path, size, False)
+            except OSError:
+                pass
+        shutil.copyfile(source_path, path)
+        return StoredBlob(digest, path, size, False)
+
+    def verify(self, digest):
+        """Vérifier que le contenu d'un blob correspond à son empreinte"""
+        path = self.path_for(digest)
+        if not os.path.exists(path):
+            return False
+        sha = hashlib.sha256()
+        with open(path, 'rb') as fh:
+            for chunk in iter(lambda: fh.read(CHUNK_SIZE), b''):
+                sha.update(chunk)
+        return sha.hexdigest() == digest
@@ -0,0 +1,170 @@
+"""
+Cache applicatif (page d'accueil, statistiques)
+
+Trois stockages sont disponibles, choisis par ``CACHE_BACKEND`` :
+
+- ``memory`` : LRU avec durée de vie, propre au processus (par défaut) ;
+- ``sqlite`` : petite base SQLite annexe partagée par les workers d'une
+  même machine, pour qu'une invalidation faite par l'un soit vue par tous ;
+- ``null`` : pas de cache.
+
+Les valeurs sont recalculées à expiration, ou dès qu'une écriture les rend
+fausses : l'application supprime alors les clés concernées (``delete``).
+"""
+
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class NullCache:
+    """Cache désactivé : chaque lecture recalcule la valeur"""
+
+    def get(self, key, default=None):
+        return default
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def delete(self, *keys):
+        pass
+
+    def clear(self):
+        pass
+
+    def get_or_set(self, key, factory, ttl=None):
+        """Valeur en cache, ou calculée par ``factory()`` puis conservée"""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = factory()
+            self.set(key, value, ttl)
+        return value
+
+
+class MemoryCache(NullCache):
+    """LRU borné en nombre d'entrées, chaque entrée ayant une durée de vie"""
+
+    def __init__(self, max_entries=1024, default_ttl=300):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (ttl or self.default_ttl)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteCache(NullCache):
+    """Cache partagé entre processus, stocké dans une base SQLite annexe
+
+    Les valeurs sont sérialisées avec pickle : n'y mettre que des données
+    produites par l'application.
+    """
+
+    def __init__(self, path, default_ttl=300, timeout=5.0):
+        self.path = path
+        self.default_ttl = default_ttl
+        self.timeout = timeout
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS cache_entry ('
+                'key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)'
+            )
+        finally:
+            conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+
+    def get(self, key, default=None):
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                'SELECT value FROM cache_entry WHERE key = ? AND expires_at >= ?', (key, time.time())
+            ).fetchone()
+        finally:
+            conn.close()
+        return pickle.loads(row[0]) if row else default
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + (ttl or self.default_ttl)
+        conn = self._connect()
+        try:
+            conn.execute(
+                'INSERT OR REPLACE INTO cache_entry (key, value, expires_at) VALUES (?, ?, ?)',
+                (key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), expires_at)
+            )
+            # Ménage occasionnel des entrées expirées
+            if hash(key) % 64 == 0:
+                conn.execute('DELETE FROM cache_entry WHERE expires_at < ?', (time.time(),))
+        finally:
+            conn.close()
+
+    def delete(self, *keys):
+        if not keys:
+            return
+        conn = self._connect()
+        try:
+            conn.executemany('DELETE FROM cache_entry WHERE key = ?', [(key,) for key in keys])
+        finally:
+            conn.close()
+
+    def clear(self):
+        conn = self._connect()
+        try:
+            conn.execute('DELETE FROM cache_entry')
+        finally:
+            conn.close()
+
+
+def create_cache(app):
+    """Construire le cache décrit par ``app.config``"""
+    backend = app.config.get('CACHE_BACKEND', 'memory')
+    ttl = app.config.get('CACHE_DEFAULT_TTL', 300)
+    if backend == 'null':
+        cache = NullCache()
+    elif backend == 'sqlite':
+        path = app.config.get('CACHE_PATH') or os.path.join(app.instance_path, 'cache.db')
+        cache = SQLiteCache(path, default_ttl=ttl)
+    elif backend == 'memory':
+        cache = MemoryCache(max_entries=app.config.get('CACHE_MAX_ENTRIES', 1024), default_ttl=ttl)
+    else:
+        raise ValueError(f'Cache inconnu : {backend}')
+    app.extensions['cache'] = cache
+    return cache
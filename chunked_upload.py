@@ -0,0 +1,158 @@
+"""
+Upload par morceaux avec reprise
+
+Protocole (routes ``/api/uploads`` dans app.py) :
+
+1. ``POST /api/uploads`` : ouverture d'une session (nom et taille du fichier) ;
+2. ``PUT /api/uploads/<id>?offset=N`` : envoi d'un morceau à la position N,
+   accompagné de son SHA-256 dans l'en-tête ``X-Chunk-Sha256`` ;
+3. ``GET /api/uploads/<id>`` : position atteinte, pour reprendre après une
+   coupure ;
+4. ``POST /api/uploads/<id>/complete`` : création du dataset.
+
+Les morceaux sont ajoutés à un fichier ``.part`` dans le dossier temporaire
+du stockage par contenu. Un morceau dont l'empreinte ne correspond pas est
+retiré du fichier. Le SHA-256 complet est tenu à jour en mémoire tant que
+les morceaux arrivent dans l'ordre sur le même processus ; sinon il est
+recalculé à la finalisation.
+
+Les workers de serve.py sont des processus : l'ajout d'un morceau prend un
+verrou ``flock`` sur le fichier partiel. Sans ``fcntl`` (Windows, serveur
+de développement), un verrou par session dans le processus le remplace ;
+il est oublié à la finalisation ou à l'abandon de la session.
+"""
+
+import hashlib
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows : un seul processus
+    fcntl = None
+
+CHUNK_READ_SIZE = 1024 * 1024  # 1 Mo
+
+# Verrous par session, utilisés seulement sans fcntl
+_locks = {}
+_locks_guard = threading.Lock()
+
+# Empreintes en cours par session : upload_id -> (hash, octets hachés)
+_running_hashes = {}
+
+
+class ChunkError(ValueError):
+    """Morceau refusé (position ou empreinte incorrecte)"""
+
+
+@contextmanager
+def _locked_part(tmp_dir, upload_id):
+    """Fichier partiel ouvert en écriture, réservé au thread ou processus appelant"""
+    with open(part_path(tmp_dir, upload_id), 'r+b') as fh:
+        if fcntl is not None:
+            # Libéré à la fermeture du fichier
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+            yield fh
+            return
+        with _locks_guard:
+            lock = _locks.setdefault(upload_id, threading.Lock())
+        with lock:
+            yield fh
+
+
+def part_path(tmp_dir, upload_id):
+    """Chemin du fichier partiel d'une session"""
+    return os.path.join(tmp_dir, f'{upload_id}.part')
+
+
+def create_part(tmp_dir, upload_id):
+    """Créer le fichier partiel vide d'une nouvelle session"""
+    os.makedirs(tmp_dir, exist_ok=True)
+    open(part_path(tmp_dir, upload_id), 'wb').close()
+    _running_hashes[upload_id] = (hashlib.sha256(), 0)
+
+
+def last_activity(tmp_dir, upload_id):
+    """Date (horodatage) du dernier morceau reçu, ``None`` sans fichier partiel"""
+    path = part_path(tmp_dir, upload_id)
+    return os.path.getmtime(path) if os.path.exists(path) else None
+
+
+def received_size(tmp_dir, upload_id):
+    """Nombre d'octets déjà reçus (le fichier partiel fait foi)"""
+    path = part_path(tmp_dir, upload_id)
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+def append_chunk(tmp_dir, upload_id, offset, stream, expected_sha256, max_size):
+    """Ajouter un morceau à la position ``offset`` et retourner la nouvelle taille
+
+    Lève ``ChunkError`` si la position ne correspond pas à la taille reçue,
+    si le morceau dépasse ``max_size`` ou si son empreinte est incorrecte
+    (le fichier est alors ramené à ``offset``).
+    """
+    with _locked_part(tmp_dir, upload_id) as fh:
+        current = os.fstat(fh.fileno()).st_size
+        if offset != current:
+            raise ChunkError(f'Position attendue : {current}')
+
+        chunk_digest = hashlib.sha256()
+        running = _running_hashes.get(upload_id)
+        file_hash = running[0].copy() if running is not None and running[1] == offset else None
+        written = 0
+        fh.seek(offset)
+        try:
+            for data in iter(lambda: stream.read(CHUNK_READ_SIZE), b''):
+                written += len(data)
+                if offset + written > max_size:
+                    raise ChunkError('Le morceau dépasse la taille annoncée du fichier')
+                chunk_digest.update(data)
+                if file_hash is not None:
+                    file_hash.update(data)
+                fh.write(data)
+
+            if expected_sha256 and chunk_digest.hexdigest() != expected_sha256.lower():
+                raise ChunkError('Empreinte du morceau incorrecte')
+            # Un morceau acquitté doit survivre à un redémarrage
+            fh.flush()
+            os.fsync(fh.fileno())
+        except Exception:
+            # Morceau refusé ou connexion coupée : on revient à la position de départ
+            fh.truncate(offset)
+            raise
+
+        if file_hash is not None:
+            _running_hashes[upload_id] = (file_hash, offset + written)
+        else:
+            _running_hashes.pop(upload_id, None)
+        return offset + written
+
+
+def file_digest(tmp_dir, upload_id):
+    """SHA-256 du fichier complet (recalculé si l'empreinte courante manque)"""
+    size = received_size(tmp_dir, upload_id)
+    running = _running_hashes.pop(upload_id, None)
+    if running is not None and running[1] == size:
+        return running[0].hexdigest()
+
+    digest = hashlib.sha256()
+    with open(part_path(tmp_dir, upload_id), 'rb') as fh:
+        for data in iter(lambda: fh.read(CHUNK_READ_SIZE), b''):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def forget(upload_id):
+    """Oublier l'état en mémoire d'une session terminée"""
+    _running_hashes.pop(upload_id, None)
+    with _locks_guard:
+        _locks.pop(upload_id, None)
+
+
+def discard(tmp_dir, upload_id):
+    """Supprimer le fichier partiel d'une session"""
+    forget(upload_id)
+    path = part_path(tmp_dir, upload_id)
+    if os.path.exists(path):
+        os.remove(path)
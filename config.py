@@ -6,15 +6,116 @@ Configuration pour l'application Nosdonnées Flask
 import os
 from datetime import timedelta
 
+from sqlalchemy.engine import make_url
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value not in (None, '') else default
+
+
+def engine_options(uri):
+    """Options du moteur (``SQLALCHEMY_ENGINE_OPTIONS``) adaptées à la base ``uri``
+
+    - SQLite sur disque : petit pool (la concurrence est réglée par
+      sqlite_tuning.py), sans vérification des connexions ;
+    - PostgreSQL : pool dimensionné pour les threads d'un worker,
+      connexions vérifiées avant usage (``pool_pre_ping``) et renouvelées,
+      durée maximale des requêtes SQL (``statement_timeout``) ;
+    - SQLite en mémoire : options de Flask-SQLAlchemy (une seule connexion).
+
+    Les valeurs se règlent par l'environnement : ``DB_POOL_SIZE``,
+    ``DB_MAX_OVERFLOW``, ``DB_POOL_TIMEOUT``, ``DB_POOL_RECYCLE``,
+    ``DB_PRE_PING`` (0/1) et ``DB_STATEMENT_TIMEOUT`` (ms, 0 : sans limite).
+    """
+    url = make_url(uri)
+    backend = url.get_backend_name()
+    if backend == 'sqlite':
+        if url.database in (None, '', ':memory:') or url.database.startswith('file::memory:'):
+            return {}
+        return {
+            'pool_size': _env_int('DB_POOL_SIZE', 5),
+            'max_overflow': _env_int('DB_MAX_OVERFLOW', 10),
+            'pool_timeout': _env_int('DB_POOL_TIMEOUT', 30),
+            'pool_pre_ping': os.environ.get('DB_PRE_PING') == '1',
+        }
+    options = {
+        'pool_size': _env_int('DB_POOL_SIZE', 10),
+        'max_overflow': _env_int('DB_MAX_OVERFLOW', 20),
+        'pool_timeout': _env_int('DB_POOL_TIMEOUT', 30),
+        'pool_recycle': _env_int('DB_POOL_RECYCLE', 1800),  # secondes (pare-feu, pgbouncer)
+        'pool_pre_ping': os.environ.get('DB_PRE_PING', '1') != '0',
+    }
+    if backend == 'postgresql':
+        connect_args = {'connect_timeout': 10, 'application_name': 'nosdonnees'}
+        statement_timeout = _env_int('DB_STATEMENT_TIMEOUT', 30000)
+        if statement_timeout:
+            connect_args['options'] = f'-c statement_timeout={statement_timeout}'
+        options['connect_args'] = connect_args
+    return options
+
+
 class Config:
     """Configuration de base"""
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'nosdonnees-secret-key-change-in-production'
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///nosdonnees.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)  # pool (voir engine_options)
+    
+    # Réglages SQLite (voir sqlite_tuning.py ; sans effet sur les autres moteurs)
+    SQLITE_TUNING_ENABLED = os.environ.get('SQLITE_TUNING', '1') != '0'
+    SQLITE_PRAGMAS = {}  # surcharges de sqlite_tuning.DEFAULT_PRAGMAS, ex. {'mmap_size': 0}
+    SQLITE_WRITE_LOCK = True  # écritures du processus sérialisées
+    SQLITE_READ_POOL_SIZE = int(os.environ.get('SQLITE_READ_POOL_SIZE', 4))  # lectures GET (0 : pas de séparation)
     
     # Configuration des uploads
     UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER') or 'uploads'
     MAX_CONTENT_LENGTH = 100 * 1024 * 1024  # 100MB
+    BLOB_FOLDER = os.path.join(UPLOAD_FOLDER, 'blobs')  # fichiers rangés par SHA-256
+    UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # 8MB par morceau (upload par morceaux)
+    UPLOAD_MAX_TOTAL_SIZE = 20 * 1024 * 1024 * 1024  # 20GB max en upload par morceaux
+    UPLOAD_SESSION_TTL = 24 * 3600  # secondes sans morceau reçu avant l'abandon d'une session
+    UPLOAD_MAX_OPEN_SESSIONS = 3  # sessions ouvertes en même temps par utilisateur
+    
+    # Délégation des téléchargements au serveur frontal
+    USE_X_SENDFILE = os.environ.get('USE_X_SENDFILE') == '1'  # Apache/lighttpd
+    DOWNLOAD_ACCEL_PREFIX = os.environ.get('DOWNLOAD_ACCEL_PREFIX')  # nginx, ex. '/protected-uploads/'
+    
+    # Configuration des compteurs de vues/téléchargements
+    COUNTER_BACKEND = os.environ.get('COUNTER_BACKEND') or 'memory'  # memory, spool
+    COUNTER_SPOOL_PATH = os.environ.get('COUNTER_SPOOL_PATH')  # instance/counters_spool.db par défaut
+    COUNTER_FLUSH_INTERVAL = 10  # secondes
+    COUNTER_FLUSH_THRESHOLD = 100  # événements
+    
+    # Journal des téléchargements (tampon en mémoire, partitions SQLite par jour)
+    DOWNLOAD_LOG_FOLDER = os.environ.get('DOWNLOAD_LOG_FOLDER')  # défaut : instance/download_log
+    DOWNLOAD_LOG_BUFFER_SIZE = 10000  # événements gardés en mémoire au plus
+    DOWNLOAD_LOG_FLUSH_INTERVAL = 10  # secondes
+    DOWNLOAD_LOG_FLUSH_THRESHOLD = 500  # événements
+    DOWNLOAD_LOG_COMPACT_AFTER_DAYS = 31  # partitions journalières regroupées par mois ensuite
+    DOWNLOAD_LOG_RETENTION_DAYS = int(os.environ.get('DOWNLOAD_LOG_RETENTION_DAYS', 0))  # 0 : sans limite
+    USAGE_HOURLY_RETENTION_DAYS = 90  # agrégats horaires (les journaliers sont gardés)
+    
+    # Profilage des fichiers (types, valeurs manquantes, cardinalité)
+    PROFILE_BATCH_SIZE = 5000  # lignes lues par lot
+    
+    # Aperçu paginé des fichiers
+    PREVIEW_INDEX_FOLDER = os.path.join(UPLOAD_FOLDER, 'previews')  # index des positions des lignes
+    PREVIEW_INDEX_STRIDE = 256  # une position conservée toutes les N lignes
+    PREVIEW_DEFAULT_LIMIT = 50
+    PREVIEW_MAX_LIMIT = 500
+    PREVIEW_CACHE_SIZE = 256  # pages d'aperçu gardées en mémoire
+    PREVIEW_INDEX_CACHE_SIZE = 32  # index des lignes gardés en mémoire
+    
+    # File des tâches de fond (profilage, etc.)
+    JOB_EMBEDDED_WORKERS = int(os.environ.get('JOB_EMBEDDED_WORKERS', 1))  # 0 avec `flask run-workers`
+    JOB_MAX_ATTEMPTS = 3
+    JOB_RETRY_DELAY = 5  # secondes, doublé à chaque nouvel essai
+    JOB_TIMEOUT = 900  # secondes avant de reprendre la tâche d'un worker disparu
+    
+    # Bases similaires (voir similarity.py)
+    SIMILARITY_INDEX_MAX_AGE = 3600  # secondes avant de relire le catalogue en mémoire
+    SIMILARITY_REBUILD_DELAY = 3600  # reconstruction programmée après une mise à jour (0 : jamais)
     
     # Configuration de sécurité
     SESSION_COOKIE_SECURE = False  # True en production avec HTTPS
@@ -23,7 +124,7 @@ class Config:
     PERMANENT_SESSION_LIFETIME = timedelta(days=7)
     
     # Configuration des fichiers
-    ALLOWED_EXTENSIONS = {'csv', 'xlsx', 'json', 'xml', 'sql', 'zip'}
+    ALLOWED_EXTENSIONS = {'csv', 'xlsx', 'xls', 'json', 'xml', 'sql', 'zip'}
     MAX_FILENAME_LENGTH = 255
     
     # Configuration de l'application
@@ -67,6 +168,28 @@ class Config:
     POPULAR_DATASETS_LIMIT = 6
     ACTIVE_DOMAINS_LIMIT = 5
     DATASETS_PER_PAGE = 12
+    LISTING_COUNT_CAP = 1000  # nombre de résultats affiché au plus (au-delà : « plus de »)
+    SUGGEST_LIMIT = 8  # complétions renvoyées par /api/suggest
+    SUGGEST_MAX_AGE = 300  # secondes avant reconstruction de l'index des suggestions (en arrière-plan)
+    
+    # Configuration du cache (accueil, statistiques)
+    CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'memory')  # memory, sqlite (partagé entre workers), null
+    CACHE_DEFAULT_TTL = 300  # secondes
+    CACHE_MAX_ENTRIES = 1024
+    CACHE_PATH = os.environ.get('CACHE_PATH')  # défaut : instance/cache.db
+    DASHBOARD_CACHE_TTL = 60  # tableau de bord, par utilisateur
+    ADMIN_LIST_PER_PAGE = 20
+    
+    # Nombre de requêtes SQL par requête HTTP (vérifié en debug et en test, voir query_budget.py)
+    QUERY_BUDGET = 30
+    QUERY_BUDGET_ACTION = 'log'  # log, raise
+    
+    # Instrumentation des requêtes (métriques Prometheus, profils des requêtes lentes)
+    INSTRUMENTATION_ENABLED = os.environ.get('INSTRUMENTATION_ENABLED') == '1'
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # jeton Bearer de /metrics (sinon local uniquement)
+    PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))  # part des requêtes sous cProfile
+    PROFILE_SLOW_SECONDS = 1.0  # profil conservé au-delà de cette durée
+    PROFILE_DIR = os.environ.get('PROFILE_DIR')  # défaut : instance/profiles
     
     # Configuration des notifications
     FLASH_MESSAGES = {
@@ -86,13 +209,18 @@ class ProductionConfig(Config):
     DEBUG = False
     TESTING = False
     SESSION_COOKIE_SECURE = True
+    JOB_EMBEDDED_WORKERS = int(os.environ.get('JOB_EMBEDDED_WORKERS', 0))  # workers lancés à part
+    CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'sqlite')  # invalidations vues par tous les workers
     
 class TestingConfig(Config):
     """Configuration pour les tests"""
     DEBUG = True
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
     WTF_CSRF_ENABLED = False
+    JOB_EAGER = True  # tâches exécutées immédiatement
+    CACHE_BACKEND = 'null'
 
 # Mapping des configurations
 config = {
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+"""
+Fixtures partagées des tests : applications créées par create_app(TestingConfig)
+"""
+
+import pytest
+
+import app as nosdonnees
+from app import db, User, Domain, Dataset
+from config import TestingConfig
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """Fabrique d'applications de test : base en mémoire, fichiers sous tmp_path
+
+    ``make_app(QUERY_BUDGET_ACTION='raise')`` ajoute des réglages à
+    TestingConfig. Les compteurs et le journal ne sont vidés que sur
+    demande (pas de thread de vidage).
+    """
+    def make(**settings):
+        defaults = {
+            'UPLOAD_FOLDER': str(tmp_path / 'uploads'),
+            'BLOB_FOLDER': str(tmp_path / 'uploads' / 'blobs'),
+            'PREVIEW_INDEX_FOLDER': str(tmp_path / 'uploads' / 'previews'),
+            'DOWNLOAD_LOG_FOLDER': str(tmp_path / 'download_log'),
+            'COUNTER_SPOOL_PATH': str(tmp_path / 'counters_spool.db'),
+            'CACHE_PATH': str(tmp_path / 'cache.db'),
+            'PROFILE_DIR': str(tmp_path / 'profiles'),
+            'COUNTER_BACKEND': 'memory',
+            'COUNTER_FLUSH_INTERVAL': 0,
+            'DOWNLOAD_LOG_FLUSH_INTERVAL': 0,
+            'JOB_EMBEDDED_WORKERS': 0,
+        }
+        config = type('TestConfig', (TestingConfig,), dict(defaults, **settings))
+        return nosdonnees.create_app(config)
+
+    yield make
+    # Incréments en attente d'un test : ni appliqués ni vus par le suivant
+    nosdonnees.counter_buffer.store.drain()
+
+
+@pytest.fixture
+def app(make_app):
+    """Application de test dans son contexte, tables créées"""
+    test_app = make_app()
+    with test_app.app_context():
+        db.create_all()
+        yield test_app
+        # Compteurs, journal et agrégats écrits dans la base et les fichiers du test
+        nosdonnees.shutdown_services()
+
+
+@pytest.fixture
+def author(app):
+    """Contributeur « auteur » des datasets de test"""
+    user = User(username='auteur', email='auteur@example.org', password_hash='x')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+@pytest.fixture
+def domain(app):
+    """Domaine « Santé » des datasets de test"""
+    domain = Domain(name='Santé')
+    db.session.add(domain)
+    db.session.commit()
+    return domain
+
+
+@pytest.fixture
+def make_dataset(author, domain):
+    """Ajouter un dataset validé de l'auteur (sans commit) ; les champs donnés remplacent les valeurs par défaut"""
+    def make(**fields):
+        values = {
+            'title': 'Base', 'description': 'Description', 'source': 'Source', 'author': author.username,
+            'file_path': 'uploads/x.csv', 'file_format': 'csv', 'domain_id': domain.id, 'user_id': author.id,
+            'status': 'validated',
+        }
+        values.update(fields)
+        dataset = Dataset(**values)
+        db.session.add(dataset)
+        db.session.flush()
+        return dataset
+
+    return make
@@ -0,0 +1,287 @@
+"""
+Compteurs de vues et de téléchargements bufferisés
+
+Plutôt que d'exécuter ``UPDATE dataset ... ; COMMIT`` à chaque affichage ou
+téléchargement, les incréments sont accumulés puis appliqués en un seul
+``UPDATE`` groupé toutes les ``COUNTER_FLUSH_INTERVAL`` secondes ou tous les
+``COUNTER_FLUSH_THRESHOLD`` événements, ainsi qu'à l'arrêt du processus.
+
+Deux stockages des incréments en attente sont disponibles :
+
+- ``memory`` : dictionnaire propre au processus (par défaut) ;
+- ``spool`` : petite base SQLite annexe partagée entre les workers d'une
+  même machine, vidée par n'importe lequel d'entre eux.
+
+Pendant une requête, les incréments en attente sont lus une seule fois
+(``snapshot``) pour tous les compteurs affichés par la page.
+"""
+
+import atexit
+import logging
+import os
+import sqlite3
+import threading
+
+from flask import has_request_context, request
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+COUNTER_FIELDS = ('view_count', 'download_count')
+
+# Incréments en attente lus pour la requête en cours (clé de l'environnement WSGI)
+PENDING_ENVIRON_KEY = 'nosdonnees.counters.pending'
+
+
+class MemoryCounterStore:
+    """Incréments en attente conservés en mémoire"""
+
+    def __init__(self):
+        self._deltas = {}
+        self._lock = threading.Lock()
+
+    def add(self, dataset_id, field, amount):
+        key = (dataset_id, field)
+        with self._lock:
+            self._deltas[key] = self._deltas.get(key, 0) + amount
+
+    def get(self, dataset_id, field):
+        with self._lock:
+            return self._deltas.get((dataset_id, field), 0)
+
+    def snapshot(self):
+        """Tous les incréments en attente, sans les retirer"""
+        with self._lock:
+            return dict(self._deltas)
+
+    def drain(self):
+        """Retirer et retourner tous les incréments en attente"""
+        with self._lock:
+            deltas, self._deltas = self._deltas, {}
+        return deltas
+
+    def restore(self, deltas):
+        """Remettre des incréments qui n'ont pas pu être appliqués"""
+        for (dataset_id, field), amount in deltas.items():
+            self.add(dataset_id, field, amount)
+
+
+class SpoolCounterStore:
+    """Incréments en attente conservés dans une base SQLite annexe
+
+    Le fichier est distinct de la base principale : l'écrire ne bloque donc
+    pas les lecteurs de celle-ci.
+    """
+
+    def __init__(self, path, timeout=5.0):
+        self.path = path
+        self.timeout = timeout
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS counter_spool ('
+                'dataset_id INTEGER NOT NULL, field TEXT NOT NULL, '
+                'delta INTEGER NOT NULL, PRIMARY KEY (dataset_id, field))'
+            )
+        finally:
+            conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+
+    def add(self, dataset_id, field, amount):
+        conn = self._connect()
+        try:
+            conn.execute(
+                'INSERT INTO counter_spool (dataset_id, field, delta) VALUES (?, ?, ?) '
+                'ON CONFLICT (dataset_id, field) DO UPDATE SET delta = delta + excluded.delta',
+                (dataset_id, field, amount)
+            )
+        finally:
+            conn.close()
+
+    def get(self, dataset_id, field):
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                'SELECT delta FROM counter_spool WHERE dataset_id = ? AND field = ?',
+                (dataset_id, field)
+            ).fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else 0
+
+    def snapshot(self):
+        conn = self._connect()
+        try:
+            rows = conn.execute('SELECT dataset_id, field, delta FROM counter_spool').fetchall()
+        finally:
+            conn.close()
+        return {(dataset_id, field): delta for dataset_id, field, delta in rows}
+
+    def drain(self):
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            rows = conn.execute('SELECT dataset_id, field, delta FROM counter_spool').fetchall()
+            conn.execute('DELETE FROM counter_spool')
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+        return {(dataset_id, field): delta for dataset_id, field, delta in rows}
+
+    def restore(self, deltas):
+        for (dataset_id, field), amount in deltas.items():
+            self.add(dataset_id, field, amount)
+
+
+class CounterBuffer:
+    """Agrège les incréments de compteurs et les applique par lots"""
+
+    def __init__(self, store=None, flush_interval=10.0, flush_threshold=100):
+        self.store = store or MemoryCounterStore()
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self._app = None
+        self._db = None
+        self._events = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._timer_pid = None
+        self._stop = threading.Event()
+        self._flush_callbacks = []
+
+    def init_app(self, app, db):
+        """Configurer le buffer à partir de ``app.config``"""
+        self._app = app
+        self._db = db
+        self.flush_interval = app.config.get('COUNTER_FLUSH_INTERVAL', self.flush_interval)
+        self.flush_threshold = app.config.get('COUNTER_FLUSH_THRESHOLD', self.flush_threshold)
+        if app.config.get('COUNTER_BACKEND', 'memory') == 'spool':
+            spool_path = app.config.get('COUNTER_SPOOL_PATH') or os.path.join(
+                app.instance_path, 'counters_spool.db'
+            )
+            self.store = SpoolCounterStore(spool_path)
+
+        app.extensions['counters'] = self
+        app.jinja_env.globals['live_count'] = self.live_count
+        # Une seule fois par processus, quel que soit le nombre d'applications créées
+        atexit.unregister(self.shutdown)
+        atexit.register(self.shutdown)
+
+    def on_flush(self, callback):
+        """Appeler ``callback(rows)`` après chaque vidage réussi (dans le contexte de l'application)
+
+        ``rows`` liste les incréments appliqués : un dict ``id``,
+        ``view_count``, ``download_count`` par dataset.
+        """
+        self._flush_callbacks.append(callback)
+        return callback
+
+    def increment(self, dataset_id, field, amount=1):
+        """Enregistrer un incrément (sans écrire dans la base principale)"""
+        if field not in COUNTER_FIELDS:
+            raise ValueError(f'Compteur inconnu : {field}')
+        self.store.add(dataset_id, field, amount)
+        self._forget_snapshot()
+        self._ensure_timer()
+
+        with self._lock:
+            self._events += 1
+            should_flush = self._events >= self.flush_threshold
+        if should_flush:
+            self.flush()
+
+    def pending(self, dataset_id, field):
+        """Incrément non encore appliqué pour ce dataset
+
+        Pendant une requête, le stockage n'est lu qu'une fois : une page qui
+        affiche les compteurs de nombreux datasets n'ouvre pas une connexion
+        au spool par compteur.
+        """
+        if not has_request_context():
+            return self.store.get(dataset_id, field)
+        deltas = request.environ.get(PENDING_ENVIRON_KEY)
+        if deltas is None:
+            deltas = request.environ[PENDING_ENVIRON_KEY] = self.store.snapshot()
+        return deltas.get((dataset_id, field), 0)
+
+    def _forget_snapshot(self):
+        # Après un incrément ou un vidage de la requête, la lecture suivante repart du stockage
+        if has_request_context():
+            request.environ.pop(PENDING_ENVIRON_KEY, None)
+
+    def live_count(self, dataset, field):
+        """Valeur du compteur incluant les incréments en attente"""
+        return (getattr(dataset, field) or 0) + self.pending(dataset.id, field)
+
+    def flush(self):
+        """Appliquer tous les incréments en attente en un seul UPDATE groupé
+
+        Retourne le nombre de datasets mis à jour.
+        """
+        with self._flush_lock:
+            with self._lock:
+                self._events = 0
+            deltas = self.store.drain()
+            self._forget_snapshot()
+            if not deltas:
+                return 0
+
+            rows = {}
+            for (dataset_id, field), amount in deltas.items():
+                row = rows.setdefault(dataset_id, {'id': dataset_id, 'view_count': 0, 'download_count': 0})
+                row[field] += amount
+
+            try:
+                with self._app.app_context():
+                    with self._db.engine.begin() as conn:
+                        conn.execute(
+                            text(
+                                'UPDATE dataset SET '
+                                'view_count = COALESCE(view_count, 0) + :view_count, '
+                                'download_count = COALESCE(download_count, 0) + :download_count '
+                                'WHERE id = :id'
+                            ),
+                            list(rows.values())
+                        )
+            except Exception:
+                logger.exception('Échec du vidage des compteurs, nouvel essai au prochain cycle')
+                self.store.restore(deltas)
+                return 0
+            with self._app.app_context():
+                for callback in self._flush_callbacks:
+                    try:
+                        callback(list(rows.values()))
+                    except Exception:
+                        logger.exception('Erreur après le vidage des compteurs')
+            return len(rows)
+
+    def shutdown(self):
+        """Arrêter le thread de vidage et appliquer les incréments restants"""
+        self._stop.set()
+        if self._app is not None:
+            self.flush()
+
+    def _ensure_timer(self):
+        # Le thread est démarré à la demande, après un éventuel fork du worker
+        if self._timer_pid == os.getpid() or not self.flush_interval:
+            return
+        with self._lock:
+            if self._timer_pid == os.getpid():
+                return
+            self._timer_pid = os.getpid()
+            self._stop = threading.Event()
+            thread = threading.Thread(target=self._run_timer, name='counter-flush', daemon=True)
+            thread.start()
+
+    def _run_timer(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Erreur dans le thread de vidage des compteurs')
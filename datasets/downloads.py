@@ -0,0 +1,183 @@
+"""
+Envoi en streaming des fichiers de bases de données
+
+Les fichiers sont lus par morceaux de taille fixe au lieu d'être chargés en
+mémoire, les requêtes ``Range``/``If-Range`` permettent la reprise des
+téléchargements et l'ETag (empreinte SHA-256 du contenu) permet de répondre
+``304 Not Modified`` aux clients qui possèdent déjà le fichier.
+
+``astream_file_response`` est la version des vues asynchrones (ASGI) : les
+lectures sont faites dans un thread et le morceau suivant n'est lu qu'une
+fois le précédent accepté par le serveur. Un client lent ne retient ni
+thread ni plus d'un morceau en mémoire.
+"""
+import asyncio
+import mimetypes
+import os
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import content_disposition_header, parse_etags, quote_etag
+
+from .ranges import RangeNotSatisfiable, parse_range
+
+CHUNK_SIZE = 64 * 1024
+
+
+def _file_iterator(path, start, length, chunk_size=CHUNK_SIZE):
+    with open(path, 'rb') as fh:
+        fh.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = fh.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+async def _async_file_iterator(path, start, length, chunk_size=CHUNK_SIZE):
+    """Morceaux lus dans un thread, à la demande du serveur ASGI
+
+    Le serveur n'itère qu'après l'envoi du morceau précédent (``await
+    send``), qui attend lui-même que le tampon de la connexion se vide :
+    la lecture suit le débit du client.
+    """
+    fh = await asyncio.to_thread(open, path, 'rb')
+    try:
+        await asyncio.to_thread(fh.seek, start)
+        remaining = length
+        while remaining > 0:
+            chunk = await asyncio.to_thread(fh.read, min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        fh.close()
+
+
+def _offload_response(path, filename):
+    """Réponse vide déléguant l'envoi au serveur frontal, ou ``None``"""
+    offload = getattr(settings, 'NOSDONNEES_DOWNLOAD_OFFLOAD', None)
+    if not offload:
+        return None
+    response = HttpResponse(content_type=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+    if offload == 'x-sendfile':
+        response['X-Sendfile'] = os.path.abspath(path)
+    elif offload == 'x-accel-redirect':
+        prefix = getattr(settings, 'NOSDONNEES_DOWNLOAD_ACCEL_PREFIX', '/protected-media/')
+        relative_path = os.path.relpath(os.path.abspath(path), os.path.abspath(settings.MEDIA_ROOT))
+        response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + relative_path.replace(os.sep, '/')
+    else:
+        return None
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    return response
+
+
+def _early_response(request, path, filename, quoted_etag):
+    """Réponse sans contenu à lire (304 ou envoi délégué), ou ``None``"""
+    if quoted_etag:
+        client_etags = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+        if quoted_etag in client_etags or '*' in client_etags:
+            response = HttpResponseNotModified()
+            response['ETag'] = quoted_etag
+            return response
+
+    response = _offload_response(path, filename)
+    if response is not None and quoted_etag:
+        response['ETag'] = quoted_etag
+    return response
+
+
+def _requested_range(request, size, quoted_etag):
+    """Plage à envoyer (``None`` : fichier complet) ; lève ``RangeNotSatisfiable``"""
+    # If-Range : la reprise n'est honorée que si le fichier n'a pas changé
+    range_header = request.META.get('HTTP_RANGE')
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if range_header and if_range and if_range != quoted_etag:
+        range_header = None
+    return parse_range(range_header, size) if range_header else None
+
+
+def _range_not_satisfiable(size):
+    response = HttpResponse(status=416)
+    response['Content-Range'] = f'bytes */{size}'
+    return response
+
+
+def stream_file_response(request, path, filename, etag=''):
+    """Construit la réponse de téléchargement (200, 206, 304 ou 416)"""
+    quoted_etag = quote_etag(etag) if etag else None
+    response = _early_response(request, path, filename, quoted_etag)
+    if response is not None:
+        return response
+
+    size = os.path.getsize(path)
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    try:
+        byte_range = _requested_range(request, size, quoted_etag)
+    except RangeNotSatisfiable:
+        return _range_not_satisfiable(size)
+
+    if byte_range is not None:
+        start, end = byte_range
+        length = end - start + 1
+        response = StreamingHttpResponse(
+            _file_iterator(path, start, length), status=206, content_type=content_type
+        )
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(length)
+        response['Content-Disposition'] = content_disposition_header(True, filename)
+    else:
+        response = FileResponse(open(path, 'rb'), as_attachment=True, filename=filename,
+                                content_type=content_type)
+        response.block_size = CHUNK_SIZE
+
+    response['Accept-Ranges'] = 'bytes'
+    if quoted_etag:
+        response['ETag'] = quoted_etag
+    return response
+
+
+async def astream_file_response(request, path, filename, etag=''):
+    """Version asynchrone de ``stream_file_response`` (mêmes codes et en-têtes)"""
+    quoted_etag = quote_etag(etag) if etag else None
+    response = _early_response(request, path, filename, quoted_etag)
+    if response is not None:
+        return response
+
+    size = await asyncio.to_thread(os.path.getsize, path)
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    try:
+        byte_range = _requested_range(request, size, quoted_etag)
+    except RangeNotSatisfiable:
+        return _range_not_satisfiable(size)
+
+    start, end = byte_range if byte_range is not None else (0, size - 1)
+    length = end - start + 1
+    response = StreamingHttpResponse(
+        _async_file_iterator(path, start, length), status=206 if byte_range is not None else 200,
+        content_type=content_type
+    )
+    if byte_range is not None:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Content-Length'] = str(length)
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    response['Accept-Ranges'] = 'bytes'
+    if quoted_etag:
+        response['ETag'] = quoted_etag
+    return response
+
+
+def is_new_download(request, response):
+    """Indique si la réponse correspond au début d'un téléchargement
+
+    Les ``304`` et les reprises (plage ne commençant pas à l'octet 0) ne
+    sont pas comptés.
+    """
+    if response.status_code not in (200, 206):
+        return False
+    if response.status_code == 206:
+        return response['Content-Range'].startswith('bytes 0-')
+    return True
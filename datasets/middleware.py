@@ -0,0 +1,67 @@
+"""
+Instrumentation des requêtes Django (voir instrumentation.py)
+
+Activée en ajoutant ``datasets.middleware.InstrumentationMiddleware`` à
+``MIDDLEWARE`` (``NOSDONNEES_INSTRUMENTATION=1``). Les requêtes SQL sont
+chronométrées avec ``connection.execute_wrapper`` ; les métriques sont
+exposées par la vue ``metrics``. Le middleware accepte les deux modes :
+sous ASGI il n'oblige pas Django à passer les vues asynchrones dans un thread.
+"""
+
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connection
+
+import instrumentation
+
+
+def _time_query(execute, sql, params, many, context):
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        instrumentation.record_query(time.perf_counter() - start)
+
+
+class InstrumentationMiddleware:
+    """Temps, requêtes SQL et octets envoyés par vue"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.metrics = instrumentation.metrics
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = instrumentation.start_request()
+        try:
+            with connection.execute_wrapper(_time_query):
+                response = self.get_response(request)
+        finally:
+            instrumentation.end_request()
+        self._observe(request, response, stats)
+        return response
+
+    async def __acall__(self, request):
+        stats = instrumentation.start_request()
+        try:
+            with connection.execute_wrapper(_time_query):
+                response = await self.get_response(request)
+        finally:
+            instrumentation.end_request()
+        self._observe(request, response, stats)
+        return response
+
+    def _observe(self, request, response, stats):
+        duration = time.perf_counter() - stats.start
+
+        match = request.resolver_match
+        endpoint = match.url_name if match and match.url_name else 'not_found'
+        length = response.get('Content-Length')
+        self.metrics.observe(endpoint, request.method, response.status_code, stats, duration,
+                             int(length) if length and length.isdigit() else None)
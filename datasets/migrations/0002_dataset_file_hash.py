@@ -0,0 +1,18 @@
+# Generated manually for Nosdonnées
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('datasets', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataset',
+            name='file_hash',
+            field=models.CharField(blank=True, help_text='Empreinte SHA-256 du contenu', max_length=64),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated manually for Nosdonnées
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('datasets', '0002_dataset_file_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataset',
+            name='profile',
+            field=models.JSONField(blank=True, help_text='Profil des colonnes (voir profiling.py)', null=True),
+        ),
+        migrations.AddField(
+            model_name='dataset',
+            name='profile_status',
+            field=models.CharField(blank=True, help_text='pending, done, unsupported, failed', max_length=20),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated manually for Nosdonnées
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('datasets', '0003_dataset_profile'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dataset',
+            index=models.Index(fields=['status', 'created_at'], name='ds_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dataset',
+            index=models.Index(fields=['status', 'download_count'], name='ds_status_downloads_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dataset',
+            index=models.Index(fields=['status', 'domain', 'created_at'], name='ds_status_domain_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dataset',
+            index=models.Index(fields=['submitted_by', 'status'], name='ds_submitter_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='downloadlog',
+            index=models.Index(fields=['dataset', 'downloaded_at'], name='download_dataset_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['dataset', 'created_at'], name='comment_dataset_date_idx'),
+        ),
+    ]
@@ -1,9 +1,15 @@
+from django.conf import settings
 from django.db import models
 from django.contrib.auth.models import User
 from django.core.validators import FileExtensionValidator
+from django.urls import reverse
 from django.utils import timezone
+import hashlib
 import os
 
+import preview
+import profiling
+
 
 class UserProfile(models.Model):
     """Profil utilisateur étendu avec rôle"""
@@ -73,6 +79,7 @@ class Dataset(models.Model):
     )
     file_format = models.CharField(max_length=10, choices=FORMAT_CHOICES)
     file_size = models.PositiveIntegerField(help_text="Taille en bytes", blank=True, null=True)
+    file_hash = models.CharField(max_length=64, blank=True, help_text="Empreinte SHA-256 du contenu")
     
     # Classification
     domain = models.ForeignKey(Domain, on_delete=models.CASCADE, related_name='datasets')
@@ -95,6 +102,8 @@ class Dataset(models.Model):
     # Métadonnées techniques
     row_count = models.PositiveIntegerField(blank=True, null=True)
     column_count = models.PositiveIntegerField(blank=True, null=True)
+    profile = models.JSONField(blank=True, null=True, help_text="Profil des colonnes (voir profiling.py)")
+    profile_status = models.CharField(max_length=20, blank=True, help_text="pending, done, unsupported, failed")
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -103,10 +112,21 @@ class Dataset(models.Model):
         verbose_name = "Base de données"
         verbose_name_plural = "Bases de données"
         ordering = ['-created_at']
+        # Accès du catalogue : statut filtré puis tri, domaine ou auteur
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='ds_status_created_idx'),
+            models.Index(fields=['status', 'download_count'], name='ds_status_downloads_idx'),
+            models.Index(fields=['status', 'domain', 'created_at'], name='ds_status_domain_idx'),
+            models.Index(fields=['submitted_by', 'status'], name='ds_submitter_status_idx'),
+        ]
     
     def __str__(self):
         return self.title
     
+    def get_absolute_url(self):
+        """URL de la page du dataset"""
+        return reverse('datasets:dataset_detail', args=[self.pk])
+    
     def get_tags_list(self):
         """Retourne la liste des tags"""
         return [tag.strip() for tag in self.tags.split(',') if tag.strip()]
@@ -117,6 +137,39 @@ class Dataset(models.Model):
             return round(self.file_size / (1024 * 1024), 2)
         return 0
     
+    def compute_file_hash(self):
+        """Calcule l'empreinte SHA-256 du fichier par morceaux"""
+        digest = hashlib.sha256()
+        for chunk in self.file.chunks():
+            digest.update(chunk)
+        return digest.hexdigest()
+    
+    def compute_profile(self):
+        """Profile le fichier (types, valeurs manquantes, cardinalité) et enregistre le résultat"""
+        try:
+            result = profiling.profile_file(self.file.path, self.file_format)
+        except profiling.UnsupportedFormat:
+            self.profile_status = 'unsupported'
+        except Exception:
+            self.profile_status = 'failed'
+        else:
+            self.row_count = result['row_count']
+            self.column_count = result['column_count']
+            self.profile = result
+            self.profile_status = 'done'
+        self.save(update_fields=['row_count', 'column_count', 'profile', 'profile_status'])
+    
+    def build_preview_index(self):
+        """Indexe les positions des lignes pour l'aperçu paginé (index partagé par empreinte)"""
+        if not self.file_hash or self.file_format not in preview.INDEXED_FORMATS:
+            return
+        path = preview.index_path(settings.NOSDONNEES_PREVIEW_INDEX_FOLDER, self.file_hash)
+        if os.path.exists(path):
+            return
+        index = preview.build_row_index(self.file.path, self.file_format)
+        if index is not None:
+            index.save(path)
+    
     def increment_download(self):
         """Incrémente le compteur de téléchargements"""
         self.download_count += 1
@@ -154,6 +207,9 @@ class DownloadLog(models.Model):
     
     class Meta:
         ordering = ['-downloaded_at']
+        indexes = [
+            models.Index(fields=['dataset', 'downloaded_at'], name='download_dataset_date_idx'),
+        ]
     
     def __str__(self):
         return f"{self.dataset.title} - {self.downloaded_at}"
@@ -170,6 +226,9 @@ class Comment(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['dataset', 'created_at'], name='comment_dataset_date_idx'),
+        ]
     
     def __str__(self):
         return f"Commentaire de {self.user.username} sur {self.dataset.title}" 
\ No newline at end of file
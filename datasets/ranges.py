@@ -0,0 +1,37 @@
+"""
+Analyse de l'en-tête ``Range`` des téléchargements
+
+Module sans dépendance à Django, testé hors du framework.
+"""
+import re
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(Exception):
+    """Plage demandée hors du fichier"""
+
+
+def parse_range(header, size):
+    """Retourne la plage (début, fin) inclusive demandée par l'en-tête ``Range``
+
+    Retourne ``None`` pour un en-tête absent, mal formé ou multi-plages
+    (le fichier complet est alors envoyé).
+    """
+    match = RANGE_RE.match((header or '').strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffixe : les N derniers octets
+        length = int(last)
+        if length == 0:
+            raise RangeNotSatisfiable()
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise RangeNotSatisfiable()
+    return start, end
@@ -1,6 +1,13 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
+# Vues asynchrones sous ASGI (asgi.py), synchrones sous WSGI
+if settings.NOSDONNEES_ASYNC_VIEWS:
+    download_view, search_view = views.dataset_download_async, views.api_search_datasets_async
+else:
+    download_view, search_view = views.dataset_download, views.api_search_datasets
+
 app_name = 'datasets'
 
 urlpatterns = [
@@ -8,7 +15,7 @@ urlpatterns = [
     path('', views.home, name='home'),
     path('datasets/', views.dataset_list, name='dataset_list'),
     path('datasets/<int:pk>/', views.dataset_detail, name='dataset_detail'),
-    path('datasets/<int:pk>/download/', views.dataset_download, name='dataset_download'),
+    path('datasets/<int:pk>/download/', download_view, name='dataset_download'),
     path('domains/', views.domain_list, name='domain_list'),
     path('domains/<int:pk>/', views.domain_detail, name='domain_detail'),
     
@@ -23,6 +30,10 @@ urlpatterns = [
     path('admin/validation/<int:pk>/', views.admin_validation, name='admin_validation'),
     
     # API
-    path('api/search/', views.api_search_datasets, name='api_search'),
+    path('api/search/', search_view, name='api_search'),
+    path('api/datasets/<int:pk>/preview/', views.api_dataset_preview, name='api_dataset_preview'),
     path('api/stats/', views.api_dataset_stats, name='api_stats'),
+    
+    # Supervision
+    path('metrics/', views.metrics, name='metrics'),
 ] 
\ No newline at end of file
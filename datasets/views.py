@@ -3,21 +3,62 @@ from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib import messages
 from django.core.paginator import Paginator
-from django.db.models import Q, Count
-from django.http import JsonResponse, HttpResponse
+from django.db.models import F, Q, Count, Sum
+from django.http import Http404, JsonResponse, HttpResponse
 from django.views.generic import ListView, DetailView, CreateView, UpdateView
 from django.urls import reverse_lazy
 from django.utils import timezone
+from django.db import transaction
+from django.core.cache import cache
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.contrib.auth.views import redirect_to_login
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from asgiref.sync import sync_to_async
+import asyncio
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import instrumentation
+import keyset
+import preview
+import profiling
 
 from .models import Dataset, Domain, UserProfile, Comment, DownloadLog
+from .downloads import astream_file_response, stream_file_response, is_new_download
 from .forms import (
     DatasetUploadForm, DatasetSearchForm, CommentForm, 
     UserRegistrationForm, DatasetUpdateForm, AdminValidationForm
 )
 
 
+def start_profiling(dataset_pk):
+    """Profile le fichier d'un dataset en arrière-plan, après l'upload"""
+    def run():
+        from django.db import connection
+        try:
+            dataset = Dataset.objects.get(pk=dataset_pk)
+            dataset.compute_profile()
+            dataset.build_preview_index()
+        except Dataset.DoesNotExist:
+            pass
+        finally:
+            connection.close()
+
+    threading.Thread(target=run, name=f'profile-{dataset_pk}', daemon=True).start()
+
+
+# Pages et statistiques qui dépendent de l'ensemble du catalogue
+CATALOGUE_CACHE_KEYS = ('datasets:home', 'datasets:stats')
+
+
+def invalidate_catalogue_cache():
+    """Oublie l'accueil et les statistiques en cache après une écriture"""
+    cache.delete_many(CATALOGUE_CACHE_KEYS)
+
+
 def is_admin(user):
     """Vérifie si l'utilisateur est admin"""
     try:
@@ -34,36 +75,31 @@ def is_contributor(user):
         return False
 
 
+def home_context():
+    """Statistiques et listes de la page d'accueil (mises en cache)"""
+    published = Dataset.objects.filter(status='published')
+    return {
+        'total_datasets': published.count(),
+        'total_downloads': published.aggregate(total=Sum('download_count'))['total'] or 0,
+        'total_users': User.objects.count(),
+        # Bases les plus populaires
+        'popular_datasets': list(published.order_by('-download_count')[:6]),
+        # Domaines les plus actifs
+        'active_domains': list(Domain.objects.annotate(
+            dataset_count=Count('datasets', filter=Q(datasets__status='published'))
+        ).filter(dataset_count__gt=0).order_by('-dataset_count')[:5]),
+    }
+
+
 def home(request):
     """Page d'accueil"""
-    # Statistiques
-    total_datasets = Dataset.objects.filter(status='published').count()
-    total_downloads = Dataset.objects.filter(status='published').aggregate(
-        total=Count('download_count')
-    )['total'] or 0
-    total_users = User.objects.count()
-    
-    # Bases les plus populaires
-    popular_datasets = Dataset.objects.filter(status='published').order_by('-download_count')[:6]
-    
-    # Domaines les plus actifs
-    active_domains = Domain.objects.annotate(
-        dataset_count=Count('datasets', filter=Q(datasets__status='published'))
-    ).filter(dataset_count__gt=0).order_by('-dataset_count')[:5]
-    
-    context = {
-        'total_datasets': total_datasets,
-        'total_downloads': total_downloads,
-        'total_users': total_users,
-        'popular_datasets': popular_datasets,
-        'active_domains': active_domains,
-    }
+    context = cache.get_or_set('datasets:home', home_context, settings.NOSDONNEES_STATS_CACHE_TIMEOUT)
     return render(request, 'datasets/home.html', context)
 
 
 def dataset_list(request):
     """Liste des bases de données avec filtres"""
-    datasets = Dataset.objects.filter(status='published')
+    datasets = Dataset.objects.filter(status='published').select_related('domain')
     
     # Formulaire de recherche
     search_form = DatasetSearchForm(request.GET)
@@ -116,7 +152,7 @@ def dataset_list(request):
 
 def dataset_detail(request, pk):
     """Détail d'une base de données"""
-    dataset = get_object_or_404(Dataset, pk=pk)
+    dataset = get_object_or_404(Dataset.objects.select_related('domain'), pk=pk)
     
     # Incrémenter le compteur de vues
     dataset.increment_view()
@@ -135,7 +171,7 @@ def dataset_detail(request, pk):
             return redirect('dataset_detail', pk=pk)
     
     # Commentaires
-    comments = dataset.comments.all()
+    comments = dataset.comments.select_related('user')
     
     context = {
         'dataset': dataset,
@@ -150,27 +186,173 @@ def dataset_download(request, pk):
     """Téléchargement d'une base de données"""
     dataset = get_object_or_404(Dataset, pk=pk, status='published')
     
-    # Incrémenter le compteur de téléchargements
-    dataset.increment_download()
+    file_path = dataset.file.path
+    if not os.path.exists(file_path):
+        messages.error(request, 'Fichier non trouvé.')
+        return redirect('dataset_detail', pk=pk)
     
-    # Enregistrer le téléchargement
-    DownloadLog.objects.create(
+    # Empreinte du contenu (ETag fort), calculée une fois pour les anciens datasets
+    if not dataset.file_hash:
+        with instrumentation.io_timer():
+            dataset.file_hash = dataset.compute_file_hash()
+        dataset.save(update_fields=['file_hash'])
+    
+    # Retourner le fichier en streaming (Range/If-Range, 304 si ETag identique)
+    response = stream_file_response(request, file_path, os.path.basename(file_path), dataset.file_hash)
+    
+    # Les 304 et les reprises de téléchargement ne sont pas comptés
+    if is_new_download(request, response):
+        # Incrémenter le compteur de téléchargements
+        dataset.increment_download()
+        
+        # Enregistrer le téléchargement
+        DownloadLog.objects.create(
+            dataset=dataset,
+            user=request.user if request.user.is_authenticated else None,
+            ip_address=request.META.get('REMOTE_ADDR', ''),
+            user_agent=request.META.get('HTTP_USER_AGENT', '')
+        )
+        invalidate_catalogue_cache()
+    
+    return response
+
+
+async def authenticated_user(request):
+    """Utilisateur connecté ou ``None``, depuis une vue asynchrone
+
+    ``request.user`` est chargé à la première lecture (session, base) : la
+    lecture est faite dans un thread, puis l'utilisateur reste en cache sur
+    la requête. ``login_required`` ne décore pas les vues asynchrones avant
+    Django 5.
+    """
+    return await sync_to_async(lambda: request.user if request.user.is_authenticated else None)()
+
+
+async def record_download(dataset, request, user):
+    """Compter et journaliser un téléchargement depuis une vue asynchrone"""
+    # Incrément fait par la base : pas de perte entre téléchargements simultanés
+    await Dataset.objects.filter(pk=dataset.pk).aupdate(download_count=F('download_count') + 1)
+    await DownloadLog.objects.acreate(
         dataset=dataset,
-        user=request.user if request.user.is_authenticated else None,
+        user=user,
         ip_address=request.META.get('REMOTE_ADDR', ''),
         user_agent=request.META.get('HTTP_USER_AGENT', '')
     )
+    await cache.adelete_many(CATALOGUE_CACHE_KEYS)
+
+
+async def dataset_download_async(request, pk):
+    """Téléchargement d'une base de données (ASGI, voir ``NOSDONNEES_ASYNC_VIEWS``)
+
+    Le fichier est envoyé par ``astream_file_response`` : un téléchargement
+    lent n'occupe pas de thread pendant le transfert.
+    """
+    user = await authenticated_user(request)
+    if user is None:
+        return redirect_to_login(request.get_full_path())
+    try:
+        dataset = await Dataset.objects.aget(pk=pk, status='published')
+    except Dataset.DoesNotExist:
+        raise Http404('Base de données introuvable')
     
-    # Retourner le fichier
     file_path = dataset.file.path
-    if os.path.exists(file_path):
-        with open(file_path, 'rb') as fh:
-            response = HttpResponse(fh.read(), content_type='application/octet-stream')
-            response['Content-Disposition'] = f'attachment; filename="{os.path.basename(file_path)}"'
-            return response
+    if not await asyncio.to_thread(os.path.exists, file_path):
+        messages.error(request, 'Fichier non trouvé.')
+        return redirect('datasets:dataset_detail', pk=pk)
+    
+    # Empreinte du contenu (ETag fort), calculée une fois pour les anciens datasets
+    if not dataset.file_hash:
+        dataset.file_hash = await asyncio.to_thread(dataset.compute_file_hash)
+        await dataset.asave(update_fields=['file_hash'])
+    
+    response = await astream_file_response(request, file_path, os.path.basename(file_path), dataset.file_hash)
+    
+    # Les 304 et les reprises de téléchargement ne sont pas comptés
+    if is_new_download(request, response):
+        await record_download(dataset, request, user)
     
-    messages.error(request, 'Fichier non trouvé.')
-    return redirect('dataset_detail', pk=pk)
+    return response
+
+
+# Pages d'aperçu déjà lues et index des lignes chargés (par processus)
+preview_pages = preview.PageCache(settings.NOSDONNEES_PREVIEW_CACHE_SIZE)
+preview_indexes = preview.IndexCache(
+    settings.NOSDONNEES_PREVIEW_INDEX_FOLDER, settings.NOSDONNEES_PREVIEW_INDEX_CACHE_SIZE
+)
+# Lectures d'aperçu à part : elles ne retiennent pas les threads des téléchargements
+preview_executor = ThreadPoolExecutor(settings.NOSDONNEES_PREVIEW_THREADS, thread_name_prefix='preview')
+
+
+async def api_dataset_preview(request, pk):
+    """API d'aperçu : lignes ``offset .. offset + limit`` du fichier, en JSON
+
+    Vue asynchrone : la lecture du fichier est faite dans un thread du pool
+    ``preview_executor``. Sans index des lignes, l'aperçu s'arrête à
+    ``NOSDONNEES_PREVIEW_UNINDEXED_MAX_OFFSET`` lignes.
+    """
+    if await authenticated_user(request) is None:
+        return JsonResponse({'error': 'Unauthorized'}, status=403)
+    try:
+        dataset = await Dataset.objects.aget(pk=pk, status='published')
+    except Dataset.DoesNotExist:
+        return JsonResponse({'error': 'Base de données introuvable'}, status=404)
+    
+    try:
+        offset = int(request.GET.get('offset', 0))
+        limit = int(request.GET.get('limit', settings.NOSDONNEES_PREVIEW_DEFAULT_LIMIT))
+    except ValueError:
+        offset = limit = -1
+    if offset < 0 or limit < 1:
+        return JsonResponse({'error': 'Paramètres offset/limit invalides'}, status=400)
+    limit = min(limit, settings.NOSDONNEES_PREVIEW_MAX_LIMIT)
+    
+    file_path = dataset.file.path
+    try:
+        modified = await asyncio.to_thread(os.path.getmtime, file_path)
+    except OSError:
+        return JsonResponse({'error': 'Fichier non trouvé'}, status=404)
+    
+    loop = asyncio.get_running_loop()
+    index = await loop.run_in_executor(preview_executor, preview_indexes.get, dataset.file_hash)
+    if index is None and offset > settings.NOSDONNEES_PREVIEW_UNINDEXED_MAX_OFFSET:
+        return JsonResponse({
+            'error': f'Fichier en cours d\'indexation : aperçu limité aux '
+                     f'{settings.NOSDONNEES_PREVIEW_UNINDEXED_MAX_OFFSET} premières lignes'
+        }, status=400)
+    
+    # Les pages sont identifiées par le contenu du fichier : elles ne changent jamais
+    version = dataset.file_hash or f'{dataset.pk}-{modified}'
+    total = index.total if index is not None else dataset.row_count
+    etag = quote_etag(f'{version}-{offset}-{limit}-{total}')
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return not_modified
+    
+    cache_key = (version, offset, limit)
+    page = preview_pages.get(cache_key)
+    if page is None:
+        try:
+            page = await loop.run_in_executor(
+                preview_executor, preview.read_rows, file_path, dataset.file_format, offset, limit, index
+            )
+        except profiling.UnsupportedFormat as exc:
+            return JsonResponse({'error': str(exc)}, status=415)
+        preview_pages.set(cache_key, page)
+    columns, rows = page
+    
+    has_more = offset + len(rows) < total if total is not None else len(rows) == limit
+    response = JsonResponse({
+        'dataset_id': dataset.pk,
+        'columns': columns,
+        'rows': rows,
+        'offset': offset,
+        'limit': limit,
+        'total': total,
+        'next_offset': offset + len(rows) if has_more else None,
+    })
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, max_age=300)
+    return response
 
 
 @login_required
@@ -191,11 +373,16 @@ def dataset_upload(request):
             else:
                 dataset.status = 'pending'
             
-            # Calculer la taille du fichier
+            # Calculer la taille et l'empreinte du fichier
             if dataset.file:
                 dataset.file_size = dataset.file.size
+                dataset.file_hash = dataset.compute_file_hash()
+                dataset.profile_status = 'pending'
             
             dataset.save()
+            transaction.on_commit(invalidate_catalogue_cache)
+            if dataset.file:
+                transaction.on_commit(lambda: start_profiling(dataset.pk))
             
             messages.success(request, 'Base de données soumise avec succès!')
             return redirect('dashboard')
@@ -214,15 +401,14 @@ def dashboard(request):
     user_profile = request.user.userprofile
     
     if user_profile.role == 'admin':
-        # Dashboard admin
-        pending_datasets = Dataset.objects.filter(status='pending')
-        recent_datasets = Dataset.objects.all().order_by('-created_at')[:10]
-        stats = {
-            'total_datasets': Dataset.objects.count(),
-            'published_datasets': Dataset.objects.filter(status='published').count(),
-            'pending_datasets': pending_datasets.count(),
-            'total_users': User.objects.count(),
-        }
+        # Dashboard admin : compteurs en une requête agrégée, file de modération paginée
+        stats = cache.get_or_set('datasets:stats', catalogue_stats, settings.NOSDONNEES_STATS_CACHE_TIMEOUT)
+        stats = dict(stats, total_users=User.objects.count())
+        pending_datasets = Paginator(
+            Dataset.objects.filter(status='pending').select_related('submitted_by', 'domain').order_by('submitted_at'),
+            20
+        ).get_page(request.GET.get('page'))
+        recent_datasets = Dataset.objects.select_related('submitted_by').order_by('-created_at')[:10]
         
         context = {
             'user_profile': user_profile,
@@ -266,6 +452,7 @@ def admin_validation(request, pk):
             dataset.validated_by = request.user
             dataset.validated_at = timezone.now()
             dataset.save()
+            invalidate_catalogue_cache()
             
             messages.success(request, 'Base de données validée avec succès!')
             return redirect('dashboard')
@@ -308,60 +495,129 @@ def domain_list(request):
     return render(request, 'datasets/domain_list.html', context)
 
 
+def keyset_page(queryset, after, before, per_page):
+    """Page d'un queryset trié par (created_at, id) décroissants, désignée par un curseur"""
+    token = before or after
+    backwards = before is not None
+    if token:
+        created_at, pk = keyset.decode_cursor(token, 'recent', 2)
+        if backwards:
+            queryset = queryset.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gt=pk))
+        else:
+            queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+    order = ['created_at', 'pk'] if backwards else ['-created_at', '-pk']
+    rows = list(queryset.order_by(*order)[:per_page + 1])
+    
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+    
+    def cursor(dataset):
+        return keyset.encode_cursor('recent', [dataset.created_at, dataset.pk])
+    
+    next_cursor = cursor(rows[-1]) if rows and (more or backwards) else None
+    prev_cursor = cursor(rows[0]) if rows and ((more and backwards) or (token and not backwards)) else None
+    return keyset.KeysetPage(rows, next_cursor, prev_cursor)
+
+
+def keyset_count(queryset, cap):
+    """Nombre de résultats borné à ``cap`` (et indicateur « plus de »)"""
+    count = queryset.order_by()[:cap + 1].count()
+    return min(count, cap), count > cap
+
+
 def domain_detail(request, pk):
     """Détail d'un domaine avec ses bases de données"""
     domain = get_object_or_404(Domain, pk=pk)
-    datasets = domain.datasets.filter(status='published')
+    datasets = domain.datasets.filter(status='published').select_related('domain')
     
-    # Pagination
-    paginator = Paginator(datasets, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Pagination par curseur sur (created_at, id), sans COUNT ni OFFSET
+    try:
+        page = keyset_page(datasets, request.GET.get('after'), request.GET.get('before'), 12)
+    except keyset.InvalidCursor:
+        return redirect('datasets:domain_detail', pk=pk)
+    count, count_is_approximate = keyset_count(datasets, 1000)
     
     context = {
         'domain': domain,
-        'page_obj': page_obj,
+        'datasets': page.items,
+        'page': page,
+        'result_count': count,
+        'count_is_approximate': count_is_approximate,
     }
     return render(request, 'datasets/domain_detail.html', context)
 
 
 # API Views pour AJAX
+def search_queryset(q):
+    """Dix premières bases publiées correspondant à ``q``"""
+    return Dataset.objects.filter(
+        Q(title__icontains=q) |
+        Q(description__icontains=q) |
+        Q(tags__icontains=q),
+        status='published'
+    )[:10]
+
+
+def search_result(dataset):
+    return {
+        'id': dataset.id,
+        'title': dataset.title,
+        'description': dataset.short_description or dataset.description[:100],
+        'url': dataset.get_absolute_url(),
+    }
+
+
 def api_search_datasets(request):
     """API de recherche AJAX"""
     q = request.GET.get('q', '')
     if q:
-        datasets = Dataset.objects.filter(
-            status='published',
-            Q(title__icontains=q) |
-            Q(description__icontains=q) |
-            Q(tags__icontains=q)
-        )[:10]
-        
-        results = []
-        for dataset in datasets:
-            results.append({
-                'id': dataset.id,
-                'title': dataset.title,
-                'description': dataset.short_description or dataset.description[:100],
-                'url': dataset.get_absolute_url(),
-            })
-        
+        results = [search_result(dataset) for dataset in search_queryset(q)]
         return JsonResponse({'results': results})
     
     return JsonResponse({'results': []})
 
 
+async def api_search_datasets_async(request):
+    """API de recherche AJAX (ASGI, voir ``NOSDONNEES_ASYNC_VIEWS``)"""
+    q = request.GET.get('q', '')
+    if q:
+        results = [search_result(dataset) async for dataset in search_queryset(q)]
+        return JsonResponse({'results': results})
+    
+    return JsonResponse({'results': []})
+
+
+def catalogue_stats():
+    """Compteurs du catalogue en une seule requête agrégée"""
+    stats = Dataset.objects.aggregate(
+        total_datasets=Count('id'),
+        published_datasets=Count('id', filter=Q(status='published')),
+        pending_datasets=Count('id', filter=Q(status='pending')),
+        total_downloads=Sum('download_count'),
+    )
+    stats['total_downloads'] = stats['total_downloads'] or 0
+    return stats
+
+
 def api_dataset_stats(request):
     """API des statistiques"""
     if request.user.is_authenticated and request.user.userprofile.role == 'admin':
-        stats = {
-            'total_datasets': Dataset.objects.count(),
-            'published_datasets': Dataset.objects.filter(status='published').count(),
-            'pending_datasets': Dataset.objects.filter(status='pending').count(),
-            'total_downloads': Dataset.objects.aggregate(
-                total=Count('download_count')
-            )['total'] or 0,
-        }
+        stats = cache.get_or_set('datasets:stats', catalogue_stats, settings.NOSDONNEES_STATS_CACHE_TIMEOUT)
         return JsonResponse(stats)
     
-    return JsonResponse({'error': 'Unauthorized'}, status=403) 
\ No newline at end of file
+    return JsonResponse({'error': 'Unauthorized'}, status=403)
+
+
+def metrics(request):
+    """Métriques des vues au format Prometheus (NOSDONNEES_INSTRUMENTATION)"""
+    if not settings.NOSDONNEES_INSTRUMENTATION:
+        return HttpResponse(status=404)
+    token = settings.NOSDONNEES_METRICS_TOKEN
+    if token:
+        if request.META.get('HTTP_AUTHORIZATION') != f'Bearer {token}':
+            return HttpResponse(status=403)
+    elif request.META.get('REMOTE_ADDR') not in ('127.0.0.1', '::1'):
+        return HttpResponse(status=403)
+    return HttpResponse(instrumentation.metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8') 
\ No newline at end of file
@@ -0,0 +1,321 @@
+"""
+Journal des téléchargements : tampon en mémoire et partitions par jour
+
+Chaque téléchargement insérait une ligne ``DownloadLog`` (User-Agent
+complet compris) dans la transaction de la requête, et la table grossissait
+sans limite dans la base principale. Désormais :
+
+- ``DownloadLogWriter.record`` ajoute l'événement à un tampon circulaire
+  en mémoire, sans écriture pendant la requête ;
+- le tampon est vidé par lots (tous les ``DOWNLOAD_LOG_FLUSH_THRESHOLD``
+  événements, toutes les ``DOWNLOAD_LOG_FLUSH_INTERVAL`` secondes et à
+  l'arrêt du processus) :
+
+  * les User-Agent sont enregistrés une seule fois dans la table
+    ``user_agent`` de la base principale, les événements ne gardent que
+    leur identifiant ;
+  * les événements sont ajoutés aux fichiers SQLite du jour
+    (``DOWNLOAD_LOG_FOLDER/AAAA-MM-JJ.db``), jamais modifiés ensuite ;
+  * les fonctions enregistrées par ``on_write`` reçoivent le lot (mise à
+    jour des agrégats ``usage_rollup``, voir rollups.py).
+
+- ``PartitionStore.compact`` regroupe les fichiers journaliers anciens en
+  un fichier par mois (``AAAA-MM.db``, indexé) et supprime les mois au-delà
+  de la durée de conservation ; les agrégats, eux, restent.
+
+Si la base est indisponible, les événements restent dans le tampon ; quand
+il est plein, les plus anciens sont abandonnés (et comptés dans
+``dropped``) plutôt que de bloquer les téléchargements.
+"""
+
+import atexit
+import glob
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+from collections import deque, namedtuple
+from datetime import date, datetime
+
+import rollups
+
+logger = logging.getLogger(__name__)
+
+DownloadEvent = namedtuple('DownloadEvent', ['dataset_id', 'user_id', 'ip_address', 'user_agent', 'downloaded_at'])
+
+_DAILY = re.compile(r'^(\d{4})-(\d{2})-(\d{2})\.db$')
+_MONTHLY = re.compile(r'^(\d{4})-(\d{2})\.db$')
+
+_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS download_event ('
+    'downloaded_at TEXT NOT NULL, dataset_id INTEGER NOT NULL, user_id INTEGER, '
+    'ip_address TEXT, user_agent_id INTEGER)'
+)
+
+
+def user_agent_digest(value):
+    return hashlib.sha1(value.encode('utf-8', 'surrogatepass')).hexdigest()
+
+
+class PartitionStore:
+    """Fichiers SQLite append-only : un par jour, puis un par mois une fois compactés"""
+
+    def __init__(self, folder, timeout=5.0):
+        self.folder = folder
+        self.timeout = timeout
+        os.makedirs(folder, exist_ok=True)
+
+    def _connect(self, path):
+        return sqlite3.connect(path, timeout=self.timeout, isolation_level=None)
+
+    def daily_path(self, day):
+        return os.path.join(self.folder, f'{day:%Y-%m-%d}.db')
+
+    def monthly_path(self, year, month):
+        return os.path.join(self.folder, f'{year:04d}-{month:02d}.db')
+
+    def append(self, day, rows):
+        """Ajouter des événements ``(moment, dataset, utilisateur, ip, user_agent_id)`` au jour ``day``"""
+        conn = self._connect(self.daily_path(day))
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(_SCHEMA)
+            conn.execute('BEGIN IMMEDIATE')
+            conn.executemany(
+                'INSERT INTO download_event (downloaded_at, dataset_id, user_id, ip_address, user_agent_id) '
+                'VALUES (?, ?, ?, ?, ?)',
+                [(moment.isoformat(sep=' '), *rest) for moment, *rest in rows]
+            )
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+
+    def partitions(self):
+        """Partitions ``(premier jour, chemin, mensuelle)`` dans l'ordre chronologique"""
+        found = []
+        for path in glob.glob(os.path.join(self.folder, '*.db')):
+            name = os.path.basename(path)
+            daily = _DAILY.match(name)
+            monthly = _MONTHLY.match(name)
+            if daily:
+                found.append((date(*map(int, daily.groups())), path, False))
+            elif monthly:
+                found.append((date(*map(int, monthly.groups()), 1), path, True))
+        return sorted(found)
+
+    def read(self, start=None, end=None):
+        """Événements dont le moment est dans ``[start, end[`` (chaînes ISO ou datetimes)"""
+        start = start.isoformat(sep=' ') if isinstance(start, datetime) else start
+        end = end.isoformat(sep=' ') if isinstance(end, datetime) else end
+        for first_day, path, _ in self.partitions():
+            conn = self._connect(path)
+            try:
+                query = 'SELECT downloaded_at, dataset_id, user_id, ip_address, user_agent_id FROM download_event'
+                clauses, params = [], []
+                if start:
+                    clauses.append('downloaded_at >= ?')
+                    params.append(start)
+                if end:
+                    clauses.append('downloaded_at < ?')
+                    params.append(end)
+                if clauses:
+                    query += ' WHERE ' + ' AND '.join(clauses)
+                yield from conn.execute(query + ' ORDER BY downloaded_at', params)
+            finally:
+                conn.close()
+
+    def compact(self, before, drop_before=None):
+        """Regrouper par mois les partitions journalières antérieures à ``before``
+
+        Les mois entièrement antérieurs à ``drop_before`` sont supprimés.
+        Retourne ``(jours regroupés, mois supprimés)``.
+        """
+        merged = dropped = 0
+        touched = set()
+        for first_day, path, monthly in self.partitions():
+            if monthly or first_day >= before:
+                continue
+            target = self.monthly_path(first_day.year, first_day.month)
+            conn = self._connect(target)
+            try:
+                conn.execute(_SCHEMA)
+                conn.execute('ATTACH DATABASE ? AS day', (path,))
+                conn.execute('BEGIN IMMEDIATE')
+                conn.execute('INSERT INTO download_event SELECT * FROM day.download_event')
+                conn.execute('COMMIT')
+                conn.execute('DETACH DATABASE day')
+            finally:
+                conn.close()
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+            touched.add(target)
+            merged += 1
+
+        for target in touched:
+            conn = self._connect(target)
+            try:
+                conn.execute('CREATE INDEX IF NOT EXISTS ix_download_event_dataset '
+                             'ON download_event (dataset_id, downloaded_at)')
+                conn.execute('VACUUM')
+            finally:
+                conn.close()
+
+        if drop_before is not None:
+            for first_day, path, monthly in self.partitions():
+                if monthly and (first_day.year, first_day.month) < (drop_before.year, drop_before.month):
+                    os.remove(path)
+                    dropped += 1
+        return merged, dropped
+
+
+class DownloadLogWriter:
+    """Tampon circulaire des téléchargements, vidé par lots"""
+
+    def __init__(self, capacity=10000, flush_interval=10.0, flush_threshold=500):
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.partitions = None
+        self.dropped = 0
+        self._events = deque(maxlen=capacity)
+        self._write_callbacks = []
+        self._user_agents = {}  # empreinte -> identifiant
+        self._app = None
+        self._db = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._timer_pid = None
+        self._stop = threading.Event()
+
+    def init_app(self, app, db):
+        """Configurer le journal à partir de ``app.config``"""
+        self._app = app
+        self._db = db
+        self.capacity = app.config.get('DOWNLOAD_LOG_BUFFER_SIZE', self.capacity)
+        self.flush_interval = app.config.get('DOWNLOAD_LOG_FLUSH_INTERVAL', self.flush_interval)
+        self.flush_threshold = app.config.get('DOWNLOAD_LOG_FLUSH_THRESHOLD', self.flush_threshold)
+        self._events = deque(self._events, maxlen=self.capacity)
+        self.partitions = PartitionStore(
+            app.config.get('DOWNLOAD_LOG_FOLDER') or os.path.join(app.instance_path, 'download_log')
+        )
+        app.extensions['download_log'] = self
+        # Une seule fois par processus, quel que soit le nombre d'applications créées
+        atexit.unregister(self.shutdown)
+        atexit.register(self.shutdown)
+
+    def record(self, dataset_id, user_id=None, ip_address=None, user_agent='', downloaded_at=None):
+        """Enregistrer un téléchargement (sans écrire dans la base)"""
+        event = DownloadEvent(dataset_id, user_id, ip_address, user_agent or '',
+                              downloaded_at or datetime.utcnow())
+        with self._lock:
+            if len(self._events) == self._events.maxlen:
+                self.dropped += 1
+                if self.dropped % 1000 == 1:
+                    logger.warning('Journal des téléchargements plein : %d événement(s) abandonné(s)', self.dropped)
+            self._events.append(event)
+            should_flush = len(self._events) >= self.flush_threshold
+        self._ensure_timer()
+        if should_flush:
+            self.flush()
+
+    def pending(self):
+        """Nombre d'événements en attente d'écriture"""
+        return len(self._events)
+
+    def flush(self):
+        """Écrire les événements en attente ; retourne leur nombre"""
+        with self._flush_lock:
+            with self._lock:
+                events = list(self._events)
+                self._events.clear()
+            written = 0
+            if events:
+                try:
+                    self.write(events)
+                    written = len(events)
+                except Exception:
+                    logger.exception('Échec de l\'écriture du journal des téléchargements, nouvel essai au prochain cycle')
+                    with self._lock:
+                        # Remis en tête, les événements arrivés entre-temps restent après ;
+                        # au-delà de la capacité, les plus anciens sont abandonnés
+                        kept = events + list(self._events)
+                        overflow = max(len(kept) - self.capacity, 0)
+                        self._events = deque(kept[overflow:], maxlen=self.capacity)
+                        if overflow:
+                            self.dropped += overflow
+                            logger.warning('Journal des téléchargements plein : %d événement(s) abandonné(s)',
+                                           self.dropped)
+                    return 0
+            return written
+
+    def on_write(self, callback):
+        """Appeler ``callback(events)`` après chaque lot écrit dans les partitions"""
+        self._write_callbacks.append(callback)
+        return callback
+
+    def write(self, events):
+        """Écrire un lot d'événements dans les partitions"""
+        # Accès à la base d'abord : un échec ici laisse les partitions intactes
+        with self._app.app_context():
+            user_agent_ids = self._intern_user_agents({event.user_agent for event in events})
+
+        by_day = {}
+        for event in events:
+            by_day.setdefault(event.downloaded_at.date(), []).append((
+                event.downloaded_at, event.dataset_id, event.user_id, event.ip_address,
+                user_agent_ids.get(event.user_agent)
+            ))
+        for day, rows in sorted(by_day.items()):
+            self.partitions.append(day, rows)
+
+        # Les événements sont écrits : une erreur ici ne doit pas les faire réécrire
+        for callback in self._write_callbacks:
+            try:
+                callback(events)
+            except Exception:
+                logger.exception('Erreur après l\'écriture du journal des téléchargements')
+
+    def _intern_user_agents(self, values):
+        """Identifiants ``{texte: id}`` des User-Agent, créés au besoin"""
+        digests = {value: user_agent_digest(value) for value in values if value}
+        missing = {digest: value for value, digest in digests.items() if digest not in self._user_agents}
+        if missing:
+            from sqlalchemy import select
+
+            table = self._db.metadata.tables['user_agent']
+            with self._db.engine.begin() as conn:
+                stmt = rollups.insert_statement(conn, table).on_conflict_do_nothing(index_elements=['digest'])
+                conn.execute(stmt, [{'digest': digest, 'value': value} for digest, value in missing.items()])
+                rows = conn.execute(select(table.c.digest, table.c.id).where(table.c.digest.in_(list(missing))))
+                if len(self._user_agents) > 10000:
+                    self._user_agents.clear()
+                self._user_agents.update(rows.all())
+        return {value: self._user_agents.get(digest) for value, digest in digests.items()}
+
+    def shutdown(self):
+        """Arrêter le thread de vidage et écrire les événements restants"""
+        self._stop.set()
+        if self._app is not None:
+            self.flush()
+
+    def _ensure_timer(self):
+        # Le thread est démarré à la demande, après un éventuel fork du worker
+        if self._timer_pid == os.getpid() or not self.flush_interval:
+            return
+        with self._lock:
+            if self._timer_pid == os.getpid():
+                return
+            self._timer_pid = os.getpid()
+            self._stop = threading.Event()
+            thread = threading.Thread(target=self._run_timer, name='download-log-flush', daemon=True)
+            thread.start()
+
+    def _run_timer(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Erreur dans le thread de vidage du journal des téléchargements')
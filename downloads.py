@@ -0,0 +1,85 @@
+"""
+Envoi des fichiers de bases de données
+
+Les fichiers sont transmis par morceaux de taille fixe (jamais chargés en
+mémoire), avec prise en charge de ``Range``/``If-Range`` pour la reprise des
+téléchargements et un ETag fort dérivé de l'empreinte SHA-256 du contenu :
+un client qui possède déjà le fichier reçoit un ``304 Not Modified``.
+
+Le transfert peut aussi être délégué au serveur frontal :
+
+- ``USE_X_SENDFILE = True`` (option native de Flask) pour Apache/lighttpd ;
+- ``DOWNLOAD_ACCEL_PREFIX = '/protected-uploads/'`` pour nginx
+  (``X-Accel-Redirect``), le préfixe devant pointer sur ``UPLOAD_FOLDER``.
+"""
+
+import hashlib
+import mimetypes
+import os
+from urllib.parse import quote
+
+from flask import current_app, request, send_file  # type: ignore
+
+HASH_CHUNK_SIZE = 1024 * 1024  # 1 Mo
+
+
+def file_sha256(path, chunk_size=HASH_CHUNK_SIZE):
+    """Calculer l'empreinte SHA-256 d'un fichier par morceaux"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _accel_redirect(path, download_name, etag, prefix):
+    upload_folder = os.path.abspath(current_app.config['UPLOAD_FOLDER'])
+    relative_path = os.path.relpath(os.path.abspath(path), upload_folder).replace(os.sep, '/')
+
+    response = current_app.response_class()
+    response.headers['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(relative_path)
+    response.headers['Content-Disposition'] = (
+        f"attachment; filename*=UTF-8''{quote(download_name)}"
+    )
+    response.mimetype = mimetypes.guess_type(download_name)[0] or 'application/octet-stream'
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+
+def send_dataset_file(path, download_name, content_hash):
+    """Construire la réponse de téléchargement d'un fichier
+
+    ``content_hash`` (SHA-256) sert d'ETag fort ; les requêtes
+    conditionnelles et partielles sont traitées par Werkzeug.
+    """
+    accel_prefix = current_app.config.get('DOWNLOAD_ACCEL_PREFIX')
+    if accel_prefix:
+        return _accel_redirect(path, download_name, content_hash, accel_prefix)
+
+    return send_file(
+        path,
+        as_attachment=True,
+        download_name=download_name,
+        conditional=True,
+        etag=content_hash,
+        max_age=current_app.config.get('DOWNLOAD_MAX_AGE', 0),
+    )
+
+
+def is_new_download(response):
+    """Indiquer si la réponse correspond au début d'un téléchargement
+
+    Décidé d'après la réponse, comme dans datasets/downloads.py : tout
+    ``200`` est compté (y compris une reprise dont le ``If-Range`` ne
+    correspond plus, servie en entier), un ``206`` seulement s'il commence
+    à l'octet 0. Les ``304`` ne sont pas comptés.
+    """
+    if response.status_code == 206:
+        return response.headers.get('Content-Range', '').startswith('bytes 0-')
+    if response.status_code != 200:
+        return False
+    if 'X-Accel-Redirect' in response.headers or 'X-Sendfile' in response.headers:
+        # La plage est appliquée par le serveur frontal : seule la requête l'indique
+        if request.range and request.range.ranges:
+            return request.range.ranges[0][0] == 0
+    return True
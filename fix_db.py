@@ -5,11 +5,12 @@ Supprime l'ancienne base et recrée les tables avec la bonne structure
 """
 
 import os
-from app import app, db, User, Domain, Dataset, DownloadLog, Comment
+from app import create_app, db, User, Domain, Dataset, DownloadLog, Comment
 from datetime import datetime
 
 def fix_database():
     """Corriger la base de données"""
+    app = create_app()
     with app.app_context():
         print("🗑️  Suppression de l'ancienne base de données...")
         
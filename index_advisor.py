@@ -0,0 +1,99 @@
+"""
+Conseiller d'index : rejoue les requêtes de l'application et signale
+celles que SQLite exécute sans index
+
+Les pages sont appelées avec le client de test Flask ; chaque SELECT émis
+est enregistré puis passé à ``EXPLAIN QUERY PLAN``. Sont signalés :
+
+- les parcours complets de table (``SCAN dataset`` sans index), dont le
+  coût croît avec la taille du catalogue ;
+- les tris dans un B-tree temporaire (``USE TEMP B-TREE FOR ORDER BY``),
+  signe qu'aucun index ne fournit l'ordre demandé (sans gravité après une
+  recherche par index qui ne retient que quelques lignes).
+
+Les petites tables de référence (domaines) peuvent être ignorées.
+"""
+
+import re
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(.*)$')
+_INDEXED_SCAN = ('USING INDEX', 'USING COVERING INDEX', 'USING INTEGER PRIMARY KEY', 'VIRTUAL TABLE')
+
+
+@contextmanager
+def record_queries(engine):
+    """Enregistrer les SELECT ``(sql, paramètres)`` exécutés dans le bloc"""
+    queries = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            queries.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield queries
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def explain(conn, statement, parameters=()):
+    """Lignes ``detail`` du plan d'exécution SQLite d'une requête"""
+    rows = conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters or ())
+    return [row[-1] for row in rows]
+
+
+def plan_issues(details, ignore_tables=()):
+    """Parcours complets et tris temporaires relevés dans un plan"""
+    issues = []
+    for detail in details:
+        scan = _SCAN.match(detail)
+        if scan:
+            table, rest = scan.groups()
+            if (table not in ignore_tables and not table.startswith('sqlite_')
+                    and not any(marker in rest for marker in _INDEXED_SCAN)):
+                issues.append(f'parcours complet de {table}')
+        elif detail.startswith('USE TEMP B-TREE FOR ORDER BY'):
+            issues.append('tri sans index (B-tree temporaire)')
+    return issues
+
+
+def is_full_scan(issue):
+    return issue.startswith('parcours complet')
+
+
+def advise(app, engine, urls, user_id=None, ignore_tables=()):
+    """Appeler ``urls`` et analyser le plan de chaque requête distincte
+
+    ``user_id`` ouvre une session Flask-Login pour les pages protégées.
+    Retourne une liste de dictionnaires ``{url, sql, plan, issues}``.
+    """
+    if engine.dialect.name != 'sqlite':
+        raise RuntimeError('Le conseiller d\'index utilise EXPLAIN QUERY PLAN (SQLite uniquement)')
+
+    client = app.test_client()
+    if user_id is not None:
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+            session['_fresh'] = True
+
+    reports = []
+    seen = set()
+    for url in urls:
+        with record_queries(engine) as queries:
+            client.get(url)
+        with engine.connect() as conn:
+            for statement, parameters in queries:
+                if statement in seen:
+                    continue
+                seen.add(statement)
+                plan = explain(conn, statement, parameters)
+                reports.append({
+                    'url': url,
+                    'sql': ' '.join(statement.split()),
+                    'plan': plan,
+                    'issues': plan_issues(plan, ignore_tables),
+                })
+    return reports
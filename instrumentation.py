@@ -0,0 +1,420 @@
+"""
+Instrumentation des requêtes : temps, requêtes SQL, gabarits, octets, E/S
+
+Pour chaque vue (endpoint) sont cumulés :
+
+- le nombre de requêtes par méthode et code de retour, et la durée de
+  traitement (histogramme) ;
+- le nombre et la durée des requêtes SQL ;
+- le nombre de connexions prises au pool et la durée pendant laquelle
+  elles ont été gardées (jusqu'à leur retour au pool, à la fin du
+  contexte d'application) ;
+- la durée de rendu des gabarits ;
+- les octets envoyés (``Content-Length``) et la durée de transfert des
+  réponses envoyées en flux (téléchargements), jusqu'à la fermeture ;
+- la durée des lectures/écritures de fichiers mesurées avec ``io_timer()``.
+
+L'occupation des pools de connexions (taille, connexions prises,
+débordement, connexions ouvertes) est relevée à chaque export.
+
+Les valeurs sont exposées au format texte Prometheus (``render()``). Elles
+sont propres au processus : avec plusieurs workers, chacun expose les
+siennes (étiquette ``pid``).
+
+Une fraction des requêtes (``PROFILE_SAMPLE_RATE``) est exécutée sous
+cProfile ; le profil est écrit dans ``PROFILE_DIR`` si la requête a duré
+plus de ``PROFILE_SLOW_SECONDS``.
+
+Le coût par requête se limite à quelques appels à ``perf_counter`` et à
+une mise à jour de dictionnaire sous verrou. Ce module ne dépend pas de
+Flask : l'intégration Flask est dans ``Instrumentation``, celle de Django
+dans ``datasets/middleware.py``.
+"""
+
+import cProfile
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Mesures de la requête en cours : une par thread, ou par tâche sous ASGI
+_current = ContextVar('instrumentation_stats', default=None)
+
+
+class RequestStats:
+    """Mesures d'une requête en cours"""
+    __slots__ = ('start', 'db_queries', 'db_seconds', 'db_checkouts', 'template_seconds', 'io_seconds', 'profiler')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.db_checkouts = 0
+        self.template_seconds = 0.0
+        self.io_seconds = 0.0
+        self.profiler = None
+
+
+def current_stats():
+    """Mesures de la requête en cours dans ce thread ou cette tâche (ou None)"""
+    return _current.get()
+
+
+def start_request():
+    stats = RequestStats()
+    _current.set(stats)
+    return stats
+
+
+def end_request():
+    stats = current_stats()
+    _current.set(None)
+    return stats
+
+
+def record_query(seconds):
+    stats = current_stats()
+    if stats is not None:
+        stats.db_queries += 1
+        stats.db_seconds += seconds
+
+
+def record_checkout():
+    stats = current_stats()
+    if stats is not None:
+        stats.db_checkouts += 1
+
+
+def record_template(seconds):
+    stats = current_stats()
+    if stats is not None:
+        stats.template_seconds += seconds
+
+
+@contextmanager
+def io_timer():
+    """Mesurer une lecture/écriture de fichier faite pendant la requête"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats = current_stats()
+        if stats is not None:
+            stats.io_seconds += time.perf_counter() - start
+
+
+class _Endpoint:
+    __slots__ = ('requests', 'buckets', 'duration', 'db_queries', 'db_seconds', 'db_checkouts',
+                 'db_hold_seconds', 'template_seconds', 'io_seconds', 'bytes_sent', 'transfer_seconds')
+
+    def __init__(self):
+        self.requests = {}  # (méthode, code) -> nombre
+        self.buckets = [0] * (len(DURATION_BUCKETS) + 1)
+        self.duration = 0.0
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.db_checkouts = 0
+        self.db_hold_seconds = 0.0
+        self.template_seconds = 0.0
+        self.io_seconds = 0.0
+        self.bytes_sent = 0
+        self.transfer_seconds = 0.0
+
+
+class Metrics:
+    """Cumuls par endpoint, pour l'export Prometheus"""
+
+    def __init__(self, prefix='nosdonnees'):
+        self.prefix = prefix
+        self.slow_profiles = 0
+        self._endpoints = {}
+        self._engines = {}  # nom -> moteur SQLAlchemy dont le pool est relevé à l'export
+        self._connections_opened = {}  # nom du moteur -> connexions ouvertes
+        self._lock = threading.Lock()
+
+    def _endpoint(self, name):
+        endpoint = self._endpoints.get(name)
+        if endpoint is None:
+            endpoint = self._endpoints[name] = _Endpoint()
+        return endpoint
+
+    def observe(self, endpoint, method, status, stats, duration, bytes_sent=None):
+        """Enregistrer une requête terminée"""
+        with self._lock:
+            data = self._endpoint(endpoint)
+            key = (method, status)
+            data.requests[key] = data.requests.get(key, 0) + 1
+            data.buckets[bisect_left(DURATION_BUCKETS, duration)] += 1
+            data.duration += duration
+            data.db_queries += stats.db_queries
+            data.db_seconds += stats.db_seconds
+            data.db_checkouts += stats.db_checkouts
+            data.template_seconds += stats.template_seconds
+            data.io_seconds += stats.io_seconds
+            if bytes_sent:
+                data.bytes_sent += bytes_sent
+
+    def observe_transfer(self, endpoint, seconds):
+        """Durée d'envoi d'une réponse en flux (jusqu'à sa fermeture)"""
+        with self._lock:
+            self._endpoint(endpoint).transfer_seconds += seconds
+
+    def observe_checkin(self, endpoint, seconds):
+        """Durée pendant laquelle une connexion prise par l'endpoint a été gardée"""
+        with self._lock:
+            self._endpoint(endpoint).db_hold_seconds += seconds
+
+    def add_engine(self, name, engine):
+        """Relever le pool de ``engine`` à chaque export"""
+        with self._lock:
+            self._engines[name] = engine
+            self._connections_opened.setdefault(name, 0)
+
+    def observe_connect(self, name):
+        with self._lock:
+            self._connections_opened[name] = self._connections_opened.get(name, 0) + 1
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+            self.slow_profiles = 0
+            self._connections_opened = dict.fromkeys(self._engines, 0)
+
+    def render(self):
+        """Cumuls au format texte d'exposition Prometheus"""
+        pid = os.getpid()
+        p = self.prefix
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f'# HELP {p}_{name} {help_text}')
+            lines.append(f'# TYPE {p}_{name} {kind}')
+
+        with self._lock:
+            endpoints = sorted(self._endpoints.items())
+
+            family('requests_total', 'counter', 'Requêtes traitées')
+            for name, data in endpoints:
+                for (method, status), count in sorted(data.requests.items()):
+                    lines.append(f'{p}_requests_total{{endpoint="{name}",method="{method}",'
+                                 f'status="{status}",pid="{pid}"}} {count}')
+
+            family('request_duration_seconds', 'histogram', 'Durée de traitement des requêtes')
+            for name, data in endpoints:
+                labels = f'endpoint="{name}",pid="{pid}"'
+                cumulative = 0
+                for bound, count in zip(DURATION_BUCKETS + ('+Inf',), data.buckets):
+                    cumulative += count
+                    lines.append(f'{p}_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'{p}_request_duration_seconds_sum{{{labels}}} {data.duration:.6f}')
+                lines.append(f'{p}_request_duration_seconds_count{{{labels}}} {cumulative}')
+
+            for metric, attribute, kind, help_text in (
+                ('db_queries_total', 'db_queries', 'counter', 'Requêtes SQL exécutées'),
+                ('db_seconds_total', 'db_seconds', 'counter', 'Durée des requêtes SQL'),
+                ('db_checkouts_total', 'db_checkouts', 'counter', 'Connexions prises au pool'),
+                ('db_connection_hold_seconds_total', 'db_hold_seconds', 'counter',
+                 'Durée pendant laquelle les connexions prises ont été gardées'),
+                ('template_seconds_total', 'template_seconds', 'counter', 'Durée de rendu des gabarits'),
+                ('file_io_seconds_total', 'io_seconds', 'counter', 'Durée des entrées/sorties fichier mesurées'),
+                ('response_bytes_total', 'bytes_sent', 'counter', 'Octets envoyés (Content-Length)'),
+                ('transfer_seconds_total', 'transfer_seconds', 'counter', 'Durée d\'envoi des réponses en flux'),
+            ):
+                family(metric, kind, help_text)
+                for name, data in endpoints:
+                    value = getattr(data, attribute)
+                    value = f'{value:.6f}' if isinstance(value, float) else value
+                    lines.append(f'{p}_{metric}{{endpoint="{name}",pid="{pid}"}} {value}')
+
+            family('slow_profiles_total', 'counter', 'Profils cProfile écrits pour des requêtes lentes')
+            lines.append(f'{p}_slow_profiles_total{{pid="{pid}"}} {self.slow_profiles}')
+
+            pools = [(name, engine.pool) for name, engine in sorted(self._engines.items())]
+            for metric, method, help_text in (
+                ('db_pool_size', 'size', 'Connexions permanentes du pool'),
+                ('db_pool_checked_out', 'checkedout', 'Connexions prises au pool'),
+                ('db_pool_overflow', 'overflow', 'Connexions en débordement du pool'),
+            ):
+                family(metric, 'gauge', help_text)
+                for name, pool in pools:
+                    # Les pools sans taille (SQLite en mémoire) ne sont pas relevés
+                    if callable(getattr(pool, method, None)):
+                        lines.append(f'{p}_{metric}{{engine="{name}",pid="{pid}"}} {getattr(pool, method)()}')
+            family('db_connections_opened_total', 'counter', 'Connexions ouvertes par les pools')
+            for name, count in sorted(self._connections_opened.items()):
+                lines.append(f'{p}_db_connections_opened_total{{engine="{name}",pid="{pid}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+class SlowRequestProfiler:
+    """Profil cProfile d'un échantillon de requêtes, conservé si elles sont lentes"""
+
+    def __init__(self, directory, sample_rate=0.0, slow_seconds=1.0, metrics=metrics):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.slow_seconds = slow_seconds
+        self.metrics = metrics
+
+    def maybe_start(self, stats):
+        if self.sample_rate and random.random() < self.sample_rate:
+            stats.profiler = cProfile.Profile()
+            stats.profiler.enable()
+
+    def finish(self, stats, endpoint, duration):
+        """Arrêter le profil ; l'écrire si la requête a été lente. Retourne son chemin"""
+        profiler = stats.profiler
+        if profiler is None:
+            return None
+        profiler.disable()
+        stats.profiler = None
+        if duration < self.slow_seconds:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(
+            self.directory, f'{endpoint}-{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}-{int(duration * 1000)}ms.prof'
+        )
+        profiler.dump_stats(path)
+        self.metrics.slow_profiles += 1
+        return path
+
+
+def _on_close(iterable, callback):
+    """Appeler ``callback`` à la fermeture d'un itérable de réponse
+
+    Werkzeug renvoie tel quel l'itérable des réponses ``direct_passthrough``
+    (``send_file``) : ``call_on_close`` n'est alors jamais appelé. L'itérable
+    (``wsgi.file_wrapper`` du serveur) n'est pas enveloppé, pour que le
+    serveur puisse toujours utiliser ``sendfile``.
+    """
+    close = getattr(iterable, 'close', None)
+
+    def closing():
+        try:
+            if close is not None:
+                close()
+        finally:
+            callback()
+
+    try:
+        iterable.close = closing
+    except AttributeError:
+        pass
+
+
+class Instrumentation:
+    """Intégration Flask (activée par ``INSTRUMENTATION_ENABLED``)"""
+
+    def __init__(self, app=None, db=None, metrics=metrics):
+        self.metrics = metrics
+        self.profiler = None
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        app.extensions['instrumentation'] = self
+        if not app.config.get('INSTRUMENTATION_ENABLED'):
+            return
+        from flask import before_render_template, template_rendered
+        from sqlalchemy import event
+
+        import sqlite_tuning
+
+        self.profiler = SlowRequestProfiler(
+            app.config.get('PROFILE_DIR') or os.path.join(app.instance_path, 'profiles'),
+            sample_rate=app.config.get('PROFILE_SAMPLE_RATE', 0.0),
+            slow_seconds=app.config.get('PROFILE_SLOW_SECONDS', 1.0),
+            metrics=self.metrics,
+        )
+
+        for name, engine in zip(('main', 'read'), sqlite_tuning.engines(app, db)):
+            event.listen(engine, 'before_cursor_execute', self._before_query)
+            event.listen(engine, 'after_cursor_execute', self._after_query)
+            # Événements du pool (conservés quand le pool est recréé par ``dispose()``)
+            event.listen(engine, 'checkout', self._on_checkout)
+            event.listen(engine, 'checkin', self._on_checkin)
+            event.listen(engine, 'connect', lambda *args, name=name: self.metrics.observe_connect(name))
+            self.metrics.add_engine(name, engine)
+        before_render_template.connect(self._before_template, app)
+        template_rendered.connect(self._after_template, app)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    @staticmethod
+    def _before_query(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('instrumentation_start', []).append(time.perf_counter())
+
+    @staticmethod
+    def _after_query(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('instrumentation_start')
+        if starts:
+            record_query(time.perf_counter() - starts.pop())
+
+    @staticmethod
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        from flask import has_request_context, request
+
+        if current_stats() is None or not has_request_context():
+            return
+        record_checkout()
+        connection_record.info['instrumentation_checkout'] = (
+            time.perf_counter(), request.endpoint or 'not_found'
+        )
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        # Rendue au pool après la réponse (fin du contexte d'application) : cumul direct par endpoint
+        checkout = connection_record.info.pop('instrumentation_checkout', None)
+        if checkout is not None:
+            start, endpoint = checkout
+            self.metrics.observe_checkin(endpoint, time.perf_counter() - start)
+
+    @staticmethod
+    def _before_template(sender, template, context, **extra):
+        stats = current_stats()
+        if stats is not None:
+            context['_instrumentation_start'] = time.perf_counter()
+
+    @staticmethod
+    def _after_template(sender, template, context, **extra):
+        start = context.get('_instrumentation_start')
+        if start is not None:
+            record_template(time.perf_counter() - start)
+
+    def _before_request(self):
+        self.profiler.maybe_start(start_request())
+
+    def _after_request(self, response):
+        from flask import request
+
+        stats = end_request()
+        if stats is None:
+            return response
+        end = time.perf_counter()
+        duration = end - stats.start
+        endpoint = request.endpoint or 'not_found'
+        self.profiler.finish(stats, endpoint, duration)
+        self.metrics.observe(endpoint, request.method, response.status_code, stats, duration,
+                             response.content_length)
+        if response.is_streamed:
+            # Fichiers envoyés en flux : durée jusqu'à la fin de l'envoi
+            done = lambda: self.metrics.observe_transfer(endpoint, time.perf_counter() - end)
+            if response.direct_passthrough:
+                _on_close(response.response, done)
+            else:
+                response.call_on_close(done)
+        return response
+
+    @staticmethod
+    def _teardown_request(exc):
+        # Requête interrompue par une exception : ne pas garder ses mesures
+        stats = end_request()
+        if stats is not None and stats.profiler is not None:
+            stats.profiler.disable()
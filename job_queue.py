@@ -0,0 +1,308 @@
+"""
+File de tâches de fond persistante
+
+Les traitements lourds déclenchés par un upload (profilage, aperçus, etc.)
+ne sont plus exécutés pendant la requête : ils sont enregistrés dans la
+table ``job`` de la base principale puis exécutés par des workers.
+
+- ``JobQueue.task()`` déclare une tâche (fonction appelée avec les
+  paramètres enregistrés) ;
+- ``JobQueue.enqueue()`` ajoute une exécution à la file ;
+- les workers réservent les tâches une par une (``UPDATE ... RETURNING``,
+  atomique même avec plusieurs processus), les réessaient avec un délai
+  exponentiel en cas d'erreur et remettent en file celles d'un worker
+  arrêté brutalement.
+
+Les workers tournent soit dans le processus web (``JOB_EMBEDDED_WORKERS``
+threads démarrés à la demande), soit à part avec ``flask run-workers``.
+"""
+
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+from datetime import datetime, timedelta
+
+from flask import has_request_context
+from sqlalchemy import Column, DateTime, Integer, String, Text, Index, select, update
+from sqlalchemy.orm import declared_attr
+
+logger = logging.getLogger(__name__)
+
+
+class JobMixin:
+    """Colonnes de la table des tâches (le modèle est déclaré dans app.py)"""
+    id = Column(Integer, primary_key=True)
+    name = Column(String(100), nullable=False)
+    payload = Column(Text)  # Paramètres de la tâche (JSON)
+    status = Column(String(20), default='queued')  # queued, running, done, failed
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=3)
+    run_at = Column(DateTime, default=datetime.utcnow)  # Pas avant cette date (délai de reprise)
+    locked_by = Column(String(100))  # Worker qui exécute la tâche
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+    last_error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    @declared_attr
+    def __table_args__(cls):
+        # Index de la réservation : tâches prêtes par date d'exécution
+        return (Index('ix_job_status_run_at', 'status', 'run_at'),)
+
+    def get_payload(self):
+        return json.loads(self.payload) if self.payload else {}
+
+
+class JobQueue:
+    """File de tâches stockée dans une table SQL"""
+
+    def __init__(self, max_attempts=3, retry_delay=5.0, retry_max_delay=600.0,
+                 poll_interval=1.0, job_timeout=900.0):
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.retry_max_delay = retry_max_delay
+        self.poll_interval = poll_interval
+        self.job_timeout = job_timeout
+        self.eager = False
+        self.embedded_workers = 0
+        self.tasks = {}
+        self._app = None
+        self._db = None
+        self._model = None
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._workers_pid = None
+        self._last_stale_check = None
+
+    def init_app(self, app, db, model):
+        """Configurer la file à partir de ``app.config``"""
+        self._app = app
+        self._db = db
+        self._model = model
+        self.max_attempts = app.config.get('JOB_MAX_ATTEMPTS', self.max_attempts)
+        self.retry_delay = app.config.get('JOB_RETRY_DELAY', self.retry_delay)
+        self.poll_interval = app.config.get('JOB_POLL_INTERVAL', self.poll_interval)
+        self.job_timeout = app.config.get('JOB_TIMEOUT', self.job_timeout)
+        self.eager = app.config.get('JOB_EAGER', False)
+        self.embedded_workers = app.config.get('JOB_EMBEDDED_WORKERS', 0)
+        app.extensions['jobs'] = self
+
+    @property
+    def table(self):
+        return self._model.__table__
+
+    def task(self, name=None):
+        """Décorateur : déclarer une fonction comme tâche de fond"""
+        def register(func):
+            self.tasks[name or func.__name__] = func
+            return func
+        return register
+
+    def enqueue(self, name, delay=0, max_attempts=None, **payload):
+        """Ajouter une tâche à la file et retourner son identifiant
+
+        Avec ``JOB_EAGER`` (tests), la tâche est exécutée immédiatement.
+        """
+        if name not in self.tasks:
+            raise ValueError(f'Tâche inconnue : {name}')
+        now = datetime.utcnow()
+        values = {
+            'name': name,
+            'payload': json.dumps(payload),
+            'status': 'queued',
+            'attempts': 0,
+            'max_attempts': max_attempts or self.max_attempts,
+            'run_at': now + timedelta(seconds=delay),
+            'created_at': now,
+        }
+        # Colonne optionnelle du modèle, pour afficher les tâches d'un dataset
+        if 'dataset_id' in payload and 'dataset_id' in self.table.c:
+            values['dataset_id'] = payload['dataset_id']
+
+        with self._app.app_context():
+            with self._db.engine.begin() as conn:
+                job_id = conn.execute(self.table.insert().values(**values)).inserted_primary_key[0]
+
+        if self.eager:
+            self.run_pending(worker_id='eager')
+        elif self.embedded_workers and has_request_context():
+            # Seul le serveur web héberge des workers (pas les commandes CLI)
+            self._ensure_embedded_workers()
+            self._wakeup.set()
+        return job_id
+
+    def claim(self, worker_id):
+        """Réserver la prochaine tâche prête (ou None)"""
+        table = self.table
+        now = datetime.utcnow()
+        next_id = (
+            select(table.c.id)
+            .where(table.c.status == 'queued', table.c.run_at <= now)
+            .order_by(table.c.run_at, table.c.id)
+            .limit(1)
+            .scalar_subquery()
+        )
+        statement = (
+            update(table)
+            .where(table.c.id == next_id, table.c.status == 'queued')
+            .values(status='running', attempts=table.c.attempts + 1,
+                    locked_by=worker_id, started_at=now)
+            .returning(table.c.id, table.c.name, table.c.payload,
+                       table.c.attempts, table.c.max_attempts)
+        )
+        with self._db.engine.begin() as conn:
+            return conn.execute(statement).first()
+
+    def _finish(self, job_id, **values):
+        with self._db.engine.begin() as conn:
+            conn.execute(update(self.table).where(self.table.c.id == job_id).values(**values))
+
+    def run_job(self, job):
+        """Exécuter une tâche réservée et enregistrer son résultat"""
+        func = self.tasks.get(job.name)
+        try:
+            if func is None:
+                raise LookupError(f'Tâche inconnue : {job.name}')
+            func(**json.loads(job.payload or '{}'))
+        except Exception as exc:
+            self._db.session.rollback()
+            error = f'{type(exc).__name__}: {exc}'
+            if job.attempts >= job.max_attempts:
+                logger.exception('Tâche %s #%s abandonnée après %s essai(s)', job.name, job.id, job.attempts)
+                self._finish(job.id, status='failed', finished_at=datetime.utcnow(), last_error=error)
+            else:
+                delay = min(self.retry_delay * 2 ** (job.attempts - 1), self.retry_max_delay)
+                logger.warning('Tâche %s #%s en erreur, nouvel essai dans %ss : %s', job.name, job.id, delay, error)
+                self._finish(job.id, status='queued', locked_by=None, last_error=error,
+                             run_at=datetime.utcnow() + timedelta(seconds=delay))
+            return False
+        finally:
+            self._db.session.remove()
+        self._finish(job.id, status='done', finished_at=datetime.utcnow(), last_error=None)
+        return True
+
+    def run_pending(self, worker_id='cli', limit=None):
+        """Exécuter les tâches prêtes jusqu'à vider la file ; retourne leur nombre"""
+        done = 0
+        with self._app.app_context():
+            self.requeue_stale()
+            while limit is None or done < limit:
+                job = self.claim(worker_id)
+                if job is None:
+                    break
+                self.run_job(job)
+                done += 1
+        return done
+
+    def requeue_stale(self):
+        """Remettre en file les tâches d'un worker arrêté pendant l'exécution"""
+        table = self.table
+        now = datetime.utcnow()
+        deadline = now - timedelta(seconds=self.job_timeout)
+        self._last_stale_check = now
+        with self._db.engine.begin() as conn:
+            conn.execute(
+                update(table)
+                .where(table.c.status == 'running', table.c.started_at < deadline,
+                       table.c.attempts >= table.c.max_attempts)
+                .values(status='failed', finished_at=now, last_error='Délai dépassé')
+            )
+            return conn.execute(
+                update(table)
+                .where(table.c.status == 'running', table.c.started_at < deadline)
+                .values(status='queued', locked_by=None, run_at=now)
+            ).rowcount
+
+    def work(self, worker_id, stop_event):
+        """Boucle d'un worker : exécuter les tâches jusqu'à l'arrêt demandé"""
+        with self._app.app_context():
+            while not stop_event.is_set():
+                try:
+                    if (self._last_stale_check is None or
+                            datetime.utcnow() - self._last_stale_check > timedelta(seconds=60)):
+                        self.requeue_stale()
+                    job = self.claim(worker_id)
+                    if job is not None:
+                        self.run_job(job)
+                        continue
+                except Exception:
+                    logger.exception('Erreur dans le worker %s', worker_id)
+                # File vide : attendre une nouvelle tâche ou le prochain tour
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def start_threads(self, count, stop_event, prefix='worker'):
+        """Démarrer ``count`` threads workers dans le processus courant"""
+        base = f'{socket.gethostname()}:{os.getpid()}'
+        threads = []
+        for index in range(count):
+            thread = threading.Thread(
+                target=self.work, args=(f'{base}:{prefix}-{index}', stop_event),
+                name=f'job-{prefix}-{index}', daemon=True
+            )
+            thread.start()
+            threads.append(thread)
+        return threads
+
+    def _ensure_embedded_workers(self):
+        # Démarrés à la demande, après un éventuel fork du serveur web
+        if self._workers_pid == os.getpid():
+            return
+        with self._lock:
+            if self._workers_pid == os.getpid():
+                return
+            self._workers_pid = os.getpid()
+            self._stop = threading.Event()
+            self.start_threads(self.embedded_workers, self._stop, prefix='web')
+
+    def shutdown(self):
+        """Arrêter les workers intégrés au processus web"""
+        self._stop.set()
+        self._wakeup.set()
+
+    def run_workers(self, threads=2, processes=1):
+        """Exécuter le pool de workers au premier plan (commande ``run-workers``)
+
+        Chaque processus exécute ``threads`` workers. SIGINT/SIGTERM arrêtent
+        le pool une fois les tâches en cours terminées.
+        """
+        stop_event = multiprocessing.Event() if processes > 1 else threading.Event()
+
+        def request_stop(signum, frame):
+            stop_event.set()
+            self._wakeup.set()
+
+        signal.signal(signal.SIGINT, request_stop)
+        signal.signal(signal.SIGTERM, request_stop)
+
+        if processes > 1 and 'fork' not in multiprocessing.get_all_start_methods():
+            logger.warning('fork indisponible : les workers tournent dans un seul processus')
+            threads, processes = threads * processes, 1
+
+        children = []
+        if processes > 1:
+            context = multiprocessing.get_context('fork')
+            for _ in range(processes - 1):
+                child = context.Process(target=self._process_main, args=(threads, stop_event))
+                child.start()
+                children.append(child)
+
+        for thread in self.start_threads(threads, stop_event):
+            while thread.is_alive():
+                thread.join(0.5)
+        for child in children:
+            child.join()
+
+    def _process_main(self, threads, stop_event):
+        # Les connexions héritées du processus parent ne doivent pas être réutilisées
+        with self._app.app_context():
+            self._db.engine.dispose(close=False)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        for thread in self.start_threads(threads, stop_event):
+            while thread.is_alive():
+                thread.join(0.5)
@@ -0,0 +1,124 @@
+"""
+Pagination par curseur (keyset) des listes de datasets
+
+Avec ``OFFSET``, la page 500 oblige la base à lire puis jeter les 5 988
+lignes précédentes, et ``paginate()`` ajoute un ``COUNT(*)`` à chaque page.
+Ici la page suivante est demandée par la clé de tri de la dernière ligne
+affichée (par exemple ``creation_date, id``) : la requête reprend l'index
+exactement à cette position, quelle que soit la profondeur.
+
+- ``encode_cursor`` / ``decode_cursor`` : curseurs opaques (base64 d'une
+  liste JSON), liés au tri pour lequel ils ont été produits ;
+- ``paginate_query`` : page suivante (``after``) ou précédente (``before``)
+  d'une requête SQLAlchemy ;
+- ``capped_count`` : nombre de résultats borné (« plus de 1 000 »), pour
+  l'en-tête des listes sans compter toute la table.
+
+Les colonnes de tri doivent être non nulles et terminées par une clé
+unique (l'identifiant), toutes dans le même sens.
+"""
+
+import base64
+import binascii
+import json
+from datetime import datetime
+
+
+class InvalidCursor(ValueError):
+    """Curseur illisible ou produit pour un autre tri"""
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict) and 'dt' in value:
+        return datetime.fromisoformat(value['dt'])
+    return value
+
+
+def encode_cursor(sort, values):
+    """Curseur opaque désignant la position ``values`` dans le tri ``sort``"""
+    payload = json.dumps([sort] + [_encode_value(value) for value in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, sort, size):
+    """Valeurs de la clé de tri contenues dans ``token`` (``size`` colonnes)"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        if not isinstance(payload, list) or payload[0] != sort or len(payload) != size + 1:
+            raise InvalidCursor('Curseur invalide pour ce tri')
+        return [_decode_value(value) for value in payload[1:]]
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError, IndexError) as exc:
+        if isinstance(exc, InvalidCursor):
+            raise
+        raise InvalidCursor('Curseur invalide') from exc
+
+
+class KeysetPage:
+    """Une page de résultats et les curseurs des pages voisines"""
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def paginate_query(query, sort, columns, per_page, after=None, before=None, descending=True):
+    """Page d'une requête triée par ``columns`` (clé unique en dernier)
+
+    ``after`` donne la page qui suit ce curseur, ``before`` celle qui le
+    précède ; sans curseur, la première page. Lève ``InvalidCursor``.
+    """
+    from sqlalchemy import tuple_
+
+    key = tuple_(*columns)
+    token = before or after
+    backwards = before is not None
+    if token:
+        values = decode_cursor(token, sort, len(columns))
+        # Page suivante d'un tri décroissant : clés strictement inférieures
+        if descending != backwards:
+            query = query.filter(key < tuple_(*values))
+        else:
+            query = query.filter(key > tuple_(*values))
+    order = [column.desc() if descending != backwards else column.asc() for column in columns]
+    rows = query.order_by(None).order_by(*order).limit(per_page + 1).all()
+
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    def cursor(row):
+        return encode_cursor(sort, [getattr(row, column.key) for column in columns])
+
+    next_cursor = prev_cursor = None
+    if rows:
+        if more or backwards:
+            next_cursor = cursor(rows[-1])
+        if (more and backwards) or (token and not backwards):
+            prev_cursor = cursor(rows[0])
+    return KeysetPage(rows, next_cursor, prev_cursor)
+
+
+def capped_count(query, cap):
+    """Nombre de résultats de ``query``, arrêté à ``cap + 1``
+
+    Retourne ``(nombre, approché)`` : ``approché`` est vrai quand il y a
+    plus de ``cap`` résultats (le nombre vaut alors ``cap``).
+    """
+    count = query.order_by(None).limit(cap + 1).count()
+    return min(count, cap), count > cap
@@ -4,10 +4,11 @@ Script de migration pour ajouter les nouveaux champs au profil utilisateur
 """
 
 import os
-from app import app, db, User
+from app import create_app, db, User
 
 def migrate_user_profile():
     """Ajouter les nouveaux champs au modèle User"""
+    app = create_app()
     with app.app_context():
         print("🔄 Migration du profil utilisateur...")
         
@@ -0,0 +1,271 @@
+"""
+Aperçu paginé du contenu des fichiers
+
+``read_rows()`` retourne une fenêtre de lignes (``offset``, ``limit``) d'un
+fichier CSV, JSON ou XLSX sans le lire en entier.
+
+Pour les CSV et les fichiers JSON Lines, un index des positions des lignes
+est construit une fois (tâche de fond après l'upload) : il conserve la
+position en octets d'une ligne sur ``stride``. Atteindre la ligne
+1 000 000 revient alors à un ``seek`` suivi d'au plus ``stride - 1`` lignes
+sautées, quelle que soit la taille du fichier. Les guillemets sont pris en
+compte : un champ CSV sur plusieurs lignes reste un seul enregistrement.
+
+Les tableaux JSON et les classeurs XLSX sont lus séquentiellement jusqu'à
+la fenêtre demandée. Les pages produites sont gardées dans ``PageCache``,
+les index chargés dans ``IndexCache`` (par empreinte du fichier).
+"""
+
+import csv
+import datetime
+import io
+import itertools
+import json
+import os
+import threading
+from array import array
+from collections import OrderedDict
+
+import profiling
+
+INDEX_STRIDE = 256  # une position conservée toutes les 256 lignes
+INDEX_VERSION = 1
+
+INDEXED_FORMATS = ('csv', 'json')
+PREVIEW_FORMATS = ('csv', 'json', 'xlsx')
+
+
+class RowIndex:
+    """Positions (en octets) d'une ligne sur ``stride`` et nombre total de lignes"""
+
+    def __init__(self, stride, total, offsets):
+        self.stride = stride
+        self.total = total
+        self.offsets = offsets
+
+    def seek_position(self, row):
+        """Position de départ et nombre de lignes à sauter pour atteindre ``row``"""
+        return self.offsets[row // self.stride], row % self.stride
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as fh:
+            array('Q', [INDEX_VERSION, self.stride, self.total]).tofile(fh)
+            self.offsets.tofile(fh)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Charger un index ; None s'il n'existe pas ou est d'une autre version"""
+        if not os.path.exists(path):
+            return None
+        data = array('Q')
+        with open(path, 'rb') as fh:
+            data.frombytes(fh.read())
+        if len(data) < 3 or data[0] != INDEX_VERSION:
+            return None
+        return cls(data[1], data[2], data[3:])
+
+
+def index_path(folder, file_hash):
+    """Chemin de l'index des lignes d'un fichier (partagé par les fichiers identiques)"""
+    return os.path.join(folder, file_hash[:2], f'{file_hash}.rowidx')
+
+
+class IndexCache:
+    """Index des lignes déjà chargés, par empreinte du fichier (LRU borné)
+
+    Un fichier ne change jamais pour une empreinte donnée : un index chargé
+    reste valable. Un index absent n'est pas retenu, il peut être construit
+    plus tard.
+    """
+
+    def __init__(self, folder, max_entries=32):
+        self.folder = folder
+        self.max_entries = max_entries
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, file_hash):
+        """Index du fichier d'empreinte ``file_hash``, ``None`` s'il n'est pas construit"""
+        if not file_hash:
+            return None
+        with self._lock:
+            index = self._indexes.get(file_hash)
+            if index is not None:
+                self._indexes.move_to_end(file_hash)
+                return index
+        index = RowIndex.load(index_path(self.folder, file_hash))
+        if index is not None:
+            with self._lock:
+                self._indexes[file_hash] = index
+                while len(self._indexes) > self.max_entries:
+                    self._indexes.popitem(last=False)
+        return index
+
+
+def iter_records(fh, quoted=True):
+    """Enregistrements ``(position, octets)`` d'un fichier texte ouvert en binaire
+
+    Avec ``quoted``, un enregistrement se termine à la première fin de ligne
+    où le nombre de guillemets est pair (règle CSV, ``""`` compris). Les
+    lignes vides sont ignorées.
+    """
+    position = fh.tell()
+    start = position
+    parts = []
+    quotes = 0
+    for line in iter(fh.readline, b''):
+        if not parts:
+            start = position
+        position += len(line)
+        parts.append(line)
+        if quoted:
+            quotes += line.count(b'"')
+            if quotes % 2:
+                continue
+        record = b''.join(parts) if len(parts) > 1 else line
+        parts = []
+        quotes = 0
+        if record.strip():
+            yield start, record
+    if parts:
+        yield start, b''.join(parts)
+
+
+def _is_json_array(fh):
+    """Le fichier JSON est-il un tableau (sinon : JSON Lines) ?"""
+    head = fh.read(1024).lstrip(b'\xef\xbb\xbf \t\r\n')
+    fh.seek(0)
+    return head[:1] == b'['
+
+
+def build_row_index(path, file_format, stride=INDEX_STRIDE):
+    """Construire l'index d'un CSV ou d'un JSON Lines (None pour les autres fichiers)"""
+    if file_format not in INDEXED_FORMATS:
+        return None
+    offsets = array('Q')
+    total = 0
+    with open(path, 'rb') as fh:
+        if file_format == 'json' and _is_json_array(fh):
+            return None
+        records = iter_records(fh, quoted=file_format == 'csv')
+        if file_format == 'csv':
+            next(records, None)  # en-tête
+        for offset, _ in records:
+            if total % stride == 0:
+                offsets.append(offset)
+            total += 1
+    return RowIndex(stride, total, offsets)
+
+
+def _decode(record):
+    return record.decode('utf-8-sig', errors='replace')
+
+
+def _json_value(value):
+    if isinstance(value, (datetime.date, datetime.datetime, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+def _window(records, index, fh, offset, limit, data_start):
+    """Enregistrements ``offset .. offset + limit`` (index utilisé s'il existe)"""
+    if index is not None:
+        if offset >= index.total:
+            return []
+        position, skip = index.seek_position(offset)
+        fh.seek(position)
+    else:
+        fh.seek(data_start)
+        skip = offset
+    return [record for _, record in itertools.islice(records(fh), skip, skip + limit)]
+
+
+def _csv_window(path, offset, limit, index):
+    with open(path, 'rb') as fh:
+        dialect = profiling.sniff_csv_dialect(_decode(fh.read(64 * 1024)))
+        fh.seek(0)
+        first = next(iter_records(fh), None)
+        if first is None:
+            return [], []
+        header_offset, header = first
+        columns = profiling.column_names(next(csv.reader([_decode(header)], dialect), []))
+        records = _window(iter_records, index, fh, offset, limit, header_offset + len(header))
+    text = ''.join(_decode(record) for record in records)
+    return columns, list(csv.reader(io.StringIO(text, newline=''), dialect))
+
+
+def _rows_from_objects(values):
+    """Colonnes (ordre d'apparition) et lignes d'une liste d'objets JSON"""
+    records = [value if isinstance(value, dict) else {'value': value} for value in values]
+    columns = list(dict.fromkeys(key for record in records for key in record))
+    return columns, [[_json_value(record.get(column)) for column in columns] for record in records]
+
+
+def _json_window(path, offset, limit, index):
+    with open(path, 'rb') as fh:
+        if not _is_json_array(fh):
+            records = _window(lambda f: iter_records(f, quoted=False), index, fh, offset, limit, 0)
+            return _rows_from_objects([json.loads(record) for record in records])
+    with open(path, 'r', encoding='utf-8-sig', errors='replace') as fh:
+        values = list(itertools.islice(profiling.iter_json_values(fh), offset, offset + limit))
+    return _rows_from_objects(values)
+
+
+def _xlsx_window(path, offset, limit):
+    try:
+        from openpyxl import load_workbook  # type: ignore
+    except ImportError:
+        raise profiling.UnsupportedFormat("openpyxl est nécessaire pour l'aperçu des fichiers XLSX")
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        header = next(sheet.iter_rows(min_row=1, max_row=1, values_only=True), None)
+        if header is None:
+            return [], []
+        rows = sheet.iter_rows(min_row=offset + 2, max_row=offset + limit + 1, values_only=True)
+        return profiling.column_names(header), [[_json_value(v) for v in row] for row in rows]
+    finally:
+        workbook.close()
+
+
+def read_rows(path, file_format, offset, limit, index=None):
+    """Colonnes et lignes ``offset .. offset + limit`` d'un fichier
+
+    Lève ``profiling.UnsupportedFormat`` pour les formats sans aperçu.
+    """
+    file_format = (file_format or '').lower()
+    if file_format == 'csv':
+        return _csv_window(path, offset, limit, index)
+    if file_format == 'json':
+        return _json_window(path, offset, limit, index)
+    if file_format == 'xlsx':
+        return _xlsx_window(path, offset, limit)
+    raise profiling.UnsupportedFormat(f'Aperçu non disponible pour le format : {file_format}')
+
+
+class PageCache:
+    """Pages d'aperçu déjà produites (LRU borné en nombre d'entrées)"""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            page = self._pages.get(key)
+            if page is not None:
+                self._pages.move_to_end(key)
+            return page
+
+    def set(self, key, page):
+        with self._lock:
+            self._pages[key] = page
+            self._pages.move_to_end(key)
+            while len(self._pages) > self.max_entries:
+                self._pages.popitem(last=False)
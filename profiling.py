@@ -0,0 +1,422 @@
+"""
+Profilage des fichiers de bases de données
+
+Lit un fichier CSV, XLSX ou JSON une seule fois, par lots de lignes, et
+calcule pour chaque colonne : type inféré, taux de valeurs manquantes,
+minimum/maximum, estimation du nombre de valeurs distinctes (HyperLogLog)
+et valeurs les plus fréquentes (résumé de Misra-Gries). La mémoire
+utilisée ne dépend pas de la taille du fichier : un lot de lignes, 4 Ko de
+registres HyperLogLog et quelques dizaines de compteurs par colonne.
+
+NumPy est utilisé pour traiter les lots de façon vectorisée s'il est
+installé ; sinon le calcul est fait en Python pur (mêmes résultats).
+openpyxl est nécessaire pour les fichiers XLSX.
+"""
+
+import csv
+import datetime
+import json
+import math
+import heapq
+import re
+from collections import Counter
+
+# NumPy est importé au premier profilage : les workers web, qui ne
+# profilent pas, ne paient pas son import au démarrage
+_UNLOADED = object()
+np = _UNLOADED
+
+
+def _numpy():
+    """Module NumPy, ou None s'il n'est pas installé"""
+    global np
+    if np is _UNLOADED:
+        try:
+            import numpy
+        except ImportError:  # pragma: no cover - dépend de l'environnement
+            numpy = None
+        np = numpy
+    return np
+
+
+BATCH_SIZE = 5000
+TOP_K = 10
+TOP_K_CAPACITY = 1000  # compteurs conservés pour le top-k
+MAX_TOP_VALUE_LENGTH = 100
+HLL_PRECISION = 12  # 2^12 = 4096 registres, erreur type ~1,6 %
+
+NULL_TOKENS = {'', 'na', 'n/a', 'nan', 'null', 'none', '-'}
+BOOL_TOKENS = {'true', 'false', 'vrai', 'faux', 'oui', 'non', 'yes', 'no'}
+INT_RE = re.compile(r'^[+-]?\d+$')
+FLOAT_RE = re.compile(r'^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$')
+DATE_RE = re.compile(r'^(\d{4}-\d{2}-\d{2}|\d{2}/\d{2}/\d{4})([ T]\d{2}:\d{2}(:\d{2})?)?$')
+
+SUPPORTED_FORMATS = ('csv', 'xlsx', 'json')
+
+
+class UnsupportedFormat(ValueError):
+    """Format de fichier non profilable"""
+
+
+class HyperLogLog:
+    """Estimation du nombre de valeurs distinctes en mémoire constante"""
+
+    def __init__(self, precision=HLL_PRECISION):
+        self.p = precision
+        self.m = 1 << precision
+        np = _numpy()
+        self.registers = np.zeros(self.m, dtype=np.uint8) if np is not None else [0] * self.m
+
+    def _hashes(self, values):
+        # hash() d'une chaîne est un SipHash 64 bits, stable pendant le profilage
+        return [hash(str(v)) & 0xFFFFFFFFFFFFFFFF for v in values]
+
+    def add_batch(self, values):
+        if not values:
+            return
+        hashes = self._hashes(values)
+        width = 64 - self.p
+        np = _numpy()
+        if np is not None:
+            h = np.array(hashes, dtype=np.uint64)
+            index = (h >> np.uint64(width)).astype(np.int64)
+            rest = h & np.uint64((1 << width) - 1)
+            # rang = position du premier bit à 1 dans les bits restants
+            bit_length = np.zeros(len(hashes), dtype=np.int64)
+            nonzero = rest > 0
+            bit_length[nonzero] = np.floor(np.log2(rest[nonzero].astype(np.float64))).astype(np.int64) + 1
+            rank = (width - np.minimum(bit_length, width) + 1).astype(np.uint8)
+            np.maximum.at(self.registers, index, rank)
+        else:
+            registers = self.registers
+            mask = (1 << width) - 1
+            for x in hashes:
+                index = x >> width
+                rank = width - (x & mask).bit_length() + 1
+                if rank > registers[index]:
+                    registers[index] = rank
+
+    def estimate(self):
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        registers = [int(r) for r in self.registers]
+        raw = alpha * m * m / sum(2.0 ** -r for r in registers)
+        zeros = registers.count(0)
+        if raw <= 2.5 * m and zeros:
+            return int(round(m * math.log(m / zeros)))
+        return int(round(raw))
+
+
+class FrequentValues:
+    """Valeurs les plus fréquentes avec un nombre borné de compteurs
+
+    Résumé de Misra-Gries fusionné lot par lot : chaque lot est d'abord
+    compté (``Counter``, en C), puis ajouté au résumé ; au-delà de
+    ``capacity`` valeurs, le (capacity+1)-ième compte est retranché à tous et
+    les compteurs nuls sont supprimés. Les comptes retournés sont des minorants
+    (exacts tant que la colonne a moins de ``capacity`` valeurs distinctes) ;
+    une colonne dont toutes les valeurs sont uniques n'a donc pas de top.
+    """
+
+    def __init__(self, capacity=TOP_K_CAPACITY):
+        self.capacity = capacity
+        self.counts = Counter()
+
+    def add_batch(self, values):
+        self.counts.update(str(v)[:MAX_TOP_VALUE_LENGTH] for v in values)
+        if len(self.counts) > self.capacity:
+            largest = heapq.nlargest(self.capacity + 1, self.counts.items(), key=lambda item: item[1])
+            cut = largest[-1][1]
+            self.counts = Counter({value: count - cut for value, count in largest[:-1] if count > cut})
+
+    def top(self, k=TOP_K):
+        # Une valeur vue une seule fois n'est pas « fréquente »
+        items = sorted((item for item in self.counts.items() if item[1] > 1),
+                       key=lambda item: (-item[1], item[0]))[:k]
+        return [[value, count] for value, count in items]
+
+
+def _is_null(value):
+    if value is None:
+        return True
+    if isinstance(value, float) and math.isnan(value):
+        return True
+    return isinstance(value, str) and value.strip().lower() in NULL_TOKENS
+
+
+def _classify(value):
+    """Type d'une valeur non nulle : integer, float, boolean, date ou string"""
+    if isinstance(value, bool):
+        return 'boolean'
+    if isinstance(value, int):
+        return 'integer'
+    if isinstance(value, float):
+        return 'float'
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return 'date'
+    if not isinstance(value, str):
+        return 'string'
+    text = value.strip()
+    if INT_RE.match(text):
+        return 'integer'
+    if FLOAT_RE.match(text):
+        return 'float'
+    if text.lower() in BOOL_TOKENS:
+        return 'boolean'
+    if DATE_RE.match(text):
+        return 'date'
+    return 'string'
+
+
+def _to_number(value):
+    return float(value.strip()) if isinstance(value, str) else float(value)
+
+
+class ColumnProfile:
+    """Statistiques accumulées pour une colonne"""
+
+    def __init__(self, name, first_row=0):
+        self.name = name
+        self.first_row = first_row  # lignes antérieures à l'apparition de la colonne
+        self.seen = 0
+        self.nulls = 0
+        self.type_counts = {}
+        self.num_min = None
+        self.num_max = None
+        self.text_min = None
+        self.text_max = None
+        self.hll = HyperLogLog()
+        self.top = FrequentValues()
+
+    def _update_numeric(self, low, high):
+        self.num_min = low if self.num_min is None else min(self.num_min, low)
+        self.num_max = high if self.num_max is None else max(self.num_max, high)
+
+    def _numeric_batch(self, values):
+        """Chemin rapide : lot entièrement numérique converti d'un bloc"""
+        np = _numpy()
+        if np is None or any(isinstance(v, bool) for v in values):
+            return False
+        try:
+            array = np.asarray([v.strip() if isinstance(v, str) else v for v in values], dtype=np.float64)
+        except (TypeError, ValueError):
+            return False
+        if not np.all(np.isfinite(array)):
+            return False
+        integer = bool(np.all(np.mod(array, 1) == 0)) and not any(
+            isinstance(v, float) or (isinstance(v, str) and not INT_RE.match(v.strip())) for v in values
+        )
+        kind = 'integer' if integer else 'float'
+        self.type_counts[kind] = self.type_counts.get(kind, 0) + len(values)
+        self._update_numeric(float(array.min()), float(array.max()))
+        return True
+
+    def update(self, values):
+        self.seen += len(values)
+        present = [v for v in values if not _is_null(v)]
+        self.nulls += len(values) - len(present)
+        if not present:
+            return
+
+        if not self._numeric_batch(present):
+            # Chaque valeur distincte du lot n'est typée qu'une fois
+            for value, count in Counter(present).items():
+                kind = _classify(value)
+                self.type_counts[kind] = self.type_counts.get(kind, 0) + count
+                if kind in ('integer', 'float'):
+                    number = _to_number(value)
+                    if math.isfinite(number):
+                        self._update_numeric(number, number)
+                else:
+                    text = value.isoformat() if kind == 'date' and not isinstance(value, str) else str(value)
+                    if self.text_min is None or text < self.text_min:
+                        self.text_min = text
+                    if self.text_max is None or text > self.text_max:
+                        self.text_max = text
+
+        self.hll.add_batch(present)
+        self.top.add_batch(present)
+
+    def inferred_type(self):
+        counts = self.type_counts
+        if not counts:
+            return 'empty'
+        if set(counts) <= {'integer'}:
+            return 'integer'
+        if set(counts) <= {'integer', 'float'}:
+            return 'float'
+        kind, count = max(counts.items(), key=lambda item: item[1])
+        # Une colonne est typée si 95 % des valeurs non nulles le sont
+        return kind if count >= 0.95 * sum(counts.values()) else 'string'
+
+    def result(self, row_count):
+        kind = self.inferred_type()
+        nulls = self.nulls + (row_count - self.seen)  # dont les lignes où la colonne manque
+        if kind in ('integer', 'float'):
+            low, high = self.num_min, self.num_max
+            if kind == 'integer' and low is not None:
+                low, high = int(low), int(high)
+        elif kind in ('date', 'string'):
+            low, high = self.text_min, self.text_max
+        else:
+            low = high = None
+        return {
+            'name': self.name,
+            'type': kind,
+            'null_ratio': round(nulls / row_count, 4) if row_count else 0.0,
+            'min': low,
+            'max': high,
+            'distinct_estimate': min(self.hll.estimate(), row_count - nulls),
+            'top_values': self.top.top(),
+        }
+
+
+def _batches(rows, batch_size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def sniff_csv_dialect(sample):
+    """Dialecte CSV (séparateur, guillemets) déduit d'un extrait du fichier"""
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=',;\t|')
+    except csv.Error:
+        return csv.excel
+
+
+def column_names(header):
+    """Noms des colonnes d'une ligne d'en-tête (les noms vides sont numérotés)"""
+    return [str(h).strip() if h is not None and str(h).strip() else f'colonne_{i + 1}'
+            for i, h in enumerate(header)]
+
+
+def _csv_rows(path):
+    with open(path, 'r', encoding='utf-8-sig', errors='replace', newline='') as fh:
+        dialect = sniff_csv_dialect(fh.read(64 * 1024))
+        fh.seek(0)
+        reader = csv.reader(fh, dialect)
+        header = next(reader, None)
+        if header is None:
+            return
+        yield column_names(header)
+        yield from reader
+
+
+def _xlsx_rows(path):
+    try:
+        from openpyxl import load_workbook  # type: ignore
+    except ImportError:
+        raise UnsupportedFormat('openpyxl est nécessaire pour profiler les fichiers XLSX')
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        yield column_names(header)
+        yield from rows
+    finally:
+        workbook.close()
+
+
+def iter_json_values(fh, read_size=64 * 1024):
+    """Itérer sur les éléments d'un tableau JSON (ou d'un fichier JSON Lines)
+    sans charger tout le fichier"""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
+    eof = False
+    while True:
+        # Sauter les blancs et les séparateurs
+        while position < len(buffer) and (buffer[position].isspace() or buffer[position] == ','
+                                          or (not started and buffer[position] == '[')):
+            if buffer[position] == '[':
+                started = True
+            position += 1
+        if position < len(buffer) and buffer[position] == ']':
+            return
+        if position < len(buffer):
+            started = True
+            try:
+                value, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                # Un nombre en fin de tampon peut être tronqué : relire la suite
+                if end < len(buffer) or eof:
+                    yield value
+                    position = end
+                    continue
+        if eof:
+            return
+        chunk = fh.read(read_size)
+        if not chunk:
+            eof = True
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+def _json_records(path):
+    """Lignes (dict) d'un fichier JSON : les colonnes sont découvertes au fil de l'eau"""
+    with open(path, 'r', encoding='utf-8-sig', errors='replace') as fh:
+        for value in iter_json_values(fh):
+            yield value if isinstance(value, dict) else {'value': value}
+
+
+def _json_cell(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+def profile_file(path, file_format, batch_size=BATCH_SIZE):
+    """Profiler un fichier et retourner un dictionnaire sérialisable en JSON
+
+    Lève ``UnsupportedFormat`` pour les formats non pris en charge.
+    """
+    file_format = (file_format or '').lower()
+    if file_format not in SUPPORTED_FORMATS:
+        raise UnsupportedFormat(f'Format non profilable : {file_format}')
+
+    columns = []
+    row_count = 0
+
+    if file_format == 'json':
+        by_name = {}
+        for batch in _batches(_json_records(path), batch_size):
+            for record in batch:
+                for name in record:
+                    if name not in by_name:
+                        by_name[name] = ColumnProfile(str(name), first_row=row_count)
+                        columns.append(by_name[name])
+                row_count += 1
+            # Colonnes absentes d'une ligne : comptées comme nulles
+            start = row_count - len(batch)
+            for column in columns:
+                offset = max(column.first_row - start, 0)
+                column.update([_json_cell(record.get(column.name)) for record in batch[offset:]])
+    else:
+        rows = _csv_rows(path) if file_format == 'csv' else _xlsx_rows(path)
+        header = next(rows, None)
+        if header is not None:
+            columns = [ColumnProfile(name) for name in header]
+            for batch in _batches(rows, batch_size):
+                row_count += len(batch)
+                for index, column in enumerate(columns):
+                    column.update([row[index] if index < len(row) else None for row in batch])
+
+    return {
+        'format': file_format,
+        'row_count': row_count,
+        'column_count': len(columns),
+        'columns': [column.result(row_count) for column in columns],
+        'numpy': _numpy() is not None,
+    }
@@ -0,0 +1,103 @@
+"""
+Budget de requêtes SQL par requête HTTP
+
+Un accès à une relation paresseuse dans une boucle de gabarit
+(``dataset.domain.name``, ``comment.user.username``) émet une requête par
+ligne. Ce module compte les requêtes SQL émises pendant chaque requête HTTP
+et signale les vues qui dépassent leur budget :
+
+- ``QUERY_BUDGET`` : nombre maximal par défaut ;
+- ``@query_budget(n)`` : budget propre à une vue ;
+- ``QUERY_BUDGET_ACTION`` : ``log`` (avertissement) ou ``raise``
+  (``QueryBudgetExceeded``, pour les tests) ;
+- actif en mode debug et en test (``QUERY_BUDGET_ENABLED`` pour forcer).
+
+L'en-tête ``X-Query-Count`` donne le nombre de requêtes de la réponse.
+"""
+
+import logging
+from contextlib import contextmanager
+
+from flask import current_app, g, has_app_context, request
+from sqlalchemy import event
+
+import sqlite_tuning
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(RuntimeError):
+    """Une vue a émis plus de requêtes SQL que son budget"""
+
+
+def query_budget(limit):
+    """Décorateur : budget de requêtes propre à une vue"""
+    def decorate(view):
+        view.query_budget = limit
+        return view
+    return decorate
+
+
+@contextmanager
+def count_queries(engine):
+    """Compter les requêtes exécutées dans le bloc (``with count_queries(e) as n: ...; n[0]``)"""
+    count = [0]
+
+    def before_cursor_execute(*args):
+        count[0] += 1
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield count
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+class QueryBudget:
+    """Compteur de requêtes SQL par requête HTTP"""
+
+    def __init__(self, app=None, db=None):
+        self.default_budget = 30
+        self.action = 'log'
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.default_budget = app.config.get('QUERY_BUDGET', self.default_budget)
+        self.action = app.config.get('QUERY_BUDGET_ACTION', self.action)
+        app.extensions['query_budget'] = self
+        if app.config.get('QUERY_BUDGET_ENABLED') is False:
+            return
+
+        for engine in sqlite_tuning.engines(app, db):
+            event.listen(engine, 'before_cursor_execute', self._count)
+        app.before_request(self._start)
+        app.after_request(self._check)
+
+    @staticmethod
+    def _count(*args):
+        if has_app_context() and 'query_count' in g:
+            g.query_count += 1
+
+    @staticmethod
+    def _start():
+        # Décidé à chaque requête : le mode debug peut être activé après la création de l'app
+        enabled = current_app.config.get('QUERY_BUDGET_ENABLED')
+        if enabled or (enabled is None and (current_app.debug or current_app.testing)):
+            g.query_count = 0
+
+    def _check(self, response):
+        count = g.pop('query_count', None)
+        if count is None:
+            return response
+        response.headers['X-Query-Count'] = str(count)
+
+        endpoint = request.endpoint
+        view = current_app.view_functions.get(endpoint) if endpoint else None
+        budget = getattr(view, 'query_budget', self.default_budget)
+        if count > budget:
+            message = f'{endpoint} : {count} requêtes SQL pour un budget de {budget} ({request.full_path})'
+            if self.action == 'raise':
+                raise QueryBudgetExceeded(message)
+            logger.warning('Budget de requêtes dépassé : %s', message)
+        return response
@@ -0,0 +1,192 @@
+"""
+Agrégats d'usage par période (rollups)
+
+Les statistiques d'usage sont lues dans la table ``usage_rollup`` plutôt
+que comptées dans le journal brut : une ligne par portée (``dataset``,
+``domain`` ou ``user``, le contributeur propriétaire), identifiant,
+granularité (``hour``, ``day``) et début de période, avec le nombre de
+téléchargements et de vues.
+
+Les événements (téléchargements écrits par download_log.py, vues
+comptées par la page d'un dataset) sont répartis par dataset et par période
+dans un ``RollupBuffer`` en mémoire. Au vidage, chaque incrément est étendu
+au domaine et au contributeur du dataset puis ajouté aux agrégats par un
+``INSERT ... ON CONFLICT DO UPDATE`` groupé (SQLite et PostgreSQL).
+"""
+
+import atexit
+import logging
+import threading
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+GRANULARITIES = ('hour', 'day')
+KINDS = ('downloads', 'views')
+
+# Écart maximal entre ``from`` et ``to`` par granularité
+MAX_RANGE = {'hour': timedelta(days=31), 'day': timedelta(days=3660)}
+
+
+def period_start(moment, granularity):
+    """Début de la période (UTC) qui contient ``moment``"""
+    if granularity == 'hour':
+        return datetime(moment.year, moment.month, moment.day, moment.hour)
+    if granularity == 'day':
+        return datetime(moment.year, moment.month, moment.day)
+    raise ValueError(f'Granularité inconnue : {granularity}')
+
+
+def period_step(granularity):
+    return timedelta(hours=1) if granularity == 'hour' else timedelta(days=1)
+
+
+def add_event(deltas, dataset_id, kind, moment, amount=1):
+    """Compter un événement dans ``deltas`` ``{(dataset, granularité, période): [téléchargements, vues]}``"""
+    index = KINDS.index(kind)
+    for granularity in GRANULARITIES:
+        counts = deltas.setdefault((dataset_id, granularity, period_start(moment, granularity)), [0, 0])
+        counts[index] += amount
+    return deltas
+
+
+def expand_deltas(deltas, owners):
+    """Incréments par dataset, domaine et contributeur
+
+    ``owners`` associe chaque dataset à ``(contributeur, domaine)``.
+    Retourne ``{(portée, identifiant, granularité, période): [téléchargements, vues]}``.
+    """
+    expanded = {}
+    for (dataset_id, granularity, period), (downloads, views) in deltas.items():
+        user_id, domain_id = owners.get(dataset_id, (None, None))
+        for scope, scope_id in (('dataset', dataset_id), ('user', user_id), ('domain', domain_id)):
+            if scope_id is None:
+                continue
+            counts = expanded.setdefault((scope, scope_id, granularity, period), [0, 0])
+            counts[0] += downloads
+            counts[1] += views
+    return expanded
+
+
+def insert_statement(conn, table):
+    """``INSERT`` du dialecte courant (pour ``on_conflict_do_update``/``do_nothing``)"""
+    if conn.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(table)
+
+
+def apply_deltas(conn, table, deltas):
+    """Ajouter des incréments étendus à la table ``usage_rollup`` (une seule requête)"""
+    if not deltas:
+        return 0
+    stmt = insert_statement(conn, table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['scope', 'scope_id', 'granularity', 'period'],
+        set_={
+            'downloads': table.c.downloads + stmt.excluded.downloads,
+            'views': table.c.views + stmt.excluded.views,
+        },
+    )
+    conn.execute(stmt, [
+        {'scope': scope, 'scope_id': scope_id, 'granularity': granularity, 'period': period,
+         'downloads': downloads, 'views': views}
+        for (scope, scope_id, granularity, period), (downloads, views) in deltas.items()
+    ])
+    return len(deltas)
+
+
+def dataset_owners(conn, dataset_ids):
+    """Contributeur et domaine de chaque dataset ``{dataset_id: (user_id, domain_id)}``"""
+    from sqlalchemy import bindparam, text
+
+    if not dataset_ids:
+        return {}
+    rows = conn.execute(
+        text('SELECT id, user_id, domain_id FROM dataset WHERE id IN :ids').bindparams(
+            bindparam('ids', expanding=True)
+        ),
+        {'ids': sorted(dataset_ids)}
+    )
+    return {dataset_id: (user_id, domain_id) for dataset_id, user_id, domain_id in rows}
+
+
+def usage_series(conn, table, scope, scope_id, granularity, start, end):
+    """Série complète (périodes sans activité à zéro) sur ``[start, end[``"""
+    from sqlalchemy import select
+
+    rows = conn.execute(
+        select(table.c.period, table.c.downloads, table.c.views).where(
+            table.c.scope == scope, table.c.scope_id == scope_id, table.c.granularity == granularity,
+            table.c.period >= start, table.c.period < end,
+        )
+    )
+    values = {period: (downloads, views) for period, downloads, views in rows}
+    series = []
+    period, step = period_start(start, granularity), period_step(granularity)
+    while period < end:
+        downloads, views = values.get(period, (0, 0))
+        series.append({'period': period, 'downloads': downloads, 'views': views})
+        period += step
+    return series
+
+
+class RollupBuffer:
+    """Incréments d'agrégats en attente, appliqués en une requête au vidage"""
+
+    def __init__(self):
+        self._deltas = {}
+        self._app = None
+        self._db = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def init_app(self, app, db):
+        self._app = app
+        self._db = db
+        app.extensions['rollups'] = self
+        # Une seule fois par processus, quel que soit le nombre d'applications créées
+        atexit.unregister(self.flush)
+        atexit.register(self.flush)
+
+    def add(self, dataset_id, kind, moment=None, amount=1):
+        """Compter un événement (sans écrire dans la base)"""
+        with self._lock:
+            add_event(self._deltas, dataset_id, kind, moment or datetime.utcnow(), amount)
+
+    def pending(self):
+        with self._lock:
+            return len(self._deltas)
+
+    def flush(self):
+        """Appliquer les incréments en attente ; retourne le nombre de lignes d'agrégats touchées"""
+        with self._flush_lock:
+            with self._lock:
+                deltas, self._deltas = self._deltas, {}
+            if not deltas or self._app is None:
+                return 0
+            try:
+                with self._app.app_context():
+                    with self._db.engine.begin() as conn:
+                        owners = dataset_owners(conn, {dataset_id for dataset_id, _, _ in deltas})
+                        return apply_deltas(conn, self._db.metadata.tables['usage_rollup'],
+                                            expand_deltas(deltas, owners))
+            except Exception:
+                logger.exception('Échec de la mise à jour des agrégats d\'usage, nouvel essai au prochain cycle')
+                with self._lock:
+                    for (dataset_id, granularity, period), counts in deltas.items():
+                        pending = self._deltas.setdefault((dataset_id, granularity, period), [0, 0])
+                        pending[0] += counts[0]
+                        pending[1] += counts[1]
+                return 0
+
+    def prune(self, granularity, before):
+        """Supprimer les agrégats ``granularity`` antérieurs à ``before``"""
+        from sqlalchemy import delete
+
+        table = self._db.metadata.tables['usage_rollup']
+        with self._app.app_context():
+            with self._db.engine.begin() as conn:
+                result = conn.execute(delete(table).where(table.c.granularity == granularity, table.c.period < before))
+        return result.rowcount
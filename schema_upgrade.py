@@ -0,0 +1,62 @@
+"""
+Mise à niveau du schéma de la base Flask sans la recréer
+
+``db.create_all()`` crée les tables manquantes mais n'ajoute ni les colonnes
+ni les index déclarés après coup sur des tables existantes. Ce module
+compare les modèles à la base et ajoute ce qui manque, sans toucher aux
+données (contrairement à fix_db.py / migrate_profile.py).
+"""
+
+from sqlalchemy import inspect, text
+
+
+def _column_default_sql(column):
+    default = column.default
+    if default is None or not default.is_scalar:
+        return ''
+    value = default.arg
+    if isinstance(value, bool):
+        return f' DEFAULT {int(value)}'
+    if isinstance(value, (int, float)):
+        return f' DEFAULT {value}'
+    if isinstance(value, str):
+        return " DEFAULT '{}'".format(value.replace("'", "''"))
+    return ''
+
+
+def upgrade_schema(db):
+    """Créer les tables, colonnes et index manquants
+
+    Retourne la liste des opérations effectuées (pour affichage).
+    """
+    operations = []
+    engine = db.engine
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+
+    db.create_all()
+
+    with engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                operations.append(f'table {table.name}')
+                continue
+
+            existing_columns = {c['name'] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(
+                    f'ALTER TABLE {table.name} ADD COLUMN {column.name} '
+                    f'{column_type}{_column_default_sql(column)}'
+                ))
+                operations.append(f'colonne {table.name}.{column.name}')
+
+            existing_indexes = {i['name'] for i in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(bind=conn, checkfirst=True)
+                    operations.append(f'index {index.name}')
+
+    return operations
@@ -0,0 +1,160 @@
+"""
+Index de recherche plein texte (SQLite FTS5) pour les bases de données
+
+La table virtuelle ``dataset_fts`` reprend les champs textuels d'un dataset
+(titre, description courte, description, mots-clés, auteur, source) avec
+``rowid = dataset.id``. Les résultats sont classés par BM25 et chaque terme
+saisi est recherché en mode préfixe, ce qui convient à la recherche au fil
+de la frappe.
+
+Lorsque FTS5 n'est pas disponible (autre moteur que SQLite, table absente),
+la recherche retombe sur l'ancien filtre ``LIKE``.
+"""
+
+import re
+import time
+import weakref
+
+from sqlalchemy import Float, Integer, column, text
+
+FTS_TABLE = 'dataset_fts'
+
+# Colonnes indexées, dans l'ordre de la table virtuelle
+FTS_COLUMNS = ('title', 'short_description', 'description', 'keywords', 'author', 'source')
+
+# Poids BM25 par colonne (même ordre que FTS_COLUMNS)
+BM25_WEIGHTS = (10.0, 5.0, 1.0, 8.0, 2.0, 2.0)
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Délai (secondes) avant de revérifier une table absente : elle peut être
+# créée ensuite par init-db ou par un autre processus
+RECHECK_INTERVAL = 60.0
+
+# Moteurs dont l'index existe, et instant de la dernière vérification
+# négative ; oubliés avec le moteur (un id() peut être repris par un moteur
+# créé ensuite, sur une autre base)
+_available = weakref.WeakSet()
+_missing = weakref.WeakKeyDictionary()
+
+
+def _engine_key(session):
+    return session.get_bind()
+
+
+def create_search_index(session):
+    """Créer la table virtuelle FTS5 si elle n'existe pas"""
+    if session.get_bind().dialect.name != 'sqlite':
+        return False
+
+    session.execute(text(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+        f"{', '.join(FTS_COLUMNS)}, "
+        "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    ))
+    session.commit()
+    key = _engine_key(session)
+    _available.add(key)
+    _missing.pop(key, None)
+    return True
+
+
+def is_available(session):
+    """Indiquer si l'index FTS5 existe pour la base courante
+
+    Seule la présence de la table est retenue ; son absence est revérifiée
+    au plus toutes les ``RECHECK_INTERVAL`` secondes.
+    """
+    key = _engine_key(session)
+    if key in _available:
+        return True
+    if key.dialect.name != 'sqlite':
+        return False
+    checked = _missing.get(key)
+    if checked is not None and time.monotonic() - checked < RECHECK_INTERVAL:
+        return False
+    found = session.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {'name': FTS_TABLE}
+    ).first()
+    if found is None:
+        _missing[key] = time.monotonic()
+        return False
+    _available.add(key)
+    _missing.pop(key, None)
+    return True
+
+
+def _row_values(dataset):
+    return {name: getattr(dataset, name) or '' for name in FTS_COLUMNS}
+
+
+def index_dataset(session, dataset):
+    """Ajouter ou remplacer un dataset dans l'index (sans commit)"""
+    if not is_available(session):
+        return
+    session.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :id"), {'id': dataset.id})
+    values = _row_values(dataset)
+    values['id'] = dataset.id
+    session.execute(
+        text(
+            f"INSERT INTO {FTS_TABLE} (rowid, {', '.join(FTS_COLUMNS)}) "
+            f"VALUES (:id, {', '.join(':' + c for c in FTS_COLUMNS)})"
+        ),
+        values
+    )
+
+
+def remove_dataset(session, dataset_id):
+    """Retirer un dataset de l'index (sans commit)"""
+    if not is_available(session):
+        return
+    session.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :id"), {'id': dataset_id})
+
+
+def rebuild_search_index(session, datasets):
+    """Reconstruire entièrement l'index à partir d'une liste de datasets"""
+    if not create_search_index(session):
+        return 0
+    session.execute(text(f"DELETE FROM {FTS_TABLE}"))
+    count = 0
+    for dataset in datasets:
+        index_dataset(session, dataset)
+        count += 1
+    session.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')"))
+    session.commit()
+    return count
+
+
+def build_match_expression(q):
+    """Convertir une saisie utilisateur en expression MATCH FTS5
+
+    Chaque mot devient un terme préfixe entre guillemets (``"mot"*``), les
+    termes étant combinés par un ET implicite. Retourne une chaîne vide si
+    la saisie ne contient aucun mot.
+    """
+    tokens = _TOKEN_RE.findall(q or '')
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def apply_search(query, model, session, q):
+    """Filtrer et classer une requête ``model`` selon la saisie ``q``
+
+    Avec FTS5 la requête est jointe à l'index et triée par pertinence BM25 ;
+    sinon (ou si la saisie ne contient aucun mot) on conserve le filtre
+    ``LIKE`` sur le titre et la description.
+    """
+    expression = build_match_expression(q)
+    if expression and is_available(session):
+        hits = text(
+            f"SELECT rowid AS dataset_id, bm25({FTS_TABLE}, "
+            f"{', '.join(str(w) for w in BM25_WEIGHTS)}) AS score "
+            f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match"
+        ).bindparams(match=expression).columns(
+            column('dataset_id', Integer), column('score', Float)
+        ).subquery('search_hits')
+        return query.join(hits, hits.c.dataset_id == model.id).order_by(hits.c.score)
+
+    return query.filter(
+        model.title.contains(q) | model.description.contains(q)
+    )
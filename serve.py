@@ -0,0 +1,529 @@
+#!/usr/bin/env python
+"""
+Serveur de production : workers multi-processus et multi-threads
+
+``app.run(debug=True)`` (app.py, start.py) et ``runserver`` (run_server.py)
+sont des serveurs de développement : un seul processus, pas de reprise
+d'un worker tombé. ``python serve.py`` sert l'application Flask (ou la
+variante Django) avec :
+
+- ``--workers`` processus, chacun servant ``--threads`` requêtes à la fois,
+  sur un socket d'écoute partagé ;
+- ``--preload`` : l'application est importée une fois par le maître, avant
+  le fork (démarrage des workers immédiat, mémoire partagée) ;
+- ``--max-requests`` (+ ``--max-requests-jitter``) : un worker est remplacé
+  après ce nombre de requêtes (fuites de mémoire, fragmentation) ;
+- signaux du maître : ``HUP`` remplace les workers sans interrompre le
+  service (nouveaux workers d'abord, puis arrêt gracieux des anciens ; le
+  code est relu sauf avec ``--preload``), ``TERM``/``INT`` arrêtent
+  gracieusement (requêtes en cours terminées dans ``--graceful-timeout``),
+  ``TTIN``/``TTOU`` ajoutent ou retirent un worker.
+
+Si gunicorn est installé, il est utilisé avec les mêmes réglages
+(``--server gunicorn``, choisi par défaut) ; sinon le gestionnaire de
+processus de ce module fait tourner le serveur WSGI de Werkzeug
+(``--server builtin``). La variante Django en ASGI (``django --asgi``)
+demande uvicorn.
+
+    python serve.py flask --workers 4 --threads 8 --bind 0.0.0.0:8000 --preload
+    python serve.py django --workers 4
+    python serve.py django --asgi --workers 4
+    python serve.py wsgi module:application
+
+Le maître écrit « Écoute sur http://hôte:port » une fois le socket ouvert.
+"""
+
+import importlib
+import importlib.util
+import logging
+import multiprocessing
+import multiprocessing.connection
+import os
+import random
+import signal
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import click # type: ignore
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler # type: ignore
+
+logger = logging.getLogger('serve')
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+PROJECT_PACKAGE = 'nosdonnees'
+CRASH_INTERVAL = 1.0  # secondes : un worker mort plus tôt est relancé après ce délai
+
+
+class Target:
+    """Application à servir et crochets autour du fork des workers"""
+
+    def __init__(self, name, load, after_fork=None, on_exit=None):
+        self.name = name
+        self.load = load  # () -> application WSGI
+        self.after_fork = after_fork or (lambda: None)  # dans le worker, avant la première requête
+        self.on_exit = on_exit or (lambda: None)  # dans le worker, après la dernière requête
+
+
+def flask_target():
+    loaded = []  # application créée par ce processus ou héritée du maître (--preload)
+
+    def load():
+        import app as nosdonnees
+        loaded.append(nosdonnees.create_app())
+        return loaded[-1]
+
+    def after_fork():
+        import app as nosdonnees
+        import sqlite_tuning
+        # Les connexions héritées du maître ne doivent pas être partagées entre processus
+        for flask_app in loaded:
+            for engine in sqlite_tuning.engines(flask_app, nosdonnees.db):
+                engine.dispose(close=False)
+
+    def on_exit():
+        import app as nosdonnees
+        nosdonnees.shutdown_services()
+
+    return Target('flask', load, after_fork, on_exit)
+
+
+def ensure_project_package():
+    """Rendre le projet Django importable sous le nom ``nosdonnees``
+
+    settings.py, wsgi.py et asgi.py désignent ``nosdonnees.settings``,
+    ``nosdonnees.urls``... : ce paquet est le dossier du projet, quel que
+    soit le nom de son dossier une fois déployé.
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', f'{PROJECT_PACKAGE}.settings')
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    if PROJECT_PACKAGE in sys.modules:
+        return
+    spec = importlib.util.find_spec(PROJECT_PACKAGE)
+    if spec is None or not spec.submodule_search_locations:
+        spec = importlib.util.spec_from_file_location(
+            PROJECT_PACKAGE, os.path.join(ROOT, '__init__.py'), submodule_search_locations=[ROOT]
+        )
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[PROJECT_PACKAGE] = module
+    spec.loader.exec_module(module)
+
+
+def django_target():
+    def load():
+        ensure_project_package()
+        return importlib.import_module(f'{PROJECT_PACKAGE}.wsgi').application
+
+    def after_fork():
+        from django.db import connections # type: ignore
+        connections.close_all()
+
+    return Target('django', load, after_fork)
+
+
+def django_asgi_application():
+    """Application ASGI de Django (fabrique pour uvicorn, importée dans chaque worker)"""
+    ensure_project_package()
+    return importlib.import_module(f'{PROJECT_PACKAGE}.asgi').application
+
+
+def import_target(spec):
+    """Application désignée par ``module:attribut``"""
+    module_name, _, attribute = spec.partition(':')
+    return Target(spec, lambda: getattr(importlib.import_module(module_name), attribute or 'application'))
+
+
+def parse_bind(bind):
+    host, _, port = bind.rpartition(':')
+    return host.strip('[]') or '0.0.0.0', int(port)
+
+
+class RequestHandler(WSGIRequestHandler):
+    """Gestionnaire HTTP/1.1 : connexions persistantes fermées après ``timeout`` secondes d'inactivité"""
+    protocol_version = 'HTTP/1.1'
+    timeout = 5
+    access_log = True
+
+    def handle_one_request(self):
+        super().handle_one_request()
+        if self.server.stopping:
+            self.close_connection = True  # worker en cours d'arrêt : pas de requête suivante
+
+    def log_request(self, *args, **kwargs):
+        if self.access_log:
+            super().log_request(*args, **kwargs)
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """Serveur WSGI de Werkzeug dont les connexions sont servies par un pool de threads borné
+
+    Une connexion n'est acceptée que si un thread est libre : les autres
+    restent dans la file du socket d'écoute, où un autre worker peut les
+    prendre, au lieu de s'accumuler dans la file du pool.
+    """
+    multithread = True
+    stopping = False
+
+    def __init__(self, listener, app, threads, handler=RequestHandler):
+        host, port = listener.getsockname()[:2]
+        super().__init__(host, port, app, handler=handler, fd=listener.fileno())
+        self.pool = ThreadPoolExecutor(threads, thread_name_prefix='http')
+        self.slots = threading.BoundedSemaphore(threads)
+
+    def get_request(self):
+        while not self.slots.acquire(timeout=0.5):
+            if self.stopping:
+                raise OSError('Worker en cours d\'arrêt')
+        try:
+            return super().get_request()
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def shutdown_request(self, request):
+        # Appelé une fois par connexion acceptée, servie ou refusée
+        try:
+            super().shutdown_request(request)
+        finally:
+            self.slots.release()
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        pool = getattr(self, 'pool', None)
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+
+class Worker:
+    """Processus de service : s'arrête après ``max_requests`` requêtes ou sur SIGTERM"""
+
+    def __init__(self, target, listener, threads, max_requests=0, keepalive=5, access_log=True, app=None):
+        self.target = target
+        self.listener = listener
+        self.threads = threads
+        self.max_requests = max_requests
+        self.keepalive = keepalive
+        self.access_log = access_log
+        self.app = app
+        self.requests = 0
+        self.server = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    def run(self, master_pid):
+        signal.signal(signal.SIGTERM, lambda signum, frame: self.stop())
+        for signum in (signal.SIGINT, signal.SIGHUP, signal.SIGTTIN, signal.SIGTTOU):
+            signal.signal(signum, signal.SIG_IGN)  # gérés par le maître
+        signal.set_wakeup_fd(-1)
+
+        app = self.app if self.app is not None else self.target.load()
+        self.target.after_fork()
+        handler = type('Handler', (RequestHandler,), {'timeout': self.keepalive, 'access_log': self.access_log})
+        self.server = PooledWSGIServer(self.listener, self._counting(app), self.threads, handler)
+        threading.Thread(target=self._watch_master, args=(master_pid,), name='master-watch', daemon=True).start()
+        try:
+            if self._stopping.is_set():
+                # TERM reçu pendant le chargement de l'application : rien à servir
+                self.server.server_close()
+            else:
+                self.server.serve_forever(poll_interval=0.5)  # ferme le serveur et attend les requêtes en cours
+        finally:
+            self.target.on_exit()
+
+    def _counting(self, app):
+        def application(environ, start_response):
+            with self._lock:
+                self.requests += 1
+                recycle = self.max_requests and self.requests >= self.max_requests
+            if recycle:
+                self.stop()
+            return app(environ, start_response)
+        return application
+
+    def stop(self):
+        """Ne plus accepter de connexions ; les requêtes en cours se terminent"""
+        if self._stopping.is_set():
+            return
+        self._stopping.set()
+        if self.server is None:
+            return  # application en cours de chargement : run() ne servira pas
+        self.server.stopping = True
+        # shutdown() attend la sortie de serve_forever : appelé hors du thread qui sert
+        threading.Thread(target=self.server.shutdown, name='worker-stop', daemon=True).start()
+
+    def _watch_master(self, master_pid):
+        while not self._stopping.wait(1.0):
+            if os.getppid() != master_pid:
+                logger.warning('Maître disparu, arrêt du worker %d', os.getpid())
+                self.stop()
+
+
+class Master:
+    """Gestion des workers : lancement, remplacement, rechargement et arrêt gracieux"""
+
+    def __init__(self, target, bind='127.0.0.1:8000', workers=2, threads=4, max_requests=0,
+                 max_requests_jitter=0, preload=False, graceful_timeout=30, keepalive=5, backlog=2048,
+                 access_log=True):
+        self.target = target
+        self.bind = bind
+        self.workers = max(1, workers)
+        self.threads = max(1, threads)
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.preload = preload
+        self.graceful_timeout = graceful_timeout
+        self.keepalive = keepalive
+        self.backlog = backlog
+        self.access_log = access_log
+        self.app = None
+        self.listener = None
+        self.generation = 0
+        self.children = {}  # processus -> génération
+        self.spawned = 0
+        self._signals = []
+        self._context = multiprocessing.get_context('fork')
+
+    def listen(self):
+        host, port = parse_bind(self.bind)
+        family = socket.AF_INET6 if ':' in host else socket.AF_INET
+        self.listener = socket.create_server((host, port), family=family, backlog=self.backlog)
+        # Non bloquant : un worker réveillé pour une connexion déjà prise par un autre n'attend pas
+        self.listener.setblocking(False)
+        return self.listener.getsockname()[:2]
+
+    def run(self):
+        host, port = self.listen()
+        if self.preload:
+            self.app = self.target.load()
+        click.echo(f'Écoute sur http://{host}:{port} ({self.target.name}, {self.workers} worker(s) '
+                   f'x {self.threads} thread(s), pid {os.getpid()})', nl=True)
+        sys.stdout.flush()
+
+        wakeup_read, wakeup_write = socket.socketpair()
+        wakeup_read.setblocking(False)
+        wakeup_write.setblocking(False)
+        signal.set_wakeup_fd(wakeup_write.fileno())
+        for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT, signal.SIGTTIN, signal.SIGTTOU):
+            signal.signal(signum, lambda signum, frame: self._signals.append(signum))
+
+        try:
+            self.maintain()
+            while True:
+                sentinels = [process.sentinel for process in self.children]
+                multiprocessing.connection.wait(sentinels + [wakeup_read], timeout=1.0)
+                try:
+                    while wakeup_read.recv(64):
+                        pass
+                except BlockingIOError:
+                    pass
+                if self.handle_signals():
+                    break
+                self.maintain()
+        finally:
+            self.stop()
+            signal.set_wakeup_fd(-1)
+            self.listener.close()
+
+    def handle_signals(self):
+        """Traiter les signaux reçus ; ``True`` pour arrêter"""
+        while self._signals:
+            signum = self._signals.pop(0)
+            if signum in (signal.SIGTERM, signal.SIGINT):
+                logger.info('Arrêt gracieux demandé')
+                return True
+            if signum == signal.SIGHUP:
+                self.reload()
+            elif signum == signal.SIGTTIN:
+                self.workers += 1
+            elif signum == signal.SIGTTOU and self.workers > 1:
+                self.workers -= 1
+        return False
+
+    def current(self):
+        return [process for process, generation in self.children.items() if generation == self.generation]
+
+    def maintain(self):
+        """Reprendre les workers terminés et ajuster leur nombre"""
+        crashed = False
+        for process in list(self.children):
+            if not process.is_alive():
+                process.join()
+                del self.children[process]
+                if process.exitcode:
+                    logger.error('Worker %d terminé avec le code %s', process.pid, process.exitcode)
+                    crashed = crashed or time.monotonic() - process.started < CRASH_INTERVAL
+        if crashed:
+            time.sleep(CRASH_INTERVAL)  # erreur au démarrage (import, configuration) : pas de boucle de fork
+        current = self.current()
+        for process in current[self.workers:]:
+            self.children[process] = -1  # surnuméraire (TTOU) : arrêt gracieux
+            process.terminate()
+        for _ in range(self.workers - len(current)):
+            self.spawn()
+
+    def spawn(self):
+        limit = self.max_requests
+        if limit and self.max_requests_jitter:
+            limit += random.randint(0, self.max_requests_jitter)
+        worker = Worker(self.target, self.listener, self.threads, limit, self.keepalive, self.access_log, self.app)
+        process = self._context.Process(target=worker.run, args=(os.getpid(),), daemon=False,
+                                        name=f'worker-{self.generation}')
+        process.start()
+        process.started = time.monotonic()
+        self.children[process] = self.generation
+        self.spawned += 1
+        return process
+
+    def reload(self):
+        """Nouveaux workers d'abord, puis arrêt gracieux des anciens"""
+        logger.info('Rechargement des workers')
+        previous = self.current()
+        self.generation += 1
+        for _ in range(self.workers):
+            self.spawn()
+        for process in previous:
+            process.terminate()
+
+    def stop(self):
+        for process in self.children:
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + self.graceful_timeout
+        for process in list(self.children):
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.warning('Worker %d arrêté de force', process.pid)
+                process.kill()
+                process.join()
+        self.children.clear()
+
+
+def run_gunicorn(target, options, worker_class='gthread'):
+    """Mêmes réglages avec gunicorn (HUP, TTIN/TTOU et max-requests y sont natifs)"""
+    from gunicorn.app.base import BaseApplication # type: ignore
+
+    settings = {
+        'bind': options['bind'], 'workers': options['workers'], 'threads': options['threads'],
+        'worker_class': worker_class, 'max_requests': options['max_requests'],
+        'max_requests_jitter': options['max_requests_jitter'], 'preload_app': options['preload'],
+        'graceful_timeout': options['graceful_timeout'], 'keepalive': options['keepalive'],
+        'backlog': options['backlog'], 'accesslog': '-' if options['access_log'] else None,
+        'post_fork': lambda server, worker: target.after_fork(),
+        'worker_exit': lambda server, worker: target.on_exit(),
+    }
+
+    class Application(BaseApplication):
+        def load_config(self):
+            for name, value in settings.items():
+                self.cfg.set(name, value)
+
+        def load(self):
+            return target.load()
+
+    Application().run()
+
+
+def run_uvicorn(options):
+    """Django en ASGI : uvicorn gère ses workers (sans préchargement ni rechargement par HUP)"""
+    import uvicorn # type: ignore
+
+    host, port = parse_bind(options['bind'])
+    uvicorn.run('serve:django_asgi_application', factory=True, app_dir=ROOT, host=host, port=port,
+                workers=options['workers'], limit_max_requests=options['max_requests'] or None,
+                timeout_graceful_shutdown=options['graceful_timeout'], timeout_keep_alive=options['keepalive'],
+                backlog=options['backlog'], access_log=options['access_log'])
+
+
+def serve(target, options, asgi=False):
+    server = options.pop('server')
+    if server == 'auto':
+        server = 'gunicorn' if importlib.util.find_spec('gunicorn') else 'builtin'
+    if asgi:
+        if importlib.util.find_spec('uvicorn') is None:
+            raise click.ClickException('uvicorn est nécessaire pour servir Django en ASGI (pip install uvicorn)')
+        if server == 'gunicorn':
+            run_gunicorn(target, options, worker_class='uvicorn.workers.UvicornWorker')
+        else:
+            run_uvicorn(options)
+        return
+    if server == 'gunicorn':
+        run_gunicorn(target, options)
+        return
+    if not options['access_log']:
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    Master(target, **options).run()
+
+
+def server_options(command):
+    for decorator in reversed((
+        click.option('--bind', default=os.environ.get('BIND', '127.0.0.1:8000'), show_default=True,
+                     help='Adresse d\'écoute (hôte:port, port 0 : choisi par le système)'),
+        click.option('--workers', default=int(os.environ.get('WEB_CONCURRENCY', os.cpu_count() or 1)),
+                     show_default='nombre de cœurs', help='Processus workers'),
+        click.option('--threads', default=4, show_default=True, help='Requêtes servies à la fois par worker'),
+        click.option('--max-requests', default=1000, show_default=True,
+                     help='Requêtes avant remplacement d\'un worker (0 : jamais)'),
+        click.option('--max-requests-jitter', default=100, show_default=True,
+                     help='Écart aléatoire ajouté à --max-requests (évite les remplacements simultanés)'),
+        click.option('--preload/--no-preload', default=False, show_default=True,
+                     help='Importer l\'application dans le maître avant le fork'),
+        click.option('--graceful-timeout', default=30, show_default=True,
+                     help='Secondes laissées aux requêtes en cours à l\'arrêt d\'un worker'),
+        click.option('--keepalive', default=5, show_default=True, help='Secondes d\'inactivité d\'une connexion persistante'),
+        click.option('--backlog', default=2048, show_default=True, help='Connexions en attente d\'acceptation'),
+        click.option('--access-log/--no-access-log', default=True, show_default=True),
+        click.option('--server', type=click.Choice(['auto', 'gunicorn', 'builtin']), default='auto', show_default=True,
+                     help='gunicorn s\'il est installé, sinon le gestionnaire de ce module'),
+    )):
+        command = decorator(command)
+    return command
+
+
+@click.group()
+def cli():
+    """Serveur de production de Nosdonnées"""
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(process)d %(levelname)s %(message)s')
+
+
+@cli.command('flask')
+@click.option('--env', default='production', show_default=True,
+              help='Configuration de config.py (FLASK_ENV) si elle n\'est pas déjà fixée')
+@server_options
+def flask_command(env, **options):
+    """Servir l'application Flask (app.py)"""
+    os.environ.setdefault('FLASK_ENV', env)
+    serve(flask_target(), options)
+
+
+@cli.command('django')
+@click.option('--asgi', is_flag=True, help='Servir asgi.py avec uvicorn (sinon wsgi.py)')
+@server_options
+def django_command(asgi, **options):
+    """Servir la variante Django (wsgi.py, ou asgi.py avec --asgi)"""
+    serve(django_target(), options, asgi=asgi)
+
+
+@cli.command('wsgi')
+@click.argument('application')
+@server_options
+def wsgi_command(application, **options):
+    """Servir une application WSGI quelconque (module:attribut)"""
+    serve(import_target(application), options)
+
+
+if __name__ == '__main__':
+    cli()
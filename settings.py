@@ -123,6 +123,68 @@ STATIC_ROOT = BASE_DIR / "staticfiles"
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# Delegate dataset downloads to the front-end server: "x-sendfile"
+# (Apache/lighttpd) or "x-accel-redirect" (nginx, internal location mapped
+# to MEDIA_ROOT). Leave empty to stream files from Django.
+NOSDONNEES_DOWNLOAD_OFFLOAD = os.environ.get("NOSDONNEES_DOWNLOAD_OFFLOAD") or None
+NOSDONNEES_DOWNLOAD_ACCEL_PREFIX = os.environ.get(
+    "NOSDONNEES_DOWNLOAD_ACCEL_PREFIX", "/protected-media/"
+)
+
+
+# Async download and search views (datasets.views.*_async), enabled by asgi.py:
+# under ASGI a slow download then holds neither a thread nor more than one
+# chunk of the file. WSGI deployments keep the synchronous views.
+# The instrumentation middleware supports both modes and keeps async views on
+# the event loop.
+NOSDONNEES_ASYNC_VIEWS = os.environ.get("NOSDONNEES_ASYNC_VIEWS") == "1"
+
+# File preview API (/api/datasets/<pk>/preview/): rows per page and pages
+# kept in memory per process.
+NOSDONNEES_PREVIEW_DEFAULT_LIMIT = int(os.environ.get("NOSDONNEES_PREVIEW_DEFAULT_LIMIT", 50))
+NOSDONNEES_PREVIEW_MAX_LIMIT = int(os.environ.get("NOSDONNEES_PREVIEW_MAX_LIMIT", 500))
+NOSDONNEES_PREVIEW_CACHE_SIZE = int(os.environ.get("NOSDONNEES_PREVIEW_CACHE_SIZE", 256))
+
+# Row indexes (see preview.py) reach any page with one seek. They are built
+# after the upload, keyed by the file's SHA-256; point this at the Flask
+# app's PREVIEW_INDEX_FOLDER to share them. Without an index, previews stop
+# at NOSDONNEES_PREVIEW_UNINDEXED_MAX_OFFSET rows so that no request scans a
+# large file. Preview reads run in their own thread pool, apart from the
+# download reads.
+NOSDONNEES_PREVIEW_INDEX_FOLDER = os.environ.get("NOSDONNEES_PREVIEW_INDEX_FOLDER") or str(MEDIA_ROOT / "previews")
+NOSDONNEES_PREVIEW_INDEX_CACHE_SIZE = int(os.environ.get("NOSDONNEES_PREVIEW_INDEX_CACHE_SIZE", 32))
+NOSDONNEES_PREVIEW_UNINDEXED_MAX_OFFSET = int(os.environ.get("NOSDONNEES_PREVIEW_UNINDEXED_MAX_OFFSET", 10000))
+NOSDONNEES_PREVIEW_THREADS = int(os.environ.get("NOSDONNEES_PREVIEW_THREADS", 2))
+
+
+# Cache for the home page and catalogue statistics. The default local-memory
+# cache is per process; set NOSDONNEES_CACHE_LOCATION to a directory to share
+# entries (and their invalidation) between workers on the same host.
+NOSDONNEES_CACHE_LOCATION = os.environ.get("NOSDONNEES_CACHE_LOCATION")
+CACHES = {
+    "default": (
+        {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": NOSDONNEES_CACHE_LOCATION,
+        }
+        if NOSDONNEES_CACHE_LOCATION
+        else {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "nosdonnees",
+        }
+    )
+}
+# Seconds; entries are also invalidated on upload, validation and download.
+NOSDONNEES_STATS_CACHE_TIMEOUT = int(os.environ.get("NOSDONNEES_STATS_CACHE_TIMEOUT", 3600))
+
+
+# Per-view timings, SQL query counts and bytes sent, exported in Prometheus
+# text format at /metrics/ (local requests only unless a bearer token is set).
+NOSDONNEES_INSTRUMENTATION = os.environ.get("NOSDONNEES_INSTRUMENTATION") == "1"
+NOSDONNEES_METRICS_TOKEN = os.environ.get("NOSDONNEES_METRICS_TOKEN")
+if NOSDONNEES_INSTRUMENTATION:
+    MIDDLEWARE.insert(0, "datasets.middleware.InstrumentationMiddleware")
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/stable/ref/settings/#default-auto-field
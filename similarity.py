@@ -0,0 +1,308 @@
+"""
+Bases similaires : index TF-IDF calculé hors requête
+
+La page d'un dataset affichait cinq datasets validés quelconques du même
+domaine (requête non indexée à chaque vue). Les voisins sont désormais
+calculés à l'avance et rangés dans la table ``similar_dataset`` (une ligne
+par dataset et par rang) : la page les lit par une seule requête sur la
+clé primaire.
+
+- chaque dataset validé est représenté par un vecteur TF-IDF creux
+  (titre, mots-clés, description et, si le profil existe, noms de
+  colonnes), normalisé ; la similarité est le cosinus ;
+- les produits scalaires sont calculés par un index inversé (terme ->
+  datasets) : seuls les couples qui partagent un terme sont parcourus, les
+  termes présents dans plus de ``MAX_DOCUMENT_FREQUENCY`` du catalogue
+  sont ignorés ;
+- ``rebuild`` recalcule tous les voisins (``flask rebuild-similar``) ;
+- ``refresh`` met à jour un seul dataset après sa validation, son rejet
+  ou son profilage : sa liste est recalculée et il est inséré dans (ou
+  retiré de) celles des datasets dont il devient (ou n'est plus) voisin.
+
+L'index est gardé en mémoire par moteur : ``refresh`` ne relit que le
+dataset modifié et ne revectorise que les documents dont un terme entre
+dans l'IDF ou en sort, au lieu de relire et d'indexer tout le catalogue.
+Il est relu après ``INDEX_MAX_AGE`` secondes, pour suivre les mises à jour
+faites par les autres processus.
+
+Les poids des autres documents et les scores des listes que ``refresh`` ne
+touche pas ne suivent pas l'évolution des fréquences des termes : une
+reconstruction périodique (tâche ``rebuild_similar``, programmée après les
+mises à jour) les remet à jour.
+"""
+
+import heapq
+import json
+import math
+import re
+import threading
+import time
+import unicodedata
+import weakref
+from collections import Counter
+
+from sqlalchemy import delete, or_, select
+
+TOP_K = 5
+MAX_DOCUMENT_FREQUENCY = 0.5  # part du catalogue au-delà de laquelle un terme est ignoré
+MIN_SCORE = 0.05
+INDEX_MAX_AGE = 3600  # secondes avant de relire le catalogue
+
+# Poids de chaque champ dans le document d'un dataset
+FIELD_WEIGHTS = {'title': 3, 'keywords': 2, 'short_description': 1, 'description': 1, 'columns': 2}
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+STOP_WORDS = frozenset(
+    'au aux avec ce ces dans de des du elle en et eux il je la le les leur lui ma mais me meme mes moi mon ne '
+    'nos notre nous on ou par pas pour qu que qui sa se ses son sur ta te tes toi ton tu un une vos votre vous '
+    'est sont ete etre avoir par plus sans entre leurs cette celui donnees base bases fichier '
+    'the of and to in for on with by is are from data dataset'.split()
+)
+
+
+def tokenize(value):
+    """Mots normalisés (minuscules, sans accents, sans mots vides ni nombres seuls)"""
+    if not value:
+        return []
+    value = unicodedata.normalize('NFKD', value.lower())
+    value = ''.join(char for char in value if not unicodedata.combining(char))
+    return [
+        token for token in _TOKEN_RE.findall(value.replace('_', ' '))
+        if len(token) > 1 and not token.isdigit() and token not in STOP_WORDS
+    ]
+
+
+def profile_columns(profile):
+    """Noms des colonnes d'un profil (JSON de profiling.py), liste vide sinon"""
+    if not profile:
+        return []
+    try:
+        data = json.loads(profile) if isinstance(profile, str) else profile
+        return [column['name'] for column in data.get('columns', []) if column.get('name')]
+    except (ValueError, TypeError, AttributeError, KeyError):
+        return []
+
+
+def document_terms(title='', short_description='', description='', keywords='', profile=None):
+    """Occurrences pondérées des termes d'un dataset"""
+    fields = {
+        'title': title,
+        'short_description': short_description,
+        'description': description,
+        'keywords': (keywords or '').replace(',', ' '),
+        'columns': ' '.join(profile_columns(profile)),
+    }
+    terms = Counter()
+    for name, value in fields.items():
+        for token in tokenize(value):
+            terms[token] += FIELD_WEIGHTS[name]
+    return terms
+
+
+class SimilarityIndex:
+    """Vecteurs TF-IDF normalisés et index inversé d'un ensemble de documents"""
+
+    def __init__(self, documents, max_document_frequency=MAX_DOCUMENT_FREQUENCY):
+        """``documents`` : ``{identifiant: Counter des termes}``"""
+        self.max_document_frequency = max_document_frequency
+        self.documents = dict(documents)
+        self.term_documents = {}  # terme -> documents qui le contiennent (IDF ou non)
+        for doc_id, terms in self.documents.items():
+            for term in terms:
+                self.term_documents.setdefault(term, set()).add(doc_id)
+        self._idf = {}
+        self.vectors = {}
+        self.postings = {}  # terme -> {document: poids}
+        for doc_id in self.documents:
+            self._index(doc_id)
+
+    def idf(self, term):
+        """IDF lissé du terme, ``None`` s'il est ignoré
+
+        Les termes d'un seul document ne rapprochent personne ; ceux de plus
+        de ``max_document_frequency`` du catalogue ne distinguent personne.
+        """
+        if term not in self._idf:
+            count = len(self.documents)
+            frequency = len(self.term_documents.get(term, ()))
+            limit = max(2, self.max_document_frequency * count)
+            self._idf[term] = math.log((1 + count) / (1 + frequency)) + 1 if 1 < frequency <= limit else None
+        return self._idf[term]
+
+    def vectorize(self, terms):
+        """Vecteur creux ``{terme: poids}`` normalisé (TF sous-linéaire x IDF)"""
+        vector = {}
+        for term, frequency in terms.items():
+            idf = self.idf(term)
+            if idf is not None:
+                vector[term] = (1 + math.log(frequency)) * idf
+        norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+        return {term: weight / norm for term, weight in vector.items()} if norm else {}
+
+    def _index(self, doc_id):
+        vector = self.vectorize(self.documents[doc_id])
+        self.vectors[doc_id] = vector
+        for term, weight in vector.items():
+            self.postings.setdefault(term, {})[doc_id] = weight
+
+    def _unindex(self, doc_id):
+        for term in self.vectors.pop(doc_id, ()):
+            del self.postings[term][doc_id]
+
+    def update(self, doc_id, terms):
+        """Remplacer le document ``doc_id`` par ``terms`` (``None`` : le retirer)
+
+        Seuls le document et ceux qui partagent un terme entrant dans l'IDF
+        ou en sortant sont revectorisés.
+        """
+        old = self.documents.get(doc_id) or {}
+        changed = set(old) | set(terms or ())
+        weighted = {term for term in changed if self.idf(term) is not None}
+
+        self._unindex(doc_id)
+        for term in old:
+            self.term_documents[term].discard(doc_id)
+        if terms is None:
+            self.documents.pop(doc_id, None)
+        else:
+            self.documents[doc_id] = terms
+            for term in terms:
+                self.term_documents.setdefault(term, set()).add(doc_id)
+        self._idf.clear()
+
+        stale = set()
+        for term in changed:
+            if (self.idf(term) is not None) != (term in weighted):
+                stale.update(self.term_documents.get(term, ()))
+        if terms is not None:
+            stale.add(doc_id)
+        for stale_id in stale:
+            self._unindex(stale_id)
+            self._index(stale_id)
+
+    def scores(self, doc_id):
+        """Similarité cosinus de ``doc_id`` avec chaque document qui partage un terme"""
+        totals = {}
+        for term, weight in self.vectors.get(doc_id, {}).items():
+            for other_id, other_weight in self.postings[term].items():
+                if other_id != doc_id:
+                    totals[other_id] = totals.get(other_id, 0.0) + weight * other_weight
+        return totals
+
+    def neighbours(self, doc_id, k=TOP_K, min_score=MIN_SCORE):
+        """Les ``k`` documents les plus proches ``[(identifiant, score)]``"""
+        return top_k(self.scores(doc_id).items(), k, min_score)
+
+
+def top_k(candidates, k=TOP_K, min_score=MIN_SCORE):
+    """Meilleurs couples ``(identifiant, score)``, l'identifiant départageant les égalités"""
+    kept = [(doc_id, score) for doc_id, score in candidates if score >= min_score]
+    return heapq.nlargest(k, kept, key=lambda item: (item[1], -item[0]))
+
+
+def load_documents(conn, dataset_table, dataset_id=None):
+    """Documents des datasets validés ``{id: Counter}`` (du seul ``dataset_id`` s'il est donné)"""
+    columns = dataset_table.c
+    query = select(columns.id, columns.title, columns.short_description, columns.description,
+                   columns.keywords, columns.profile).where(columns.status == 'validated')
+    if dataset_id is not None:
+        query = query.where(columns.id == dataset_id)
+    rows = conn.execute(query)
+    return {
+        row.id: document_terms(row.title, row.short_description, row.description, row.keywords, row.profile)
+        for row in rows
+    }
+
+
+def load_neighbours(conn, table, dataset_ids):
+    """Listes enregistrées ``{dataset_id: [(voisin, score)]}``"""
+    if not dataset_ids:
+        return {}
+    lists = {dataset_id: [] for dataset_id in dataset_ids}
+    rows = conn.execute(
+        select(table.c.dataset_id, table.c.similar_id, table.c.score)
+        .where(table.c.dataset_id.in_(sorted(dataset_ids)))
+        .order_by(table.c.dataset_id, table.c.rank)
+    )
+    for dataset_id, similar_id, score in rows:
+        lists[dataset_id].append((similar_id, score))
+    return lists
+
+
+def store_neighbours(conn, table, lists):
+    """Remplacer les listes ``{dataset_id: [(voisin, score)]}`` données"""
+    if not lists:
+        return
+    conn.execute(delete(table).where(table.c.dataset_id.in_(sorted(lists))))
+    rows = [
+        {'dataset_id': dataset_id, 'rank': rank, 'similar_id': similar_id, 'score': score}
+        for dataset_id, neighbours in lists.items()
+        for rank, (similar_id, score) in enumerate(neighbours)
+    ]
+    if rows:
+        conn.execute(table.insert(), rows)
+
+
+# Index du catalogue par moteur : (index, date de lecture)
+_indexes = weakref.WeakKeyDictionary()
+_indexes_lock = threading.Lock()
+
+
+def rebuild(conn, table, dataset_table, k=TOP_K):
+    """Recalculer les voisins de tous les datasets validés ; retourne le nombre de listes"""
+    index = SimilarityIndex(load_documents(conn, dataset_table))
+    conn.execute(delete(table))
+    store_neighbours(conn, table, {doc_id: index.neighbours(doc_id, k) for doc_id in index.vectors})
+    with _indexes_lock:
+        _indexes[conn.engine] = (index, time.monotonic())
+    return len(index.vectors)
+
+
+def refresh(conn, table, dataset_table, dataset_id, k=TOP_K, max_age=INDEX_MAX_AGE):
+    """Mettre à jour les voisins après un changement du dataset ``dataset_id``
+
+    Retourne le nombre de listes réécrites.
+    """
+    with _indexes_lock:
+        cached = _indexes.get(conn.engine)
+        if cached is None or time.monotonic() - cached[1] > max_age:
+            cached = _indexes[conn.engine] = (SimilarityIndex(load_documents(conn, dataset_table)), time.monotonic())
+        index = cached[0]
+        index.update(dataset_id, load_documents(conn, dataset_table, dataset_id).get(dataset_id))
+        return _refresh_lists(conn, table, index, dataset_id, k)
+
+
+def _refresh_lists(conn, table, index, dataset_id, k):
+    lists = {}
+    if dataset_id in index.vectors:
+        lists[dataset_id] = index.neighbours(dataset_id, k)
+        scores = index.scores(dataset_id)
+    else:
+        scores = {}
+
+    # Listes où le dataset figure déjà ou pourrait entrer
+    holders = set(conn.execute(
+        select(table.c.dataset_id).where(table.c.similar_id == dataset_id)
+    ).scalars())
+    current = load_neighbours(conn, table, holders | {other_id for other_id, score in scores.items()
+                                                      if score >= MIN_SCORE})
+    for other_id, neighbours in current.items():
+        if other_id not in index.vectors:
+            continue
+        score = scores.get(other_id, 0.0)
+        if score >= MIN_SCORE:
+            kept = [(similar_id, value) for similar_id, value in neighbours if similar_id != dataset_id]
+            updated = top_k(kept + [(dataset_id, score)], k)
+        elif other_id in holders:
+            # N'est plus voisin (rejeté ou modifié) : la place libérée est recalculée
+            updated = index.neighbours(other_id, k)
+        else:
+            continue
+        if updated != neighbours:
+            lists[other_id] = updated
+
+    if dataset_id not in index.vectors:
+        conn.execute(delete(table).where(or_(table.c.dataset_id == dataset_id, table.c.similar_id == dataset_id)))
+    store_neighbours(conn, table, lists)
+    return len(lists)
@@ -0,0 +1,211 @@
+"""
+Réglages SQLite de production : WAL, pragmas, écritures sérialisées et
+lectures sur un pool dédié
+
+Avec le journal par défaut (``DELETE``), chaque écriture (vidage des
+compteurs, commentaire, upload) verrouille toute la base : les lectures
+concurrentes attendent puis échouent en « database is locked ». Pour une
+base SQLite, ``SQLiteTuning`` :
+
+- applique à chaque nouvelle connexion les pragmas de ``SQLITE_PRAGMAS``
+  (``journal_mode=WAL`` : les lecteurs ne sont plus bloqués par
+  l'écrivain ; ``synchronous=NORMAL``, ``cache_size``, ``mmap_size``,
+  ``temp_store`` et ``busy_timeout``) ;
+- sérialise les écritures du processus (``WriteLock``) : la première
+  instruction d'écriture d'une transaction attend son tour, sans
+  interroger SQLite en boucle, et le verrou est rendu au commit ou au
+  rollback. Le module ``sqlite3`` n'ouvre la transaction qu'à la première
+  écriture : elle ne part jamais d'un instantané de lecture périmé. Entre
+  processus, ``busy_timeout`` prend le relais ;
+- sert les requêtes ``GET``/``HEAD`` par un second moteur
+  (``SQLITE_READ_POOL_SIZE`` connexions en ``query_only``) : ``db.session``
+  y envoie ses lectures tant qu'il n'a rien écrit, les écritures et les
+  autres méthodes HTTP gardant le moteur principal.
+
+``SQLITE_READ_POOL_SIZE = 0`` désactive la séparation ; les bases en
+mémoire et les autres moteurs ne sont pas touchés.
+"""
+
+import logging
+import threading
+import time
+
+from flask import current_app, has_app_context, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event
+from sqlalchemy.sql.dml import UpdateBase
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',  # sûr en WAL : seul le dernier commit peut être perdu en cas de coupure
+    'busy_timeout': 5000,  # ms
+    'cache_size': -64000,  # Kio (64 Mo) par connexion
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+READ_METHODS = ('GET', 'HEAD')
+
+_WRITE_PREFIXES = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'CREATE', 'DROP', 'ALTER')
+
+
+def is_file_database(url):
+    """Base SQLite sur disque (pas en mémoire)"""
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:') \
+        and not url.database.startswith('file::memory:')
+
+
+def apply_pragmas(dbapi_connection, pragmas):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+    finally:
+        cursor.close()
+
+
+class WriteLock:
+    """Verrou des écritures du processus, réentrant par thread et libérable d'un autre thread"""
+
+    def __init__(self, timeout=5.0):
+        self.timeout = timeout
+        self.acquisitions = 0
+        self.waits = 0  # acquisitions qui ont attendu
+        self.wait_seconds = 0.0
+        self._condition = threading.Condition()
+        self._owner = None
+        self._depth = 0
+
+    def acquire(self):
+        """Attendre son tour ; ``False`` après ``timeout`` (SQLite décide alors avec ``busy_timeout``)"""
+        ident = threading.get_ident()
+        with self._condition:
+            if self._owner == ident:
+                self._depth += 1
+                return True
+            started = time.perf_counter()
+            deadline = started + self.timeout
+            while self._owner is not None:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0 or not self._condition.wait(remaining):
+                    if self._owner is not None:
+                        return False
+            waited = time.perf_counter() - started
+            self._owner, self._depth = ident, 1
+            self.acquisitions += 1
+            if waited > 0.0001:
+                self.waits += 1
+                self.wait_seconds += waited
+            return True
+
+    def release(self):
+        with self._condition:
+            self._depth -= 1
+            if self._depth <= 0:
+                self._owner, self._depth = None, 0
+                self._condition.notify()
+
+
+def _is_write(statement):
+    return statement.lstrip()[:7].upper().startswith(_WRITE_PREFIXES)
+
+
+class SQLiteTuning:
+    """Pragmas, verrou d'écriture et moteur de lecture d'une base SQLite"""
+
+    def __init__(self, app=None, db=None):
+        self.pragmas = dict(DEFAULT_PRAGMAS)
+        self.write_lock = None
+        self.read_engine = None
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        app.extensions['sqlite_tuning'] = self
+        if app.config.get('SQLITE_TUNING_ENABLED') is False:
+            return
+        with app.app_context():
+            engine = db.engine
+        if not is_file_database(engine.url):
+            return
+
+        self.pragmas.update(app.config.get('SQLITE_PRAGMAS') or {})
+        event.listen(engine, 'connect', self._on_connect)
+        # Connexions ouvertes avant les réglages (schéma, compteurs) : reprises avec
+        engine.dispose()
+
+        if app.config.get('SQLITE_WRITE_LOCK', True):
+            self.write_lock = WriteLock(timeout=self.pragmas.get('busy_timeout', 5000) / 1000)
+            event.listen(engine, 'before_cursor_execute', self._before_write)
+            event.listen(engine, 'commit', self._release)
+            event.listen(engine, 'rollback', self._release)
+            event.listen(engine.pool, 'reset', self._on_reset)
+            for name in ('invalidate', 'close'):
+                event.listen(engine.pool, name, self._release_record)
+
+        pool_size = app.config.get('SQLITE_READ_POOL_SIZE', 0)
+        if pool_size:
+            self.read_engine = create_engine(
+                engine.url, pool_size=pool_size, max_overflow=pool_size,
+                connect_args={'check_same_thread': False}
+            )
+            event.listen(self.read_engine, 'connect', self._on_connect_read)
+
+    def engines(self):
+        """Moteurs supplémentaires à instrumenter (lecture)"""
+        return [self.read_engine] if self.read_engine is not None else []
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        apply_pragmas(dbapi_connection, self.pragmas)
+
+    def _on_connect_read(self, dbapi_connection, connection_record):
+        # Le mode du journal appartient au fichier : déjà réglé par le moteur principal
+        apply_pragmas(dbapi_connection, {name: value for name, value in self.pragmas.items()
+                                         if name != 'journal_mode'})
+        apply_pragmas(dbapi_connection, {'query_only': 'ON'})
+
+    def _before_write(self, conn, cursor, statement, parameters, context, executemany):
+        if conn.info.get('write_lock') or not _is_write(statement):
+            return
+        if self.write_lock.acquire():
+            conn.info['write_lock'] = True
+        else:
+            logger.warning('Écriture SQLite en attente depuis %.1f s, poursuite sans le verrou',
+                           self.write_lock.timeout)
+
+    def _release(self, conn):
+        if conn.info.pop('write_lock', False):
+            self.write_lock.release()
+
+    def _on_reset(self, dbapi_connection, connection_record, reset_state):
+        self._release_record(dbapi_connection, connection_record)
+
+    def _release_record(self, dbapi_connection, connection_record, *args):
+        # Connexion rendue au pool (ou fermée) sans commit ni rollback explicite
+        if connection_record is not None and connection_record.info.pop('write_lock', False):
+            self.write_lock.release()
+
+
+def engines(app, db):
+    """Moteurs de l'application : principal, puis lecture s'il existe"""
+    tuning = app.extensions.get('sqlite_tuning')
+    with app.app_context():
+        return [db.engine] + (tuning.engines() if tuning is not None else [])
+
+
+class RoutingSession(Session):
+    """Session qui lit sur le moteur de lecture pendant les requêtes GET/HEAD"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and not isinstance(clause, UpdateBase) \
+                and not self.info.get('wrote') and has_app_context():
+            tuning = current_app.extensions.get('sqlite_tuning')
+            if tuning is not None and tuning.read_engine is not None and has_request_context() \
+                    and request.method in READ_METHODS:
+                return tuning.read_engine
+        if self._flushing or isinstance(clause, UpdateBase):
+            # La suite de la requête doit voir ce qui vient d'être écrit
+            self.info['wrote'] = True
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
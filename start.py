@@ -21,11 +21,12 @@ def start_app():
     
     # Importer et démarrer l'application
     try:
-        from app import app, init_db
+        from app import create_app, ensure_database
+        app = create_app()
         
-        # Initialiser la base de données
-        print("📊 Initialisation de la base de données...")
-        init_db()
+        # Créer la base au premier lancement (mises à jour : flask --app app init-db)
+        print("📊 Vérification de la base de données...")
+        ensure_database(app)
         
         # Démarrer le serveur
         print("🌐 Démarrage du serveur web...")
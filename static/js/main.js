@@ -33,20 +33,113 @@ document.addEventListener('DOMContentLoaded', function() {
         observer.observe(card);
     });
     
-    // Gestion du formulaire de recherche
-    const searchForm = document.querySelector('form[action*="dataset_list"]');
-    if (searchForm) {
-        const searchInput = searchForm.querySelector('input[name="q"]');
-        let searchTimeout;
+    // Suggestions de recherche au fil de la frappe (/api/suggest, index en mémoire côté serveur)
+    const suggestKinds = {dataset: 'Base', keyword: 'Mot-clé', domain: 'Domaine', author: 'Auteur'};
+    const suggestCache = new Map();
+    document.querySelectorAll('input[data-suggest-url]').forEach(input => {
+        const menu = document.createElement('div');
+        menu.className = 'dropdown-menu';
+        menu.setAttribute('role', 'listbox');
+        input.parentNode.appendChild(menu);
+        let suggestTimeout;
+        let controller = null;
+        let active = -1;
         
-        searchInput.addEventListener('input', function() {
-            clearTimeout(searchTimeout);
-            searchTimeout = setTimeout(function() {
-                // Recherche en temps réel (optionnel)
-                console.log('Recherche:', searchInput.value);
-            }, 500);
+        function hideSuggestions() {
+            menu.classList.remove('show');
+            active = -1;
+        }
+        
+        function highlight(index) {
+            const items = menu.querySelectorAll('.dropdown-item');
+            items.forEach((item, i) => item.classList.toggle('active', i === index));
+            active = index;
+        }
+        
+        function showSuggestions(suggestions) {
+            menu.replaceChildren();
+            suggestions.forEach(suggestion => {
+                const item = document.createElement('a');
+                item.className = 'dropdown-item d-flex justify-content-between';
+                item.href = suggestion.url;
+                item.setAttribute('role', 'option');
+                const label = document.createElement('span');
+                label.textContent = suggestion.label;
+                const kind = document.createElement('small');
+                kind.className = 'text-muted ms-3';
+                kind.textContent = suggestKinds[suggestion.kind] || suggestion.kind;
+                item.append(label, kind);
+                menu.appendChild(item);
+            });
+            if (!suggestions.length) {
+                hideSuggestions();
+                return;
+            }
+            menu.style.left = input.offsetLeft + 'px';
+            menu.style.top = (input.offsetTop + input.offsetHeight) + 'px';
+            menu.style.minWidth = input.offsetWidth + 'px';
+            menu.classList.add('show');
+            active = -1;
+        }
+        
+        function fetchSuggestions(q) {
+            if (suggestCache.has(q)) {
+                showSuggestions(suggestCache.get(q));
+                return;
+            }
+            // Seule la dernière saisie compte
+            if (controller) {
+                controller.abort();
+            }
+            controller = new AbortController();
+            fetch(input.dataset.suggestUrl + '?q=' + encodeURIComponent(q), {signal: controller.signal})
+                .then(response => response.ok ? response.json() : {suggestions: []})
+                .then(data => {
+                    if (suggestCache.size > 200) {
+                        suggestCache.clear();
+                    }
+                    suggestCache.set(q, data.suggestions);
+                    if (input.value.trim() === q) {
+                        showSuggestions(data.suggestions);
+                    }
+                })
+                .catch(error => {
+                    if (error.name !== 'AbortError') {
+                        hideSuggestions();
+                    }
+                });
+        }
+        
+        input.addEventListener('input', function() {
+            clearTimeout(suggestTimeout);
+            const q = input.value.trim();
+            if (!q) {
+                hideSuggestions();
+                return;
+            }
+            suggestTimeout = setTimeout(() => fetchSuggestions(q), 120);
         });
-    }
+        
+        input.addEventListener('keydown', function(e) {
+            const items = menu.querySelectorAll('.dropdown-item');
+            if (!menu.classList.contains('show') || !items.length) {
+                return;
+            }
+            if (e.key === 'ArrowDown' || e.key === 'ArrowUp') {
+                e.preventDefault();
+                const step = e.key === 'ArrowDown' ? 1 : -1;
+                highlight((active + step + items.length) % items.length);
+            } else if (e.key === 'Enter' && active >= 0) {
+                e.preventDefault();
+                window.location.href = items[active].href;
+            } else if (e.key === 'Escape') {
+                hideSuggestions();
+            }
+        });
+        
+        // Laisser le temps au clic sur une suggestion
+        input.addEventListener('blur', () => setTimeout(hideSuggestions, 150));
+    });
     
     // Gestion des filtres
     const filterSelects = document.querySelectorAll('select[name="domain"], select[name="file_format"]');
@@ -96,7 +189,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 `;
                 
                 // Validation de la taille du fichier
-                const maxSize = 100; // MB
+                const maxSize = parseInt(this.dataset.maxSizeMb || '100', 10); // MB
                 if (file.size > maxSize * 1024 * 1024) {
                     fileDisplay.innerHTML = `
                         <div class="alert alert-danger">
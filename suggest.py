@@ -0,0 +1,275 @@
+"""
+Suggestions de recherche au fil de la frappe (index de préfixes en mémoire)
+
+``/api/suggest?q=`` complète la saisie à partir des titres des datasets
+validés, de leurs mots-clés, domaines et auteurs, sans requête SQL par
+frappe :
+
+- chaque libellé est normalisé (minuscules, sans accents) et rangé dans
+  un tableau trié une fois par début de mot (« couverture vaccinale » est
+  trouvé par « cou » et par « vac ») ; une saisie correspond à l'intervalle
+  ``bisect`` des clés qui commencent par elle ;
+- les complétions sont classées d'abord par correspondance en début de
+  libellé, puis par popularité (téléchargements du dataset, ou cumulés
+  sur les datasets d'un mot-clé, domaine ou auteur) ;
+- les résultats des saisies de un à trois caractères, qui couvrent une
+  grande part de l'index, sont calculés à la construction ; ceux des
+  autres saisies qui parcourent beaucoup de clés sont gardés ensuite. Un
+  ajout les met à jour, un retrait les fait recalculer à la demande ;
+- l'index est mis à jour dans le processus à la validation ou au rejet
+  d'un dataset, et reconstruit en arrière-plan quand il a plus de
+  ``max_age`` secondes (changements faits par les autres processus,
+  compteurs de téléchargements).
+"""
+
+import bisect
+import heapq
+import logging
+import re
+import threading
+import time
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+SHORT_PREFIX = 3  # saisies dont les résultats sont calculés à la construction
+CACHED_SCAN = 256  # au-delà de ce nombre de clés parcourues, le résultat d'une saisie est gardé
+MAX_CACHED = 20000  # résultats gardés au plus
+
+_SEPARATORS = re.compile(r'[^a-z0-9]+')
+
+
+def normalize(value):
+    """Minuscules sans accents, mots séparés par une espace"""
+    value = unicodedata.normalize('NFKD', (value or '').lower())
+    value = ''.join(char for char in value if not unicodedata.combining(char))
+    return _SEPARATORS.sub(' ', value).strip()
+
+
+def word_keys(norm):
+    """Suffixes du libellé normalisé commençant à chaque mot"""
+    keys = [norm] if norm else []
+    for position, char in enumerate(norm):
+        if char == ' ':
+            keys.append(norm[position + 1:])
+    return keys
+
+
+def dataset_terms(row):
+    """Entrées ``(type, clé, libellé, cible)`` apportées par un dataset
+
+    ``row`` a les attributs ``id``, ``title``, ``keywords``, ``author``,
+    ``domain_id`` et ``domain_name``.
+    """
+    terms = [('dataset', row.id, row.title, row.id)]
+    for keyword in (row.keywords or '').split(','):
+        keyword = keyword.strip()
+        if normalize(keyword):
+            terms.append(('keyword', normalize(keyword), keyword, keyword))
+    if row.domain_id is not None and normalize(row.domain_name):
+        terms.append(('domain', row.domain_id, row.domain_name, row.domain_id))
+    if normalize(row.author):
+        terms.append(('author', normalize(row.author), row.author, row.author))
+    return terms
+
+
+class _State:
+    """Tableau trié des clés et entrées de l'index"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.keys = []  # (clé normalisée, type, identifiant), trié
+        self.entries = {}  # (type, identifiant) -> [libellé, normalisé, cible, nombre, popularité]
+        self.datasets = {}  # dataset_id -> (entrées apportées, popularité)
+        self.cached = {}  # saisie -> meilleures entrées [(rang, entrée)]
+
+    def rank(self, key, entry_id):
+        entry = self.entries[entry_id]
+        # Début du libellé avant début d'un autre mot, puis popularité, puis les datasets
+        return (key == entry[1], entry[4], entry[3], entry_id[0] == 'dataset')
+
+    def add(self, row, sort=True):
+        popularity = getattr(row, 'download_count', 0) or 0
+        entry_ids = []
+        for kind, ident, label, target in dataset_terms(row):
+            entry_id = (kind, ident)
+            if entry_id in entry_ids:
+                continue
+            entry_ids.append(entry_id)
+            entry = self.entries.get(entry_id)
+            if entry is None:
+                norm = normalize(label)
+                entry = self.entries[entry_id] = [label, norm, target, 0, 0]
+                for key in word_keys(norm):
+                    if sort:
+                        bisect.insort(self.keys, (key, kind, ident))
+                    else:
+                        self.keys.append((key, kind, ident))
+            entry[3] += 1
+            entry[4] += popularity
+        self.datasets[row.id] = (entry_ids, popularity)
+        return entry_ids
+
+    def remove(self, dataset_id):
+        """Retirer les apports d'un dataset ; retourne les libellés normalisés touchés"""
+        entry_ids, popularity = self.datasets.pop(dataset_id, ((), 0))
+        touched = []
+        for entry_id in entry_ids:
+            entry = self.entries[entry_id]
+            touched.append(entry[1])
+            entry[3] -= 1
+            entry[4] -= popularity
+            if entry[3] <= 0:
+                del self.entries[entry_id]
+                for key in word_keys(entry[1]):
+                    position = bisect.bisect_left(self.keys, (key, *entry_id))
+                    if position < len(self.keys) and self.keys[position] == (key, *entry_id):
+                        del self.keys[position]
+        return touched
+
+    def precompute(self):
+        """Meilleures entrées de toutes les saisies courtes (un parcours par longueur)"""
+        self.cached = {}
+        for length in range(1, SHORT_PREFIX + 1):
+            prefix, best = None, {}
+            for key, kind, ident in self.keys:
+                if key[:length] != prefix:
+                    if best:
+                        self.cached[prefix] = self._top(best)
+                    prefix, best = key[:length], {}
+                rank = self.rank(key, (kind, ident))
+                if best.get((kind, ident), (False,)) < rank:
+                    best[(kind, ident)] = rank
+            if best:
+                self.cached[prefix] = self._top(best)
+
+    def cached_prefixes(self, norm):
+        for key in word_keys(norm):
+            for length in range(1, len(key) + 1):
+                if key[:length] in self.cached:
+                    yield key, key[:length]
+
+    def forget(self, norms):
+        """Oublier les résultats dont le classement a pu baisser (recalcul à la demande)"""
+        for norm in norms:
+            for _, prefix in list(self.cached_prefixes(norm)):
+                self.cached.pop(prefix, None)
+
+    def merge(self, entry_ids):
+        """Faire entrer des entrées ajoutées ou mieux classées dans les résultats gardés"""
+        for entry_id in entry_ids:
+            for key, prefix in list(self.cached_prefixes(self.entries[entry_id][1])):
+                best = {other_id: rank for rank, other_id in self.cached[prefix]}
+                rank = self.rank(key, entry_id)
+                if best.get(entry_id, (False,)) < rank:
+                    best[entry_id] = rank
+                    self.cached[prefix] = self._top(best)
+
+    def _top(self, best):
+        return [(rank, entry_id) for entry_id, rank in
+                heapq.nlargest(self.limit, best.items(), key=lambda item: item[1])]
+
+    def search(self, prefix):
+        """Meilleures entrées des clés qui commencent par ``prefix``"""
+        found = self.cached.get(prefix)
+        if found is not None:
+            return found
+        start = bisect.bisect_left(self.keys, (prefix,))
+        end = bisect.bisect_left(self.keys, (prefix + '\uffff',), start)
+        best = {}
+        for key, kind, ident in self.keys[start:end]:
+            rank = self.rank(key, (kind, ident))
+            if best.get((kind, ident), (False,)) < rank:
+                best[(kind, ident)] = rank
+        found = self._top(best)
+        if end - start > CACHED_SCAN:
+            if len(self.cached) >= MAX_CACHED:
+                self.cached.clear()
+            self.cached[prefix] = found
+        return found
+
+    def result(self, entry_id):
+        label, _, target, count, _ = self.entries[entry_id]
+        return {'kind': entry_id[0], 'label': label, 'target': target, 'count': count}
+
+
+class SuggestIndex:
+    """Index de préfixes des libellés du catalogue, partagé par les requêtes du processus"""
+
+    def __init__(self, max_age=300, limit=8):
+        self.max_age = max_age
+        self.limit = limit
+        self.built_at = None
+        self._state = _State(limit)
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def build(self, rows):
+        """Reconstruire entièrement l'index à partir des datasets validés"""
+        state = _State(self.limit)
+        for row in rows:
+            state.add(row, sort=False)
+        state.keys.sort()
+        state.precompute()
+        with self._lock:
+            self._state = state
+            self.built_at = time.monotonic()
+        return len(state.datasets)
+
+    def add_dataset(self, row):
+        """Ajouter (ou remplacer) un dataset validé"""
+        with self._lock:
+            self._state.forget(self._state.remove(row.id))
+            self._state.merge(self._state.add(row))
+
+    def remove_dataset(self, dataset_id):
+        """Retirer un dataset (rejeté, supprimé)"""
+        with self._lock:
+            self._state.forget(self._state.remove(dataset_id))
+
+    def suggest(self, q, limit=None):
+        """Complétions de la saisie ``q``, les mieux classées d'abord"""
+        prefix = normalize(q)
+        if not prefix:
+            return []
+        limit = min(limit or self.limit, self.limit)
+        with self._lock:
+            return [self._state.result(entry_id) for _, entry_id in self._state.search(prefix)[:limit]]
+
+    def is_stale(self):
+        return self.built_at is None or (self.max_age and time.monotonic() - self.built_at > self.max_age)
+
+    def ensure_fresh(self, load):
+        """Construire l'index au premier appel, puis le rafraîchir en arrière-plan quand il est ancien
+
+        ``load()`` retourne les lignes des datasets validés.
+        """
+        if self.built_at is None:
+            with self._lock:
+                first = self.built_at is None and not self._refreshing
+                if first:
+                    self._refreshing = True
+            if first:
+                try:
+                    self.build(load())
+                finally:
+                    self._refreshing = False
+                return
+        if not self.is_stale():
+            return
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        thread = threading.Thread(target=self._refresh, args=(load,), name='suggest-refresh', daemon=True)
+        thread.start()
+
+    def _refresh(self, load):
+        try:
+            self.build(load())
+        except Exception:
+            logger.exception('Échec de la reconstruction de l\'index des suggestions')
+            # Nouvel essai au prochain délai plutôt qu'à chaque frappe
+            self.built_at = time.monotonic()
+        finally:
+            self._refreshing = False
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+"""
+Tests du banc d'essai (catalogue synthétique, mesures, comparaison)
+"""
+
+import pytest
+from flask import Flask
+
+import app as nosdonnees
+from app import db, Dataset, Comment, UsageRollup, Blob
+from benchmark import compare_reports, generate_catalogue, percentile, run_scenario
+from blob_store import BlobStore
+
+
+@pytest.fixture
+def test_app():
+    test_app = Flask(__name__)
+    test_app.config.update(SQLALCHEMY_DATABASE_URI='sqlite://', SQLALCHEMY_TRACK_MODIFICATIONS=False)
+    db.init_app(test_app)
+    with test_app.app_context():
+        db.create_all()
+        yield test_app
+
+
+def test_generate_catalogue(test_app, tmp_path):
+    """Catalogue aux tailles demandées, agrégats cohérents, reproductible"""
+    spec = {'users': 6, 'domains': 3, 'datasets': 40, 'comments': 60, 'downloads': 200, 'files': 4, 'file_size': 2048}
+    counts = generate_catalogue(nosdonnees, BlobStore(str(tmp_path / 'blobs')), spec, seed=1)
+    assert counts['datasets'] == 40 and counts['comments'] == 60 and counts['downloads'] == 200
+
+    assert db.session.query(db.func.sum(Dataset.download_count)).scalar() == 200
+    assert db.session.query(db.func.sum(UsageRollup.downloads)).filter_by(scope='dataset', granularity='day').scalar() == 200
+    assert db.session.query(db.func.sum(UsageRollup.downloads)).filter_by(scope='domain', granularity='hour').scalar() == 200
+    assert db.session.query(db.func.sum(Dataset.rating_count)).scalar() == Comment.query.count()
+    assert Blob.query.count() == counts['files'] == db.session.query(db.func.count(db.distinct(Dataset.file_hash))).scalar()
+    dataset = Dataset.query.first()
+    with open(dataset.file_path, 'rb') as f:
+        assert len(f.read()) == dataset.file_size
+    assert 1024 <= dataset.file_size <= 3200
+
+    first = [(d.title, d.status, d.download_count) for d in Dataset.query.order_by(Dataset.id)]
+    db.drop_all()
+    db.create_all()
+    generate_catalogue(nosdonnees, BlobStore(str(tmp_path / 'blobs')), spec, seed=1)
+    assert [(d.title, d.status, d.download_count) for d in Dataset.query.order_by(Dataset.id)] == first
+
+
+def test_run_scenario_counts_errors():
+    """Percentiles, débit et réponses inattendues"""
+    app = Flask(__name__)
+
+    @app.route('/<int:i>')
+    def page(i):
+        return 'ok', 200 if i % 5 else 500
+
+    result = run_scenario(app.test_client(), lambda client, i: client.get(f'/{i}'), iterations=20, warmup=2)
+    assert result['requests'] == 20 and result['errors'] == 4
+    assert result['p50_ms'] <= result['p95_ms'] <= result['max_ms']
+    assert result['throughput_rps'] > 0
+
+
+def test_percentile_and_compare():
+    assert percentile([1, 2, 3, 4], 0.5) == 2.5
+    assert percentile([], 0.5) is None
+    before = {'scenarios': {'home': {'p50_ms': 2.0}, 'listing': {'p50_ms': 10.0}}}
+    after = {'scenarios': {'home': {'p50_ms': 1.0}, 'upload': {'p50_ms': 5.0}}}
+    assert compare_reports(before, after) == {'home': -50.0}
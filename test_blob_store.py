@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+"""
+Tests du stockage des fichiers par contenu
+"""
+
+import hashlib
+import io
+import os
+
+import pytest
+from flask import Flask, Request, jsonify, request
+
+from blob_store import BlobStore, HashingTempFile
+
+
+@pytest.fixture
+def store(tmp_path):
+    return BlobStore(str(tmp_path / 'blobs'))
+
+
+def test_store_and_deduplicate(store):
+    """Deux contenus identiques partagent le même fichier"""
+    content = b'a,b\n1,2\n'
+    first = store.store(io.BytesIO(content))
+    second = store.store(io.BytesIO(content))
+
+    assert first.digest == hashlib.sha256(content).hexdigest()
+    assert first.path == store.path_for(first.digest)
+    assert first.path.endswith(os.path.join(first.digest[:2], first.digest[2:4], first.digest))
+    assert not first.duplicate and second.duplicate
+    assert second.path == first.path
+    assert os.listdir(store.tmp_dir) == []
+    assert store.verify(first.digest)
+
+
+def test_import_file_links(store, tmp_path):
+    """Un fichier existant est importé par lien physique"""
+    source = tmp_path / 'ancien.csv'
+    source.write_bytes(b'x,y\n')
+    stored = store.import_file(str(source))
+    assert os.path.samefile(stored.path, source)
+
+
+def test_hash_computed_during_upload(store):
+    """Le fichier reçu est haché pendant la réception puis renommé sans copie"""
+    test_app = Flask(__name__)
+
+    class UploadRequest(Request):
+        def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+            return store.open_temp()
+
+    test_app.request_class = UploadRequest
+
+    @test_app.route('/upload', methods=['POST'])
+    def upload():
+        stream = request.files['file'].stream
+        assert isinstance(stream, HashingTempFile)
+        stored = store.store(stream)
+        return jsonify(digest=stored.digest, size=stored.size)
+
+    content = os.urandom(300 * 1024)
+    response = test_app.test_client().post(
+        '/upload', data={'file': (io.BytesIO(content), 'data.csv')},
+        content_type='multipart/form-data'
+    )
+    assert response.json == {'digest': hashlib.sha256(content).hexdigest(), 'size': len(content)}
+    assert store.verify(response.json['digest'])
+    assert os.listdir(store.tmp_dir) == []
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+"""
+Tests du cache applicatif
+"""
+
+from flask import Flask
+
+import caching
+from caching import MemoryCache, SQLiteCache
+
+
+def test_memory_cache_ttl_and_lru(monkeypatch):
+    """Les entrées expirent et la moins récemment lue est évincée"""
+    now = [100.0]
+    monkeypatch.setattr(caching.time, 'monotonic', lambda: now[0])
+    cache = MemoryCache(max_entries=2, default_ttl=10)
+
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+
+    now[0] += 11
+    assert cache.get('a') is None
+    assert cache.get('c', 'absent') == 'absent'
+
+
+def test_get_or_set_computes_once():
+    """La valeur n'est calculée qu'une fois, puis recalculée après suppression"""
+    cache = MemoryCache()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {'total': len(calls)}
+
+    assert cache.get_or_set('stats', compute) == {'total': 1}
+    assert cache.get_or_set('stats', compute) == {'total': 1}
+    cache.delete('stats', 'autre')
+    assert cache.get_or_set('stats', compute) == {'total': 2}
+
+
+def test_sqlite_cache_is_shared(tmp_path):
+    """Deux instances (deux workers) voient les mêmes entrées et invalidations"""
+    path = str(tmp_path / 'cache.db')
+    first, second = SQLiteCache(path), SQLiteCache(path)
+
+    first.set('home:data', {'total': 3}, ttl=60)
+    assert second.get('home:data') == {'total': 3}
+    second.delete('home:data')
+    assert first.get('home:data') is None
+
+    first.set('expired', 1, ttl=-1)
+    assert second.get('expired') is None
+
+
+def test_create_cache_from_config(tmp_path):
+    """Le stockage est choisi par CACHE_BACKEND"""
+    app = Flask(__name__)
+    app.config['CACHE_BACKEND'] = 'sqlite'
+    app.config['CACHE_PATH'] = str(tmp_path / 'shared.db')
+    assert isinstance(caching.create_cache(app), SQLiteCache)
+    assert app.extensions['cache'] is not None
+
+    app.config['CACHE_BACKEND'] = 'null'
+    cache = caching.create_cache(app)
+    cache.set('key', 'value')
+    assert cache.get('key') is None
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+"""
+Tests de l'upload par morceaux
+"""
+
+import hashlib
+import io
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import app as nosdonnees
+import chunked_upload
+from app import db, UploadSession
+from chunked_upload import ChunkError
+
+CONTENT = bytes(range(256)) * 400
+
+
+def _sha(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def test_chunks_appended_in_order(tmp_path):
+    """Les morceaux sont ajoutés et l'empreinte complète est tenue à jour"""
+    tmp_dir = str(tmp_path)
+    chunked_upload.create_part(tmp_dir, 'u1')
+    offset = 0
+    for start in range(0, len(CONTENT), 30000):
+        chunk = CONTENT[start:start + 30000]
+        offset = chunked_upload.append_chunk(tmp_dir, 'u1', offset, io.BytesIO(chunk), _sha(chunk), len(CONTENT))
+    assert offset == len(CONTENT)
+    assert chunked_upload.file_digest(tmp_dir, 'u1') == _sha(CONTENT)
+
+
+def test_bad_checksum_is_rolled_back(tmp_path):
+    """Un morceau à l'empreinte incorrecte est retiré du fichier partiel"""
+    tmp_dir = str(tmp_path)
+    chunked_upload.create_part(tmp_dir, 'u2')
+    chunked_upload.append_chunk(tmp_dir, 'u2', 0, io.BytesIO(CONTENT[:1000]), None, len(CONTENT))
+
+    with pytest.raises(ChunkError):
+        chunked_upload.append_chunk(tmp_dir, 'u2', 1000, io.BytesIO(CONTENT[1000:2000]), _sha(b'autre'), len(CONTENT))
+    assert chunked_upload.received_size(tmp_dir, 'u2') == 1000
+
+    with pytest.raises(ChunkError):
+        chunked_upload.append_chunk(tmp_dir, 'u2', 500, io.BytesIO(CONTENT[500:600]), None, len(CONTENT))
+
+
+def test_resume_after_restart_recomputes_digest(tmp_path):
+    """Sans empreinte en mémoire (autre worker), elle est recalculée à la fin"""
+    tmp_dir = str(tmp_path)
+    chunked_upload.create_part(tmp_dir, 'u3')
+    chunked_upload.append_chunk(tmp_dir, 'u3', 0, io.BytesIO(CONTENT[:5000]), None, len(CONTENT))
+    chunked_upload._running_hashes.clear()
+
+    offset = chunked_upload.received_size(tmp_dir, 'u3')
+    chunked_upload.append_chunk(tmp_dir, 'u3', offset, io.BytesIO(CONTENT[offset:]), None, len(CONTENT))
+    assert chunked_upload.file_digest(tmp_dir, 'u3') == _sha(CONTENT)
+
+
+def test_chunk_larger_than_file_refused(tmp_path):
+    """Un morceau ne peut pas dépasser la taille annoncée"""
+    tmp_dir = str(tmp_path)
+    chunked_upload.create_part(tmp_dir, 'u4')
+    with pytest.raises(ChunkError):
+        chunked_upload.append_chunk(tmp_dir, 'u4', 0, io.BytesIO(CONTENT), None, 100)
+    assert chunked_upload.received_size(tmp_dir, 'u4') == 0
+
+
+@pytest.mark.skipif(chunked_upload.fcntl is None, reason='verrou flock indisponible')
+def test_part_locked_across_workers(tmp_path):
+    """Un autre worker qui tient le verrou du fichier partiel fait attendre l'ajout"""
+    tmp_dir = str(tmp_path)
+    chunked_upload.create_part(tmp_dir, 'u5')
+    with open(chunked_upload.part_path(tmp_dir, 'u5'), 'r+b') as other:
+        chunked_upload.fcntl.flock(other.fileno(), chunked_upload.fcntl.LOCK_EX)
+        writer = threading.Thread(target=chunked_upload.append_chunk,
+                                  args=(tmp_dir, 'u5', 0, io.BytesIO(CONTENT[:1000]), None, len(CONTENT)))
+        writer.start()
+        time.sleep(0.2)
+        assert chunked_upload.received_size(tmp_dir, 'u5') == 0
+    writer.join(5)
+    assert chunked_upload.received_size(tmp_dir, 'u5') == 1000
+
+
+def test_completed_session_is_forgotten(tmp_path, monkeypatch):
+    """Finalisée ou abandonnée, une session ne laisse ni verrou ni empreinte en mémoire"""
+    monkeypatch.setattr(chunked_upload, 'fcntl', None)
+    tmp_dir = str(tmp_path)
+    for upload_id in ('u6', 'u7'):
+        chunked_upload.create_part(tmp_dir, upload_id)
+        chunked_upload.append_chunk(tmp_dir, upload_id, 0, io.BytesIO(CONTENT[:1000]), None, len(CONTENT))
+    assert {'u6', 'u7'} <= set(chunked_upload._locks)
+
+    chunked_upload.file_digest(tmp_dir, 'u6')
+    chunked_upload.forget('u6')
+    chunked_upload.discard(tmp_dir, 'u7')
+    assert not {'u6', 'u7'} & set(chunked_upload._locks)
+    assert not {'u6', 'u7'} & set(chunked_upload._running_hashes)
+
+
+def _session(author, upload_id, age):
+    upload = UploadSession(id=upload_id, user_id=author.id, filename='x.csv', total_size=len(CONTENT),
+                           created_at=datetime.utcnow() - age)
+    db.session.add(upload)
+    db.session.commit()
+    chunked_upload.create_part(nosdonnees.blob_store.tmp_dir, upload_id)
+    return upload
+
+
+def test_expired_session_is_purged(app, author):
+    """Une session sans morceau depuis UPLOAD_SESSION_TTL est abandonnée et son fichier supprimé"""
+    tmp_dir = nosdonnees.blob_store.tmp_dir
+    ttl = app.config['UPLOAD_SESSION_TTL']
+    stale = _session(author, 'stale', timedelta(seconds=ttl + 60))
+    old = time.time() - ttl - 60
+    os.utime(chunked_upload.part_path(tmp_dir, 'stale'), (old, old))
+    active = _session(author, 'active', timedelta(seconds=ttl + 60))  # morceau reçu à l'instant
+    recent = _session(author, 'recent', timedelta(seconds=60))
+
+    assert nosdonnees.purge_expired_uploads() == 1
+    assert (stale.status, active.status, recent.status) == ('failed', 'open', 'open')
+    assert not os.path.exists(chunked_upload.part_path(tmp_dir, 'stale'))
+    assert os.path.exists(chunked_upload.part_path(tmp_dir, 'active'))
+
+
+def test_open_sessions_limited_per_user(app, author):
+    """Au-delà d'UPLOAD_MAX_OPEN_SESSIONS, une nouvelle session est refusée"""
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(author.id)
+    statuses = [
+        client.post('/api/uploads', json={'filename': 'x.csv', 'size': 100}).status_code
+        for _ in range(app.config['UPLOAD_MAX_OPEN_SESSIONS'] + 1)
+    ]
+    assert statuses[:-1] == [201] * app.config['UPLOAD_MAX_OPEN_SESSIONS']
+    assert statuses[-1] == 429
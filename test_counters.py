@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+"""
+Tests des compteurs de vues/téléchargements bufferisés
+"""
+
+import pytest
+
+import counters
+from app import db, Dataset, counter_buffer
+from caching import MemoryCache
+from counters import CounterBuffer
+
+
+@pytest.fixture
+def counter_app(app, make_dataset):
+    """Application de test avec un dataset déjà vu 5 fois"""
+    make_dataset(view_count=5, download_count=0)
+    db.session.commit()
+    return app
+
+
+def _counts(test_app):
+    with test_app.app_context():
+        dataset = db.session.get(Dataset, 1)
+        return dataset.view_count, dataset.download_count
+
+
+@pytest.mark.parametrize('backend', ['memory', 'spool'])
+def test_increments_are_coalesced(counter_app, backend):
+    """Les incréments restent en attente puis sont appliqués en un seul lot"""
+    counter_app.config['COUNTER_BACKEND'] = backend
+    counter_app.config['COUNTER_FLUSH_THRESHOLD'] = 1000
+    buffer = CounterBuffer()
+    buffer.init_app(counter_app, db)
+
+    for _ in range(3):
+        buffer.increment(1, 'view_count')
+    buffer.increment(1, 'download_count')
+
+    assert _counts(counter_app) == (5, 0)
+    with counter_app.app_context():
+        assert buffer.live_count(db.session.get(Dataset, 1), 'view_count') == 8
+
+    assert buffer.flush() == 1
+    assert _counts(counter_app) == (8, 1)
+    assert buffer.pending(1, 'view_count') == 0
+
+
+def test_threshold_triggers_flush(counter_app):
+    """Le seuil d'événements déclenche le vidage automatique"""
+    counter_app.config['COUNTER_FLUSH_THRESHOLD'] = 2
+    buffer = CounterBuffer()
+    buffer.init_app(counter_app, db)
+
+    buffer.increment(1, 'view_count')
+    assert _counts(counter_app) == (5, 0)
+    buffer.increment(1, 'view_count')
+    assert _counts(counter_app) == (7, 0)
+
+
+def test_unknown_field_rejected(counter_app):
+    """Seuls les compteurs connus peuvent être incrémentés"""
+    buffer = CounterBuffer()
+    buffer.init_app(counter_app, db)
+    with pytest.raises(ValueError):
+        buffer.increment(1, 'rating')
+
+
+def test_catalogue_cache_follows_downloads(counter_app):
+    """Un vidage de vues seules garde l'accueil en cache ; des téléchargements l'invalident"""
+    cache = counter_app.extensions['cache'] = MemoryCache()
+    cache.set('home:data', 'accueil')
+
+    counter_buffer.increment(1, 'view_count')
+    counter_buffer.flush()
+    assert cache.get('home:data') == 'accueil'
+
+    counter_buffer.increment(1, 'download_count')
+    counter_buffer.flush()
+    assert cache.get('home:data') is None
+
+
+def test_pending_read_once_per_request(counter_app, monkeypatch):
+    """Avec le spool, une page qui affiche plusieurs compteurs n'ouvre qu'une connexion"""
+    counter_app.config['COUNTER_BACKEND'] = 'spool'
+    buffer = CounterBuffer()
+    buffer.init_app(counter_app, db)
+    buffer.increment(1, 'view_count')
+    connections = []
+    connect = buffer.store._connect
+
+    def counted_connect():
+        connections.append(1)
+        return connect()
+
+    monkeypatch.setattr(buffer.store, '_connect', counted_connect)
+
+    with counter_app.test_request_context('/datasets'):
+        dataset = db.session.get(Dataset, 1)
+        assert buffer.live_count(dataset, 'view_count') == 6
+        assert buffer.live_count(dataset, 'download_count') == 0
+        assert len(connections) == 1
+
+        buffer.increment(1, 'download_count')
+        assert buffer.live_count(dataset, 'download_count') == 1
+        assert len(connections) == 3
+
+
+def test_shutdown_registered_once(counter_app, monkeypatch):
+    """Créer plusieurs applications n'empile pas les arrêts à la sortie"""
+    registered = []
+
+    def unregister(func):
+        registered[:] = [other for other in registered if other != func]
+
+    monkeypatch.setattr(counters.atexit, 'register', registered.append)
+    monkeypatch.setattr(counters.atexit, 'unregister', unregister)
+    buffer = CounterBuffer()
+    buffer.init_app(counter_app, db)
+    buffer.init_app(counter_app, db)
+    assert registered == [buffer.shutdown]
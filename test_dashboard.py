@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+"""
+Tests des statistiques du tableau de bord
+"""
+
+import pickle
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event
+
+from app import db, User, UsageRollup, dashboard_user_stats, dashboard_data
+
+
+@pytest.fixture
+def dashboard_app(app, author, make_dataset):
+    """Application de test avec un contributeur et des bases de chaque statut"""
+    other = User(username='autre', email='autre@example.org', password_hash='x')
+    db.session.add(other)
+    db.session.flush()
+    datasets = [
+        make_dataset(title=f'Base {status}', author=owner.username, user_id=owner.id, status=status,
+                     rating_sum=rating_sum, rating_count=rating_count)
+        for owner, status, rating_sum, rating_count in [
+            (author, 'validated', 9, 2), (author, 'validated', 0, 0), (author, 'pending', 0, 0),
+            (author, 'rejected', 3, 1), (other, 'validated', 5, 1),
+        ]
+    ]
+    # Téléchargements agrégés par jour (et par dataset, non comptés ici)
+    db.session.add_all([
+        UsageRollup(scope='user', scope_id=author.id, granularity='day', period=datetime(2024, 1, 1), downloads=1),
+        UsageRollup(scope='user', scope_id=author.id, granularity='day', period=datetime(2024, 1, 2), downloads=1),
+        UsageRollup(scope='dataset', scope_id=datasets[0].id, granularity='day', period=datetime(2024, 1, 1), downloads=2),
+        UsageRollup(scope='user', scope_id=other.id, granularity='day', period=datetime(2024, 1, 1), downloads=1),
+    ])
+    db.session.commit()
+    return app, author.id
+
+
+def test_user_stats_in_one_query(dashboard_app):
+    """Compteurs par statut, téléchargements et note moyenne en une requête"""
+    test_app, user_id = dashboard_app
+    with test_app.app_context():
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            stats = dashboard_user_stats(user_id)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+
+    assert len(statements) == 1
+    assert stats == {
+        'total_datasets': 4,
+        'validated_datasets': 2,
+        'pending_datasets': 1,
+        'rejected_datasets': 1,
+        'total_downloads': 2,
+        'average_rating': 4.0
+    }
+
+
+def test_dashboard_data_is_cacheable(dashboard_app):
+    """Le contenu mis en cache ne dépend pas de la session (sérialisable)"""
+    test_app, user_id = dashboard_app
+    with test_app.app_context():
+        data = dashboard_data(user_id, is_admin=False)
+    data = pickle.loads(pickle.dumps(data))
+    assert [row.status for row in data['user_datasets']].count('validated') == 2
+    assert data['user_datasets'][0].domain_name == 'Santé'
+    assert data['user_stats']['total_datasets'] == 4
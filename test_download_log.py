@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+"""
+Tests du journal des téléchargements (tampon, partitions, agrégats)
+"""
+
+import os
+from datetime import date, datetime
+
+import pytest
+from flask import Flask
+
+from app import db, User, Domain, Dataset, UserAgent, UsageRollup
+from download_log import DownloadLogWriter, PartitionStore
+from rollups import RollupBuffer
+
+
+@pytest.fixture
+def log_app(tmp_path):
+    """Application isolée avec deux datasets de contributeurs différents"""
+    test_app = Flask(__name__)
+    test_app.config.update(
+        SQLALCHEMY_DATABASE_URI='sqlite://', SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        DOWNLOAD_LOG_FOLDER=str(tmp_path / 'download_log'), DOWNLOAD_LOG_FLUSH_INTERVAL=0,
+        DOWNLOAD_LOG_FLUSH_THRESHOLD=100
+    )
+    db.init_app(test_app)
+    with test_app.app_context():
+        db.create_all()
+        users = [User(username=f'user{i}', email=f'user{i}@example.org', password_hash='x') for i in range(2)]
+        domain = Domain(name='Santé')
+        db.session.add_all(users + [domain])
+        db.session.flush()
+        datasets = [
+            Dataset(title=f'Base {i}', description='D', source='S', author='a', file_path='x.csv',
+                    file_format='csv', domain_id=domain.id, user_id=users[i].id, status='validated')
+            for i in range(2)
+        ]
+        db.session.add_all(datasets)
+        db.session.commit()
+        writer = DownloadLogWriter()
+        writer.init_app(test_app, db)
+        buffer = RollupBuffer()
+        buffer.init_app(test_app, db)
+
+        @writer.on_write
+        def rollup_downloads(events):
+            for event in events:
+                buffer.add(event.dataset_id, 'downloads', event.downloaded_at)
+            buffer.flush()
+        yield test_app, writer, [d.id for d in datasets], [u.id for u in users]
+
+
+def test_flush_writes_partitions_user_agents_and_rollups(log_app):
+    """Rien n'est écrit avant le vidage ; ensuite un seul User-Agent par texte"""
+    test_app, writer, (first, second), (owner, other) = log_app
+    firefox = 'Mozilla/5.0 Firefox/118.0'
+    writer.record(first, user_agent=firefox, downloaded_at=datetime(2024, 3, 1, 10))
+    writer.record(first, user_agent=firefox, downloaded_at=datetime(2024, 3, 2, 9))
+    writer.record(second, user_agent='curl/8.1.2', downloaded_at=datetime(2024, 3, 2, 11))
+    assert writer.pending() == 3
+    with test_app.app_context():
+        assert UsageRollup.query.count() == 0
+
+    assert writer.flush() == 3
+    assert writer.pending() == 0
+    with test_app.app_context():
+        assert UserAgent.query.count() == 2
+        ids = {agent.value: agent.id for agent in UserAgent.query}
+        totals = {(r.scope, r.scope_id, r.period.day): r.downloads
+                  for r in UsageRollup.query.filter(UsageRollup.scope != 'domain', UsageRollup.granularity == 'day')}
+    assert totals == {
+        ('dataset', first, 1): 1, ('dataset', first, 2): 1, ('user', owner, 1): 1, ('user', owner, 2): 1,
+        ('dataset', second, 2): 1, ('user', other, 2): 1,
+    }
+    assert sorted(os.listdir(writer.partitions.folder)) == ['2024-03-01.db', '2024-03-02.db']
+    events = list(writer.partitions.read(start=datetime(2024, 3, 2)))
+    assert [(e[1], e[4]) for e in events] == [(first, ids[firefox]), (second, ids['curl/8.1.2'])]
+
+    # Les vidages suivants incrémentent les agrégats existants
+    writer.record(first, user_agent=firefox, downloaded_at=datetime(2024, 3, 1, 12))
+    writer.flush()
+    with test_app.app_context():
+        assert db.session.get(UsageRollup, ('user', owner, 'day', datetime(2024, 3, 1))).downloads == 2
+        assert UserAgent.query.count() == 2
+
+
+def test_full_buffer_drops_oldest(log_app):
+    """Tampon plein (base indisponible) : les plus anciens événements sont abandonnés"""
+    test_app, _, (first, _), _ = log_app
+    writer = DownloadLogWriter(capacity=3, flush_interval=0, flush_threshold=10)
+    for i in range(5):
+        writer.record(first, downloaded_at=datetime(2024, 3, 1, i))
+    assert writer.pending() == 3
+    assert writer.dropped == 2
+
+
+def test_failed_flush_keeps_newest_events(log_app):
+    """Échec d'écriture pendant que d'autres téléchargements arrivent : seuls les plus anciens sont abandonnés"""
+    test_app, _, (first, _), _ = log_app
+    writer = DownloadLogWriter(capacity=3, flush_interval=0, flush_threshold=10)
+    for hour in range(2):
+        writer.record(first, downloaded_at=datetime(2024, 3, 1, hour))
+
+    def unavailable(events):
+        for hour in range(2, 4):
+            writer.record(first, downloaded_at=datetime(2024, 3, 1, hour))
+        raise OSError('base indisponible')
+
+    writer.write = unavailable
+    assert writer.flush() == 0
+    assert [event.downloaded_at.hour for event in writer._events] == [1, 2, 3]
+    assert writer.dropped == 1
+
+
+def test_compaction_by_month(tmp_path):
+    """Les jours anciens sont regroupés par mois, les mois trop anciens supprimés"""
+    store = PartitionStore(str(tmp_path))
+    for day in (date(2024, 1, 5), date(2024, 1, 20), date(2024, 2, 3), date(2024, 3, 1)):
+        store.append(day, [(datetime(day.year, day.month, day.day, 8), 1, None, '10.0.0.1', None)])
+
+    assert store.compact(before=date(2024, 3, 1)) == (3, 0)
+    assert sorted(os.listdir(tmp_path)) == ['2024-01.db', '2024-02.db', '2024-03-01.db']
+    assert len(list(store.read())) == 4
+
+    assert store.compact(before=date(2024, 3, 1), drop_before=date(2024, 2, 15)) == (0, 1)
+    assert [row[0] for row in store.read()] == ['2024-02-03 08:00:00', '2024-03-01 08:00:00']
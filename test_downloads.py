@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""
+Tests de l'envoi des fichiers (ETag, 304, Range/If-Range)
+"""
+
+import pytest
+from flask import Flask
+
+from downloads import file_sha256, send_dataset_file, is_new_download
+
+CONTENT = b'id,valeur\n' + b''.join(f'{i},{i * 2}\n'.encode() for i in range(1000))
+
+
+@pytest.fixture
+def client(tmp_path):
+    """Application minimale servant un fichier CSV"""
+    path = tmp_path / 'data.csv'
+    path.write_bytes(CONTENT)
+    content_hash = file_sha256(str(path))
+
+    test_app = Flask(__name__)
+    test_app.config['UPLOAD_FOLDER'] = str(tmp_path)
+    counted = []
+
+    @test_app.route('/download')
+    def download():
+        response = send_dataset_file(str(path), 'data.csv', content_hash)
+        if is_new_download(response):
+            counted.append(response.status_code)
+        return response
+
+    test_client = test_app.test_client()
+    test_client.counted = counted
+    test_client.etag = content_hash
+    return test_client
+
+
+def test_strong_etag_and_not_modified(client):
+    """Le contenu est envoyé avec un ETag fort, puis 304 si inchangé"""
+    response = client.get('/download')
+    assert response.status_code == 200
+    assert response.data == CONTENT
+    assert response.headers['ETag'] == f'"{client.etag}"'
+
+    response = client.get('/download', headers={'If-None-Match': f'"{client.etag}"'})
+    assert response.status_code == 304
+    assert client.counted == [200]
+
+
+def test_range_resume(client):
+    """Une reprise renvoie 206 et n'est pas comptée comme téléchargement"""
+    response = client.get('/download', headers={'Range': 'bytes=100-199'})
+    assert response.status_code == 206
+    assert response.data == CONTENT[100:200]
+    assert response.headers['Content-Range'] == f'bytes 100-199/{len(CONTENT)}'
+
+    response = client.get('/download', headers={'Range': 'bytes=0-9'})
+    assert response.status_code == 206
+    assert client.counted == [206]
+
+
+def test_if_range_mismatch_sends_full_file(client):
+    """Si l'ETag a changé, If-Range renvoie le fichier complet"""
+    response = client.get('/download', headers={'Range': 'bytes=100-', 'If-Range': '"autre"'})
+    assert response.status_code == 200
+    assert response.data == CONTENT
+    assert client.counted == [200]
+
+
+def test_accel_redirect(client):
+    """Avec DOWNLOAD_ACCEL_PREFIX, l'envoi est délégué à nginx"""
+    client.application.config['DOWNLOAD_ACCEL_PREFIX'] = '/protected-uploads/'
+    response = client.get('/download')
+    assert response.headers['X-Accel-Redirect'] == '/protected-uploads/data.csv'
+    assert response.data == b''
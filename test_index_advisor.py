@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""
+Tests des index composites et du conseiller d'index
+"""
+
+import pytest
+from flask import Flask, jsonify
+
+import index_advisor
+from app import db, Dataset, DownloadLog, Comment
+
+
+@pytest.fixture
+def advisor_app():
+    """Application isolée dont les routes reprennent les requêtes du catalogue"""
+    test_app = Flask(__name__)
+    test_app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    test_app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(test_app)
+
+    @test_app.route('/datasets')
+    def listing():
+        datasets = Dataset.query.filter_by(status='validated', domain_id=1).order_by(
+            Dataset.creation_date.desc()).limit(12).all()
+        return jsonify([dataset.id for dataset in datasets])
+
+    @test_app.route('/activity')
+    def activity():
+        DownloadLog.query.filter_by(dataset_id=1).order_by(DownloadLog.downloaded_at.desc()).limit(10).all()
+        Comment.query.filter_by(dataset_id=1).order_by(Comment.created_at.desc()).all()
+        Dataset.query.filter_by(user_id=1, status='pending').count()
+        return ''
+
+    @test_app.route('/by-title')
+    def by_title():
+        return jsonify(Dataset.query.filter_by(title='Vaccination').count())
+
+    with test_app.app_context():
+        db.create_all()
+        yield test_app
+
+
+def test_plan_issues():
+    """Parcours complets et tris temporaires sont relevés, pas les recherches par index"""
+    plan = ['SCAN dataset', 'SEARCH domain USING INTEGER PRIMARY KEY (rowid=?)', 'USE TEMP B-TREE FOR ORDER BY']
+    assert index_advisor.plan_issues(plan) == ['parcours complet de dataset', 'tri sans index (B-tree temporaire)']
+    assert index_advisor.plan_issues(['SCAN dataset USING INDEX ix_dataset_status_creation_date']) == []
+    assert index_advisor.plan_issues(['SCAN domain'], ignore_tables=('domain',)) == []
+
+
+def test_catalogue_queries_use_indexes(advisor_app):
+    """Les accès du catalogue passent par les index composites"""
+    reports = index_advisor.advise(advisor_app, db.engine, ['/datasets', '/activity'])
+    assert len(reports) == 4
+    assert all(report['issues'] == [] for report in reports)
+    plans = ' '.join(detail for report in reports for detail in report['plan'])
+    for name in ('ix_dataset_status_domain', 'ix_download_log_dataset_downloaded_at',
+                 'ix_comment_dataset_created_at', 'ix_dataset_user_status'):
+        assert name in plans
+
+
+def test_unindexed_query_is_flagged(advisor_app):
+    """Un filtre sans index est signalé comme parcours complet"""
+    [report] = index_advisor.advise(advisor_app, db.engine, ['/by-title'])
+    assert report['issues'] == ['parcours complet de dataset']
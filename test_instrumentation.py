@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+"""
+Tests de l'instrumentation des requêtes (métriques Prometheus, profils)
+"""
+
+import io
+import re
+
+import pytest
+from flask import Flask, render_template_string, send_file
+from flask_sqlalchemy import SQLAlchemy
+
+from instrumentation import Instrumentation, Metrics, io_timer
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    def make(**config):
+        test_app = Flask(__name__)
+        test_app.config.update(
+            SQLALCHEMY_DATABASE_URI='sqlite://', INSTRUMENTATION_ENABLED=True,
+            PROFILE_DIR=str(tmp_path / 'profiles')
+        )
+        test_app.config.update(config)
+        db = SQLAlchemy(test_app)
+
+        @test_app.route('/liste')
+        def liste():
+            db.session.execute(db.text('SELECT 1'))
+            db.session.execute(db.text('SELECT 2'))
+            return render_template_string('{% for i in range(3) %}{{ i }}{% endfor %}')
+
+        @test_app.route('/fichier')
+        def fichier():
+            with io_timer():
+                data = b'x' * 4096
+            return send_file(io.BytesIO(data), download_name='x.csv')
+
+        instrumentation = Instrumentation(test_app, db, metrics=Metrics())
+        return test_app, instrumentation.metrics
+    return make
+
+
+def test_metrics_per_endpoint(make_app):
+    """Durée, requêtes SQL, gabarits et octets cumulés par vue"""
+    test_app, metrics = make_app()
+    client = test_app.test_client()
+    client.get('/liste')
+    client.get('/liste')
+    response = client.get('/fichier')
+    assert response.data == b'x' * 4096
+    response.close()
+
+    liste = metrics._endpoints['liste']
+    assert liste.requests == {('GET', 200): 2}
+    assert liste.db_queries == 4
+    assert liste.template_seconds > 0
+    fichier = metrics._endpoints['fichier']
+    assert fichier.bytes_sent == 4096
+    assert fichier.io_seconds > 0
+    assert fichier.transfer_seconds > 0
+
+    text = metrics.render()
+    assert '# TYPE nosdonnees_request_duration_seconds histogram' in text
+    assert 'nosdonnees_requests_total{endpoint="liste",method="GET",status="200"' in text
+    assert 'nosdonnees_request_duration_seconds_bucket{endpoint="liste"' in text
+    assert 'le="+Inf"} 2' in text
+    assert 'nosdonnees_response_bytes_total{endpoint="fichier"' in text
+
+
+def test_slow_request_profile(make_app, tmp_path):
+    """Les requêtes échantillonnées plus lentes que le seuil laissent un profil"""
+    test_app, metrics = make_app(PROFILE_SAMPLE_RATE=1.0, PROFILE_SLOW_SECONDS=0)
+    test_app.test_client().get('/liste')
+    assert [path.name.startswith('liste-') for path in (tmp_path / 'profiles').iterdir()] == [True]
+    assert metrics.slow_profiles == 1
+
+
+def test_disabled_by_default(make_app):
+    """Sans INSTRUMENTATION_ENABLED, rien n'est mesuré"""
+    test_app, metrics = make_app(INSTRUMENTATION_ENABLED=False)
+    test_app.test_client().get('/liste')
+    assert metrics._endpoints == {}
+
+
+def test_connection_checkouts(make_app, tmp_path):
+    """Connexions prises au pool par vue, durée de garde et occupation du pool"""
+    from config import engine_options
+
+    uri = f'sqlite:///{tmp_path / "pool.db"}'
+    test_app, metrics = make_app(SQLALCHEMY_DATABASE_URI=uri, SQLALCHEMY_ENGINE_OPTIONS=engine_options(uri))
+    client = test_app.test_client()
+    client.get('/liste')
+    client.get('/liste')
+
+    liste = metrics._endpoints['liste']
+    assert liste.db_checkouts == 2
+    assert liste.db_hold_seconds > 0
+
+    text = metrics.render()
+    assert 'nosdonnees_db_checkouts_total{endpoint="liste"' in text
+    assert 'nosdonnees_db_pool_size{engine="main"' in text
+    # Connexions rendues à la fin de chaque requête
+    assert re.search(r'nosdonnees_db_pool_checked_out\{engine="main",pid="\d+"\} 0\n', text)
+    assert 'nosdonnees_db_connections_opened_total{engine="main"' in text
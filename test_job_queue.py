@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+"""
+Tests de la file des tâches de fond
+"""
+
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+
+from job_queue import JobMixin, JobQueue
+
+
+@pytest.fixture
+def setup(tmp_path):
+    """Application minimale avec sa propre table de tâches"""
+    test_app = Flask(__name__)
+    test_app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{tmp_path / "jobs.db"}'
+    test_app.config['JOB_RETRY_DELAY'] = 10
+    test_db = SQLAlchemy(test_app)
+
+    class Job(JobMixin, test_db.Model):
+        pass
+
+    with test_app.app_context():
+        test_db.create_all()
+
+    queue = JobQueue()
+    queue.init_app(test_app, test_db, Job)
+    return test_app, test_db, Job, queue
+
+
+def test_job_runs_once(setup):
+    """Une tâche est exécutée une fois avec ses paramètres"""
+    test_app, test_db, Job, queue = setup
+    calls = []
+
+    @queue.task()
+    def record(value):
+        calls.append(value)
+
+    job_id = queue.enqueue('record', value=42)
+    assert queue.run_pending() == 1
+    assert queue.run_pending() == 0
+    assert calls == [42]
+    with test_app.app_context():
+        job = test_db.session.get(Job, job_id)
+        assert (job.status, job.attempts) == ('done', 1)
+
+
+def test_retry_with_backoff_then_fail(setup):
+    """Une tâche en erreur est reprogrammée avec un délai croissant puis abandonnée"""
+    test_app, test_db, Job, queue = setup
+
+    @queue.task()
+    def broken():
+        raise RuntimeError('boom')
+
+    job_id = queue.enqueue('broken', max_attempts=2)
+    assert queue.run_pending() == 1
+    with test_app.app_context():
+        job = test_db.session.get(Job, job_id)
+        assert job.status == 'queued'
+        assert 'boom' in job.last_error
+        assert job.run_at > datetime.utcnow() + timedelta(seconds=5)
+        job.run_at = datetime.utcnow()
+        test_db.session.commit()
+
+    assert queue.run_pending() == 1
+    with test_app.app_context():
+        assert test_db.session.get(Job, job_id).status == 'failed'
+
+
+def test_stale_job_is_requeued(setup):
+    """La tâche d'un worker arrêté pendant l'exécution est reprise"""
+    test_app, test_db, Job, queue = setup
+    calls = []
+    queue.task('noop')(lambda: calls.append(1))
+
+    job_id = queue.enqueue('noop')
+    with test_app.app_context():
+        assert queue.claim('disparu').id == job_id
+        job = test_db.session.get(Job, job_id)
+        job.started_at = datetime.utcnow() - timedelta(hours=1)
+        test_db.session.commit()
+
+    assert queue.run_pending() == 1
+    assert calls == [1]
+
+
+def test_concurrent_workers_claim_each_job_once(setup):
+    """Plusieurs workers ne réservent jamais la même tâche"""
+    test_app, test_db, Job, queue = setup
+    seen = []
+    lock = threading.Lock()
+
+    @queue.task()
+    def record(value):
+        with lock:
+            seen.append(value)
+
+    for value in range(30):
+        queue.enqueue('record', value=value)
+
+    threads = [threading.Thread(target=queue.run_pending, args=(f'w{i}',)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(seen) == list(range(30))
+
+
+def test_eager_mode(setup):
+    """En mode JOB_EAGER la tâche est exécutée dès l'ajout"""
+    test_app, test_db, Job, queue = setup
+    queue.eager = True
+    calls = []
+    queue.task('noop')(lambda: calls.append(1))
+    queue.enqueue('noop')
+    assert calls == [1]
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+"""
+Tests de la pagination par curseur
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+import keyset
+from app import db, Dataset, LISTING_SORTS
+
+
+@pytest.fixture
+def listing_app(app, make_dataset):
+    """Application de test avec 25 datasets validés (dates et téléchargements en double)"""
+    start = datetime(2024, 1, 1)
+    for i in range(25):
+        make_dataset(title=f'Base {i}', creation_date=start + timedelta(days=i // 3), download_count=i % 4)
+    db.session.commit()
+    return app
+
+
+def _walk(sort, per_page):
+    query = Dataset.query.filter_by(status='validated')
+    pages = [keyset.paginate_query(query, sort, LISTING_SORTS[sort], per_page)]
+    while pages[-1].has_next:
+        pages.append(keyset.paginate_query(query, sort, LISTING_SORTS[sort], per_page, after=pages[-1].next_cursor))
+    return query, pages
+
+
+@pytest.mark.parametrize('sort', ['recent', 'downloads'])
+def test_forward_walk_matches_offset_order(listing_app, sort):
+    """Les pages successives couvrent toute la liste, dans l'ordre, sans doublon"""
+    with listing_app.app_context():
+        query, pages = _walk(sort, per_page=7)
+        expected = query.order_by(*[column.desc() for column in LISTING_SORTS[sort]]).all()
+        assert [d.id for page in pages for d in page.items] == [d.id for d in expected]
+        assert [len(page.items) for page in pages] == [7, 7, 7, 4]
+        assert not pages[0].has_prev and pages[1].has_prev
+
+
+def test_backward_walk(listing_app):
+    """Le curseur « before » ramène exactement la page précédente"""
+    with listing_app.app_context():
+        query, pages = _walk('recent', per_page=7)
+        columns = LISTING_SORTS['recent']
+        back = keyset.paginate_query(query, 'recent', columns, 7, before=pages[2].prev_cursor)
+        assert [d.id for d in back.items] == [d.id for d in pages[1].items]
+        assert back.has_next and back.has_prev
+        first = keyset.paginate_query(query, 'recent', columns, 7, before=back.prev_cursor)
+        assert [d.id for d in first.items] == [d.id for d in pages[0].items]
+        assert not first.has_prev
+
+
+def test_invalid_cursor(listing_app):
+    """Un curseur modifié ou produit pour un autre tri est refusé"""
+    with listing_app.app_context():
+        query, pages = _walk('recent', per_page=10)
+        with pytest.raises(keyset.InvalidCursor):
+            keyset.paginate_query(query, 'downloads', LISTING_SORTS['downloads'], 10, after=pages[0].next_cursor)
+        with pytest.raises(keyset.InvalidCursor):
+            keyset.paginate_query(query, 'recent', LISTING_SORTS['recent'], 10, after='pas-un-curseur')
+
+
+def test_capped_count(listing_app):
+    """Le nombre est exact sous le plafond, sinon borné et marqué approché"""
+    with listing_app.app_context():
+        query = Dataset.query.filter_by(status='validated')
+        assert keyset.capped_count(query, 100) == (25, False)
+        assert keyset.capped_count(query, 10) == (10, True)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""
+Tests sur une base PostgreSQL locale (ignorés si elle n'est pas disponible)
+
+La base est donnée par ``TEST_DATABASE_URL`` (par défaut
+``postgresql://localhost/nosdonnees_test``) ; ses tables sont créées puis
+supprimées par le test.
+"""
+
+import os
+
+import pytest
+from sqlalchemy import create_engine, text
+
+import app as nosdonnees
+from app import db, Comment
+from config import engine_options
+
+DATABASE_URL = os.environ.get('TEST_DATABASE_URL', 'postgresql://localhost/nosdonnees_test')
+
+
+def _available(url):
+    try:
+        engine = create_engine(url, connect_args={'connect_timeout': 2})
+        with engine.connect():
+            pass
+        engine.dispose()
+        return True
+    except Exception:
+        return False
+
+
+requires_postgresql = pytest.mark.skipif(
+    not DATABASE_URL.startswith('postgresql') or not _available(DATABASE_URL),
+    reason='PostgreSQL local indisponible (TEST_DATABASE_URL)'
+)
+
+
+@pytest.fixture
+def app(make_app):
+    """Application de test sur PostgreSQL (à la place de la base en mémoire de conftest.py)"""
+    test_app = make_app(SQLALCHEMY_DATABASE_URI=DATABASE_URL, SQLALCHEMY_ENGINE_OPTIONS=engine_options(DATABASE_URL))
+    with test_app.app_context():
+        db.drop_all()
+        db.create_all()
+        try:
+            yield test_app
+        finally:
+            nosdonnees.shutdown_services()
+            db.session.remove()
+            db.drop_all()
+            db.engine.dispose()
+
+
+@pytest.fixture
+def pg_app(app, author, make_dataset):
+    """Application servant les vues de l'application, avec cinq datasets et un commentaire"""
+    datasets = [
+        make_dataset(title=f'Couverture vaccinale {i}', file_size=2048, keywords='santé,vaccins')
+        for i in range(5)
+    ]
+    db.session.add(Comment(dataset_id=datasets[0].id, user_id=author.id, text='Avis', rating=4))
+    db.session.commit()
+    return app, datasets[0].id
+
+
+def test_engine_options():
+    """Profil PostgreSQL : pool dimensionné, connexions vérifiées, durée des requêtes limitée"""
+    options = engine_options('postgresql://localhost/nosdonnees')
+    assert options['pool_pre_ping'] and options['pool_size'] > 0 and options['pool_recycle'] > 0
+    assert 'statement_timeout' in options['connect_args']['options']
+
+
+@requires_postgresql
+def test_views_on_postgresql(pg_app):
+    """Accueil, liste, détail, recherche et suggestions servis par PostgreSQL"""
+    test_app, dataset_id = pg_app
+    client = test_app.test_client()
+    for url in ('/', '/datasets', f'/datasets/{dataset_id}', '/datasets?q=vaccinale', '/api/search?q=vaccinale',
+                '/api/suggest?q=couv'):
+        response = client.get(url)
+        assert response.status_code == 200, url
+    assert response.get_json()['suggestions']
+
+    with test_app.app_context():
+        timeout = db.session.execute(text('SHOW statement_timeout')).scalar()
+        assert timeout != '0'
+        assert db.engine.pool.size() == test_app.config['SQLALCHEMY_ENGINE_OPTIONS']['pool_size']
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+"""
+Tests de l'aperçu paginé des fichiers
+"""
+
+import json
+
+import pytest
+
+import preview
+from preview import IndexCache, PageCache, RowIndex, build_row_index, index_path, read_rows
+from profiling import UnsupportedFormat
+
+
+@pytest.fixture
+def csv_file(tmp_path):
+    """CSV dont certains champs entre guillemets contiennent des retours à la ligne"""
+    path = tmp_path / 'data.csv'
+    lines = ['id,commentaire']
+    for i in range(2000):
+        comment = f'"ligne {i}\nsuite, avec virgule"' if i % 3 == 0 else f'texte {i}'
+        lines.append(f'{i},{comment}')
+    path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+    return str(path)
+
+
+def test_csv_window_with_index(csv_file, tmp_path):
+    """La fenêtre lue via l'index correspond à la lecture séquentielle"""
+    index = build_row_index(csv_file, 'csv', stride=64)
+    assert index.total == 2000
+    index_path = str(tmp_path / 'idx' / 'data.rowidx')
+    index.save(index_path)
+    index = RowIndex.load(index_path)
+
+    columns, rows = read_rows(csv_file, 'csv', 1500, 5, index=index)
+    assert columns == ['id', 'commentaire']
+    assert rows[0] == ['1500', 'ligne 1500\nsuite, avec virgule']
+    assert [row[0] for row in rows] == ['1500', '1501', '1502', '1503', '1504']
+    assert read_rows(csv_file, 'csv', 1500, 5) == (columns, rows)
+
+    assert read_rows(csv_file, 'csv', 1998, 10, index=index)[1][-1][0] == '1999'
+    assert read_rows(csv_file, 'csv', 5000, 10, index=index)[1] == []
+
+
+def test_json_lines_and_array(tmp_path):
+    """Les JSON Lines sont indexés, les tableaux JSON lus séquentiellement"""
+    records = [{'id': i, 'nom': f'n"{i}'} for i in range(300)]
+    lines_path = tmp_path / 'data.jsonl'
+    lines_path.write_text('\n'.join(json.dumps(r) for r in records) + '\n', encoding='utf-8')
+    array_path = tmp_path / 'data.json'
+    array_path.write_text(json.dumps(records), encoding='utf-8')
+
+    index = build_row_index(str(lines_path), 'json', stride=16)
+    assert index.total == 300
+    assert read_rows(str(lines_path), 'json', 250, 2, index=index) == (['id', 'nom'], [[250, 'n"250'], [251, 'n"251']])
+
+    assert build_row_index(str(array_path), 'json') is None
+    assert read_rows(str(array_path), 'json', 250, 2) == (['id', 'nom'], [[250, 'n"250'], [251, 'n"251']])
+
+
+def test_unsupported_format(tmp_path):
+    path = tmp_path / 'data.sql'
+    path.write_text('SELECT 1;')
+    assert build_row_index(str(path), 'sql') is None
+    with pytest.raises(UnsupportedFormat):
+        read_rows(str(path), 'sql', 0, 10)
+
+
+def test_page_cache_evicts_oldest():
+    cache = PageCache(max_entries=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert (cache.get('a'), cache.get('b'), cache.get('c')) == (1, None, 3)
+
+
+def test_index_cache_loads_once(csv_file, tmp_path, monkeypatch):
+    """Un index chargé n'est plus relu ; un index absent est recherché à nouveau"""
+    folder = str(tmp_path / 'previews')
+    indexes = IndexCache(folder)
+    loads = []
+    load = RowIndex.load.__func__
+
+    def counted_load(cls, path):
+        loads.append(path)
+        return load(cls, path)
+
+    monkeypatch.setattr(preview.RowIndex, 'load', classmethod(counted_load))
+    assert indexes.get('ab' * 32) is None
+    build_row_index(csv_file, 'csv', stride=64).save(index_path(folder, 'ab' * 32))
+    assert indexes.get('ab' * 32).total == 2000
+    assert indexes.get('ab' * 32).total == 2000
+    assert len(loads) == 2
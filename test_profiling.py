@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+"""
+Tests du profilage des fichiers
+"""
+
+import json
+
+import pytest
+
+import profiling
+from profiling import HyperLogLog, UnsupportedFormat, profile_file
+
+
+@pytest.fixture
+def csv_file(tmp_path):
+    """CSV séparé par des points-virgules, avec des valeurs manquantes"""
+    path = tmp_path / 'data.csv'
+    lines = ['id;ville;prix;actif;date']
+    for i in range(1000):
+        if i % 10 == 0:
+            lines.append(f'{i};;NA;oui;')
+        else:
+            lines.append(f'{i};ville{i % 7};{i / 4:.2f};{"oui" if i % 2 else "non"};2024-02-{i % 28 + 1:02d}')
+    path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+    return str(path)
+
+
+def _columns(result):
+    return {column['name']: column for column in result['columns']}
+
+
+def test_csv_profile(csv_file):
+    """Types, valeurs manquantes, min/max, cardinalité et valeurs fréquentes"""
+    result = profile_file(csv_file, 'csv', batch_size=128)
+    assert result['row_count'] == 1000
+    assert result['column_count'] == 5
+
+    columns = _columns(result)
+    assert columns['id']['type'] == 'integer'
+    assert (columns['id']['min'], columns['id']['max']) == (0, 999)
+    assert columns['id']['top_values'] == []  # valeurs toutes différentes
+    assert columns['prix']['type'] == 'float'
+    assert columns['prix']['null_ratio'] == 0.1
+    assert columns['actif']['type'] == 'boolean'
+    assert columns['date']['type'] == 'date'
+    assert columns['date']['min'] == '2024-02-01'
+    assert columns['ville']['distinct_estimate'] == 7
+    assert columns['ville']['top_values'][0][1] == 129
+    json.dumps(result)
+
+
+def test_pure_python_matches_numpy(csv_file, monkeypatch):
+    """Le calcul sans NumPy donne les mêmes résultats"""
+    expected = profile_file(csv_file, 'csv', batch_size=100)
+    monkeypatch.setattr(profiling, 'np', None)
+    result = profile_file(csv_file, 'csv', batch_size=100)
+    assert result['columns'] == expected['columns']
+
+
+def test_json_array_streamed(tmp_path):
+    """Tableau JSON lu par morceaux ; les colonnes absentes sont comptées nulles"""
+    path = tmp_path / 'data.json'
+    records = [{'a': i, 'b': 'x'} if i < 6 else {'a': i, 'c': [1, 2]} for i in range(12)]
+    path.write_text(json.dumps(records), encoding='utf-8')
+
+    with open(path, encoding='utf-8') as fh:
+        assert list(profiling.iter_json_values(fh, read_size=7)) == records
+
+    columns = _columns(profile_file(str(path), 'json', batch_size=5))
+    assert columns['a']['type'] == 'integer'
+    assert columns['b']['null_ratio'] == 0.5
+    assert columns['c']['null_ratio'] == 0.5
+
+
+def test_hyperloglog_accuracy():
+    """L'estimation reste à quelques pourcents du nombre réel"""
+    hll = HyperLogLog()
+    for start in range(0, 100000, 5000):
+        hll.add_batch([f'valeur-{i}' for i in range(start, start + 5000)])
+    assert abs(hll.estimate() - 100000) < 5000
+
+
+def test_unsupported_format(tmp_path):
+    path = tmp_path / 'data.zip'
+    path.write_bytes(b'PK')
+    with pytest.raises(UnsupportedFormat):
+        profile_file(str(path), 'zip')
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""
+Tests du nombre de requêtes SQL par vue (pas de chargement paresseux par ligne)
+"""
+
+import pytest
+
+from app import db, User, Domain, Dataset, Comment
+from query_budget import QueryBudgetExceeded, query_budget
+
+
+@pytest.fixture
+def catalogue_app(app):
+    """Application de test (base en mémoire, sans cache), dépassements de budget levés"""
+    app.extensions['query_budget'].action = 'raise'
+    # Un domaine par dataset et un auteur par commentaire : un chargement
+    # paresseux par ligne dépasserait le budget
+    users = [User(username=f'user{i}', email=f'user{i}@example.org', password_hash='x') for i in range(30)]
+    domains = [Domain(name=f'Domaine {i}') for i in range(15)]
+    db.session.add_all(users + domains)
+    db.session.flush()
+    datasets = [
+        Dataset(
+            title=f'Base {i}', description='Description', source='Source', author=users[i].username,
+            file_path='uploads/x.csv', file_format='csv', file_size=2048, keywords='santé,vaccins', domain_id=domains[i].id,
+            user_id=users[0].id, status='validated'
+        )
+        for i in range(15)
+    ]
+    db.session.add_all(datasets)
+    db.session.flush()
+    db.session.add_all([
+        Comment(dataset_id=datasets[0].id, user_id=users[i].id, text=f'Avis {i}', rating=4)
+        for i in range(30)
+    ])
+    db.session.commit()
+    yield app, datasets[0].id, users[0].id
+
+
+def _query_count(client, url):
+    response = client.get(url)
+    assert response.status_code == 200
+    return int(response.headers['X-Query-Count'])
+
+
+def test_listing_and_detail_within_budget(catalogue_app):
+    """Liste, détail (30 commentaires) et accueil : nombre de requêtes constant"""
+    test_app, dataset_id, _ = catalogue_app
+    client = test_app.test_client()
+    assert _query_count(client, '/datasets') <= 6
+    assert _query_count(client, f'/datasets/{dataset_id}') <= 6
+    assert _query_count(client, '/') <= 6
+
+
+def test_dashboard_within_budget(catalogue_app):
+    """Le tableau de bord d'un contributeur ne charge pas les relations ligne par ligne"""
+    test_app, _, user_id = catalogue_app
+    client = test_app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+    assert 0 < _query_count(client, '/dashboard') <= 10
+
+
+def test_budget_exceeded_raises(catalogue_app):
+    """Une vue au-delà de son budget est signalée"""
+    test_app, _, _ = catalogue_app
+
+    @test_app.route('/lazy')
+    @query_budget(3)
+    def lazy():
+        return ', '.join(dataset.domain.name for dataset in Dataset.query.all())
+
+    with pytest.raises(QueryBudgetExceeded):
+        test_app.test_client().get('/lazy')
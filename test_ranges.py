@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+"""
+Tests des plages de téléchargement : analyse de l'en-tête Range des
+téléchargements Django (sans Django) et comptage des reprises côté Flask
+"""
+
+import pytest
+from flask import Flask
+
+from datasets.ranges import RangeNotSatisfiable, parse_range
+from downloads import file_sha256, is_new_download, send_dataset_file
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('bytes=0-99', (0, 99)),
+    ('bytes=100-', (100, 999)),  # ouverte : jusqu'à la fin
+    ('bytes=900-5000', (900, 999)),  # fin ramenée à la taille
+    ('bytes=-100', (900, 999)),  # suffixe : les 100 derniers octets
+    ('bytes=-5000', (0, 999)),  # suffixe plus long que le fichier
+    (' bytes=10-20 ', (10, 20)),
+])
+def test_single_range(header, expected):
+    """Plage unique, ouverte ou suffixe, bornée par la taille du fichier"""
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize('header', [None, '', 'bytes=-', 'bytes=0-9,20-29', 'items=0-9', 'bytes=a-b'])
+def test_ignored_headers_send_whole_file(header):
+    """En-tête absent, mal formé ou multi-plages : fichier complet"""
+    assert parse_range(header, 1000) is None
+
+
+@pytest.mark.parametrize('header', ['bytes=1000-', 'bytes=1000-1200', 'bytes=50-10', 'bytes=-0'])
+def test_unsatisfiable(header):
+    """Début hors du fichier, plage inversée ou suffixe vide"""
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range(header, 1000)
+
+
+def test_empty_file():
+    """Aucune plage n'est satisfiable dans un fichier vide"""
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range('bytes=0-', 0)
+
+
+@pytest.fixture
+def range_app(tmp_path):
+    """Application minimale et fichier de 1000 octets"""
+    path = tmp_path / 'data.csv'
+    path.write_bytes(b'x' * 1000)
+    test_app = Flask(__name__)
+    test_app.config['UPLOAD_FOLDER'] = str(tmp_path)
+    return test_app, str(path), file_sha256(str(path))
+
+
+@pytest.mark.parametrize('headers, status, counted', [
+    ({'Range': 'bytes=100-', 'If-Range': '"autre"'}, 200, True),  # ETag changé : fichier complet
+    ({'Range': 'bytes=100-'}, 206, False),  # reprise
+    ({'Range': 'bytes=0-99'}, 206, True),
+    ({}, 200, True),
+])
+def test_new_download_decided_from_response(range_app, headers, status, counted):
+    """Une reprise dont le If-Range ne correspond plus est un nouveau téléchargement complet"""
+    test_app, path, content_hash = range_app
+    with test_app.test_request_context('/download', headers=headers):
+        response = send_dataset_file(path, 'data.csv', content_hash)
+        assert response.status_code == status
+        assert is_new_download(response) is counted
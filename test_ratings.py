@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+"""
+Tests de l'agrégat des notes stocké sur les datasets
+"""
+
+import pytest
+from flask import g
+
+from app import db, User, Dataset, Comment, apply_rating, backfill_ratings, valid_rating
+
+
+@pytest.fixture
+def rating_app(app, author, make_dataset):
+    """Application de test avec un dataset validé"""
+    dataset = make_dataset(title='Vaccination', description='Couverture vaccinale', source='Ministère')
+    db.session.commit()
+    return app, author.id, dataset.id
+
+
+def _comment(user_id, dataset_id, rating):
+    rating = valid_rating(rating)
+    comment = Comment(dataset_id=dataset_id, user_id=user_id, text='Avis', rating=rating)
+    db.session.add(comment)
+    apply_rating(dataset_id, rating)
+    db.session.commit()
+    return comment
+
+
+def test_rating_maintained_on_insert_and_delete(rating_app):
+    """L'agrégat suit les ajouts et suppressions ; les notes 0 sont ignorées"""
+    test_app, user_id, dataset_id = rating_app
+    with test_app.app_context():
+        _comment(user_id, dataset_id, 5)
+        removed = _comment(user_id, dataset_id, 2)
+        _comment(user_id, dataset_id, 0)
+
+        dataset = db.session.get(Dataset, dataset_id)
+        assert (dataset.rating_sum, dataset.rating_count) == (7, 2)
+        assert dataset.rating == pytest.approx(3.5)
+
+        apply_rating(dataset_id, removed.rating, sign=-1)
+        db.session.delete(removed)
+        db.session.commit()
+        db.session.refresh(dataset)
+        assert (dataset.rating_sum, dataset.rating_count, dataset.rating) == (5, 1, 5.0)
+
+
+def test_comment_routes_maintain_rating(rating_app):
+    """Ajouter puis supprimer un commentaire par les routes met l'agrégat à jour"""
+    test_app, author_id, dataset_id = rating_app
+    reader = User(username='lecteur', email='lecteur@example.org', password_hash='x')
+    db.session.add(reader)
+    db.session.commit()
+    client = test_app.test_client()
+
+    def login(user_id):
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+        # Les requêtes partagent le contexte de la fixture : Flask-Login y garde l'utilisateur précédent
+        g.pop('_login_user', None)
+
+    def aggregate():
+        db.session.expire_all()
+        dataset = db.session.get(Dataset, dataset_id)
+        return dataset.rating_sum, dataset.rating_count, dataset.rating
+
+    login(author_id)
+    client.post(f'/add_comment/{dataset_id}', data={'comment_text': 'Très utile', 'rating': '5'})
+    client.post(f'/add_comment/{dataset_id}', data={'comment_text': 'Sans note', 'rating': '0'})
+    login(reader.id)
+    client.post(f'/add_comment/{dataset_id}', data={'comment_text': 'Incomplet', 'rating': '2'})
+    assert aggregate() == (7, 2, 3.5)
+
+    reader_comment = Comment.query.filter_by(user_id=reader.id).one()
+    login(author_id)
+    client.post(f'/delete_comment/{reader_comment.id}')  # pas son commentaire : refusé
+    assert aggregate() == (7, 2, 3.5)
+
+    login(reader.id)
+    client.post(f'/delete_comment/{reader_comment.id}')
+    assert aggregate() == (5, 1, 5.0)
+    unrated = Comment.query.filter_by(text='Sans note').one()
+    login(author_id)
+    client.post(f'/delete_comment/{unrated.id}')
+    assert aggregate() == (5, 1, 5.0)
+    assert Comment.query.count() == 1
+
+
+def test_backfill_matches_comments(rating_app):
+    """La commande de rattrapage recalcule l'agrégat depuis les commentaires"""
+    test_app, user_id, dataset_id = rating_app
+    with test_app.app_context():
+        db.session.add_all([
+            Comment(dataset_id=dataset_id, user_id=user_id, text='a', rating=4),
+            Comment(dataset_id=dataset_id, user_id=user_id, text='b', rating=1),
+            Comment(dataset_id=dataset_id, user_id=user_id, text='c', rating=0),
+        ])
+        db.session.commit()
+
+        assert backfill_ratings() == 1
+        dataset = db.session.get(Dataset, dataset_id)
+        assert (dataset.rating_sum, dataset.rating_count, dataset.rating) == (5, 2, 2.5)
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+"""
+Tests des agrégats d'usage (rollups) et de l'API d'usage
+"""
+
+from datetime import datetime
+
+import pytest
+
+from app import db, UsageRollup
+from rollups import RollupBuffer
+
+
+@pytest.fixture
+def usage_app(app, author, domain, make_dataset):
+    """Application de test servant les vues de l'application, agrégats alimentés par un buffer"""
+    datasets = [make_dataset(title=f'Base {status}', status=status) for status in ('validated', 'pending')]
+    db.session.commit()
+    buffer = RollupBuffer()
+    buffer.init_app(app, db)
+    return app, buffer, datasets[0].id, datasets[1].id, author.id, domain.id
+
+
+def test_buffer_rolls_up_by_hour_day_and_scope(usage_app):
+    """Chaque événement compte dans l'heure et le jour du dataset, du domaine et du contributeur"""
+    test_app, buffer, dataset_id, other_id, user_id, domain_id = usage_app
+    buffer.add(dataset_id, 'downloads', datetime(2024, 3, 1, 10, 5))
+    buffer.add(dataset_id, 'downloads', datetime(2024, 3, 1, 10, 40))
+    buffer.add(dataset_id, 'views', datetime(2024, 3, 1, 11, 0))
+    buffer.add(other_id, 'views', datetime(2024, 3, 1, 23, 59))
+    assert buffer.flush() == 13
+    buffer.add(dataset_id, 'views', datetime(2024, 3, 1, 11, 30))
+    buffer.flush()
+
+    with test_app.app_context():
+        def rollup(scope, scope_id, granularity, period):
+            row = db.session.get(UsageRollup, (scope, scope_id, granularity, period))
+            return row.downloads, row.views
+
+        assert rollup('dataset', dataset_id, 'hour', datetime(2024, 3, 1, 10)) == (2, 0)
+        assert rollup('dataset', dataset_id, 'hour', datetime(2024, 3, 1, 11)) == (0, 2)
+        assert rollup('dataset', dataset_id, 'day', datetime(2024, 3, 1)) == (2, 2)
+        assert rollup('domain', domain_id, 'day', datetime(2024, 3, 1)) == (2, 3)
+        assert rollup('user', user_id, 'day', datetime(2024, 3, 1)) == (2, 3)
+    assert buffer.pending() == 0
+
+
+def test_usage_api(usage_app):
+    """Série complétée par des zéros, totaux, erreurs de paramètres"""
+    test_app, buffer, dataset_id, other_id, _, _ = usage_app
+    for day, hour in ((1, 9), (1, 9), (3, 14)):
+        buffer.add(dataset_id, 'downloads', datetime(2024, 3, day, hour))
+    buffer.add(dataset_id, 'views', datetime(2024, 3, 2, 8))
+    buffer.flush()
+    client = test_app.test_client()
+
+    data = client.get(f'/api/datasets/{dataset_id}/usage?from=2024-03-01&to=2024-03-04').get_json()
+    assert data['granularity'] == 'day'
+    assert [(p['period'][:10], p['downloads'], p['views']) for p in data['series']] == [
+        ('2024-03-01', 2, 0), ('2024-03-02', 0, 1), ('2024-03-03', 1, 0), ('2024-03-04', 0, 0)
+    ]
+    assert data['totals'] == {'downloads': 3, 'views': 1}
+
+    data = client.get(f'/api/datasets/{dataset_id}/usage?granularity=hour&from=2024-03-01&to=2024-03-01T23:00').get_json()
+    assert len(data['series']) == 24
+    assert data['series'][9] == {'period': '2024-03-01T09:00:00', 'downloads': 2, 'views': 0}
+
+    url = f'/api/datasets/{dataset_id}/usage'
+    assert client.get(url + '?granularity=week').status_code == 400
+    assert client.get(url + '?from=hier').status_code == 400
+    assert client.get(url + '?from=2024-03-05&to=2024-03-01').status_code == 400
+    assert client.get(url + '?granularity=hour&from=2024-01-01&to=2024-03-01').status_code == 400
+    assert client.get(f'/api/datasets/{other_id}/usage').status_code == 403
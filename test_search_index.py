@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+"""
+Tests de l'index de recherche plein texte (FTS5)
+"""
+
+import pytest
+
+from sqlalchemy import text
+
+import search_index
+from app import db, User, Dataset
+
+
+@pytest.fixture
+def search_app(app, make_dataset):
+    """Application de test avec trois datasets indexés"""
+    search_index.create_search_index(db.session)
+    rows = [
+        ('Vaccination régionale', 'Couverture vaccinale par région', 'vaccin, santé'),
+        ('Recensement agricole', 'Exploitations et cultures', 'agriculture'),
+        ('Hôpitaux publics', 'Capacité des hôpitaux et vaccination', 'santé'),
+    ]
+    for title, description, keywords in rows:
+        dataset = make_dataset(title=title, description=description, source='Ministère', keywords=keywords)
+        search_index.index_dataset(db.session, dataset)
+    db.session.commit()
+    return app
+
+
+def _search(q):
+    query = Dataset.query.filter_by(status='validated')
+    return [d.title for d in search_index.apply_search(query, Dataset, db.session, q).all()]
+
+
+def test_match_expression():
+    """Chaque mot devient un terme préfixe, la ponctuation est ignorée"""
+    assert search_index.build_match_expression('vacc "région') == '"vacc"* "région"*'
+    assert search_index.build_match_expression('  !! ') == ''
+
+
+def test_prefix_and_ranking(search_app):
+    """La recherche préfixe trouve les deux datasets, le titre l'emporte"""
+    with search_app.app_context():
+        assert _search('vacc') == ['Vaccination régionale', 'Hôpitaux publics']
+
+
+def test_accents_ignored(search_app):
+    """Les accents sont neutralisés par le tokenizer"""
+    with search_app.app_context():
+        assert _search('hopitaux') == ['Hôpitaux publics']
+
+
+def test_reindex_and_remove(search_app):
+    """La mise à jour et la suppression se reflètent dans les résultats"""
+    with search_app.app_context():
+        dataset = Dataset.query.filter_by(title='Recensement agricole').first()
+        dataset.keywords = 'vaccin'
+        search_index.index_dataset(db.session, dataset)
+        db.session.commit()
+        assert 'Recensement agricole' in _search('vaccin')
+
+        search_index.remove_dataset(db.session, dataset.id)
+        db.session.commit()
+        assert 'Recensement agricole' not in _search('vaccin')
+
+
+def test_rejected_dataset_leaves_index(search_app):
+    """Rejeter un dataset le retire de l'index ; le valider l'y remet"""
+    admin = User(username='admin', email='admin@example.org', password_hash='x', role='admin')
+    db.session.add(admin)
+    db.session.commit()
+    dataset_id = Dataset.query.filter_by(title='Hôpitaux publics').first().id
+    client = search_app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(admin.id)
+
+    def indexed():
+        return db.session.execute(
+            text(f'SELECT count(*) FROM {search_index.FTS_TABLE} WHERE rowid = :id'), {'id': dataset_id}
+        ).scalar()
+
+    client.post(f'/admin/reject_dataset/{dataset_id}', data={'rejection_reason': 'Doublon'})
+    assert indexed() == 0
+    client.post(f'/admin/validate_dataset/{dataset_id}')
+    assert indexed() == 1
+
+
+def test_availability_follows_the_engine(search_app, make_app):
+    """La disponibilité de FTS5 est propre à chaque moteur, pas à son id()"""
+    assert search_index.is_available(db.session)
+    other = make_app()
+    with other.app_context():
+        db.create_all()
+        assert not search_index.is_available(db.session)
+        assert search_index.apply_search(Dataset.query, Dataset, db.session, 'vaccin').all() == []
+
+
+def test_missing_index_is_rechecked(app, monkeypatch):
+    """Une table absente n'est pas retenue pour toujours"""
+    assert not search_index.is_available(db.session)
+    # Table créée par un autre processus : visible après le délai de revérification
+    db.session.execute(text(f'CREATE VIRTUAL TABLE {search_index.FTS_TABLE} USING fts5(title)'))
+    db.session.commit()
+    assert not search_index.is_available(db.session)
+    monkeypatch.setattr(search_index, 'RECHECK_INTERVAL', 0.0)
+    assert search_index.is_available(db.session)
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+"""
+Tests du serveur de production (serve.py, gestionnaire de processus intégré)
+
+Le serveur est lancé dans un sous-processus sur un port libre, avec une
+application WSGI minimale qui renvoie le pid du worker.
+"""
+
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from benchmark import load_http
+from serve import PooledWSGIServer, Target, Worker
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+APPLICATION = '''
+import os, time
+
+def application(environ, start_response):
+    if environ['PATH_INFO'] == '/slow':
+        time.sleep(0.5)
+    elif environ['PATH_INFO'] == '/cpu':
+        sum(i * i for i in range(20000))
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [str(os.getpid()).encode()]
+'''
+
+
+class Server:
+    def __init__(self, tmp_path, *options):
+        (tmp_path / 'pidapp.py').write_text(APPLICATION)
+        env = dict(os.environ, PYTHONPATH=str(tmp_path), PYTHONUNBUFFERED='1')
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, 'serve.py'), 'wsgi', 'pidapp:application', '--server', 'builtin',
+             '--bind', '127.0.0.1:0', '--no-access-log', '--keepalive', '1', '--graceful-timeout', '5', *options],
+            env=env, cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+        )
+        line = self.process.stdout.readline()
+        assert line.startswith('Écoute sur '), line
+        self.url = line.split()[2]
+
+    def get(self, path='/'):
+        with urllib.request.urlopen(self.url + path, timeout=5) as response:
+            return int(response.read())
+
+    def pids(self, count=40):
+        return {self.get() for _ in range(count)}
+
+    def wait_for(self, condition, timeout=10):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if condition():
+                return True
+            time.sleep(0.1)
+        return False
+
+    def stop(self):
+        if self.process.poll() is None:
+            self.process.send_signal(signal.SIGTERM)
+            try:
+                self.process.wait(10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.process.stdout.close()
+
+
+@pytest.fixture
+def server(tmp_path):
+    servers = []
+
+    def start(*options):
+        servers.append(Server(tmp_path, *options))
+        return servers[-1]
+
+    yield start
+    for started in servers:
+        started.stop()
+
+
+def test_workers_and_graceful_stop(server):
+    """Plusieurs workers servent le même port ; TERM termine la requête en cours puis arrête"""
+    started = server('--workers', '2', '--threads', '2', '--max-requests', '0')
+    assert started.wait_for(lambda: len(started.pids()) == 2)
+    before = started.pids()
+
+    with ThreadPoolExecutor(1) as executor:
+        slow = executor.submit(started.get, '/slow')
+        time.sleep(0.2)
+        started.process.send_signal(signal.SIGTERM)
+        assert slow.result() in before
+    assert started.process.wait(10) == 0
+
+
+def test_max_requests_recycles_worker(server):
+    """Un worker est remplacé après --max-requests requêtes"""
+    started = server('--workers', '1', '--max-requests', '5', '--max-requests-jitter', '0')
+    pids = [started.get() for _ in range(15)]
+    assert len(set(pids)) >= 3
+    assert pids[:5] == [pids[0]] * 5
+
+
+def test_reload_replaces_workers(server):
+    """HUP : de nouveaux workers remplacent les anciens, sans interruption du service"""
+    started = server('--workers', '2', '--max-requests', '0')
+    assert started.wait_for(lambda: len(started.pids()) == 2)
+    before = started.pids()
+
+    started.process.send_signal(signal.SIGHUP)
+    assert started.wait_for(lambda: not started.pids(10) & before)
+    assert len(started.pids()) == 2
+
+
+def test_preload_and_respawn(server):
+    """Avec --preload, un worker tué est relancé par le maître"""
+    started = server('--workers', '1', '--max-requests', '0', '--preload')
+    pid = started.get()
+    os.kill(pid, signal.SIGKILL)
+    assert started.wait_for(lambda: started.get() != pid)
+
+
+@pytest.mark.skipif((os.cpu_count() or 1) < 2, reason='un seul cœur : pas de gain à attendre de plusieurs workers')
+def test_throughput_scales_with_workers(server):
+    """Deux workers servent nettement plus de requêtes CPU qu'un seul"""
+    throughput = {}
+    for workers in (1, 2):
+        started = server('--workers', str(workers), '--threads', '1', '--max-requests', '0')
+        assert started.wait_for(lambda: len(started.pids()) == workers)
+        throughput[workers] = load_http(started.url, ['/cpu'], 4, 2.0)['throughput_rps']
+        started.stop()
+    assert throughput[2] > 1.4 * throughput[1], throughput
+
+
+def test_connections_accepted_only_with_free_thread():
+    """Thread occupé : la connexion suivante attend dans la file du socket, pas dans celle du pool"""
+    release = threading.Event()
+
+    def application(environ, start_response):
+        release.wait(5)
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return [b'ok']
+
+    listener = socket.create_server(('127.0.0.1', 0))
+    listener.setblocking(False)
+    server = PooledWSGIServer(listener, application, 1)
+    accepted = []
+    get_request = server.get_request
+
+    def counted_get_request():
+        request = get_request()
+        accepted.append(request)
+        return request
+
+    server.get_request = counted_get_request
+    threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.1}, daemon=True).start()
+    url = 'http://%s:%d/' % listener.getsockname()[:2]
+    try:
+        with ThreadPoolExecutor(2) as executor:
+            responses = [executor.submit(urllib.request.urlopen, url, timeout=5) for _ in range(2)]
+            time.sleep(0.5)
+            assert len(accepted) == 1
+            release.set()
+            assert [response.result().read() for response in responses] == [b'ok', b'ok']
+        assert len(accepted) == 2
+    finally:
+        server.stopping = True
+        server.shutdown()
+        listener.close()
+
+
+def test_stop_while_loading():
+    """TERM reçu avant la création du serveur : le worker ne sert pas et ne plante pas"""
+    listener = socket.create_server(('127.0.0.1', 0))
+    listener.setblocking(False)
+    worker = Worker(Target('test', lambda: None), listener, 1)
+
+    def load():
+        worker.stop()
+        return lambda environ, start_response: []
+
+    worker.target.load = load
+    signums = (signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGTTIN, signal.SIGTTOU)
+    handlers = {signum: signal.getsignal(signum) for signum in signums}
+    try:
+        worker.run(os.getppid())
+    finally:
+        for signum, handler in handlers.items():
+            signal.signal(signum, handler)
+        listener.close()
+    assert worker.server is not None and worker.requests == 0
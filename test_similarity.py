@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+"""
+Tests de l'index des bases similaires (TF-IDF précalculé)
+"""
+
+import json
+
+import pytest
+
+import app as nosdonnees
+from app import db, Dataset, Job, SimilarDataset
+import similarity
+
+CATALOGUE = [
+    ('Vaccination des enfants', 'santé,vaccins', 'Couverture vaccinale par région', ['region', 'taux_vaccination']),
+    ('Campagnes de vaccination', 'vaccins,santé', 'Doses administrées par campagne', ['campagne', 'doses']),
+    ('Hôpitaux et lits', 'santé,hôpitaux', 'Capacité des hôpitaux par région', ['region', 'lits']),
+    ('Prix du riz', 'agriculture,marchés', 'Prix du riz sur les marchés', ['marche', 'prix']),
+    ('Prix du maïs', 'agriculture,marchés', 'Prix du maïs sur les marchés', ['marche', 'prix']),
+    ('Production agricole', 'agriculture', 'Production de riz et de maïs par région', ['region', 'culture']),
+]
+
+
+@pytest.fixture
+def catalogue(app, make_dataset):
+    """Base en mémoire avec un petit catalogue validé"""
+    datasets = [
+        make_dataset(title=title, keywords=keywords, description=description,
+                     profile=json.dumps({'columns': [{'name': name} for name in columns]}))
+        for title, keywords, description, columns in CATALOGUE
+    ]
+    db.session.commit()
+    return [dataset.id for dataset in datasets]
+
+
+def _lists():
+    rows = db.session.query(SimilarDataset).order_by(SimilarDataset.dataset_id, SimilarDataset.rank).all()
+    lists = {}
+    for row in rows:
+        lists.setdefault(row.dataset_id, []).append((row.similar_id, round(row.score, 6)))
+    return lists
+
+
+def _rebuild():
+    with db.engine.begin() as conn:
+        similarity.rebuild(conn, SimilarDataset.__table__, Dataset.__table__)
+
+
+def _refresh(dataset_id):
+    with db.engine.begin() as conn:
+        similarity.refresh(conn, SimilarDataset.__table__, Dataset.__table__, dataset_id)
+
+
+def test_tokenize_and_document_terms():
+    """Accents, mots vides et noms de colonnes du profil"""
+    assert similarity.tokenize('Données de Santé publique 2024') == ['sante', 'publique']
+    terms = similarity.document_terms(title='Vaccins', keywords='santé,vaccins',
+                                      profile=json.dumps({'columns': [{'name': 'taux_vaccination'}]}))
+    assert terms['vaccins'] == 3 + 2
+    assert terms['taux'] == terms['vaccination'] == 2
+
+
+def test_rebuild_ranks_by_topic(catalogue):
+    """Les voisins les plus proches partagent le sujet"""
+    vaccination, campagnes, hopitaux, riz, mais, production = catalogue
+    _rebuild()
+    lists = _lists()
+    assert lists[vaccination][0][0] == campagnes
+    assert lists[riz][0][0] == mais
+    assert {similar_id for similar_id, _ in lists[riz][:2]} == {mais, production}
+    assert all(score >= similarity.MIN_SCORE for neighbours in lists.values() for _, score in neighbours)
+    assert all(dataset_id not in {s for s, _ in neighbours} for dataset_id, neighbours in lists.items())
+
+
+def test_refresh_matches_rebuild(catalogue):
+    """Une validation puis un rejet sont répercutés sans recalcul complet"""
+    riz = catalogue[3]
+    dataset = db.session.get(Dataset, riz)
+    dataset.status = 'pending'
+    db.session.commit()
+    _rebuild()
+    assert riz not in _lists()
+
+    dataset.status = 'validated'
+    db.session.commit()
+    _refresh(riz)
+    incremental = _lists()
+    _rebuild()
+    rebuilt = _lists()
+    # Les scores des autres listes gardent les anciennes fréquences : seuls la liste du
+    # dataset et les rangs où il apparaît sont comparés
+    assert incremental[riz] == rebuilt[riz]
+    assert {d for d, neighbours in incremental.items() if riz in dict(neighbours)} == \
+        {d for d, neighbours in rebuilt.items() if riz in dict(neighbours)}
+
+    dataset.status = 'rejected'
+    db.session.commit()
+    _refresh(riz)
+    assert riz not in _lists()
+    assert all(riz not in {s for s, _ in neighbours} for neighbours in _lists().values())
+
+
+def test_refresh_reads_only_the_changed_dataset(catalogue, monkeypatch):
+    """Après une reconstruction, l'index en mémoire évite de relire le catalogue"""
+    riz = catalogue[3]
+    _rebuild()
+    reads = []
+    load_documents = similarity.load_documents
+
+    def counted_load(conn, dataset_table, dataset_id=None):
+        reads.append(dataset_id)
+        return load_documents(conn, dataset_table, dataset_id)
+
+    monkeypatch.setattr(similarity, 'load_documents', counted_load)
+    db.session.get(Dataset, riz).status = 'rejected'
+    db.session.commit()
+    _refresh(riz)
+    assert reads == [riz]
+    assert riz not in _lists()
+
+
+def test_index_update_matches_new_index():
+    """Ajouter un document revectorise ceux dont un terme entre dans l'IDF"""
+    documents = {
+        dataset_id: similarity.document_terms(title=title, keywords=keywords, description=description)
+        for dataset_id, (title, keywords, description, _) in enumerate(CATALOGUE, start=1)
+    }
+    riz = documents.pop(4)
+    index = similarity.SimilarityIndex(documents)
+    assert 'prix' not in index.vectors[5]  # « prix » n'est alors que dans un document
+
+    index.update(4, riz)
+    fresh = similarity.SimilarityIndex({**documents, 4: riz})
+    assert index.neighbours(4) == pytest.approx(fresh.neighbours(4))
+    assert index.vectors[5] == pytest.approx(fresh.vectors[5])
+
+    index.update(4, None)
+    assert 4 not in index.vectors and all(4 not in postings for postings in index.postings.values())
+
+
+def test_refresh_task_schedules_one_rebuild(catalogue):
+    """Les mises à jour programment une seule reconstruction différée"""
+    nosdonnees.refresh_similar(catalogue[0])
+    nosdonnees.refresh_similar(catalogue[1])
+    assert Job.query.filter_by(name='rebuild_similar', status='queued').count() == 1
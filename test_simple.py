@@ -3,10 +3,11 @@
 Test simple de l'application Flask
 """
 
-from app import app
+from app import create_app
 
 def test_app():
     """Test de l'application"""
+    app = create_app()
     with app.test_client() as client:
         print("🧪 Test de l'application Flask...")
         
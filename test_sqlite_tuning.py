@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""
+Tests des réglages SQLite (WAL, pragmas, verrou d'écriture, pool de lecture)
+"""
+
+import threading
+import time
+
+import pytest
+from flask import Flask
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+import app as nosdonnees
+from app import db, Domain
+from sqlite_tuning import SQLiteTuning, WriteLock
+
+
+@pytest.fixture
+def tuned_app(tmp_path):
+    """Application isolée sur une base SQLite sur disque"""
+    test_app = Flask(nosdonnees.__name__)
+    test_app.config.update(
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'tuned.db'}", SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        SQLITE_READ_POOL_SIZE=2, SQLITE_PRAGMAS={'cache_size': -2000},
+    )
+    db.init_app(test_app)
+    tuning = SQLiteTuning(test_app, db)
+    with test_app.app_context():
+        db.create_all()
+    yield test_app, tuning
+    with test_app.app_context():
+        db.engine.dispose()
+    tuning.read_engine.dispose()
+
+
+def test_pragmas_and_read_only_pool(tuned_app):
+    """WAL et pragmas sur chaque connexion ; le pool de lecture refuse les écritures"""
+    test_app, tuning = tuned_app
+    with test_app.app_context():
+        with db.engine.connect() as conn:
+            assert conn.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+            assert conn.execute(text('PRAGMA synchronous')).scalar() == 1  # NORMAL
+            assert conn.execute(text('PRAGMA busy_timeout')).scalar() == 5000
+            assert conn.execute(text('PRAGMA cache_size')).scalar() == -2000
+    with tuning.read_engine.connect() as conn:
+        assert conn.execute(text('PRAGMA query_only')).scalar() == 1
+        with pytest.raises(OperationalError):
+            conn.execute(text("INSERT INTO domain (name) VALUES ('x')"))
+
+
+def test_get_requests_read_from_pool(tuned_app):
+    """Lectures GET sur le pool de lecture, écritures et autres méthodes sur le moteur principal"""
+    test_app, tuning = tuned_app
+    acquisitions = tuning.write_lock.acquisitions
+    with test_app.test_request_context('/datasets'):
+        assert db.session.get_bind() is tuning.read_engine
+        db.session.add(Domain(name='Santé'))
+        db.session.flush()
+        # Après une écriture, la requête doit lire ce qu'elle vient d'écrire
+        assert db.session.get_bind() is db.engine
+        assert Domain.query.filter_by(name='Santé').count() == 1
+        db.session.commit()
+    with test_app.test_request_context('/datasets', method='POST'):
+        assert db.session.get_bind() is db.engine
+    with test_app.test_request_context('/datasets'):
+        assert Domain.query.count() == 1
+    assert tuning.write_lock.acquisitions == acquisitions + 1
+
+
+def test_write_lock_serializes_threads():
+    """Un écrivain à la fois, réentrant dans le même thread, abandon après le délai"""
+    lock = WriteLock(timeout=0.05)
+    assert lock.acquire() and lock.acquire()
+    lock.release()
+    results = []
+    thread = threading.Thread(target=lambda: results.append(lock.acquire()))
+    thread.start()
+    thread.join()
+    assert results == [False]
+
+    active, overlaps = [], []
+
+    def write():
+        if lock.acquire():
+            active.append(1)
+            overlaps.append(len(active))
+            time.sleep(0.005)
+            active.pop()
+            lock.release()
+
+    lock.timeout = 5
+    threads = [threading.Thread(target=write) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    lock.release()
+    for thread in threads:
+        thread.join()
+    assert overlaps == [1] * 5 and lock.waits >= 4
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+"""
+Tests du budget de démarrage d'un worker (import de l'application et première requête)
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+# Mesures de référence : ~0,7 s d'import (Flask et SQLAlchemy pour l'essentiel),
+# ~30 ms pour create_app() et ~60 ms pour la première page
+IMPORT_BUDGET = 2.0  # secondes
+CREATE_APP_BUDGET = 0.5  # secondes
+FIRST_REQUEST_BUDGET = 0.5  # secondes
+
+SCRIPT = '''
+import json, os, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter() - started
+report = {
+    'import_seconds': imported,
+    'application_built': any(isinstance(value, app.Flask) for value in vars(app).values()),
+}
+started = time.perf_counter()
+flask_app = app.create_app()
+report['create_app_seconds'] = time.perf_counter() - started
+report.update(
+    heavy_modules=sorted(name for name in ('numpy', 'pandas', 'openpyxl', 'similarity', 'index_advisor')
+                         if name in sys.modules),
+    database_created=os.path.exists(sys.argv[1]),
+    upload_folder_created=os.path.exists(sys.argv[2]),
+)
+with flask_app.app_context():
+    app.upgrade_schema(app.db)
+client = flask_app.test_client()
+started = time.perf_counter()
+report['status'] = client.get('/').status_code
+report['first_request_seconds'] = time.perf_counter() - started
+print(json.dumps(report))
+'''
+
+
+def test_startup_budget(tmp_path):
+    """Ni l'import ni create_app() ne touchent la base ou le disque ; import, création et première page dans le budget"""
+    database = tmp_path / 'startup.db'
+    uploads = tmp_path / 'uploads'
+    env = dict(
+        os.environ, DATABASE_URL=f'sqlite:///{database}', UPLOAD_FOLDER=str(uploads),
+        DOWNLOAD_LOG_FOLDER=str(tmp_path / 'download_log'), CACHE_BACKEND='memory',
+        COUNTER_BACKEND='memory', JOB_EMBEDDED_WORKERS='0'
+    )
+    output = subprocess.run(
+        [sys.executable, '-c', SCRIPT, str(database), str(uploads)], env=env, check=True,
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+    ).stdout
+    report = json.loads(output.strip().splitlines()[-1])
+
+    assert not report['application_built']
+    assert report['heavy_modules'] == []
+    assert not report['database_created'] and not report['upload_folder_created']
+    assert report['status'] == 200
+    assert report['import_seconds'] < IMPORT_BUDGET, report
+    assert report['create_app_seconds'] < CREATE_APP_BUDGET, report
+    assert report['first_request_seconds'] < FIRST_REQUEST_BUDGET, report
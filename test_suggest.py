@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""
+Tests des suggestions de recherche (index de préfixes en mémoire)
+"""
+
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app import db, Dataset
+from suggest import SuggestIndex
+
+
+def _row(dataset_id, title, keywords='', author='auteur', domain_id=1, domain_name='Santé', download_count=0):
+    return SimpleNamespace(id=dataset_id, title=title, keywords=keywords, author=author, domain_id=domain_id,
+                           domain_name=domain_name, download_count=download_count)
+
+
+def test_prefix_matching_and_ranking():
+    """Début de mot, accents ignorés, début de libellé puis popularité"""
+    index = SuggestIndex()
+    index.build([
+        _row(1, 'Couverture vaccinale', 'vaccins,santé', download_count=10),
+        _row(2, 'Vaccination des enfants', 'vaccins', download_count=3),
+        _row(3, 'Prix du riz', 'agriculture', domain_id=2, domain_name='Agriculture'),
+    ])
+    assert [s['label'] for s in index.suggest('VACC')] == ['vaccins', 'Vaccination des enfants', 'Couverture vaccinale']
+    vaccins = index.suggest('vaccins')[0]
+    assert (vaccins['kind'], vaccins['count']) == ('keyword', 2)
+    assert {(s['kind'], s['label']) for s in index.suggest('sante')} == {('keyword', 'santé'), ('domain', 'Santé')}
+    assert index.suggest('riz')[0]['target'] == 3
+    assert index.suggest('zzz') == [] and index.suggest('  ') == []
+    assert len(index.suggest('a', limit=2)) == 2
+
+
+def test_incremental_updates():
+    """Ajout et retrait d'un dataset sans reconstruction, y compris pour les saisies courtes"""
+    index = SuggestIndex()
+    index.build([_row(1, 'Prix du riz', 'marchés')])
+    assert [s['label'] for s in index.suggest('ma')] == ['marchés']
+    index.add_dataset(_row(2, 'Marchés de gros', 'marchés', download_count=5))
+    assert [s['label'] for s in index.suggest('ma')] == ['marchés', 'Marchés de gros']
+    assert index.suggest('marches')[0]['count'] == 2
+    index.remove_dataset(2)
+    index.remove_dataset(1)
+    assert index.suggest('ma') == [] and index.suggest('prix') == []
+
+
+def test_background_refresh_when_stale():
+    """Un index ancien continue de servir pendant sa reconstruction"""
+    index = SuggestIndex(max_age=0.01)
+    index.ensure_fresh(lambda: [_row(1, 'Prix du riz')])
+    time.sleep(0.02)
+    index.ensure_fresh(lambda: [_row(2, 'Prix du maïs')])
+    assert [s['label'] for s in index.suggest('prix')] in (['Prix du riz'], ['Prix du maïs'])
+    for _ in range(100):
+        if index.suggest('prix')[0]['label'] == 'Prix du maïs':
+            break
+        time.sleep(0.01)
+    assert index.suggest('prix')[0]['label'] == 'Prix du maïs'
+
+
+@pytest.fixture
+def suggest_app(app, make_dataset):
+    """Application de test (base en mémoire), index des suggestions vide"""
+    for title, status in (('Vaccination des enfants', 'validated'), ('Vaccins en attente', 'pending')):
+        make_dataset(title=title, keywords='vaccins', status=status)
+    db.session.commit()
+    return app
+
+
+def test_suggest_endpoint_without_queries(suggest_app):
+    """L'index est construit à la première saisie puis servi sans lire la base"""
+    client = suggest_app.test_client()
+    response = client.get('/api/suggest?q=vac')
+    assert response.status_code == 200
+    labels = [s['label'] for s in response.get_json()['suggestions']]
+    assert labels == ['Vaccination des enfants', 'vaccins']
+    assert response.get_json()['suggestions'][0]['url'].startswith('/datasets/')
+
+    # L'index est en mémoire : un dataset validé directement en base n'est vu qu'à la reconstruction
+    db.session.execute(db.update(Dataset).values(status='validated'))
+    db.session.commit()
+    response = client.get('/api/suggest?q=vaccins')
+    assert int(response.headers['X-Query-Count']) == 0
+    assert [s['label'] for s in response.get_json()['suggestions']] == ['vaccins']
+    assert client.get('/api/suggest?q=').get_json()['suggestions'] == []
@@ -0,0 +1,48 @@
+"""
+Vues et commandes déclarées à l'import, ajoutées à l'application par ``create_app()``
+
+Les vues de l'application étaient attachées, à l'import de ``app.py``, à
+une application créée au même moment. ``ViewRegistry`` les garde en
+attente : ``route()`` et ``command()`` s'utilisent comme ``app.route()`` et
+``app.cli.command()``, et ``register(app)`` les ajoute à l'application
+construite par la fabrique.
+
+Un blueprint Flask ferait de même, mais préfixe les points d'entrée par
+son nom (``main.dataset_list``) : tous les ``url_for('dataset_list')`` des
+gabarits, des redirections et des métriques par vue devraient changer.
+Les points d'entrée enregistrés ici gardent leur nom.
+"""
+
+import click
+from flask.cli import with_appcontext
+
+
+class ViewRegistry:
+    """Règles d'URL et commandes CLI en attente d'une application"""
+
+    def __init__(self):
+        self.rules = []  # (règle, point d'entrée, vue, options)
+        self.commands = []
+
+    def route(self, rule, **options):
+        """Décorateur équivalent à ``app.route``"""
+        def decorator(view):
+            endpoint = options.pop('endpoint', view.__name__)
+            self.rules.append((rule, endpoint, view, options))
+            return view
+        return decorator
+
+    def command(self, name=None, **attrs):
+        """Décorateur équivalent à ``app.cli.command`` (exécuté dans le contexte de l'application)"""
+        def decorator(func):
+            command = click.command(name, **attrs)(with_appcontext(func))
+            self.commands.append(command)
+            return command
+        return decorator
+
+    def register(self, app):
+        """Ajouter les vues et commandes à ``app``"""
+        for rule, endpoint, view, options in self.rules:
+            app.add_url_rule(rule, endpoint, view, **options)
+        for command in self.commands:
+            app.cli.add_command(command)